@@ -61,6 +61,11 @@ class Config:
     def deepseek_api_key(self) -> str:
         return get_env_variable('DEEPSEEK_API_KEY')
 
+    @property
+    def deepseek_base_url(self) -> str:
+        """DeepSeek兼容接口的基础地址，可指向本地模拟服务"""
+        return get_env_variable('DEEPSEEK_BASE_URL', 'https://api.deepseek.com/v1')
+
     @property
     def mcp_server_path(self) -> str:
         return get_env_variable('MCP_SERVER_PATH', './sql-linter-mcp-server')
@@ -69,5 +74,110 @@ class Config:
     def log_level(self) -> str:
         return get_env_variable('LOG_LEVEL', 'INFO')
 
+    @property
+    def llm_max_concurrency(self) -> int:
+        """同时在途的LLM调用上限"""
+        return int(get_env_variable('LLM_MAX_CONCURRENCY', '8'))
+
+    @property
+    def llm_requests_per_minute(self) -> float:
+        """LLM每分钟请求数上限"""
+        return float(get_env_variable('LLM_REQUESTS_PER_MINUTE', '120'))
+
+    @property
+    def llm_tokens_per_minute(self) -> float:
+        """LLM每分钟token数上限"""
+        return float(get_env_variable('LLM_TOKENS_PER_MINUTE', '200000'))
+
+    @property
+    def llm_max_retries(self) -> int:
+        """429/5xx错误的最大重试次数"""
+        return int(get_env_variable('LLM_MAX_RETRIES', '3'))
+
+    @property
+    def metadata_db_path(self) -> str:
+        """本地元数据SQLite数据库路径"""
+        return get_env_variable('METADATA_DB_PATH', 'metadata.db')
+
+    @property
+    def metadata_snapshot_path(self) -> str:
+        """同步后生成的只读元数据快照路径，存在时规范检查和智能体优先使用"""
+        return get_env_variable('METADATA_SNAPSHOT_PATH', 'metadata.snapshot')
+
+    @property
+    def retrieval_index_path(self) -> str:
+        """同步后更新的表结构检索索引（字符 n-gram TF-IDF）路径"""
+        return get_env_variable('RETRIEVAL_INDEX_PATH', 'metadata.retrieval.npz')
+
+    @property
+    def metadata_sync_parallelism(self) -> int:
+        """元数据同步的并行任务数，也是每个数据源的连接池大小"""
+        return int(get_env_variable('METADATA_SYNC_PARALLELISM', '4'))
+
+    @property
+    def metadata_sync_retries(self) -> int:
+        """元数据同步任务失败后的重试次数"""
+        return int(get_env_variable('METADATA_SYNC_RETRIES', '2'))
+
+    @property
+    def metadata_sync_enabled(self) -> bool:
+        """是否在MCP服务进程内后台定时同步元数据"""
+        return get_env_variable('METADATA_SYNC_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+    @property
+    def metadata_sync_check_interval(self) -> float:
+        """后台同步检查数据源是否到期的周期（秒），各数据源按自己的 sync_interval 同步"""
+        return float(get_env_variable('METADATA_SYNC_CHECK_INTERVAL', '60'))
+
+    @property
+    def metadata_sync_jitter(self) -> float:
+        """检查周期的随机抖动比例"""
+        return float(get_env_variable('METADATA_SYNC_JITTER', '0.1'))
+
+    @property
+    def sql_auto_rewrite(self) -> bool:
+        """智能体返回SQL前是否自动应用预估扫描量更少的等价改写"""
+        return get_env_variable('SQL_AUTO_REWRITE', 'false').lower() in ('1', 'true', 'yes')
+
+    @property
+    def sql_templates_enabled(self) -> bool:
+        """命中SQL模板的需求是否直接按模板生成，跳过LLM"""
+        return get_env_variable('SQL_TEMPLATES_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+    @property
+    def sql_templates_path(self) -> str:
+        """SQL模板库（TOML）路径，未设置时使用 src/rules/sql_templates.toml"""
+        return get_env_variable('SQL_TEMPLATES_PATH', '')
+
+    @property
+    def sample_data_dir(self) -> str:
+        """试运行使用的本地样本目录，每个库一个SQLite文件"""
+        return get_env_variable('SAMPLE_DATA_DIR', 'samples')
+
+    @property
+    def sample_fixture_path(self) -> str:
+        """样本夹具（JSON）路径，未设置时按字段统计生成合成样本"""
+        return get_env_variable('SAMPLE_FIXTURE_PATH', '')
+
+    @property
+    def sample_partitions(self) -> int:
+        """分区表抽样的最新分区数"""
+        return int(get_env_variable('SAMPLE_PARTITIONS', '3'))
+
+    @property
+    def sample_rows_per_partition(self) -> int:
+        """每个分区的样本行数"""
+        return int(get_env_variable('SAMPLE_ROWS_PER_PARTITION', '200'))
+
+    @property
+    def sample_run_timeout(self) -> float:
+        """试运行的超时时间（秒）"""
+        return float(get_env_variable('SAMPLE_RUN_TIMEOUT', '5'))
+
+    @property
+    def prompt_schema_token_budget(self) -> int:
+        """提示词中表结构部分的token预算"""
+        return int(get_env_variable('PROMPT_SCHEMA_TOKEN_BUDGET', '1500'))
+
 # 创建全局配置实例
 config = Config()
\ No newline at end of file
@@ -0,0 +1,283 @@
+# join_advisor.py
+"""
+连接策略建议：按本地统计判断每个连接能否改为 MAPJOIN（广播小表，避免 Reduce 端连接），
+以及 Reduce 端连接的连接键是否容易倾斜（NULL 过多、高频值、基数过低），给出 hint 和 Hive 参数。
+
+表大小取分区裁剪后的预估量（VolumeEstimator），连接键统计取 metadata.db 的 column_stats。
+"""
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.scope import traverse_scope
+
+from .config import config
+from .volume_hints import VolumeEstimator, format_bytes
+
+# 默认阈值，与 Hive 参数的默认值一致，可在 sql_rules.toml 的 [rules.join_skew] 中覆盖
+DEFAULT_THRESHOLDS = {
+    # hive.mapjoin.smalltable.filesize
+    "mapjoin_max_bytes": 25_000_000,
+    # hive.skewjoin.key：单个键超过该行数视为倾斜
+    "skew_key_rows": 100_000,
+    # 最高频值占比超过该值才算高频值（避免把均匀分布的大表当作倾斜）
+    "hot_fraction": 0.05,
+}
+
+
+class SkewedKey(NamedTuple):
+    """容易倾斜的连接键"""
+    alias: str
+    table: str
+    column: str
+    # null：NULL 过多；hot：有高频值；low_ndv：基数过低，每个值的行数都超过阈值
+    reason: str
+    # 单个键的预估行数
+    rows: int
+    fraction: Optional[float] = None
+
+
+class JoinAdvice(NamedTuple):
+    """一个连接的建议"""
+    left: Tuple[str, ...]
+    right: str
+    kind: str
+    keys: Tuple[Tuple[str, str], ...]
+    # 建议广播（MAPJOIN）的表别名及其预估大小
+    broadcast: Optional[str] = None
+    broadcast_bytes: Optional[int] = None
+    skewed: Tuple[SkewedKey, ...] = ()
+
+    @property
+    def label(self) -> str:
+        return f"{', '.join(self.left) or '?'} {self.kind} {self.right}"
+
+    @property
+    def outer(self) -> bool:
+        words = self.kind.split()
+        return words[0] in ("LEFT", "RIGHT", "FULL") and "SEMI" not in words and "ANTI" not in words
+
+    def suggestions(self, skew_key_rows: int = DEFAULT_THRESHOLDS["skew_key_rows"]) -> List[str]:
+        """建议文本，每条一行"""
+        lines = []
+        if self.broadcast is not None:
+            size = "大小未知" if self.broadcast_bytes is None else f"约 {format_bytes(self.broadcast_bytes)}"
+            lines.append(f"{self.broadcast} {size}，建议广播：SELECT /*+ MAPJOIN({self.broadcast}) */ ...，"
+                         f"并 SET hive.auto.convert.join=true; SET hive.ignore.mapjoin.hint=false;")
+        for key in self.skewed:
+            column = f"{key.alias}.{key.column}"
+            if key.reason == "null":
+                fix = (f"在 WHERE 中加上 {column} IS NOT NULL" if not self.outer
+                       else f"用 COALESCE({column}, CONCAT('null_', RAND())) 把 NULL 打散")
+                lines.append(f"{column} 约 {key.fraction:.0%} 为 NULL（约 {key.rows:,} 行），"
+                             f"全部落在同一个 Reducer，建议{fix}")
+                continue
+            if key.reason == "hot":
+                cause = f"{column} 最高频值约占 {key.fraction:.0%}（约 {key.rows:,} 行）"
+            else:
+                cause = f"{column} 基数过低，每个值约 {key.rows:,} 行"
+            fix = (f"SET hive.optimize.skewjoin=true; SET hive.skewjoin.key={skew_key_rows};" if not self.outer
+                   else "把高频值单独处理后 UNION ALL（hive.optimize.skewjoin 只作用于内连接）")
+            lines.append(f"{cause}，连接容易倾斜，建议 {fix}")
+        return lines
+
+
+def _join_kind(join: exp.Join) -> str:
+    """JOIN、LEFT JOIN、LEFT SEMI JOIN、FULL OUTER JOIN 等"""
+    words = [join.side, join.kind if join.kind != "OUTER" or join.side == "FULL" else ""]
+    return " ".join(word for word in words if word) + " JOIN" if any(words) else "JOIN"
+
+
+def _broadcastable(join: exp.Join) -> Tuple[bool, bool]:
+    """(左表能否广播, 右表能否广播)：外连接只能广播非保留的一侧，FULL OUTER JOIN 都不能"""
+    side = join.side.upper()
+    if side == "FULL":
+        return False, False
+    if side == "LEFT":
+        return False, True
+    if side == "RIGHT":
+        return True, False
+    return True, True
+
+
+class JoinAdvisor:
+    """按本地统计给出每个连接的 MAPJOIN 和倾斜建议"""
+
+    def __init__(self, metadata_db_path: str, dialect: str = "hive"):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            dialect: SQL方言
+        """
+        self.dialect = dialect
+        self.estimator = VolumeEstimator(metadata_db_path, dialect)
+
+    def advise(self, sql: Union[str, exp.Expression], thresholds: Optional[Dict] = None) -> List[JoinAdvice]:
+        """
+        Args:
+            sql: SQL 或解析后的语法树
+            thresholds: 覆盖 DEFAULT_THRESHOLDS 的阈值
+
+        Returns:
+            有建议的连接；SQL 无法解析时为空列表
+        """
+        limits = dict(DEFAULT_THRESHOLDS, **{key: value for key, value in (thresholds or {}).items()
+                                             if key in DEFAULT_THRESHOLDS})
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect) if isinstance(sql, str) else sql
+            scopes = traverse_scope(tree)
+        except Exception:
+            return []
+
+        advice = []
+        for scope in scopes:
+            select = scope.expression
+            if not isinstance(select, exp.Select) or not select.args.get("joins"):
+                continue
+            volumes = {alias.lower(): volume for alias, volume in self.estimator.scope_volumes(scope).items()}
+            aliases = [alias.lower() for alias in scope.sources]
+            where = select.args.get("where")
+            for join in select.args["joins"]:
+                item = self._advise_join(join, where, aliases, volumes, limits)
+                if item is not None:
+                    advice.append(item)
+        return advice
+
+    def _columns(self, volume) -> Dict[str, object]:
+        stats = self.estimator.stats(volume.table) if volume is not None and volume.has_stats else None
+        return {name.lower(): column for name, column in stats.columns.items()} if stats is not None else {}
+
+    def _resolve(self, column: exp.Column, aliases: List[str], volumes: Dict) -> Optional[str]:
+        """字段所属的表别名；不带限定名时按统计中的字段归属，无法唯一确定时为 None"""
+        if column.table:
+            return column.table.lower()
+        owners = [alias for alias in aliases if column.name.lower() in self._columns(volumes.get(alias))]
+        return owners[0] if len(owners) == 1 else None
+
+    def _keys(self, join: exp.Join, right: str, where: Optional[exp.Where], aliases: List[str],
+              volumes: Dict) -> List[Tuple[Tuple[str, str], Tuple[str, str]]]:
+        """连接键 ((左表别名, 字段), (右表别名, 字段))"""
+        if join.args.get("using"):
+            left = aliases[:aliases.index(right)] if right in aliases else []
+            pairs = []
+            for identifier in join.args["using"]:
+                name = identifier.name.lower()
+                owners = [alias for alias in left if name in self._columns(volumes.get(alias))] or left[:1]
+                pairs.extend(((owner, name), (right, name)) for owner in owners[:1])
+            return pairs
+        conditions = [join.args.get("on")]
+        if join.kind == "CROSS" or isinstance(join.args.get("on"), exp.Boolean):
+            conditions.append(where.this if where is not None else None)
+        pairs = []
+        for condition in conditions:
+            if condition is None:
+                continue
+            for eq in condition.find_all(exp.EQ):
+                if not (isinstance(eq.left, exp.Column) and isinstance(eq.right, exp.Column)):
+                    continue
+                sides = [(self._resolve(column, aliases, volumes), column.name.lower())
+                         for column in (eq.left, eq.right)]
+                if sides[0][0] is None or sides[1][0] is None or sides[0][0] == sides[1][0]:
+                    continue
+                if sides[1][0] == right:
+                    pairs.append((sides[0], sides[1]))
+                elif sides[0][0] == right:
+                    pairs.append((sides[1], sides[0]))
+        return pairs
+
+    def _advise_join(self, join: exp.Join, where: Optional[exp.Where], aliases: List[str], volumes: Dict,
+                     limits: Dict) -> Optional[JoinAdvice]:
+        right = join.this.alias_or_name.lower()
+        pairs = self._keys(join, right, where, aliases, volumes)
+        # 没有连接键（笛卡尔积）时左侧是之前的所有表
+        preceding = aliases[:aliases.index(right)] if right in aliases else []
+        left = tuple(dict.fromkeys(alias for (alias, _), _ in pairs)) or tuple(preceding)
+
+        def size(alias):
+            volume = volumes.get(alias)
+            return volume.total_bytes if volume is not None else None
+
+        right_bytes = size(right)
+        left_sizes = [size(alias) for alias in left]
+        left_bytes = sum(left_sizes) if left_sizes and None not in left_sizes else None
+        left_ok, right_ok = _broadcastable(join)
+        broadcast = None
+        if right_ok and right_bytes is not None and right_bytes <= limits["mapjoin_max_bytes"] \
+                and (left_bytes is None or left_bytes > right_bytes):
+            broadcast = (right, right_bytes)
+        elif left_ok and len(left) == 1 and left_bytes is not None and left_bytes <= limits["mapjoin_max_bytes"] \
+                and (right_bytes is None or right_bytes > left_bytes):
+            broadcast = (left[0], left_bytes)
+
+        skewed = []
+        if broadcast is None:
+            # Reduce 端连接才会因为键分布不均而倾斜
+            seen = set()
+            for side in (key for pair in pairs for key in pair):
+                if side in seen:
+                    continue
+                seen.add(side)
+                found = self._skew(side, volumes.get(side[0]), limits)
+                if found is not None:
+                    skewed.append(found)
+
+        if broadcast is None and not skewed:
+            return None
+        keys = tuple((f"{l_alias}.{l_col}", f"{r_alias}.{r_col}") for (l_alias, l_col), (r_alias, r_col) in pairs)
+        # 逗号连接在 WHERE 中有关联条件时是普通的内连接
+        kind = "JOIN" if join.kind == "CROSS" and pairs else _join_kind(join)
+        return JoinAdvice(left, right, kind, keys, *(broadcast or (None, None)), tuple(skewed))
+
+    def _skew(self, side: Tuple[str, str], volume, limits: Dict) -> Optional[SkewedKey]:
+        alias, name = side
+        column = self._columns(volume).get(name)
+        rows = volume.row_count if volume is not None else None
+        if column is None or not rows:
+            return None
+        threshold = limits["skew_key_rows"]
+        if column.null_fraction and rows * column.null_fraction >= threshold:
+            return SkewedKey(alias, volume.table, name, "null", int(rows * column.null_fraction), column.null_fraction)
+        if column.top_fraction is not None:
+            hot_rows = int(rows * column.top_fraction)
+            if column.top_fraction >= limits["hot_fraction"] and hot_rows >= threshold:
+                return SkewedKey(alias, volume.table, name, "hot", hot_rows, column.top_fraction)
+        elif column.ndv and rows // column.ndv >= threshold:
+            return SkewedKey(alias, volume.table, name, "low_ndv", rows // column.ndv)
+        return None
+
+    def render(self, sql: Union[str, exp.Expression], thresholds: Optional[Dict] = None) -> str:
+        """
+        建议文本
+
+        Returns:
+            每个连接的建议；没有建议时为空字符串
+        """
+        skew_key_rows = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))["skew_key_rows"]
+        lines = []
+        for item in self.advise(sql, thresholds):
+            lines.append(f"- {item.label}:")
+            lines.extend(f"  - {suggestion}" for suggestion in item.suggestions(skew_key_rows))
+        return "\n".join(lines)
+
+
+_advisor_lock = threading.Lock()
+_join_advisor: Optional[JoinAdvisor] = None
+
+
+def get_join_advisor() -> JoinAdvisor:
+    """进程共享的连接策略建议，读取 METADATA_DB_PATH 中的统计"""
+    global _join_advisor
+    if _join_advisor is None:
+        with _advisor_lock:
+            if _join_advisor is None:
+                _join_advisor = JoinAdvisor(config.metadata_db_path)
+    return _join_advisor
+
+
+def set_join_advisor(advisor: Optional[JoinAdvisor]) -> Optional[JoinAdvisor]:
+    """替换进程共享的连接策略建议（None 表示下次使用时按配置重新创建），返回原来的实例"""
+    global _join_advisor
+    with _advisor_lock:
+        previous, _join_advisor = _join_advisor, advisor
+    return previous
@@ -0,0 +1,359 @@
+# join_paths.py
+"""
+表连接路径推荐：根据元数据为两张表找出最短的连接路径和连接条件。
+
+图中有两类边：
+    共同键      名称和类型都相同的键字段（*_id、*_key、*_code 等）。每个 (字段, 类型) 作为一个键节点，
+                表与其包含的键节点相连，避免热门键在表之间产生平方级的边；
+                越少表共享的键越具体，代价越低
+    字段级血缘  source_column -> target_column 给出不同名字段的连接条件；只采用两端都是键字段或
+                直接映射的血缘（指标加工的血缘不能作为连接条件），代价高于任何共同键
+最常连接的表（共享键最多的表）在加载时预先计算最短路径树，其余路径按需计算并缓存，
+元数据库更新后整体失效。
+"""
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .config import config
+from ..utils.sqlite_access import read_connection
+
+# 视为连接键的字段名后缀
+KEY_SUFFIXES = ("_id", "_key", "_code", "_no", "_sk")
+
+# 字段级血缘连接的代价在最宽泛的共同键之上再加的值
+LINEAGE_MARGIN = 0.05
+
+# 视为直接映射的血缘加工规则（不区分大小写）
+IDENTITY_TRANSFORMS = ("直接映射", "直接取值", "直接", "identity", "direct", "copy")
+
+_TYPE_ARGS_RE = re.compile(r"\(.*\)")
+
+
+class JoinStep(NamedTuple):
+    """路径中的一次连接：左表、右表、连接条件 [(左表字段, 右表字段)] 和依据（key/lineage）"""
+    left: str
+    right: str
+    conditions: Tuple[Tuple[str, str], ...]
+    via: str
+
+
+class ShortestPaths(NamedTuple):
+    """从一张表出发的最短路径：节点 -> 代价最低的 (节点, 连接次数) 状态，状态 -> (代价, 上一状态, 边信息)"""
+    best: Dict[int, Tuple[int, int]]
+    states: Dict[Tuple[int, int], Tuple[float, Optional[Tuple[int, int]], object]]
+
+
+class JoinPath(NamedTuple):
+    """两表之间的连接路径"""
+    tables: Tuple[str, ...]
+    steps: Tuple[JoinStep, ...]
+    cost: float
+
+    def to_sql(self) -> str:
+        """渲染为 FROM ... JOIN ... ON 片段，表别名依次为 t1、t2..."""
+        aliases = {table: f"t{i}" for i, table in enumerate(self.tables, 1)}
+        lines = [f"FROM {self.tables[0]} {aliases[self.tables[0]]}"]
+        for step in self.steps:
+            left, right = aliases[step.left], aliases[step.right]
+            on = " AND ".join(f"{left}.{lcol} = {right}.{rcol}" for lcol, rcol in step.conditions)
+            lines.append(f"JOIN {step.right} {right} ON {on}")
+        return "\n".join(lines)
+
+
+def is_key_column(name: str) -> bool:
+    """字段名是否像连接键"""
+    name = name.lower()
+    return name.endswith(KEY_SUFFIXES)
+
+
+def is_identity_transform(source_column: str, transform_rule: Optional[str]) -> bool:
+    """血缘的加工规则是否为直接映射：规则为直接映射的说法，或就是源字段本身"""
+    rule = (transform_rule or "").strip().lower()
+    return rule in IDENTITY_TRANSFORMS or rule.rsplit(".", 1)[-1].strip("`") == source_column.lower()
+
+
+def _normalize_type(data_type: Optional[str]) -> str:
+    return _TYPE_ARGS_RE.sub("", (data_type or "").lower()).strip()
+
+
+class JoinPathFinder:
+    """
+    从 metadata.db 懒加载的表连接图，文件更新后自动重新加载。
+    """
+
+    def __init__(self, metadata_db_path: str, hub_count: int = 20, max_joins: int = 4,
+                 cache_size: int = 4096, exclude_columns: Iterable[str] = ("dt", "date")):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            hub_count: 加载时预先计算最短路径树的表数量
+            max_joins: 路径中最多的连接次数
+            cache_size: 缓存的按需计算路径数量
+            exclude_columns: 不作为连接键的字段（如分区字段）
+        """
+        self.metadata_db_path = metadata_db_path
+        self.hub_count = hub_count
+        self.max_joins = max_joins
+        self.cache_size = cache_size
+        self.exclude_columns = {column.lower() for column in exclude_columns}
+        self._loaded_mtime: Optional[float] = None
+        self._tables: List[str] = []
+        self._table_ids: Dict[str, int] = {}
+        self._by_short_name: Dict[str, List[int]] = {}
+        # 表 -> [(相邻节点, 代价, 连接条件或键字段)]，键节点编号从 len(tables) 开始
+        self._adjacency: List[List[Tuple[int, float, object]]] = []
+        self._keys: List[str] = []
+        self._trees: Dict[int, "ShortestPaths"] = {}
+        self._cache: "OrderedDict[Tuple[int, int], Optional[JoinPath]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with read_connection(self.metadata_db_path) as conn:
+                columns = conn.execute(
+                    "SELECT table_schema, table_name, column_name, data_type FROM columns_meta").fetchall()
+                lineage = conn.execute(
+                    "SELECT source_table, target_table, source_column, target_column, transform_rule FROM table_lineage "
+                    "WHERE source_column IS NOT NULL AND target_column IS NOT NULL").fetchall()
+        except sqlite3.OperationalError:
+            # 元数据库尚未初始化
+            columns, lineage = [], []
+        self._build(columns, lineage)
+
+    def _build(self, columns: Iterable[Tuple], lineage: Iterable[Tuple]):
+        table_ids: Dict[str, int] = {}
+        key_members: Dict[Tuple[str, str], set] = {}
+        for schema, table, column, data_type in columns:
+            table_id = table_ids.setdefault(f"{schema}.{table}".lower(), len(table_ids))
+            column = column.lower()
+            if column in self.exclude_columns or not is_key_column(column):
+                continue
+            key_members.setdefault((column, _normalize_type(data_type)), set()).add(table_id)
+
+        lineage_pairs: Dict[Tuple[int, int], List[Tuple[str, str]]] = {}
+        for source_table, target_table, source_column, target_column, transform_rule in lineage:
+            # 指标加工（如 pay_amount -> total_amount）不是连接条件
+            if not (is_key_column(source_column) and is_key_column(target_column)) \
+                    and not is_identity_transform(source_column, transform_rule):
+                continue
+            src = table_ids.setdefault(source_table.lower(), len(table_ids))
+            dst = table_ids.setdefault(target_table.lower(), len(table_ids))
+            if src != dst:
+                condition = (source_column.lower(), target_column.lower())
+                pairs = lineage_pairs.setdefault((src, dst), [])
+                if condition not in pairs:
+                    pairs.append(condition)
+
+        n_tables = len(table_ids)
+        adjacency: List[List[Tuple[int, float, object]]] = [[] for _ in range(n_tables)]
+        keys: List[str] = []
+        for (column, _), members in key_members.items():
+            if len(members) < 2:
+                continue
+            key_node = n_tables + len(keys)
+            keys.append(column)
+            # 共享的表越多，键越宽泛，代价越高；一次连接的代价分摊在进出键节点的两条边上
+            half_cost = (1.0 + 0.1 * math.log2(len(members))) / 2
+            adjacency.append([(table_id, half_cost, column) for table_id in sorted(members)])
+            for table_id in members:
+                adjacency[table_id].append((key_node, half_cost, column))
+        # 血缘连接的代价高于所有表共享的键，有共同键时优先按共同键连接
+        lineage_cost = 1.0 + 0.1 * math.log2(max(n_tables, 2)) + LINEAGE_MARGIN
+        for (src, dst), pairs in lineage_pairs.items():
+            conditions = tuple(pairs)
+            adjacency[src].append((dst, lineage_cost, conditions))
+            adjacency[dst].append((src, lineage_cost, tuple((b, a) for a, b in conditions)))
+
+        tables = list(table_ids)
+        by_short_name: Dict[str, List[int]] = {}
+        for name, table_id in table_ids.items():
+            by_short_name.setdefault(name.split(".", 1)[-1], []).append(table_id)
+
+        self._tables, self._table_ids, self._by_short_name = tables, table_ids, by_short_name
+        self._adjacency, self._keys = adjacency, keys
+        self._cache.clear()
+        # 共享键最多的表最常参与连接，预先计算它们的最短路径树
+        hubs = sorted(range(n_tables), key=lambda t: (-len(adjacency[t]), tables[t]))[:self.hub_count]
+        self._trees = {hub: self._shortest_paths(hub) for hub in hubs if adjacency[hub]}
+
+    def _ensure_loaded(self):
+        mtime = os.path.getmtime(self.metadata_db_path) if os.path.exists(self.metadata_db_path) else None
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                if mtime is None:
+                    self._build([], [])
+                else:
+                    self._load()
+                self._loaded_mtime = mtime
+
+    def _shortest_paths(self, start: int, target: Optional[int] = None) -> "ShortestPaths":
+        """
+        连接次数不超过 max_joins 的最短路径：以 (节点, 已用连接次数) 为状态做 Dijkstra，
+        代价更低但连接次数更多的路径不会挤掉次数更少的路径；指定 target 时到达即停止
+
+        Returns:
+            各节点代价最低的状态，以及 状态 -> (代价, 上一状态, 边信息)
+        """
+        n_tables = len(self._tables)
+        origin = (start, 0)
+        states: Dict[Tuple[int, int], Tuple[float, Optional[Tuple[int, int]], object]] = {origin: (0.0, None, None)}
+        best: Dict[int, Tuple[int, int]] = {}
+        # 各节点已确定的状态中最少的连接次数，次数不更少的状态不必再展开
+        fewest_hops: Dict[int, int] = {}
+        heap = [(0.0, 0, start)]
+        while heap:
+            cost, hops, node = heapq.heappop(heap)
+            if fewest_hops.get(node, self.max_joins + 1) <= hops:
+                continue
+            fewest_hops[node] = hops
+            best.setdefault(node, (node, hops))
+            if node == target:
+                break
+            for neighbor, edge_cost, info in self._adjacency[node]:
+                # 经过键节点的两条边只算一次连接
+                next_hops = hops + (1 if neighbor < n_tables else 0)
+                if next_hops >= fewest_hops.get(neighbor, self.max_joins + 1):
+                    continue
+                state, next_cost = (neighbor, next_hops), cost + edge_cost
+                if state not in states or next_cost < states[state][0]:
+                    states[state] = (next_cost, (node, hops), info)
+                    heapq.heappush(heap, (next_cost, next_hops, neighbor))
+        return ShortestPaths(best, states)
+
+    def _resolve(self, table: str) -> Optional[int]:
+        table = table.lower()
+        if table in self._table_ids:
+            return self._table_ids[table]
+        candidates = self._by_short_name.get(table, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _path_from_tree(self, tree: "ShortestPaths", start: int, end: int) -> Optional[JoinPath]:
+        """从以 start 为起点的最短路径中取出到 end 的路径"""
+        if end not in tree.best:
+            return None
+        n_tables = len(self._tables)
+        state = tree.best[end]
+        cost = tree.states[state][0]
+        nodes = [end]
+        infos = []
+        while nodes[-1] != start:
+            _, state, info = tree.states[state]
+            infos.append(info)
+            nodes.append(state[0])
+        nodes.reverse()
+        infos.reverse()
+
+        tables = [nodes[0]]
+        steps = []
+        i = 0
+        while i < len(infos):
+            if nodes[i + 1] >= n_tables:
+                # 表 -> 键节点 -> 表
+                column = infos[i]
+                left, right = nodes[i], nodes[i + 2]
+                steps.append(JoinStep(self._tables[left], self._tables[right], ((column, column),), "key"))
+                tables.append(right)
+                i += 2
+            else:
+                left, right = nodes[i], nodes[i + 1]
+                steps.append(JoinStep(self._tables[left], self._tables[right], infos[i], "lineage"))
+                tables.append(right)
+                i += 1
+        return JoinPath(tuple(self._tables[t] for t in tables), tuple(steps), round(cost, 4))
+
+    def find_path(self, from_table: str, to_table: str) -> Optional[JoinPath]:
+        """
+        两表之间代价最低的连接路径
+
+        Args:
+            from_table: 起始表，可以是 "库.表" 或唯一的表名
+            to_table: 目标表
+
+        Returns:
+            连接路径；表不存在或在 max_joins 次连接内不可达时返回None
+        """
+        self._ensure_loaded()
+        start, end = self._resolve(from_table), self._resolve(to_table)
+        if start is None or end is None or start == end:
+            return None
+        if start in self._trees:
+            return self._path_from_tree(self._trees[start], start, end)
+        if end in self._trees:
+            path = self._path_from_tree(self._trees[end], end, start)
+            return self._reverse(path) if path else None
+
+        key = (start, end)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        path = self._path_from_tree(self._shortest_paths(start, end), start, end)
+        with self._lock:
+            self._cache[key] = path
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return path
+
+    @staticmethod
+    def _reverse(path: JoinPath) -> JoinPath:
+        steps = tuple(JoinStep(step.right, step.left, tuple((b, a) for a, b in step.conditions), step.via)
+                      for step in reversed(path.steps))
+        return JoinPath(tuple(reversed(path.tables)), steps, path.cost)
+
+    def join_hints(self, tables: Sequence[str]) -> List[JoinStep]:
+        """
+        为一组表给出连接建议：依次把每张表连到已连接的表中代价最低的一张
+
+        Args:
+            tables: 表名列表，按重要程度排序
+
+        Returns:
+            连接步骤，路径中途经的表也会出现在步骤里
+        """
+        steps: List[JoinStep] = []
+        connected: List[str] = []
+        seen = set()
+        for table in tables:
+            if not connected:
+                connected.append(table)
+                continue
+            paths = [path for path in (self.find_path(other, table) for other in connected) if path]
+            connected.append(table)
+            if not paths:
+                continue
+            for step in min(paths, key=lambda p: p.cost).steps:
+                pair = (step.left, step.right)
+                if pair not in seen:
+                    seen.add(pair)
+                    steps.append(step)
+        return steps
+
+
+_finder_lock = threading.Lock()
+_join_path_finder: Optional[JoinPathFinder] = None
+
+
+def get_join_path_finder() -> JoinPathFinder:
+    """进程共享的连接路径推荐器，从 METADATA_DB_PATH 加载"""
+    global _join_path_finder
+    if _join_path_finder is None:
+        with _finder_lock:
+            if _join_path_finder is None:
+                _join_path_finder = JoinPathFinder(config.metadata_db_path)
+    return _join_path_finder
+
+
+def set_join_path_finder(finder: Optional[JoinPathFinder]) -> Optional[JoinPathFinder]:
+    """替换进程共享的连接路径推荐器（None 表示下次使用时按配置重新创建），返回原来的推荐器"""
+    global _join_path_finder
+    with _finder_lock:
+        previous, _join_path_finder = _join_path_finder, finder
+    return previous
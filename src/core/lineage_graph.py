@@ -0,0 +1,306 @@
+# lineage_graph.py
+"""
+血缘关系图：把 table_lineage 加载为紧凑的邻接结构，回答上下游影响分析。
+
+表和字段（"表.字段"）分别驻留为整数编号，边按起点和终点各存一份 CSR 数组
+（indptr / 邻接点 / 边序号）。广度优先遍历按层向量化展开，每层一次 NumPy 切片拼接和去重；
+深度优先遍历用于按路径展示。遍历结果按 (层级, 方向, 起点, 深度, 顺序) 缓存，元数据库更新后整体失效。
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import config
+from ..utils.retrieval_index import gather_csr_rows
+from ..utils.sqlite_access import read_connection
+
+DIRECTIONS = ("upstream", "downstream")
+
+
+class LineageHop(NamedTuple):
+    """遍历到的节点：名称、距起点的层数、到达它的上一节点和该边的转换规则"""
+    node: str
+    depth: int
+    via: str
+    rule: str
+
+
+class _Graph:
+    """单一层级（表或字段）的有向图"""
+
+    def __init__(self, names: List[str], short_names: List[str], sources: Sequence[int], targets: Sequence[int],
+                 rules: Optional[List[str]] = None):
+        """
+        Args:
+            names: 节点名称，下标即节点编号
+            short_names: 不带库名的节点名称，只给表名时用于查找
+            sources: 各边的起点
+            targets: 各边的终点
+            rules: 各边的转换规则
+        """
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.by_short_name: Dict[str, List[int]] = {}
+        for i, short in enumerate(short_names):
+            if short != names[i]:
+                self.by_short_name.setdefault(short, []).append(i)
+        self.rules = rules
+        src = np.asarray(sources, dtype=np.int32)
+        dst = np.asarray(targets, dtype=np.int32)
+        self.edge_count = len(src)
+        self.csr = {
+            "downstream": self._csr(src, dst, len(names)),
+            "upstream": self._csr(dst, src, len(names)),
+        }
+
+    @staticmethod
+    def _csr(src: np.ndarray, dst: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        order = np.argsort(src, kind="stable")
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n)))).astype(np.int64)
+        return indptr, dst[order], order.astype(np.int32)
+
+    def resolve(self, name: str) -> List[int]:
+        """按全名查找节点，找不到时按不带库名的名称查找（可能对应多个库中的同名表）"""
+        name = name.lower()
+        if name in self.ids:
+            return [self.ids[name]]
+        return self.by_short_name.get(name, [])
+
+    def bfs(self, starts: np.ndarray, direction: str, max_depth: Optional[int]) -> List[LineageHop]:
+        """按层展开，结果按层数、名称排序，每个节点只记录最短路径上的上一节点"""
+        indptr, neighbors, edges = self.csr[direction]
+        n = len(self.names)
+        depth_of = np.full(n, -1, dtype=np.int32)
+        parent = np.full(n, -1, dtype=np.int32)
+        via_edge = np.full(n, -1, dtype=np.int32)
+        depth_of[starts] = 0
+        frontier = starts
+        depth = 0
+        while frontier.size and (max_depth is None or depth < max_depth):
+            positions, lengths = gather_csr_rows(indptr, frontier)
+            fresh = depth_of[neighbors[positions]] < 0
+            if not fresh.any():
+                break
+            positions = positions[fresh]
+            origins = np.repeat(frontier, lengths)[fresh]
+            reached, first = np.unique(neighbors[positions], return_index=True)
+            depth += 1
+            depth_of[reached] = depth
+            parent[reached] = origins[first]
+            via_edge[reached] = edges[positions[first]]
+            frontier = reached
+
+        hops = [self._hop(int(i), int(depth_of[i]), int(parent[i]), int(via_edge[i]))
+                for i in np.nonzero(depth_of > 0)[0]]
+        hops.sort(key=lambda hop: (hop.depth, hop.node))
+        return hops
+
+    def dfs(self, starts: np.ndarray, direction: str, max_depth: Optional[int]) -> List[LineageHop]:
+        """深度优先的先序结果，便于按路径逐级展示"""
+        indptr, neighbors, edges = self.csr[direction]
+        visited = {int(i) for i in starts}
+        hops: List[LineageHop] = []
+        stack = [(int(i), 0, -1, -1) for i in reversed(starts)]
+        while stack:
+            node, depth, parent, edge = stack.pop()
+            if depth > 0:
+                if node in visited:
+                    continue
+                visited.add(node)
+                hops.append(self._hop(node, depth, parent, edge))
+            if max_depth is not None and depth >= max_depth:
+                continue
+            children = sorted(range(indptr[node], indptr[node + 1]), key=lambda p: self.names[neighbors[p]],
+                              reverse=True)
+            for position in children:
+                child = int(neighbors[position])
+                if child not in visited:
+                    stack.append((child, depth + 1, node, int(edges[position])))
+        return hops
+
+    def _hop(self, node: int, depth: int, parent: int, edge: int) -> LineageHop:
+        rule = self.rules[edge] if self.rules is not None and edge >= 0 else ""
+        return LineageHop(self.names[node], depth, self.names[parent] if parent >= 0 else "", rule or "")
+
+
+def _short_table(name: str) -> str:
+    return name.split(".", 1)[1] if "." in name else name
+
+
+class LineageGraph:
+    """
+    从 metadata.db 懒加载的血缘关系图，文件更新后自动重新加载。
+
+    source_table -> target_table 为数据流向：下游是依赖该表的表，上游是该表的数据来源。
+    字段级血缘只使用 source_column 和 target_column 都不为空的记录，节点名为 "表.字段"。
+    """
+
+    def __init__(self, metadata_db_path: str, cache_size: int = 4096):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            cache_size: 缓存的遍历结果数量
+        """
+        self.metadata_db_path = metadata_db_path
+        self.cache_size = cache_size
+        self._loaded_mtime: Optional[float] = None
+        self._tables = _Graph([], [], [], [])
+        self._columns = _Graph([], [], [], [], [])
+        self._cache: "OrderedDict[Tuple, List[LineageHop]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with read_connection(self.metadata_db_path) as conn:
+                rows = conn.execute("SELECT source_table, target_table, source_column, target_column, transform_rule "
+                                    "FROM table_lineage").fetchall()
+        except sqlite3.OperationalError:
+            # 元数据库尚未初始化
+            rows = []
+        self._build(rows)
+
+    def _build(self, rows: Iterable[Tuple]):
+        table_ids: Dict[str, int] = {}
+        column_ids: Dict[str, int] = {}
+        column_short: List[str] = []
+        table_edges = set()
+        column_src, column_dst, column_rules = [], [], []
+        for source_table, target_table, source_column, target_column, rule in rows:
+            source_table, target_table = source_table.lower(), target_table.lower()
+            src = table_ids.setdefault(source_table, len(table_ids))
+            dst = table_ids.setdefault(target_table, len(table_ids))
+            if src != dst:
+                table_edges.add((src, dst))
+            if source_column and target_column:
+                ends = []
+                for table, column in ((source_table, source_column.lower()), (target_table, target_column.lower())):
+                    name = f"{table}.{column}"
+                    if name not in column_ids:
+                        column_ids[name] = len(column_ids)
+                        column_short.append(f"{_short_table(table)}.{column}")
+                    ends.append(column_ids[name])
+                column_src.append(ends[0])
+                column_dst.append(ends[1])
+                column_rules.append(rule or "")
+
+        table_names = list(table_ids)
+        edges = sorted(table_edges)
+        self._tables = _Graph(table_names, [_short_table(name) for name in table_names],
+                              [e[0] for e in edges], [e[1] for e in edges])
+        self._columns = _Graph(list(column_ids), column_short, column_src, column_dst, column_rules)
+        self._cache.clear()
+
+    def _ensure_loaded(self):
+        mtime = os.path.getmtime(self.metadata_db_path) if os.path.exists(self.metadata_db_path) else None
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                if mtime is None:
+                    self._build([])
+                else:
+                    self._load()
+                self._loaded_mtime = mtime
+
+    def stats(self) -> Dict[str, int]:
+        """表和字段的节点数、边数"""
+        self._ensure_loaded()
+        return {'tables': len(self._tables.names), 'table_edges': self._tables.edge_count,
+                'columns': len(self._columns.names), 'column_edges': self._columns.edge_count}
+
+    def resolve(self, table: str, column: Optional[str] = None) -> List[str]:
+        """
+        查找血缘图中的表或字段节点
+
+        Args:
+            table: 表名，可以是 "库.表" 或只有表名
+            column: 字段名，为空时查找表
+
+        Returns:
+            匹配的节点名称，只给表名且多个库中有同名表时返回多个
+        """
+        self._ensure_loaded()
+        graph = self._columns if column else self._tables
+        name = f"{table}.{column}" if column else table
+        return [graph.names[i] for i in graph.resolve(name)]
+
+    def traverse(self, table: str, direction: str = "downstream", column: Optional[str] = None,
+                 max_depth: Optional[int] = None, order: str = "bfs") -> List[LineageHop]:
+        """
+        上下游遍历
+
+        Args:
+            table: 起点表名，可以是 "库.表" 或只有表名
+            direction: "upstream"（数据来源）或 "downstream"（受影响的下游）
+            column: 起点字段，指定时按字段级血缘遍历
+            max_depth: 最大层数，None表示不限
+            order: "bfs" 按层数排序，"dfs" 按路径先序排列
+
+        Returns:
+            遍历到的节点（不含起点）
+
+        Raises:
+            ValueError: direction 或 order 不合法时
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"不支持的遍历方向: {direction}")
+        if order not in ("bfs", "dfs"):
+            raise ValueError(f"不支持的遍历顺序: {order}")
+        self._ensure_loaded()
+        graph = self._columns if column else self._tables
+        starts = tuple(sorted(graph.resolve(f"{table}.{column}" if column else table)))
+        if not starts:
+            return []
+
+        key = (bool(column), direction, starts, max_depth, order)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        start_array = np.array(starts, dtype=np.int32)
+        if order == "bfs":
+            hops = graph.bfs(start_array, direction, max_depth)
+        else:
+            hops = graph.dfs(start_array, direction, max_depth)
+        with self._lock:
+            self._cache[key] = hops
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return hops
+
+    def upstream(self, table: str, column: Optional[str] = None, max_depth: Optional[int] = None,
+                 order: str = "bfs") -> List[LineageHop]:
+        """表或字段的数据来源"""
+        return self.traverse(table, "upstream", column, max_depth, order)
+
+    def downstream(self, table: str, column: Optional[str] = None, max_depth: Optional[int] = None,
+                   order: str = "bfs") -> List[LineageHop]:
+        """依赖表或字段的下游（表延迟或变更时受影响的范围）"""
+        return self.traverse(table, "downstream", column, max_depth, order)
+
+
+_graph_lock = threading.Lock()
+_lineage_graph: Optional[LineageGraph] = None
+
+
+def get_lineage_graph() -> LineageGraph:
+    """进程共享的血缘关系图，从 METADATA_DB_PATH 加载"""
+    global _lineage_graph
+    if _lineage_graph is None:
+        with _graph_lock:
+            if _lineage_graph is None:
+                _lineage_graph = LineageGraph(config.metadata_db_path)
+    return _lineage_graph
+
+
+def set_lineage_graph(graph: Optional[LineageGraph]) -> Optional[LineageGraph]:
+    """替换进程共享的血缘关系图（None 表示下次使用时按配置重新创建），返回原来的图"""
+    global _lineage_graph
+    with _graph_lock:
+        previous, _lineage_graph = _lineage_graph, graph
+    return previous
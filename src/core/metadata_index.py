@@ -0,0 +1,196 @@
+# metadata_index.py
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .config import config
+from ..utils.metadata_snapshot import SnapshotIndex
+from ..utils.sqlite_access import read_connection
+
+
+class ColumnMeta:
+    """字段元数据"""
+    __slots__ = ("name", "data_type", "comment", "ordinal")
+
+    def __init__(self, name: str, data_type: str, comment: str, ordinal: int):
+        self.name = name
+        self.data_type = data_type
+        self.comment = comment
+        self.ordinal = ordinal
+
+
+class TableMeta:
+    """表元数据，字段按小写名称索引"""
+    __slots__ = ("source", "schema", "name", "comment", "columns", "partition_keys")
+
+    def __init__(self, source: str, schema: str, name: str, comment: str):
+        self.source = source
+        self.schema = schema
+        self.name = name
+        self.comment = comment
+        self.columns: Dict[str, ColumnMeta] = {}
+        self.partition_keys: Tuple[str, ...] = ()
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+
+def _intern(value: Optional[str]) -> str:
+    """元数据中大量重复的库名、类型名等字符串只保留一份"""
+    return sys.intern(value or "")
+
+
+class MetadataIndex:
+    """
+    从 metadata.db 懒加载的进程内元数据索引，文件更新后自动重新加载。
+
+    表按 "库.表" 和表名两种键索引，字段按表内小写名称索引，查询都是常数时间，
+    规范检查和智能体的热路径上不再访问SQLite。
+    """
+
+    def __init__(self, metadata_db_path: str, partition_fields: Iterable[str] = ("dt", "date")):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            partition_fields: 视为分区键的字段名
+        """
+        self.metadata_db_path = metadata_db_path
+        self.partition_fields = tuple(field.lower() for field in partition_fields)
+        self._loaded_mtime: Optional[float] = None
+        self._by_full_name: Dict[str, TableMeta] = {}
+        self._by_name: Dict[str, List[TableMeta]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        tables: Dict[Tuple[str, str, str], TableMeta] = {}
+        try:
+            with read_connection(self.metadata_db_path) as conn:
+                for source, schema, name, comment in conn.execute(
+                        "SELECT source, table_schema, table_name, table_comment FROM tables_meta"):
+                    key = (source, schema.lower(), name.lower())
+                    tables[key] = TableMeta(_intern(source), _intern(schema), _intern(name), comment or "")
+                for source, schema, name, column, data_type, comment in conn.execute(
+                        "SELECT source, table_schema, table_name, column_name, data_type, column_comment "
+                        "FROM columns_meta ORDER BY source, table_schema, table_name, id"):
+                    key = (source, schema.lower(), name.lower())
+                    table = tables.get(key)
+                    if table is None:
+                        table = tables[key] = TableMeta(_intern(source), _intern(schema), _intern(name), "")
+                    table.columns[_intern(column.lower())] = ColumnMeta(
+                        _intern(column), _intern(data_type), comment or "", len(table.columns))
+        except sqlite3.OperationalError:
+            # 元数据库尚未初始化
+            tables = {}
+
+        by_full_name: Dict[str, TableMeta] = {}
+        by_name: Dict[str, List[TableMeta]] = {}
+        for table in tables.values():
+            table.partition_keys = tuple(column.name for key, column in table.columns.items()
+                                         if key in self.partition_fields)
+            # 多个数据源存在同名表时保留先加载的一个
+            by_full_name.setdefault(table.full_name.lower(), table)
+            by_name.setdefault(table.name.lower(), []).append(table)
+
+        self._by_full_name = by_full_name
+        self._by_name = by_name
+
+    def _ensure_loaded(self):
+        mtime = os.path.getmtime(self.metadata_db_path) if os.path.exists(self.metadata_db_path) else None
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                if mtime is None:
+                    self._by_full_name, self._by_name = {}, {}
+                else:
+                    self._load()
+                self._loaded_mtime = mtime
+
+    def is_empty(self) -> bool:
+        """没有任何表元数据（未同步或数据库不存在）"""
+        self._ensure_loaded()
+        return not self._by_full_name
+
+    def table_count(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_full_name)
+
+    def get_table(self, table: str, schema: Optional[str] = None) -> Optional[TableMeta]:
+        """
+        查找表
+
+        Args:
+            table: 表名，可以是 "库.表" 形式
+            schema: 库名，table 不含库名时可单独指定
+
+        Returns:
+            表元数据；不存在，或只给表名而多个库中都有同名表时返回None
+        """
+        self._ensure_loaded()
+        if schema is None and "." in table:
+            schema, table = table.rsplit(".", 1)
+        if schema:
+            return self._by_full_name.get(f"{schema}.{table}".lower())
+        candidates = self._by_name.get(table.lower(), [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def has_table(self, table: str, schema: Optional[str] = None) -> bool:
+        """表是否存在（只给表名时，任意库中存在即可）"""
+        self._ensure_loaded()
+        if schema is None and "." not in table:
+            return table.lower() in self._by_name
+        return self.get_table(table, schema) is not None
+
+    def columns(self, table: str, schema: Optional[str] = None) -> List[ColumnMeta]:
+        """表的字段列表（按字段顺序），表不存在时返回空列表"""
+        meta = self.get_table(table, schema)
+        return list(meta.columns.values()) if meta else []
+
+    def column(self, table: str, column: str, schema: Optional[str] = None) -> Optional[ColumnMeta]:
+        """查找字段的类型和注释"""
+        meta = self.get_table(table, schema)
+        return meta.columns.get(column.lower()) if meta else None
+
+    def partition_keys(self, table: str, schema: Optional[str] = None) -> Tuple[str, ...]:
+        """表的分区键"""
+        meta = self.get_table(table, schema)
+        return meta.partition_keys if meta else ()
+
+    def table_names(self) -> List[str]:
+        """所有表的 "库.表" 名称"""
+        self._ensure_loaded()
+        return [table.full_name for table in self._by_full_name.values()]
+
+
+# 两种实现的查询接口相同
+MetadataLookup = Union[MetadataIndex, SnapshotIndex]
+
+_index_lock = threading.Lock()
+_metadata_index: Optional[MetadataLookup] = None
+
+
+def get_metadata_index(partition_fields: Iterable[str] = ("dt", "date")) -> MetadataLookup:
+    """
+    进程共享的元数据索引：METADATA_SNAPSHOT_PATH 快照存在时 mmap 共享快照，
+    否则从 METADATA_DB_PATH 加载到内存
+    """
+    global _metadata_index
+    if _metadata_index is None:
+        with _index_lock:
+            if _metadata_index is None:
+                if os.path.exists(config.metadata_snapshot_path):
+                    _metadata_index = SnapshotIndex(config.metadata_snapshot_path, partition_fields)
+                else:
+                    _metadata_index = MetadataIndex(config.metadata_db_path, partition_fields)
+    return _metadata_index
+
+
+def set_metadata_index(index: Optional[MetadataLookup]) -> Optional[MetadataLookup]:
+    """替换进程共享的元数据索引（None 表示下次使用时按配置重新创建），返回原来的索引"""
+    global _metadata_index
+    with _index_lock:
+        previous, _metadata_index = _metadata_index, index
+    return previous
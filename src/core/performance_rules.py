@@ -0,0 +1,169 @@
+# performance_rules.py
+"""
+Hive 性能规则包：对分区字段使用函数、笛卡尔积、ORDER BY 不带 LIMIT、大表 COUNT(DISTINCT)、
+可以用 UNION ALL 的 UNION，以及连接数/子查询数过多。所有规则在一次语法树遍历中完成。
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from sqlglot import exp
+
+# 规则配置键及默认编号
+PERFORMANCE_RULES = {
+    "partition_column_function": "R102",
+    "join_conditions": "R401",
+    "query_complexity": "R501",
+    "order_by_limit": "R502",
+    "count_distinct": "R503",
+    "union_distinct": "R504",
+}
+
+DEFAULT_MESSAGES = {
+    "partition_column_function": "不要对分区字段使用函数，否则无法分区裁剪",
+    "join_conditions": "JOIN语句应该包含明确的连接条件，避免笛卡尔积",
+    "query_complexity": "查询复杂度过高，建议简化",
+    "order_by_limit": "ORDER BY 会在单个Reducer上全局排序，必须带 LIMIT",
+    "count_distinct": "大表上的 COUNT(DISTINCT) 只用一个Reducer去重，建议改为先 GROUP BY 再 COUNT",
+    "union_distinct": "UNION 会对结果整体去重，结果不会重复时使用 UNION ALL",
+}
+
+
+def _qualifiers(node: exp.Expression) -> Set[str]:
+    """表达式中字段的表限定名，不带限定名的字段记为空字符串"""
+    return {column.table.lower() for column in node.find_all(exp.Column)}
+
+
+def _links(condition: Optional[exp.Expression], alias: str) -> bool:
+    """条件中是否有把 alias 与其他表关联起来的等值条件"""
+    if condition is None:
+        return False
+    for eq in condition.find_all(exp.EQ, exp.NullSafeEQ):
+        left, right = _qualifiers(eq.left), _qualifiers(eq.right)
+        if not left or not right:
+            continue
+        if "" in left or "" in right:
+            # 不带限定名的字段无法判断来源，按已关联处理
+            return True
+        if (alias in left and right - {alias}) or (alias in right and left - {alias}):
+            return True
+    return False
+
+
+def _single_row(source: exp.Expression) -> bool:
+    """只返回一行的子查询（没有 GROUP BY 的聚合），与它做笛卡尔积不会放大数据量"""
+    query = source.this if isinstance(source, exp.Subquery) else None
+    return (isinstance(query, exp.Select) and not query.args.get("group")
+            and all(isinstance(item.unalias(), (exp.AggFunc, exp.Literal)) for item in query.expressions))
+
+
+def _partition_function(column: exp.Column) -> Optional[exp.Func]:
+    """WHERE 或 JOIN ON 中包住分区字段的最外层函数（CAST 不影响裁剪，不算）"""
+    func = None
+    in_condition = True
+    node = column.parent
+    while node is not None:
+        if isinstance(node, (exp.Where, exp.Join)):
+            return func
+        if isinstance(node, (exp.Select, exp.Subquery, exp.Window)):
+            return None
+        if isinstance(node, exp.Connector):
+            # AND/OR 在 sqlglot 中也是 Func，到这里单个条件已经结束
+            in_condition = False
+        elif in_condition and isinstance(node, exp.Func) and not isinstance(node, exp.Cast):
+            func = node
+        node = node.parent
+    return None
+
+
+def _source_tables(select: Optional[exp.Select]) -> List[exp.Table]:
+    """SELECT 直接读取的表"""
+    if select is None:
+        return []
+    sources = []
+    from_ = select.args.get("from_")
+    if from_ is not None:
+        sources.append(from_.this)
+    sources.extend(join.this for join in select.args.get("joins") or [])
+    return [source for source in sources if isinstance(source, exp.Table)]
+
+
+def check_performance(parsed_sql: exp.Expression, rules_config: Dict[str, Dict], partition_fields: Sequence[str],
+                      table_rows: Optional[Callable[[str], Optional[int]]] = None) -> List[str]:
+    """
+    一次遍历检查所有启用的性能规则
+
+    Args:
+        parsed_sql: 解析后的SQL
+        rules_config: sql_rules.toml 中的 [rules] 配置
+        partition_fields: 分区字段名
+        table_rows: 按 "库.表" 或表名查询行数的函数，用于判断大表；没有统计时不检查 COUNT(DISTINCT)
+
+    Returns:
+        问题列表
+    """
+    enabled = {name for name in PERFORMANCE_RULES if rules_config.get(name, {}).get("enabled", True)}
+    if not enabled:
+        return []
+
+    def report(name: str, detail: str):
+        rule_config = rules_config.get(name, {})
+        level = rule_config.get("level", "warning")
+        message = rule_config.get("description", DEFAULT_MESSAGES[name])
+        issues.append(f"[{level.capitalize()}-{rule_config.get('id', PERFORMANCE_RULES[name])}] {message}：{detail}")
+
+    issues: List[str] = []
+    partition_fields = {field.lower() for field in partition_fields}
+    large_rows = rules_config.get("count_distinct", {}).get("large_table_rows", 10_000_000)
+    joins = subqueries = 0
+    table_names: List[str] = []
+    cte_names: Set[str] = set()
+    reported: Set[str] = set()
+
+    for node in parsed_sql.walk():
+        if isinstance(node, exp.Column):
+            if "partition_column_function" in enabled and node.name.lower() in partition_fields:
+                func = _partition_function(node)
+                if func is not None and func.sql() not in reported:
+                    reported.add(func.sql())
+                    report("partition_column_function", f"{func.sql(dialect='hive')}")
+        elif isinstance(node, exp.Join):
+            joins += 1
+            if "join_conditions" in enabled and not node.args.get("using"):
+                alias = node.this.alias_or_name.lower()
+                select = node.parent if isinstance(node.parent, exp.Select) else None
+                where = select.args.get("where") if select is not None else None
+                if not (_links(node.args.get("on"), alias) or _links(where, alias) or _single_row(node.this)):
+                    report("join_conditions", f"与 {node.this.alias_or_name} 的连接没有关联两张表的等值条件")
+        elif isinstance(node, exp.Subquery):
+            subqueries += 1
+        elif isinstance(node, exp.Table):
+            if node.name:
+                table_names.append(node.name.lower())
+        elif isinstance(node, exp.CTE):
+            cte_names.add(node.alias_or_name.lower())
+        elif isinstance(node, exp.Order):
+            if ("order_by_limit" in enabled and isinstance(node.parent, (exp.Select, exp.Union))
+                    and not node.parent.args.get("limit")):
+                report("order_by_limit", node.sql(dialect="hive"))
+        elif isinstance(node, exp.Count):
+            if "count_distinct" in enabled and table_rows is not None and isinstance(node.this, exp.Distinct):
+                for table in _source_tables(node.find_ancestor(exp.Select)):
+                    name = f"{table.db}.{table.name}" if table.db else table.name
+                    rows = table_rows(name)
+                    if rows is not None and rows >= large_rows:
+                        report("count_distinct", f"{node.sql(dialect='hive')}（{name} 约 {rows:,} 行）")
+                        break
+        elif isinstance(node, exp.Union):
+            if "union_distinct" in enabled and node.args.get("distinct"):
+                report("union_distinct", "UNION 改为 UNION ALL")
+
+    if "query_complexity" in enabled:
+        rule_config = rules_config.get("query_complexity", {})
+        tables = sum(1 for name in table_names if name not in cte_names)
+        exceeded = [f"{label} {count} 个（上限 {limit}）" for label, count, limit in (
+            ("连接", joins, rule_config.get("max_joins", 5)),
+            ("子查询", subqueries, rule_config.get("max_subqueries", 3)),
+            ("表", tables, rule_config.get("max_tables", 10)),
+        ) if count > limit]
+        if exceeded:
+            report("query_complexity", "，".join(exceeded))
+    return issues
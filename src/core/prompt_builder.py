@@ -0,0 +1,297 @@
+# prompt_builder.py
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .join_paths import JoinPathFinder
+from .rate_limiter import estimate_tokens
+from .server import RULES_CONFIG
+from ..utils.retrieval_index import RetrievalIndex, document_fields
+from ..utils.sqlite_access import read_connection
+
+# 固定的角色与约定说明，作为所有请求共享的稳定前缀
+BASE_SYSTEM_PROMPT = """你是一个专业的数据分析SQL助手，专门帮助业务分析师编写高效、规范的SQL查询。
+
+你的工作流程：
+1. 理解用户的业务需求
+2. 生成符合大数据开发规范的SQL代码
+3. 自动对生成的SQL进行规范检查
+4. 根据检查结果优化SQL，并向用户解释修改原因
+
+重要规范：
+- 禁止使用 SELECT *
+- 必须指定分区字段 dt 的过滤条件
+- 表必须使用别名
+- 字段别名使用下划线命名法
+- 注意敏感字段的访问权限
+
+生成SQL时请遵循以下约定：
+- 使用Hive SQL语法
+- 表名格式：ods_*, dwd_*, dws_*, app_*
+- 分区字段使用 dt，格式为 'yyyy-MM-dd'
+- 字段命名使用蛇形命名法（snake_case）
+- 只使用“可用表结构”中列出的表和字段，不要臆造表名或字段名
+
+请用中文与用户交流，生成的SQL代码要可以直接执行。"""
+
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def extract_terms(text: str) -> List[str]:
+    """
+    把文本切分为检索词：英文/数字按单词（含蛇形命名拆分），中文按二元组
+
+    Args:
+        text: 文本
+
+    Returns:
+        检索词列表
+    """
+    if not text:
+        return []
+    text = text.lower()
+    terms = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class _TableEntry:
+    """表结构条目"""
+    __slots__ = ("schema", "name", "comment", "columns")
+
+    def __init__(self, schema: str, name: str, comment: Optional[str]):
+        self.schema = schema
+        self.name = name
+        self.comment = comment or ""
+        self.columns: List[Tuple[str, str, str]] = []
+
+
+class SchemaCatalog:
+    """
+    从 metadata.db 懒加载的表结构目录，文件更新后自动重新加载。
+
+    表的相关度由字符 n-gram TF-IDF 检索索引计算；同步时生成的索引文件存在时直接加载，
+    只对内容有变化的表重新计算。
+    """
+
+    def __init__(self, metadata_db_path: str, retrieval_index_path: Optional[str] = None):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            retrieval_index_path: 检索索引文件路径，默认与数据库同名、扩展名为 .retrieval.npz
+        """
+        self.metadata_db_path = metadata_db_path
+        self.retrieval_index_path = (retrieval_index_path
+                                     or os.path.splitext(metadata_db_path)[0] + ".retrieval.npz")
+        self._loaded_mtime: Optional[float] = None
+        self._tables: Dict[Tuple[str, str, str], _TableEntry] = {}
+        self._index = RetrievalIndex(self.retrieval_index_path)
+        self._index_loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        tables: Dict[Tuple[str, str, str], _TableEntry] = {}
+        try:
+            with read_connection(self.metadata_db_path) as conn:
+                for source, schema, name, comment in conn.execute(
+                        "SELECT source, table_schema, table_name, table_comment FROM tables_meta"):
+                    tables[(source, schema, name)] = _TableEntry(schema, name, comment)
+                for source, schema, name, column, data_type, comment in conn.execute(
+                        "SELECT source, table_schema, table_name, column_name, data_type, column_comment "
+                        "FROM columns_meta ORDER BY source, table_schema, table_name, id"):
+                    entry = tables.get((source, schema, name))
+                    if entry is None:
+                        entry = tables[(source, schema, name)] = _TableEntry(schema, name, None)
+                    entry.columns.append((column, data_type or "", comment or ""))
+        except sqlite3.OperationalError:
+            # 元数据库尚未初始化
+            tables = {}
+
+        if not self._index_loaded:
+            self._index.load()
+            self._index_loaded = True
+        stats = self._index.update([
+            (key, document_fields(entry.name, entry.comment, [(column, comment) for column, _, comment in entry.columns]))
+            for key, entry in tables.items()
+        ])
+        if stats['rebuilt'] or stats['removed']:
+            try:
+                self._index.save()
+            except OSError:
+                # 索引文件不可写时只在内存中使用
+                pass
+        self._tables = tables
+
+    def _ensure_loaded(self):
+        mtime = os.path.getmtime(self.metadata_db_path) if os.path.exists(self.metadata_db_path) else None
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                if mtime is None:
+                    self._tables = {}
+                    self._index.update([])
+                else:
+                    self._load()
+                self._loaded_mtime = mtime
+
+    def rank_tables(self, user_request: str, limit: int = 20) -> List[Tuple[_TableEntry, float]]:
+        """
+        按与需求的相关度对表排序
+
+        Args:
+            user_request: 用户需求
+            limit: 最多返回的表数量
+
+        Returns:
+            (表条目, 得分) 列表
+        """
+        self._ensure_loaded()
+        return [(self._tables[key], score) for key, score in self._index.search(user_request, limit)]
+
+
+class PromptBuilder:
+    """
+    构建发给LLM的消息：稳定前缀（角色、约定、规则）在前，按需选择的表结构在最后，
+    便于服务端前缀缓存命中
+    """
+
+    def __init__(self, metadata_db_path: str, schema_token_budget: int = 1500,
+                 retrieval_index_path: Optional[str] = None, join_finder: Optional[JoinPathFinder] = None):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            schema_token_budget: 表结构部分的token预算
+            retrieval_index_path: 表结构检索索引文件路径
+            join_finder: 表连接路径推荐器，默认从同一元数据库加载
+        """
+        self.catalog = SchemaCatalog(metadata_db_path, retrieval_index_path)
+        self.join_finder = join_finder or JoinPathFinder(metadata_db_path)
+        self.schema_token_budget = schema_token_budget
+        self._system_prompt: Optional[str] = None
+
+    def system_prompt(self) -> str:
+        """稳定前缀：基础约定加上已启用的规范检查规则，进程内保持不变"""
+        if self._system_prompt is None:
+            lines = [BASE_SYSTEM_PROMPT, "", "规范检查规则："]
+            for name, rule in sorted(RULES_CONFIG.get("rules", {}).items(), key=lambda item: item[1].get("id", item[0])):
+                if rule.get("enabled", True) and rule.get("description"):
+                    lines.append(f"- [{rule.get('id', name)}] {rule['description']}")
+            self._system_prompt = "\n".join(lines)
+        return self._system_prompt
+
+    def _partition_fields(self) -> List[str]:
+        rule = RULES_CONFIG.get("rules", {}).get("partition_filter", {})
+        return rule.get("partition_fields", ["dt", "date"])
+
+    def _render_table(self, entry: _TableEntry, request_terms: set, budget: int) -> Optional[str]:
+        """渲染单个表结构，预算不足时优先保留分区字段和与需求相关的字段，一个字段都放不下时返回None"""
+        header = f"表 {entry.schema}.{entry.name}" + (f" -- {entry.comment}" if entry.comment else "")
+        partition_fields = set(self._partition_fields())
+
+        def priority(column):
+            name, _, comment = column
+            if name in partition_fields:
+                return 0
+            if request_terms & set(extract_terms(name) + extract_terms(comment)):
+                return 1
+            return 2
+
+        lines = [header]
+        used = estimate_tokens(header)
+        # 为截断标记预留预算
+        limit = budget - estimate_tokens("\n  ...")
+        if used > limit:
+            return None
+        for name, data_type, comment in sorted(entry.columns, key=priority):
+            line = f"  {name} {data_type}" + (f" -- {comment}" if comment else "")
+            cost = estimate_tokens("\n" + line)
+            if used + cost > limit:
+                if len(lines) == 1:
+                    return None
+                lines.append("  ...")
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    def schema_context(self, user_request: str) -> str:
+        """
+        在token预算内选择与需求相关的表结构
+
+        Args:
+            user_request: 用户需求
+
+        Returns:
+            表结构说明文本，没有可用元数据时返回空字符串
+        """
+        request_terms = set(extract_terms(user_request))
+        blocks = []
+        selected = []
+        remaining = self.schema_token_budget
+        for entry, _ in self.catalog.rank_tables(user_request):
+            block = self._render_table(entry, request_terms, remaining)
+            if block is None:
+                # 预算已不足以容纳下一个表
+                break
+            blocks.append(block)
+            selected.append(f"{entry.schema}.{entry.name}")
+            remaining -= estimate_tokens("\n\n" + block)
+
+        hints = self._render_join_hints(selected, remaining)
+        if hints:
+            blocks.append(hints)
+        return "\n\n".join(blocks)
+
+    def _render_join_hints(self, tables: List[str], budget: int) -> Optional[str]:
+        """所选表之间的推荐连接条件，超出预算的部分不输出"""
+        if len(tables) < 2:
+            return None
+        lines = ["表连接建议："]
+        used = estimate_tokens(lines[0])
+        for step in self.join_finder.join_hints(tables):
+            on = " AND ".join(f"{step.left}.{lcol} = {step.right}.{rcol}" for lcol, rcol in step.conditions)
+            line = f"  {on}"
+            cost = estimate_tokens("\n" + line)
+            if used + cost > budget - estimate_tokens("\n\n"):
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines) if len(lines) > 1 else None
+
+    @staticmethod
+    def _with_schema(text: str, schema_context: str) -> str:
+        """把表结构放在消息末尾"""
+        if not schema_context:
+            return text + "\n\n可用表结构：暂无元数据，请按命名约定选择表和字段。"
+        return text + "\n\n可用表结构：\n" + schema_context
+
+    def generation_messages(self, user_request: str, schema_context: str) -> List[Dict]:
+        """生成初始SQL的消息"""
+        content = ("请根据以下业务需求生成Hive SQL查询。"
+                   "请只返回SQL代码，不要额外的解释或标记。确保SQL符合规范且可以直接执行。\n\n"
+                   f"业务需求：{user_request}")
+        return [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": self._with_schema(content, schema_context)},
+        ]
+
+    def repair_messages(self, user_request: str, original_sql: str, lint_feedback: str,
+                        schema_context: str) -> List[Dict]:
+        """根据规范检查反馈修复SQL的消息"""
+        content = ("请根据规范检查反馈优化原始SQL代码，解决所有错误和警告问题。"
+                   "请只返回优化后的SQL代码，不要额外的解释或标记。\n\n"
+                   f"原始业务需求：{user_request}\n\n"
+                   f"原始SQL代码：\n```sql\n{original_sql}\n```\n\n"
+                   f"规范检查反馈：\n{lint_feedback}")
+        return [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": self._with_schema(content, schema_context)},
+        ]
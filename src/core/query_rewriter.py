@@ -0,0 +1,175 @@
+# query_rewriter.py
+"""
+等价改写建议：以 metadata.db 中的字段类型为 schema，用 sqlglot 优化器做字段限定、谓词下推、列裁剪、
+子查询解嵌套和只用一次的 CTE/子查询合并，给出改写后的SQL、与原SQL的差异和预估扫描量的变化。
+
+扫描量按分区裁剪后的数据量乘以读取字段占比估算（假设是 ORC/Parquet 等列式存储）。
+"""
+import difflib
+import threading
+from typing import Dict, NamedTuple, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import OptimizeError
+from sqlglot.optimizer import optimize
+from sqlglot.optimizer.eliminate_ctes import eliminate_ctes
+from sqlglot.optimizer.merge_subqueries import merge_subqueries
+from sqlglot.optimizer.pushdown_predicates import pushdown_predicates
+from sqlglot.optimizer.pushdown_projections import pushdown_projections
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.scope import traverse_scope
+from sqlglot.optimizer.simplify import simplify
+from sqlglot.optimizer.unnest_subqueries import unnest_subqueries
+
+from .config import config
+from .metadata_index import MetadataLookup, get_metadata_index
+from .volume_hints import VolumeEstimator, format_bytes
+
+# 依次执行的优化步骤；simplify 清理谓词下推后留下的 TRUE AND ...
+REWRITE_RULES = (qualify, pushdown_projections, unnest_subqueries, pushdown_predicates, merge_subqueries,
+                 eliminate_ctes, simplify)
+
+
+class RewriteError(Exception):
+    """SQL 无法解析，或引用的表、字段无法按元数据确定"""
+
+
+class Rewrite(NamedTuple):
+    """改写结果"""
+    original: str
+    sql: str
+    diff: str
+    # 预估扫描字节数，有表缺少统计时为 None
+    scan_before: Optional[int]
+    scan_after: Optional[int]
+
+    @property
+    def changed(self) -> bool:
+        return self.original != self.sql
+
+    @property
+    def improved(self) -> bool:
+        """改写后预估扫描量更少"""
+        return self.scan_before is not None and self.scan_after is not None and self.scan_after < self.scan_before
+
+    def summary(self) -> str:
+        """扫描量变化说明"""
+        if self.scan_before is None or self.scan_after is None:
+            return "📉 **预估扫描量**: 部分表暂无统计信息，无法估算"
+        if not self.scan_before:
+            return f"📉 **预估扫描量**: {format_bytes(self.scan_after)}"
+        reduction = 1 - self.scan_after / self.scan_before
+        return (f"📉 **预估扫描量**: {format_bytes(self.scan_before)} → {format_bytes(self.scan_after)}"
+                f"（减少 {reduction:.0%}，按列式存储估算）")
+
+
+def _type(data_type: str, dialect: str) -> str:
+    """元数据中的字段类型，无法识别的类型（如数据源特有类型）记为 UNKNOWN"""
+    try:
+        return exp.DataType.build(data_type or "UNKNOWN", dialect=dialect).sql(dialect)
+    except Exception:
+        return "UNKNOWN"
+
+
+class QueryRewriter:
+    """用 sqlglot 优化器把查询改写为等价且扫描更少的形式"""
+
+    def __init__(self, index: Optional[MetadataLookup] = None, estimator: Optional[VolumeEstimator] = None,
+                 dialect: str = "hive"):
+        """
+        Args:
+            index: 元数据索引，默认使用进程共享的索引
+            estimator: 扫描量估算，默认读取 METADATA_DB_PATH
+            dialect: SQL方言
+        """
+        self._index = index
+        self.estimator = estimator or VolumeEstimator(config.metadata_db_path, dialect)
+        self.dialect = dialect
+
+    @property
+    def index(self) -> MetadataLookup:
+        return self._index if self._index is not None else get_metadata_index()
+
+    def _schema(self, tree: exp.Expression) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """引用到的表的 {库: {表: {字段: 类型}}}，只写了表名的表补上库名"""
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        schema: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for table in tree.find_all(exp.Table):
+            if not table.name or (not table.db and table.name.lower() in cte_names):
+                continue
+            meta = self.index.get_table(table.name, table.db or None)
+            if meta is None:
+                raise RewriteError(f"元数据中没有表 {'.'.join(part for part in (table.db, table.name) if part)}")
+            if not table.db:
+                table.set("db", exp.to_identifier(meta.schema))
+            schema.setdefault(meta.schema, {})[meta.name] = {
+                column.name: _type(column.data_type, self.dialect) for column in meta.columns.values()}
+        return schema
+
+    def _scan_bytes(self, tree: exp.Expression) -> Optional[int]:
+        """已限定字段的语法树的预估扫描量：各表裁剪后的数据量 × 读取字段占比"""
+        total = 0
+        for scope in traverse_scope(tree):
+            for alias, volume in self.estimator.scope_volumes(scope).items():
+                if not volume.has_stats or volume.total_bytes is None:
+                    return None
+                meta = self.index.get_table(volume.table)
+                used = {column.name.lower() for column in scope.columns if column.table.lower() == alias.lower()}
+                fraction = 1.0
+                if meta is not None and meta.columns:
+                    fraction = min(1.0, max(len(used), 1) / len(meta.columns))
+                total += int(volume.total_bytes * fraction)
+        return total
+
+    def rewrite(self, sql: str) -> Rewrite:
+        """
+        Args:
+            sql: 原始SQL
+
+        Returns:
+            改写结果
+
+        Raises:
+            RewriteError: SQL 无法解析，或表、字段无法按元数据确定
+        """
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+        except Exception as e:
+            raise RewriteError(f"SQL解析失败: {e}") from e
+        if not isinstance(tree, exp.Query):
+            raise RewriteError("只支持 SELECT 查询")
+        original = tree.sql(self.dialect, pretty=True)
+        schema = self._schema(tree)
+        try:
+            qualified = qualify(tree.copy(), schema=schema, dialect=self.dialect, identify=False)
+            optimized = optimize(tree, schema=schema, dialect=self.dialect, rules=REWRITE_RULES, identify=False)
+        except OptimizeError as e:
+            raise RewriteError(f"无法按元数据确定字段来源: {e}") from e
+
+        rewritten = optimized.sql(self.dialect, pretty=True)
+        diff = "\n".join(difflib.unified_diff(original.splitlines(), rewritten.splitlines(),
+                                              "原始SQL", "改写后", lineterm=""))
+        return Rewrite(original, rewritten, diff, self._scan_bytes(qualified), self._scan_bytes(optimized))
+
+
+_rewriter_lock = threading.Lock()
+_query_rewriter: Optional[QueryRewriter] = None
+
+
+def get_query_rewriter() -> QueryRewriter:
+    """进程共享的改写器，使用共享的元数据索引和 METADATA_DB_PATH 中的统计"""
+    global _query_rewriter
+    if _query_rewriter is None:
+        with _rewriter_lock:
+            if _query_rewriter is None:
+                _query_rewriter = QueryRewriter()
+    return _query_rewriter
+
+
+def set_query_rewriter(rewriter: Optional[QueryRewriter]) -> Optional[QueryRewriter]:
+    """替换进程共享的改写器（None 表示下次使用时按配置重新创建），返回原来的实例"""
+    global _query_rewriter
+    with _rewriter_lock:
+        previous, _query_rewriter = _query_rewriter, rewriter
+    return previous
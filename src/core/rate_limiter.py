@@ -0,0 +1,256 @@
+# rate_limiter.py
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# 优先级类别，数值越小越优先
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "batch": 1,
+}
+
+
+class APICallError(Exception):
+    """LLM接口调用失败，携带HTTP状态码以便判断是否可重试"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """429、5xx以及没有状态码的网络错误可以重试"""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数：中文等非ASCII字符按1个token计，ASCII字符按4个字符1个token计
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率补充令牌"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            capacity: 桶容量（允许的突发量），默认为10秒的补充量
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate * 10)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回获取指定数量令牌需要等待的秒数，0表示可以立即获取"""
+        self._refill()
+        # 超过桶容量的请求按装满时放行，避免永远无法获取
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """扣除令牌，允许为负以便事后按实际用量修正"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """按实际用量修正（amount为负时追加扣除）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后放行一个试探请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        """调用前检查，熔断时抛出CircuitOpenError"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("DeepSeek API熔断中，请稍后重试")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                raise CircuitOpenError("DeepSeek API熔断恢复试探中，请稍后重试")
+            self._probing = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_aborted(self):
+        """调用在完成前被中止（如取消），释放试探名额"""
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class AdmissionController:
+    """LLM调用准入控制：请求数/token数令牌桶、优先级排队、重试退避与熔断"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数上限
+            tokens_per_minute: 每分钟token数上限
+            max_retries: 可重试错误的最大重试次数
+            backoff_base: 指数退避的基础秒数
+            backoff_max: 单次退避的最大秒数
+            failure_threshold: 熔断器打开前允许的连续失败次数
+            reset_timeout: 熔断器打开后的冷却秒数
+        """
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"admitted": 0, "retries": 0, "rejected": 0, "failures": 0}
+
+    def queue_depth(self) -> Dict[str, int]:
+        """按优先级统计排队数量"""
+        depth = {name: 0 for name in PRIORITY_CLASSES}
+        names = {value: name for name, value in PRIORITY_CLASSES.items()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                depth[names[priority]] += 1
+        return depth
+
+    async def acquire(self, estimated_tokens: int, priority: str = "interactive"):
+        """
+        按优先级排队直到两个令牌桶都允许放行
+
+        Args:
+            estimated_tokens: 预估的token用量
+            priority: 优先级类别（interactive 或 batch）
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级类别: {priority}")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITY_CLASSES[priority], next(self._sequence), estimated_tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 排队中被取消时重新调度，避免队首的已取消请求阻塞后续请求
+            self._dispatch()
+            raise
+
+    def _dispatch(self):
+        """按优先级放行队首请求，令牌不足时设置定时器稍后再试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            self.stats["admitted"] += 1
+            future.set_result(None)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """用实际token用量修正预估值"""
+        self.token_bucket.refund(estimated_tokens - actual_tokens)
+
+    def _backoff(self, attempt: int, error: APICallError) -> float:
+        """带抖动的指数退避时间，服务端给出Retry-After时优先使用"""
+        if error.retry_after:
+            return min(self.backoff_max, error.retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def call(self, func: Callable[[], Awaitable], estimated_tokens: int, priority: str = "interactive"):
+        """
+        在准入控制下执行调用，遇到429/5xx时重试
+
+        Args:
+            func: 实际发起调用的协程函数
+            estimated_tokens: 预估的token用量
+            priority: 优先级类别
+
+        Returns:
+            func的返回值
+        """
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.stats["rejected"] += 1
+                raise
+            try:
+                await self.acquire(estimated_tokens, priority)
+                result = await func()
+            except APICallError as e:
+                self.stats["failures"] += 1
+                if not e.retryable:
+                    # 4xx 是请求本身的问题（如提示词过长），不代表服务异常，不计入熔断
+                    self.breaker.record_aborted()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.stats["retries"] += 1
+                print(f"DeepSeek API调用失败({e.status_code})，{delay:.2f}秒后第{attempt}次重试")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 取消等非接口错误不计入熔断，但需要释放试探名额
+                self.breaker.record_aborted()
+                raise
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,268 @@
+# sample_sandbox.py
+"""
+样本试运行：把生成的 Hive SQL 用 sqlglot 转写为 SQLite 方言，在本地样本数据上执行，
+返回前几行结果和耗时，让分析师不用提交到集群就能确认SQL语义和结果形状。
+
+引用的表没有样本时按元数据字段和统计中最新的几个分区物化样本（见 utils/sample_data.py）；
+样本库以只读方式 ATTACH，执行超时后中断。
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+
+from .config import config
+from .metadata_index import MetadataLookup, get_metadata_index
+from ..utils.sample_data import (FixtureSampleProvider, SampleInfo, SampleProvider, SampleStore,
+                                 SyntheticSampleProvider)
+from ..utils.table_stats import TableStatsStore
+
+# 每执行多少条 SQLite 虚拟机指令检查一次超时
+_PROGRESS_STEPS = 10000
+
+# SQLite 自身占用的库名，同名的样本库改用其他名称挂载
+_RESERVED_SCHEMAS = ("main", "temp")
+
+
+class SandboxError(Exception):
+    """SQL 无法解析或转写、不是查询，或引用的表既没有样本也没有元数据"""
+
+
+class SandboxResult(NamedTuple):
+    """试运行结果"""
+    # 转写后在 SQLite 上执行的SQL
+    sql: str
+    columns: Tuple[str, ...]
+    rows: List[Tuple]
+    # 结果超过返回行数
+    truncated: bool
+    # 库.表 -> 使用的样本
+    samples: Dict[str, SampleInfo]
+    transpile_ms: float
+    materialize_ms: float
+    execute_ms: float
+    # 执行失败时的 SQLite 错误
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class SampleSandbox:
+    """在本地样本上试运行查询"""
+
+    def __init__(self, store: SampleStore, provider: Optional[SampleProvider] = None,
+                 index: Optional[MetadataLookup] = None, stats_store: Optional[TableStatsStore] = None,
+                 partitions_per_table: int = 3, rows_per_partition: int = 200, dialect: str = "hive"):
+        """
+        Args:
+            store: 样本目录
+            provider: 缺少样本时的样本来源，为 None 时只使用已物化的样本
+            index: 元数据索引，默认使用进程共享的索引
+            stats_store: 提供抽样分区的统计，为 None 时整表抽样
+            partitions_per_table: 分区表抽样的最新分区数
+            rows_per_partition: 每个分区的样本行数
+            dialect: SQL方言
+        """
+        self.store = store
+        self.provider = provider
+        self._index = index
+        self.stats_store = stats_store
+        self.partitions_per_table = partitions_per_table
+        self.rows_per_partition = rows_per_partition
+        self.dialect = dialect
+
+    @property
+    def index(self) -> MetadataLookup:
+        return self._index if self._index is not None else get_metadata_index()
+
+    def materialize(self, table: str, schema: Optional[str] = None) -> SampleInfo:
+        """
+        按元数据字段和最新分区重新物化一张表的样本
+
+        Raises:
+            SandboxError: 没有样本来源，或元数据中没有该表
+        """
+        meta = self.index.get_table(table, schema)
+        if meta is None:
+            raise SandboxError(f"元数据中没有表 {'.'.join(part for part in (schema, table) if part)}")
+        if self.provider is None:
+            raise SandboxError(f"表 {meta.full_name} 没有样本数据")
+        partition_rows: Dict[str, Optional[int]] = {}
+        stats = self.stats_store.table(meta.full_name) if self.stats_store is not None else None
+        if stats is not None and stats.partition_keys:
+            partition_rows = {name: rows for name, rows, _ in
+                              self.stats_store.partitions(stats, self.partitions_per_table)}
+        elif stats is not None:
+            partition_rows = {"": stats.row_count}
+        columns = [(column.name, column.data_type) for column in meta.columns.values()]
+        return self.store.materialize(self.provider, meta.schema, meta.name, columns,
+                                      [name for name in partition_rows if name], self.rows_per_partition,
+                                      partition_rows)
+
+    def _tables(self, tree: exp.Expression) -> List[Tuple[str, str]]:
+        """查询引用的 (库, 表)，只写了表名的表按元数据补上库名"""
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        tables = []
+        for table in tree.find_all(exp.Table):
+            if not table.name or (not table.db and table.name.lower() in cte_names):
+                continue
+            schema = table.db
+            if not schema:
+                meta = self.index.get_table(table.name)
+                if meta is None:
+                    raise SandboxError(f"无法确定表 {table.name} 所在的库")
+                schema = meta.schema
+                table.set("db", exp.to_identifier(schema))
+            if (schema, table.name) not in tables:
+                tables.append((schema, table.name))
+        return tables
+
+    @staticmethod
+    def _attach_names(tree: exp.Expression, tables: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        确定各样本库的挂载名并改写表引用：库名一律加引号（如 default 是 SQLite 关键字），
+        与 SQLite 内置库同名的改用生成的名称
+
+        Returns:
+            小写库名 -> 挂载名
+        """
+        schemas = list(dict.fromkeys(schema.lower() for schema, _ in tables))
+        attached: Dict[str, str] = {}
+        for schema in schemas:
+            name = schema
+            while name in _RESERVED_SCHEMAS or (name != schema and name in schemas) or name in attached.values():
+                name += "_sample"
+            attached[schema] = name
+        for table in tree.find_all(exp.Table):
+            if table.db and table.db.lower() in attached:
+                table.set("db", exp.to_identifier(attached[table.db.lower()], quoted=True))
+        return attached
+
+    def run(self, sql: str, limit: int = 20, timeout: float = 5.0) -> SandboxResult:
+        """
+        Args:
+            sql: 查询SQL
+            limit: 返回的最多行数
+            timeout: 执行超时（秒）
+
+        Returns:
+            试运行结果；执行失败（如样本上不支持的函数）时 error 为 SQLite 的错误信息
+
+        Raises:
+            SandboxError: SQL 无法解析或转写、不是查询，或引用的表无法取得样本
+        """
+        started = time.perf_counter()
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+        except Exception as e:
+            raise SandboxError(f"SQL解析失败: {e}") from e
+        if not isinstance(tree, exp.Query):
+            raise SandboxError("只支持 SELECT 查询")
+        tables = self._tables(tree)
+        attached = self._attach_names(tree, tables)
+        try:
+            transpiled = tree.sql("sqlite")
+        except Exception as e:
+            raise SandboxError(f"无法转写为 SQLite: {e}") from e
+        transpile_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        samples: Dict[str, SampleInfo] = {}
+        for schema, table in tables:
+            try:
+                info = self.store.info(schema, table) or self.materialize(table, schema)
+            except ValueError as e:
+                raise SandboxError(str(e)) from e
+            samples[f"{schema}.{table}"] = info
+        materialize_ms = (time.perf_counter() - started) * 1000
+
+        conn = sqlite3.connect(":memory:")
+        try:
+            for schema, name in attached.items():
+                try:
+                    conn.execute('ATTACH DATABASE ? AS "' + name.replace('"', '""') + '"',
+                                 (f"file:{self.store.path(schema)}?mode=ro",))
+                except (sqlite3.Error, ValueError) as e:
+                    raise SandboxError(f"无法挂载库 {schema} 的样本: {e}") from e
+            deadline = time.perf_counter() + timeout
+            conn.set_progress_handler(lambda: time.perf_counter() > deadline, _PROGRESS_STEPS)
+            started = time.perf_counter()
+            try:
+                cursor = conn.execute(transpiled)
+                rows = cursor.fetchmany(limit + 1)
+            except sqlite3.Error as e:
+                message = f"执行超过 {timeout:g} 秒被中断" if time.perf_counter() > deadline else str(e)
+                return SandboxResult(transpiled, (), [], False, samples, transpile_ms, materialize_ms,
+                                     (time.perf_counter() - started) * 1000, message)
+            execute_ms = (time.perf_counter() - started) * 1000
+            columns = tuple(description[0] for description in cursor.description or ())
+        finally:
+            conn.close()
+        return SandboxResult(transpiled, columns, rows[:limit], len(rows) > limit, samples,
+                             transpile_ms, materialize_ms, execute_ms)
+
+
+def format_result(result: SandboxResult) -> str:
+    """试运行结果的 Markdown 展示"""
+    lines = []
+    for name, info in result.samples.items():
+        scope = f"分区 {', '.join(info.partitions)}" if info.partitions else "整表"
+        lines.append(f"- {name}：{scope}，{info.row_count} 行样本")
+    timing = (f"⏱️ **耗时**: 转写 {result.transpile_ms:.1f} ms，准备样本 {result.materialize_ms:.1f} ms，"
+              f"执行 {result.execute_ms:.1f} ms")
+    parts = ["🧪 **样本数据**:", *lines, "", timing, "", f"```sql\n{result.sql}\n```", ""]
+    if not result.ok:
+        parts.append(f"❌ **执行失败**: {result.error}")
+        return "\n".join(parts)
+    if not result.rows:
+        parts.append("结果为空（样本只包含上面列出的分区，请确认过滤条件）")
+        return "\n".join(parts)
+
+    def cell(value) -> str:
+        return "NULL" if value is None else str(value).replace("|", "\\|").replace("\n", " ")
+
+    parts.append("| " + " | ".join(result.columns) + " |")
+    parts.append("|" + "---|" * len(result.columns))
+    parts.extend("| " + " | ".join(cell(value) for value in row) + " |" for row in result.rows)
+    if result.truncated:
+        parts.append(f"\n仅显示前 {len(result.rows)} 行")
+    parts.append("\n⚠️ 结果基于本地样本数据，只用于确认SQL语义和结果形状，不代表真实数据")
+    return "\n".join(parts)
+
+
+_sandbox_lock = threading.Lock()
+_sample_sandbox: Optional[SampleSandbox] = None
+
+
+def get_sample_sandbox() -> SampleSandbox:
+    """
+    进程共享的试运行沙箱：样本保存在 SAMPLE_DATA_DIR，缺少样本时从 SAMPLE_FIXTURE_PATH 读取，
+    未配置夹具时按 METADATA_DB_PATH 中的字段统计生成
+    """
+    global _sample_sandbox
+    if _sample_sandbox is None:
+        with _sandbox_lock:
+            if _sample_sandbox is None:
+                stats_store = TableStatsStore(config.metadata_db_path)
+                if config.sample_fixture_path:
+                    provider: SampleProvider = FixtureSampleProvider(config.sample_fixture_path)
+                else:
+                    provider = SyntheticSampleProvider(stats_store)
+                _sample_sandbox = SampleSandbox(SampleStore(config.sample_data_dir), provider,
+                                                stats_store=stats_store,
+                                                partitions_per_table=config.sample_partitions,
+                                                rows_per_partition=config.sample_rows_per_partition)
+    return _sample_sandbox
+
+
+def set_sample_sandbox(sandbox: Optional[SampleSandbox]) -> Optional[SampleSandbox]:
+    """替换进程共享的试运行沙箱（None 表示下次使用时按配置重新创建），返回原来的实例"""
+    global _sample_sandbox
+    with _sandbox_lock:
+        previous, _sample_sandbox = _sample_sandbox, sandbox
+    return previous
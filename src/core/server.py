@@ -4,8 +4,23 @@ from sqlglot import exp
 import re
 import toml
 import os
+import difflib
+import asyncio
 from typing import List, Dict, Any
 
+from .config import config
+from .join_advisor import DEFAULT_THRESHOLDS, get_join_advisor
+from .join_paths import get_join_path_finder
+from .lineage_graph import get_lineage_graph
+from .metadata_index import get_metadata_index
+from .performance_rules import PERFORMANCE_RULES, check_performance
+from .query_rewriter import RewriteError, get_query_rewriter
+from .sample_sandbox import SandboxError, format_result, get_sample_sandbox
+from .sql_templates import get_sql_template_library
+from .volume_hints import get_volume_estimator
+from .write_checks import WRITE_RULES, get_write_checker
+from ..utils.metadata_search import MetadataSearch
+
 # Create FastMCP instance
 app = FastMCP("sql-linter-mcp-server")
 
@@ -71,6 +86,10 @@ async def lint_sql(sql_string: str) -> str:
     Returns:
         包含所有检查问题和建议的格式化字符串
     """
+    return check_sql(sql_string)
+
+def check_sql(sql_string: str) -> str:
+    """lint_sql 的同步实现，供注册SQL模板等非异步场景使用"""
     try:
         # 1. 使用sqlglot解析SQL
         # Get SQL dialect from config, default to hive
@@ -85,9 +104,13 @@ async def lint_sql(sql_string: str) -> str:
     # 3. Initialize rules based on statement type and configuration
     rules = []
 
+    write_checks = any(RULES_CONFIG["rules"].get(name, {}).get("enabled", True) for name in WRITE_RULES)
     if is_ddl:
         # For DDL statements, apply DDL-specific rules
         rules.append(_check_ddl_rules)
+        # CREATE TABLE AS SELECT 同样是写入
+        if write_checks and isinstance(parsed_sql, exp.Create) and parsed_sql.expression is not None:
+            rules.append(_check_write_path)
     else:
         # For query statements, apply configured query rules
         if RULES_CONFIG["rules"].get("select_star", {}).get("enabled", True):
@@ -100,6 +123,14 @@ async def lint_sql(sql_string: str) -> str:
             rules.append(_check_sensitive_columns)
         if RULES_CONFIG["rules"].get("field_alias_naming", {}).get("enabled", True):
             rules.append(_check_field_alias_naming)
+        if RULES_CONFIG["rules"].get("schema_references", {}).get("enabled", True):
+            rules.append(_check_schema_references)
+        if any(RULES_CONFIG["rules"].get(name, {}).get("enabled", True) for name in PERFORMANCE_RULES):
+            rules.append(_check_performance_rules)
+        if RULES_CONFIG["rules"].get("join_skew", {}).get("enabled", True):
+            rules.append(_check_join_skew)
+        if write_checks and isinstance(parsed_sql, exp.Insert):
+            rules.append(_check_write_path)
 
     issues = []
 
@@ -117,6 +148,258 @@ async def lint_sql(sql_string: str) -> str:
             result.append(f"{i}. {issue}")
         return "\n".join(result)
 
+@app.tool()
+async def search_tables(query: str, page: int = 1, page_size: int = 20) -> str:
+    """
+    根据业务需求检索相关数据表，按表名、表注释、字段和业务术语的相关度（BM25）排序。
+
+    Args:
+        query: 业务需求或关键词，如 "用户注册渠道"、"order_amount"
+        page: 页码，从1开始
+        page_size: 每页条数，最多100
+
+    Returns:
+        格式化的检索结果
+    """
+    if not os.path.exists(config.metadata_db_path):
+        return "元数据库不存在，请先同步元数据"
+    searcher = MetadataSearch(config.metadata_db_path)
+    result = await asyncio.to_thread(searcher.search_tables, query, page, page_size)
+    if not result["results"]:
+        return f"未找到与 '{query}' 相关的表"
+
+    pages = (result["total"] + result["page_size"] - 1) // result["page_size"]
+    lines = [f"与 '{query}' 相关的表（共 {result['total']} 个，第 {result['page']}/{pages} 页）:"]
+    start = (result["page"] - 1) * result["page_size"]
+    for i, item in enumerate(result["results"], start + 1):
+        line = f"{i}. {item['schema']}.{item['table']}"
+        if item["comment"]:
+            line += f" - {item['comment']}"
+        if item["matched_columns"]:
+            line += f"（相关字段: {', '.join(item['matched_columns'])}）"
+        lines.append(line)
+    return "\n".join(lines)
+
+@app.tool()
+async def suggest_join_path(from_table: str, to_table: str) -> str:
+    """
+    根据共同键字段和字段级血缘推荐两张表的连接路径和连接条件。
+
+    Args:
+        from_table: 起始表，可以是 "库.表" 或唯一的表名
+        to_table: 目标表
+
+    Returns:
+        连接路径说明和 FROM ... JOIN ... ON 片段
+    """
+    path = await asyncio.to_thread(get_join_path_finder().find_path, from_table, to_table)
+    if path is None:
+        return f"未找到 '{from_table}' 与 '{to_table}' 之间的连接路径"
+
+    basis = {"key": "共同键", "lineage": "字段级血缘"}
+    lines = [f"{' -> '.join(path.tables)}（{len(path.steps)} 次连接）:"]
+    for step in path.steps:
+        columns = ", ".join(lcol if lcol == rcol else f"{lcol}={rcol}" for lcol, rcol in step.conditions)
+        lines.append(f"- {step.left} 与 {step.right} 经{basis[step.via]} {columns} 连接")
+    lines.append("")
+    lines.append(path.to_sql())
+    return "\n".join(lines)
+
+@app.tool()
+async def advise_joins(sql_string: str) -> str:
+    """
+    按表统计检查SQL中的每个连接：小表是否应该广播（MAPJOIN）、连接键是否容易倾斜，给出 hint 和 Hive 参数。
+
+    Args:
+        sql_string: 需要检查的SQL语句
+
+    Returns:
+        每个连接的建议
+    """
+    dialect = RULES_CONFIG.get("general", {}).get("sql_dialect", "hive")
+    try:
+        parsed_sql = sqlglot.parse_one(sql_string, read=dialect)
+    except Exception as e:
+        return f"SQL解析失败: {str(e)}"
+    text = await asyncio.to_thread(get_join_advisor().render, parsed_sql, RULES_CONFIG["rules"].get("join_skew", {}))
+    if not text:
+        return "未发现需要调整的连接（没有统计信息的表不做判断）"
+    return f"连接策略建议（基于本地统计）:\n{text}"
+
+@app.tool()
+async def rewrite_sql(sql_string: str) -> str:
+    """
+    用 sqlglot 优化器把查询改写为等价且扫描更少的形式：字段限定、谓词下推、列裁剪、子查询解嵌套、
+    合并只用一次的 CTE。字段类型取自元数据库。
+
+    Args:
+        sql_string: 需要改写的SELECT查询
+
+    Returns:
+        改写后的SQL、与原SQL的差异和预估扫描量变化
+    """
+    try:
+        rewrite = await asyncio.to_thread(get_query_rewriter().rewrite, sql_string)
+    except RewriteError as e:
+        return f"无法改写: {e}"
+    if not rewrite.changed:
+        return "SQL已是优化器的最简形式，无需改写"
+    return "\n".join([
+        "改写后的SQL:", "```sql", rewrite.sql, "```", "",
+        "差异:", "```diff", rewrite.diff, "```", "",
+        rewrite.summary(),
+    ])
+
+@app.tool()
+async def match_sql_template(user_request: str) -> str:
+    """
+    按常用业务SQL模板库匹配需求，从需求中抽取日期范围、渠道、指标等参数并渲染SQL，不调用LLM。
+
+    Args:
+        user_request: 业务需求描述
+
+    Returns:
+        匹配到的模板、参数和SQL
+    """
+    library = await asyncio.to_thread(get_sql_template_library)
+    match = library.match(user_request)
+    if match is None:
+        return f"没有匹配的SQL模板（已注册 {len(library)} 个）"
+    return "\n".join([
+        f"模板: {match.template.title}（{match.template.name}）",
+        f"参数: {match.describe()}",
+        "```sql", match.sql, "```",
+    ])
+
+@app.tool()
+async def sample_run_sql(sql_string: str, limit: int = 20, refresh_tables: str = "") -> str:
+    """
+    在本地样本数据上试运行查询：转写为 SQLite 方言执行，返回前几行结果和耗时，用于确认SQL语义和结果形状。
+    分区表只抽样最新的几个分区，缺少样本的表自动物化。
+
+    Args:
+        sql_string: 需要试运行的SELECT查询
+        limit: 返回的最多行数
+        refresh_tables: 先重新物化样本的表，多个用逗号分隔，如 "dw.orders,dw.users"
+
+    Returns:
+        样本范围、耗时、执行的SQL和结果
+    """
+    sandbox = get_sample_sandbox()
+    try:
+        for table in filter(None, (name.strip() for name in refresh_tables.split(","))):
+            await asyncio.to_thread(sandbox.materialize, table)
+        result = await asyncio.to_thread(sandbox.run, sql_string, max(1, limit), config.sample_run_timeout)
+    except SandboxError as e:
+        return f"无法试运行: {e}"
+    return format_result(result)
+
+# 血缘查询结果最多输出的节点数
+LINEAGE_OUTPUT_LIMIT = 200
+
+@app.tool()
+async def lineage_upstream(table: str, column: str = "", max_depth: int = 0) -> str:
+    """
+    查询表或字段的上游血缘（数据从哪里来）。
+
+    Args:
+        table: 表名，可以是 "库.表" 或只有表名
+        column: 字段名，指定时查询字段级血缘
+        max_depth: 最大层数，0表示不限
+
+    Returns:
+        按层列出的上游表或字段
+    """
+    return await asyncio.to_thread(_lineage_report, table, column, max_depth, "upstream")
+
+@app.tool()
+async def lineage_downstream(table: str, column: str = "", max_depth: int = 0) -> str:
+    """
+    查询表或字段的下游血缘（该表延迟或变更时受影响的表）。
+
+    Args:
+        table: 表名，可以是 "库.表" 或只有表名
+        column: 字段名，指定时查询字段级血缘
+        max_depth: 最大层数，0表示不限
+
+    Returns:
+        按层列出的下游表或字段
+    """
+    return await asyncio.to_thread(_lineage_report, table, column, max_depth, "downstream")
+
+def _lineage_report(table, column, max_depth, direction):
+    """格式化血缘查询结果"""
+    graph = get_lineage_graph()
+    subject = f"{table}.{column}" if column else table
+    if not graph.resolve(table, column or None):
+        return f"血缘关系中没有 '{subject}'"
+
+    hops = graph.traverse(table, direction, column or None, max_depth if max_depth > 0 else None)
+    label = "上游" if direction == "upstream" else "下游"
+    if not hops:
+        return f"'{subject}' 没有{label}"
+
+    lines = [f"'{subject}' 的{label}（共 {len(hops)} 个" + ("字段" if column else "表")
+             + (f"，最多 {max_depth} 层" if max_depth > 0 else "") + "）:"]
+    for hop in hops[:LINEAGE_OUTPUT_LIMIT]:
+        line = f"第{hop.depth}层: {hop.node}（{'来自' if direction == 'downstream' else '流向'} {hop.via}）"
+        if hop.rule:
+            line += f" 规则: {hop.rule}"
+        lines.append(line)
+    if len(hops) > LINEAGE_OUTPUT_LIMIT:
+        lines.append(f"... 另有 {len(hops) - LINEAGE_OUTPUT_LIMIT} 个未列出，可减小 max_depth")
+    return "\n".join(lines)
+
+@app.tool()
+async def sync_metadata_now(full: bool = False, source: str = "") -> str:
+    """
+    立即同步元数据（默认增量），在后台线程执行；已有同步在进行时等待它完成。
+
+    Args:
+        full: 为True时重新校验所有表
+        source: 只同步指定的数据源，默认为全部
+
+    Returns:
+        同步耗时、变更行数和失败的任务
+    """
+    # 同步调度器依赖元数据采集器和数据源配置，只在用到时导入
+    from .sync_scheduler import get_sync_scheduler
+
+    future, started = get_sync_scheduler().trigger(full=full, sources=[source] if source else None)
+    try:
+        stats = await asyncio.wrap_future(future)
+    except Exception as e:
+        return f"元数据同步失败: {e}"
+
+    lines = [] if started else ["已有同步在进行，以下为该次同步的结果"]
+    lines.append(f"元数据同步完成：同步 {len(stats['sources'])} 个数据源，耗时 {stats['elapsed_s']} 秒，"
+                 f"读取 {stats['rows_read']} 行，变更 {stats['rows_changed']} 行")
+    for label, error in stats["errors"].items():
+        lines.append(f"- {label} 失败: {error}")
+    return "\n".join(lines)
+
+@app.tool()
+async def metadata_sync_status() -> str:
+    """
+    查看元数据同步状态：最近一次同步的耗时、变更行数、错误，以及各数据源距上次同步的时间。
+
+    Returns:
+        格式化的同步状态
+    """
+    from .sync_scheduler import get_sync_scheduler
+
+    metrics = await asyncio.to_thread(get_sync_scheduler().metrics)
+    lines = ["元数据同步状态:",
+             f"- 正在同步: {'是' if metrics['running'] else '否'}",
+             f"- 已执行 {metrics['runs']} 次（失败 {metrics['failures']} 次，合并 {metrics['coalesced']} 次触发）"]
+    if metrics["last_finished_at"] is not None:
+        lines.append(f"- 最近一次（{metrics['last_trigger']}）: 耗时 {metrics['last_duration_s']} 秒，"
+                     f"变更 {metrics['last_rows_changed'] if metrics['last_rows_changed'] is not None else '-'} 行"
+                     + (f"，错误: {metrics['last_error']}" if metrics["last_error"] else ""))
+    for name, seconds in metrics["staleness_s"].items():
+        lines.append(f"- {name}: " + ("从未同步" if seconds is None else f"{seconds:.0f} 秒前同步"))
+    return "\n".join(lines)
+
 def _check_select_star(parsed_sql, original_sql):
     """检查是否使用 SELECT * """
     issues = []
@@ -204,6 +487,100 @@ def _check_field_alias_naming(parsed_sql, original_sql):
             issues.append(f"[{level.capitalize()}-{rule_config.get('id', 'R201')}] {message}")
     return issues
 
+def _check_schema_references(parsed_sql, original_sql):
+    """检查引用的表和字段是否存在于元数据中，元数据为空时跳过"""
+    issues = []
+    # Get configuration for this rule
+    rule_config = RULES_CONFIG["rules"].get("schema_references", {})
+    partition_fields = RULES_CONFIG["rules"].get("partition_filter", {}).get("partition_fields", ["dt", "date"])
+    index = get_metadata_index(partition_fields)
+    if index.is_empty():
+        return issues
+
+    level = rule_config.get("level", "error")
+    prefix = f"[{level.capitalize()}-{rule_config.get('id', 'R801')}] " \
+             f"{rule_config.get('description', 'SQL引用了元数据中不存在的表或字段')}"
+    cte_names = {cte.alias_or_name.lower() for cte in parsed_sql.find_all(exp.CTE)}
+
+    # 表别名/表名 -> 表元数据；存在CTE、子查询、未知表时无法确定未加限定的字段来自哪张表
+    tables = {}
+    unresolved = any(parsed_sql.find_all(exp.Subquery, exp.Lateral, exp.Unnest, exp.Explode))
+    for table in parsed_sql.find_all(exp.Table):
+        if not table.name:
+            continue
+        if not table.db and table.name.lower() in cte_names:
+            unresolved = True
+            continue
+        meta = index.get_table(table.name, table.db or None)
+        if meta is None:
+            unresolved = True
+            # 只给表名且多个库中都有同名表时无法判断，不报告
+            if not index.has_table(table.name, table.db or None):
+                full_name = f"{table.db}.{table.name}" if table.db else table.name
+                issues.append(f"{prefix}：表 '{full_name}' 不存在")
+            continue
+        tables[table.alias_or_name.lower()] = meta
+        tables.setdefault(table.name.lower(), meta)
+
+    output_names = {alias.alias.lower() for alias in parsed_sql.find_all(exp.Alias) if alias.alias}
+    reported = set()
+    for column in parsed_sql.find_all(exp.Column):
+        name = column.name
+        if not name or isinstance(column.this, exp.Star) or column.args.get("db"):
+            continue
+        qualifier = column.table.lower()
+        if qualifier:
+            meta = tables.get(qualifier)
+            # 限定名是CTE、子查询或未知表的别名
+            if meta is None or name.lower() in meta.columns:
+                continue
+            candidates = [meta]
+            label = f"{column.table}.{name}"
+        else:
+            if unresolved or not tables or name.lower() in output_names:
+                continue
+            candidates = list({id(meta): meta for meta in tables.values()}.values())
+            if any(name.lower() in meta.columns for meta in candidates):
+                continue
+            label = name
+        if label.lower() in reported:
+            continue
+        reported.add(label.lower())
+        message = f"{prefix}：字段 '{label}' 不存在于表 {', '.join(meta.full_name for meta in candidates)}"
+        suggestion = difflib.get_close_matches(name.lower(), [key for meta in candidates for key in meta.columns],
+                                               n=1)
+        if suggestion:
+            message += f"，是否应为 '{suggestion[0]}'？"
+        issues.append(message)
+    return issues
+
+def _check_performance_rules(parsed_sql, original_sql):
+    """Hive 性能规则，大表按本地元数据库中的统计判断"""
+    partition_fields = RULES_CONFIG["rules"].get("partition_filter", {}).get("partition_fields", ["dt", "date"])
+    # 共享的估算器按表缓存统计，元数据库换入新版本后失效，lint 不必每次查询元数据库
+    estimator = get_volume_estimator()
+
+    def table_rows(name):
+        stats = estimator.stats(name)
+        return stats.row_count if stats is not None else None
+
+    return check_performance(parsed_sql, RULES_CONFIG["rules"], partition_fields, table_rows)
+
+def _check_join_skew(parsed_sql, original_sql):
+    """按表统计检查可以广播的小表和容易倾斜的连接键，没有统计的表不检查"""
+    rule_config = RULES_CONFIG["rules"].get("join_skew", {})
+    level = rule_config.get("level", "warning")
+    prefix = f"[{level.capitalize()}-{rule_config.get('id', 'R505')}] " \
+             f"{rule_config.get('description', '连接可以改为 MAPJOIN 或连接键容易倾斜')}"
+    skew_key_rows = rule_config.get("skew_key_rows", DEFAULT_THRESHOLDS["skew_key_rows"])
+    return [f"{prefix}：{advice.label}：{suggestion}"
+            for advice in get_join_advisor().advise(parsed_sql, rule_config)
+            for suggestion in advice.suggestions(skew_key_rows)]
+
+def _check_write_path(parsed_sql, original_sql):
+    """INSERT 和 CTAS 的动态分区与小文件检查，规模按本地统计估算"""
+    return get_write_checker().check(parsed_sql, RULES_CONFIG["rules"])
+
 def _check_ddl_rules(parsed_sql, original_sql):
     """检查DDL语句的规则"""
     issues = []
@@ -259,5 +636,9 @@ def _camel_to_snake(name):
     return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
 
 if __name__ == "__main__":
+    if config.metadata_sync_enabled:
+        from .sync_scheduler import get_sync_scheduler
+
+        get_sync_scheduler().start()
     # 使用 SSE 传输方式运行服务器，避免 Windows 环境下的 stdio 通信问题
     app.run(transport="sse")
@@ -0,0 +1,62 @@
+# single_flight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """一次共享的在途调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同key的并发调用：同一时刻只执行一次，所有等待者共享结果。
+
+    某个等待者被取消只影响它自己；所有等待者都取消后才取消底层调用。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    def inflight(self) -> int:
+        """当前在途的共享调用数量"""
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入key对应的在途调用
+
+        Args:
+            key: 合并键
+            func: 没有在途调用时用于发起调用的协程函数
+
+        Returns:
+            共享调用的结果
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.stats["executed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            # shield 保证单个等待者取消时不会取消共享的调用
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 最后一个等待者离开，后续相同请求重新发起调用
+                self._forget(key, call)
+                call.task.cancel()
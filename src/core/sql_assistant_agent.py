@@ -2,79 +2,176 @@ import requests
 import json
 import asyncio
 import os
-from typing import Optional
+import re
+import time
+import unicodedata
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Optional, Set
 # Import the lint function directly from the server module
-from .server import lint_sql
+from .server import check_sql, lint_sql
 # 导入配置
 from .config import config, setup_environment
+from .rate_limiter import AdmissionController, APICallError, estimate_tokens
+from .single_flight import SingleFlight
+from .prompt_builder import PromptBuilder
+from .query_rewriter import QueryRewriter, RewriteError
+from .sql_templates import get_sql_template_library
+from .volume_hints import VolumeEstimator
+
+# 当前生成流程的统计信息，LLM调用时累加token用量
+_request_stats: ContextVar[Optional[Dict]] = ContextVar("request_stats", default=None)
+
+def _issue_count(lint_result: str) -> float:
+    """lint_sql 报告中的问题数，无法解析的SQL记为无穷大"""
+    if "符合所有规范" in lint_result:
+        return 0
+    if not lint_result.startswith("SQL规范检查报告"):
+        return float("inf")
+    return sum(1 for line in lint_result.splitlines() if re.match(r"\d+\. ", line))
 
 class SQLAssistantAgent:
-    def __init__(self, deepseek_api_key: Optional[str] = None):
+    # 未指定会话时使用的默认会话ID
+    DEFAULT_SESSION = "default"
+
+    def __init__(self, deepseek_api_key: Optional[str] = None, max_concurrent_requests: Optional[int] = None,
+                 base_url: Optional[str] = None):
         """
         初始化SQL助手智能体
 
         Args:
             deepseek_api_key: DeepSeek API密钥，如果为None则从环境变量读取
+            max_concurrent_requests: 同时在途的LLM调用上限，如果为None则从配置读取
+            base_url: DeepSeek兼容接口的基础地址，如果为None则从配置读取
         """
 
-        if not setup_environment():
+        if not setup_environment() and not (deepseek_api_key or os.getenv("DEEPSEEK_API_KEY")):
             print("❌ 环境设置失败，程序退出")
             return
 
         # 使用配置中的值
         # self.mcp_server_path = mcp_server_path or config.mcp_server_path
         # We don't need the server path anymore since we're calling the function directly
-        self.api_key = config.deepseek_api_key or os.getenv("DEEPSEEK_API_KEY")
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"  # DeepSeek API端点
+        self.api_key = deepseek_api_key or os.getenv("DEEPSEEK_API_KEY")
+        # DeepSeek API端点，可通过 DEEPSEEK_BASE_URL 指向本地模拟服务
+        self.base_url = f"{(base_url or config.deepseek_base_url).rstrip('/')}/chat/completions"
 
         if not self.api_key:
             raise ValueError("DeepSeek API密钥未提供，请设置DEEPSEEK_API_KEY环境变量或传入api_key参数")
 
-        # 设置系统提示词，定义智能体的角色和能力
-        self.system_prompt = """
-        你是一个专业的数据分析SQL助手，专门帮助业务分析师编写高效、规范的SQL查询。
-
-        你的工作流程：
-        1. 理解用户的业务需求
-        2. 生成符合大数据开发规范的SQL代码
-        3. 自动对生成的SQL进行规范检查
-        4. 根据检查结果优化SQL，并向用户解释修改原因
-
-        重要规范：
-        - 禁止使用 SELECT *
-        - 必须指定分区字段 dt 的过滤条件
-        - 表必须使用别名
-        - 字段别名使用下划线命名法
-        - 注意敏感字段的访问权限
+        # 提示词构建：稳定前缀在前，按需选择的表结构在后
+        self.prompt_builder = PromptBuilder(config.metadata_db_path, config.prompt_schema_token_budget,
+                                            config.retrieval_index_path)
+        self.system_prompt = self.prompt_builder.system_prompt()
+
+        # 根据本地统计给出生成SQL的扫描量预估
+        self.volume_estimator = VolumeEstimator(config.metadata_db_path)
+        # 返回前把SQL改写为扫描更少的等价查询
+        self.query_rewriter = QueryRewriter(estimator=self.volume_estimator)
+        self.auto_rewrite = config.sql_auto_rewrite
+        # 命中常用业务模板的需求直接渲染模板，不调用LLM
+        self.template_library = get_sql_template_library() if config.sql_templates_enabled else None
+
+        # 最近请求的提示词token、缓存命中与修复轮次统计
+        self.request_stats = deque(maxlen=200)
+
+        # 按会话登记的任务，支持按会话取消
+        self.session_tasks: Dict[str, Set[asyncio.Task]] = {}
+
+        # 全局信号量限制在途的LLM调用数量
+        self.max_concurrent_requests = max_concurrent_requests or config.llm_max_concurrency
+        self._llm_semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self._llm_waiting = 0
+        self._llm_inflight = 0
+        self._llm_max_waiting = 0
+        self._llm_total_calls = 0
+        self._llm_total_wait = 0.0
+
+        # 准入控制：按请求数/token数限流、优先级排队、重试与熔断
+        self.admission = AdmissionController(
+            requests_per_minute=config.llm_requests_per_minute,
+            tokens_per_minute=config.llm_tokens_per_minute,
+            max_retries=config.llm_max_retries,
+        )
+        # 预留给模型输出的token数，调用完成后按实际用量修正
+        self.expected_completion_tokens = 512
+
+        # 合并相同需求的并发生成流程
+        self._generation_flight = SingleFlight()
+
+    @property
+    def current_task(self) -> Optional[asyncio.Task]:
+        """默认会话中最近登记的任务（兼容旧接口）"""
+        tasks = self.session_tasks.get(self.DEFAULT_SESSION)
+        if not tasks:
+            return None
+        return next(iter(tasks))
+
+    def _register_task(self, session_id: str, task: asyncio.Task):
+        """登记会话任务"""
+        self.session_tasks.setdefault(session_id, set()).add(task)
+
+    def _unregister_task(self, session_id: str, task: asyncio.Task):
+        """注销会话任务，会话内没有任务时移除该会话"""
+        tasks = self.session_tasks.get(session_id)
+        if tasks is None:
+            return
+        tasks.discard(task)
+        if not tasks:
+            del self.session_tasks[session_id]
 
-        生成SQL时请遵循以下约定：
-        - 使用Hive SQL语法
-        - 表名格式：ods_*, dwd_*, dws_*, app_*
-        - 分区字段使用 dt，格式为 'yyyy-MM-dd'
-        - 字段命名使用蛇形命名法（snake_case）
+    def get_metrics(self) -> Dict:
+        """
+        获取并发与排队指标
 
-        请用中文与用户交流，生成的SQL代码要可以直接执行。
+        Returns:
+            包含会话数、任务数、LLM在途/排队数量等指标的字典
         """
+        return {
+            "active_sessions": len(self.session_tasks),
+            "running_tasks": sum(len(tasks) for tasks in self.session_tasks.values()),
+            "llm_max_concurrency": self.max_concurrent_requests,
+            "llm_inflight": self._llm_inflight,
+            "llm_queue_depth": self._llm_waiting,
+            "llm_max_queue_depth": self._llm_max_waiting,
+            "llm_total_calls": self._llm_total_calls,
+            "llm_avg_queue_wait_ms": round(self._llm_total_wait / self._llm_total_calls * 1000, 2)
+            if self._llm_total_calls else 0.0,
+            "admission_queue_depth": self.admission.queue_depth(),
+            "admission_stats": dict(self.admission.stats),
+            "circuit_state": self.admission.breaker.state,
+            "inflight_pipelines": self._generation_flight.inflight(),
+            "coalesced_requests": self._generation_flight.stats["coalesced"],
+            **self._prompt_metrics(),
+        }
 
-        # 添加任务取消支持
-        self.current_task = None
+    def _prompt_metrics(self) -> Dict:
+        """汇总最近请求的提示词token、缓存命中率与修复轮次比例"""
+        stats = list(self.request_stats)
+        if not stats:
+            return {"prompt_requests": 0, "prompt_cache_hit_rate": 0.0, "repair_round_rate": 0.0}
+        prompt_tokens = sum(item["prompt_tokens"] for item in stats)
+        cache_hit_tokens = sum(item["prompt_cache_hit_tokens"] for item in stats)
+        return {
+            "prompt_requests": len(stats),
+            "avg_prompt_tokens": round(prompt_tokens / len(stats), 1),
+            "prompt_cache_hit_rate": round(cache_hit_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "repair_round_rate": round(sum(1 for item in stats if item["repair_rounds"]) / len(stats), 3),
+            "template_hit_rate": round(sum(1 for item in stats if item.get("template")) / len(stats), 3),
+        }
 
-    async def _call_deepseek_api(self, messages: list, temperature: float = 0.1) -> str:
+    async def _call_deepseek_api(self, messages: list, temperature: float = 0.1, priority: str = "interactive") -> str:
         """
         调用DeepSeek API
 
         Args:
             messages: 消息列表
             temperature: 生成温度
+            priority: 优先级类别（interactive 或 batch）
 
         Returns:
             API返回的文本内容
         """
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
         payload = {
             "model": "deepseek-chat",  # 使用deepseek-chat模型
             "messages": messages,
@@ -83,27 +180,139 @@ class SQLAssistantAgent:
             "stream": False
         }
 
-        try:
-            # 创建一个可取消的请求任务
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
+        estimated = sum(estimate_tokens(m["content"]) for m in messages) + self.expected_completion_tokens
+        result = await self.admission.call(lambda: self._send_with_concurrency_limit(payload), estimated, priority)
+
+        usage = result.get("usage") or {}
+        if usage.get("total_tokens"):
+            self.admission.record_usage(estimated, usage["total_tokens"])
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["llm_calls"] += 1
+            stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            stats["prompt_cache_hit_tokens"] += usage.get("prompt_cache_hit_tokens", 0)
+            stats["completion_tokens"] += usage.get("completion_tokens", 0)
 
-            result = response.json()
+        try:
             return result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise Exception(f"解析DeepSeek API响应失败: {str(e)}")
+
+    async def _send_with_concurrency_limit(self, payload: dict) -> dict:
+        """在全局并发上限内发送请求"""
+        # 超过并发上限的调用在信号量上排队
+        queued_at = time.monotonic()
+        self._llm_waiting += 1
+        if self._llm_semaphore.locked():
+            self._llm_max_waiting = max(self._llm_max_waiting, self._llm_waiting)
+        try:
+            await self._llm_semaphore.acquire()
+        finally:
+            self._llm_waiting -= 1
+
+        self._llm_inflight += 1
+        self._llm_total_calls += 1
+        self._llm_total_wait += time.monotonic() - queued_at
+        try:
+            return await self._post_chat_completion(payload)
+        finally:
+            self._llm_inflight -= 1
+            self._llm_semaphore.release()
+
+    async def _post_chat_completion(self, payload: dict) -> dict:
+        """
+        发送chat completions请求
 
+        Args:
+            payload: 请求体
+
+        Returns:
+            API返回的JSON响应
+
+        Raises:
+            APICallError: 请求失败时，携带HTTP状态码
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        try:
+            # 在线程中执行阻塞请求，避免阻塞事件循环
+            response = await asyncio.to_thread(
+                requests.post, self.base_url, headers=headers, json=payload, timeout=30
+            )
+            response.raise_for_status()
+            return response.json()
+
+        except requests.exceptions.HTTPError as e:
+            retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+            raise APICallError(
+                f"DeepSeek API调用失败: {str(e)}",
+                status_code=e.response.status_code if e.response is not None else None,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
         except requests.exceptions.RequestException as e:
-            raise Exception(f"DeepSeek API调用失败: {str(e)}")
-        except KeyError as e:
+            raise APICallError(f"DeepSeek API调用失败: {str(e)}")
+        except ValueError as e:
             raise Exception(f"解析DeepSeek API响应失败: {str(e)}")
 
-    async def generate_and_review_sql(self, user_request: str) -> str:
-        """生成并审核SQL的核心方法"""
-        # 保存当前任务引用以便取消
-        self.current_task = asyncio.current_task()
+    async def generate_and_review_sql(self, user_request: str, session_id: str = DEFAULT_SESSION,
+                                      priority: str = "interactive") -> str:
+        """
+        生成并审核SQL的核心方法
+
+        Args:
+            user_request: 用户的业务需求
+            session_id: 会话ID，用于按会话取消任务
+            priority: LLM调用的优先级类别，批量任务使用 batch
+
+        Returns:
+            包含SQL和检查结果的回复
+        """
+        # 按会话登记当前任务以便取消
+        task = asyncio.current_task()
+        self._register_task(session_id, task)
+        try:
+            # 相同需求的并发请求共享同一个生成流程
+            return await self._generation_flight.do(
+                self._normalize_request(user_request),
+                lambda: self._generate_and_review_sql(user_request, priority)
+            )
+        finally:
+            self._unregister_task(session_id, task)
+
+    @staticmethod
+    def _normalize_request(user_request: str) -> str:
+        """规范化用户需求，作为合并并发请求的键"""
+        text = unicodedata.normalize("NFKC", user_request).casefold()
+        return re.sub(r"\s+", " ", text).strip()
+
+    async def _generate_and_review_sql(self, user_request: str, priority: str = "interactive") -> str:
+        """生成并审核SQL，并记录本次请求的提示词统计"""
+        stats = {"llm_calls": 0, "prompt_tokens": 0, "prompt_cache_hit_tokens": 0,
+                 "completion_tokens": 0, "repair_rounds": 0, "schema_tokens": 0, "template": None}
+        _request_stats.set(stats)
+        try:
+            return await self._run_generation_pipeline(user_request, priority, stats)
+        finally:
+            self.request_stats.append(stats)
+            print(f"📊 提示词token: {stats['prompt_tokens']}，缓存命中: {stats['prompt_cache_hit_tokens']}，"
+                  f"表结构: {stats['schema_tokens']}，修复轮次: {stats['repair_rounds']}")
+
+    async def _run_generation_pipeline(self, user_request: str, priority: str, stats: Dict) -> str:
+        """生成、检查并按需修复SQL"""
+        # 0. 命中模板且渲染结果通过规范检查时直接返回
+        templated = self._render_template(user_request, stats)
+        if templated is not None:
+            return templated
+
+        schema_context = self.prompt_builder.schema_context(user_request)
+        stats["schema_tokens"] = estimate_tokens(schema_context)
 
         # 1. 首先生成初始SQL
         print("🤖 正在理解您的需求并生成SQL...")
-        initial_sql = await self._generate_initial_sql(user_request)
+        initial_sql = await self._generate_initial_sql(user_request, priority, schema_context)
         if not initial_sql:
             return "抱歉，我无法理解您的需求并生成SQL。"
 
@@ -115,12 +324,15 @@ class SQLAssistantAgent:
         lint_result = await lint_sql(initial_sql)
 
         # 3. 如果有问题，尝试修复
+        final_sql, final_check = initial_sql, lint_result
         if "符合所有规范" not in lint_result:
             print("⚠️ 发现规范问题，正在优化...")
-            optimized_sql = await self._optimize_sql(initial_sql, lint_result, user_request)
+            stats["repair_rounds"] += 1
+            optimized_sql = await self._optimize_sql(initial_sql, lint_result, user_request, priority, schema_context)
 
             # 再次检查优化后的SQL
             if optimized_sql != initial_sql:
+                final_sql = optimized_sql
                 # Call the lint function directly instead of using MCP client
                 final_check = await lint_sql(optimized_sql)
                 if "符合所有规范" in final_check:
@@ -128,27 +340,64 @@ class SQLAssistantAgent:
                 else:
                     result = f"🔄 已优化SQL，但仍存在一些建议：\n```sql\n{optimized_sql}\n```\n\n📋 **检查结果**:\n{final_check}"
             else:
+                final_check = lint_result
                 result = f"ℹ️ 生成的SQL有一些建议：\n```sql\n{initial_sql}\n```\n\n📋 **检查结果**:\n{lint_result}"
         else:
             result = f"✅ 生成的SQL符合所有规范：\n```sql\n{initial_sql}\n```"
 
-        return result
+        # 4. 预估扫描量更少时应用等价改写
+        if self.auto_rewrite:
+            try:
+                rewrite = await asyncio.to_thread(self.query_rewriter.rewrite, final_sql)
+            except RewriteError as e:
+                print(f"SQL改写跳过: {e}")
+            else:
+                # 改写后的SQL重新检查，规范问题不比原SQL多时才采用，结果按新的检查报告重写
+                rewrite_check = await lint_sql(rewrite.sql) if rewrite.improved else None
+                if rewrite_check is not None and _issue_count(rewrite_check) <= _issue_count(final_check):
+                    final_sql, final_check = rewrite.sql, rewrite_check
+                    if "符合所有规范" in rewrite_check:
+                        result = f"✅ 已为您生成符合规范的SQL：\n```sql\n{final_sql}\n```"
+                    else:
+                        result = f"ℹ️ 生成的SQL有一些建议：\n```sql\n{final_sql}\n```\n\n📋 **检查结果**:\n{rewrite_check}"
+                    result += f"\n\n⚡ **已自动改写为等价SQL**（谓词下推、列裁剪、子查询合并）\n{rewrite.summary()}"
+                elif rewrite_check is not None:
+                    print(f"改写后的SQL规范问题更多，保留原SQL:\n{rewrite_check}")
+
+        # 5. 附上各表的预估数据量和命中分区数
+        volume_hints = self.volume_estimator.render(final_sql)
+        if volume_hints:
+            result += f"\n\n{volume_hints}"
 
-    async def _generate_initial_sql(self, user_request: str) -> str:
-        """调用DeepSeek API生成初始SQL"""
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"""
-请根据以下业务需求生成Hive SQL查询：
+        return result
 
-业务需求：{user_request}
+    def _render_template(self, user_request: str, stats: Dict) -> Optional[str]:
+        """按模板生成SQL；没有匹配的模板或渲染结果未通过规范检查时返回 None"""
+        if self.template_library is None:
+            return None
+        match = self.template_library.match(user_request)
+        if match is None:
+            return None
+        lint_result = check_sql(match.sql)
+        if "符合所有规范" not in lint_result:
+            print(f"模板 {match.template.name} 渲染结果未通过规范检查，改用LLM生成:\n{lint_result}")
+            return None
+        stats["template"] = match.template.name
+        print(f"🧩 命中SQL模板「{match.template.title}」，耗时 {match.elapsed_ms:.1f} ms")
+        result = (f"✅ 已按模板「{match.template.title}」生成符合规范的SQL：\n```sql\n{match.sql}\n```\n\n"
+                  f"🧩 **模板参数**: {match.describe()}")
+        volume_hints = self.volume_estimator.render(match.sql)
+        if volume_hints:
+            result += f"\n\n{volume_hints}"
+        return result
 
-请只返回SQL代码，不要额外的解释或标记。确保SQL符合规范且可以直接执行。
-"""}
-        ]
+    async def _generate_initial_sql(self, user_request: str, priority: str = "interactive",
+                                    schema_context: str = "") -> str:
+        """调用DeepSeek API生成初始SQL"""
+        messages = self.prompt_builder.generation_messages(user_request, schema_context)
 
         try:
-            response = await self._call_deepseek_api(messages, temperature=0.1)
+            response = await self._call_deepseek_api(messages, temperature=0.1, priority=priority)
 
             # 清理响应，提取SQL代码
             sql_code = self._extract_sql_from_response(response)
@@ -158,24 +407,12 @@ class SQLAssistantAgent:
             print(f"DeepSeek API调用失败: {e}")
             return ""
 
-    async def _optimize_sql(self, original_sql: str, lint_feedback: str, user_request: str) -> str:
+    async def _optimize_sql(self, original_sql: str, lint_feedback: str, user_request: str,
+                            priority: str = "interactive", schema_context: str = "") -> str:
         """根据检查结果调用DeepSeek优化SQL"""
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content":
-                f"""原始业务需求：{user_request}
-                    原始SQL代码：
-                ```sql
-                {original_sql}
-                规范检查反馈：
-                {lint_feedback}
-
-                请根据规范检查反馈优化原始SQL代码，解决所有错误和警告问题。
-                请只返回优化后的SQL代码，不要额外的解释或标记。
-                """}
-                ]
+        messages = self.prompt_builder.repair_messages(user_request, original_sql, lint_feedback, schema_context)
         try:
-            response = await self._call_deepseek_api(messages, temperature=0.1)
+            response = await self._call_deepseek_api(messages, temperature=0.1, priority=priority)
             optimized_sql = self._extract_sql_from_response(response)
 
             # 如果优化失败，返回原始SQL
@@ -215,17 +452,31 @@ class SQLAssistantAgent:
         # 直接返回清理后的响应
         return cleaned_response
 
+    async def cancel_session_task(self, session_id: str = DEFAULT_SESSION, timeout: float = 5.0) -> str:
+        """
+        取消指定会话中正在运行的任务，不影响其他会话
+
+        Args:
+            session_id: 会话ID
+            timeout: 等待任务结束的最长秒数
+
+        Returns:
+            取消结果说明
+        """
+        tasks = [task for task in self.session_tasks.get(session_id, ()) if not task.done()]
+        if not tasks:
+            return "当前没有正在运行的任务"
+
+        for task in tasks:
+            task.cancel()
+        # 使用 asyncio.wait 等待结束，避免被取消任务的 CancelledError 传播到调用方
+        await asyncio.wait(tasks, timeout=timeout)
+        print(f"会话 {session_id} 的 {len(tasks)} 个任务已取消")
+        return "任务已成功取消"
+
     async def cancel_current_task(self):
-        """取消当前任务"""
-        if self.current_task and not self.current_task.done():
-            self.current_task.cancel()
-            try:
-                await self.current_task
-            except asyncio.CancelledError:
-                print("任务已成功取消")
-                # 根据 SonarQube 规则 python:S7497，需要重新抛出 CancelledError
-                raise
-        return "当前没有正在运行的任务"
+        """取消默认会话的当前任务"""
+        return await self.cancel_session_task(self.DEFAULT_SESSION)
 
     async def chat(self, message: str) -> str:
         """
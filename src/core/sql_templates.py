@@ -0,0 +1,516 @@
+# sql_templates.py
+"""
+常用业务SQL模板库：参数化的 Hive SQL，用 ":名称" 作为参数占位符（见 src/rules/sql_templates.toml）。
+
+模板注册时预先解析为 sqlglot 语法树，并用示例参数渲染后做规范检查，未通过的模板不参与匹配。
+用户需求按关键词匹配模板，从需求中抽取日期范围、枚举值（如渠道）、指标等参数，
+在语法树上替换占位符生成SQL；命中模板的需求不再调用LLM生成。需求中除关键词、参数、日期和
+常用虚词外还有其他内容（如另外的指标或过滤条件）时不匹配，交给LLM处理。
+"""
+import datetime
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import sqlglot
+import toml
+from sqlglot import exp
+
+from .config import config
+
+SLOT_TYPES = ("date", "enum", "metric", "int", "string")
+
+DEFAULT_TEMPLATES_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rules', 'sql_templates.toml'))
+
+_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 需求中同时出现同一参数的多个取值时 _resolve 的返回值，模板不匹配
+_AMBIGUOUS = object()
+
+_NUMBER = r"(\d+|[零一二两三四五六七八九十]+)"
+
+_DATE_PATTERNS = (
+    re.compile(r"(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})日?"),
+    re.compile(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)"),
+)
+
+# extract_date_range 识别的日期说法，匹配时视为已被参数覆盖
+_DATE_WORDS = re.compile("|".join([
+    *(pattern.pattern for pattern in _DATE_PATTERNS),
+    r"(?:最近|近|过去)" + _NUMBER + r"\s*(?:天|日|周|个月|月)",
+    "上周|上星期|本周|这周|上个月|上月|本月|这个月|前天|昨天|昨日|今天|今日",
+]))
+
+# 不影响需求含义的常用词，匹配时与关键词、参数一样视为已覆盖
+FILLER_WORDS = ("帮我", "给我", "请", "统计", "查询", "查看", "查", "计算", "看一下", "一下", "看看", "列出",
+                "是多少", "有多少", "多少", "情况", "数据", "分别", "的", "了", "吗", "呢", "从", "到", "至")
+
+
+class TemplateError(Exception):
+    """模板无法解析、参数定义有误，或示例SQL未通过规范检查"""
+
+
+def normalize(text: str) -> str:
+    """全角转半角、统一大小写和空白，用于关键词匹配"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def parse_number(text: str) -> Optional[int]:
+    """阿拉伯数字或百以内的中文数字"""
+    if text.isdigit():
+        return int(text)
+    if not text or any(char not in _DIGITS and char != "十" for char in text):
+        return None
+    if "十" not in text:
+        return int("".join(str(_DIGITS[char]) for char in text))
+    tens, _, units = text.partition("十")
+    return (_DIGITS[tens] if tens else 1) * 10 + (_DIGITS[units] if units else 0)
+
+
+def extract_date_range(text: str, today: datetime.date) -> Optional[Tuple[datetime.date, datetime.date]]:
+    """
+    从需求中抽取日期范围：明确的日期（两个日期为起止），今天/昨天/前天，最近N天，本周/上周，本月/上个月
+
+    Returns:
+        (起始日期, 结束日期)，都包含在内；没有日期时为 None
+    """
+    dates = []
+    for pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                dates.append(datetime.date(*(int(part) for part in match.groups())))
+            except ValueError:
+                continue
+        if dates:
+            return min(dates), max(dates)
+
+    yesterday = today - datetime.timedelta(days=1)
+    match = re.search(r"(?:最近|近|过去)" + _NUMBER + r"\s*(天|日|周|个月|月)", text)
+    if match:
+        count = parse_number(match.group(1)) or 1
+        days = {"周": 7, "个月": 30, "月": 30}.get(match.group(2), 1) * count
+        return today - datetime.timedelta(days=days), yesterday
+    if "上周" in text or "上星期" in text:
+        start = today - datetime.timedelta(days=today.weekday() + 7)
+        return start, start + datetime.timedelta(days=6)
+    if "本周" in text or "这周" in text:
+        return today - datetime.timedelta(days=today.weekday()), today
+    if "上个月" in text or "上月" in text:
+        end = today.replace(day=1) - datetime.timedelta(days=1)
+        return end.replace(day=1), end
+    if "本月" in text or "这个月" in text:
+        return today.replace(day=1), today
+    for word, offset in (("前天", 2), ("昨天", 1), ("昨日", 1), ("今天", 0), ("今日", 0)):
+        if word in text:
+            day = today - datetime.timedelta(days=offset)
+            return day, day
+    return None
+
+
+def _relative_date(value: str, today: datetime.date) -> datetime.date:
+    """默认值中的日期：today、yesterday、-N（N天前）或 YYYY-MM-DD"""
+    if value == "today":
+        return today
+    if value == "yesterday":
+        return today - datetime.timedelta(days=1)
+    if re.fullmatch(r"-\d+", value):
+        return today + datetime.timedelta(days=int(value))
+    return datetime.date.fromisoformat(value)
+
+
+class SlotOption(NamedTuple):
+    """枚举或指标参数的一个取值：value 为写入SQL的值（指标为SQL表达式），synonyms 为需求中的说法"""
+    value: str
+    synonyms: Tuple[str, ...]
+
+
+class TemplateSlot(NamedTuple):
+    """模板参数"""
+    name: str
+    # SLOT_TYPES 之一
+    type: str
+    description: str = ""
+    # date：取日期范围的起始（start）或结束（end）
+    bound: str = "end"
+    format: str = "%Y-%m-%d"
+    # enum / metric 的取值
+    options: Tuple[SlotOption, ...] = ()
+    # int / string：从需求中抽取参数的正则，取第一个分组
+    pattern: Optional[str] = None
+    default: Optional[str] = None
+    # 需求中没有且没有默认值时，删除占位符所在的过滤条件
+    optional: bool = False
+    # 注册时做规范检查使用的参数值
+    example: Optional[str] = None
+
+
+class SQLTemplate:
+    """一个参数化的SQL模板"""
+
+    def __init__(self, name: str, title: str, sql: str, keywords: Sequence[str], slots: Sequence[TemplateSlot],
+                 exclude: Sequence[str] = (), description: str = "", allowed: Sequence[str] = ()):
+        """
+        Args:
+            name: 模板标识
+            title: 模板名称
+            sql: 带 ":名称" 占位符的SQL
+            keywords: 需求中必须全部出现的关键词（正则表达式），每项可用 "|" 分隔多个同义词
+            slots: 参数定义
+            exclude: 需求中出现任意一个时不匹配该模板
+            description: 模板说明
+            allowed: 需求中可以出现、但不要求出现的说法（如模板本身统计的指标）
+        """
+        self.name = name
+        self.title = title
+        self.sql = sql.strip()
+        self.keywords = tuple(tuple(re.compile(normalize(word)) for word in group.split("|")) for group in keywords)
+        self.exclude = tuple(normalize(word) for word in exclude)
+        self.allowed = tuple(normalize(word) for word in allowed)
+        self.slots = {slot.name: slot for slot in slots}
+        self.description = description
+        # 注册时生成：预解析的语法树和指标表达式
+        self.tree: Optional[exp.Expression] = None
+        self.metrics: Dict[Tuple[str, str], exp.Expression] = {}
+
+    @classmethod
+    def from_config(cls, name: str, entry: Dict) -> "SQLTemplate":
+        """
+        从 sql_templates.toml 中的 [templates.<name>] 配置创建
+
+        Raises:
+            TemplateError: 参数类型不支持
+        """
+        slots = []
+        for slot_name, slot in entry.get("params", {}).items():
+            if slot.get("type") not in SLOT_TYPES:
+                raise TemplateError(f"模板 {name} 的参数 {slot_name} 类型不支持: {slot.get('type')}")
+            options = tuple(SlotOption(str(option["value"]), tuple(option.get("synonyms", ())))
+                            for option in slot.get("options", ()))
+            slots.append(TemplateSlot(
+                slot_name, slot["type"], slot.get("description", ""), slot.get("bound", "end"),
+                slot.get("format", "%Y-%m-%d"), options, slot.get("pattern"),
+                None if slot.get("default") is None else str(slot["default"]), slot.get("optional", False),
+                None if slot.get("example") is None else str(slot["example"])))
+        return cls(name, entry.get("title", name), entry["sql"], entry.get("keywords", ()), slots,
+                   entry.get("exclude", ()), entry.get("description", ""), entry.get("allowed", ()))
+
+    def matched_keywords(self, text: str) -> Optional[int]:
+        """关键词全部出现时返回关键词组数，否则为 None"""
+        if any(word in text for word in self.exclude):
+            return None
+        if not all(any(word.search(text) for word in group) for group in self.keywords):
+            return None
+        return len(self.keywords)
+
+    def uncovered(self, text: str) -> str:
+        """
+        需求中不属于关键词、参数取值、日期、allowed 和 FILLER_WORDS 的部分
+
+        Returns:
+            未覆盖的文字和数字，没有时为空字符串
+        """
+        covered = [False] * len(text)
+
+        def cover(pattern: str):
+            for match in re.finditer(pattern, text):
+                covered[match.start():match.end()] = [True] * (match.end() - match.start())
+
+        for group in self.keywords:
+            for word in group:
+                cover(word.pattern)
+        for slot in self.slots.values():
+            if slot.type in ("enum", "metric"):
+                for option in slot.options:
+                    for word in (option.value, *option.synonyms):
+                        cover(re.escape(normalize(word)))
+            elif slot.pattern:
+                cover(slot.pattern)
+        cover(_DATE_WORDS.pattern)
+        for word in (*self.allowed, *FILLER_WORDS):
+            cover(re.escape(word))
+        return "".join(char for char, done in zip(text, covered) if not done and re.match(r"\w", char))
+
+
+class TemplateMatch(NamedTuple):
+    """需求匹配到的模板"""
+    template: SQLTemplate
+    # 参数名 -> 取值，None 表示删除了对应的过滤条件
+    params: Dict[str, Optional[str]]
+    sql: str
+    elapsed_ms: float
+
+    def describe(self) -> str:
+        """参数说明"""
+        parts = []
+        for name, value in self.params.items():
+            slot = self.template.slots[name]
+            label = slot.description or name
+            if value is None:
+                parts.append(f"{label}：不限")
+            else:
+                synonyms = [option.synonyms[0] for option in slot.options if option.value == value and option.synonyms]
+                parts.append(f"{label}：{synonyms[0] if synonyms else value}")
+        return "，".join(parts)
+
+
+def _drop_condition(node: exp.Expression):
+    """删除占位符所在的过滤条件（AND/OR 的一侧，或整个 WHERE/HAVING）"""
+    condition = node
+    while not isinstance(condition.parent, (exp.Connector, exp.Where, exp.Having)):
+        condition = condition.parent
+        if condition is None or isinstance(condition, (exp.Query, exp.Join, exp.Subquery)):
+            raise TemplateError(f"可选参数 {node.name} 必须位于 WHERE/HAVING 条件中")
+    parent = condition.parent
+    if isinstance(parent, exp.Connector):
+        parent.replace(parent.expression if condition is parent.this else parent.this)
+    else:
+        parent.pop()
+
+
+class SQLTemplateLibrary:
+    """模板库：注册时预解析并做规范检查，按需求匹配模板并渲染SQL"""
+
+    def __init__(self, lint: Optional[Callable[[str], str]] = None, dialect: str = "hive"):
+        """
+        Args:
+            lint: 规范检查函数，返回 lint_sql 格式的报告；为 None 时注册不做检查
+            dialect: SQL方言
+        """
+        self.lint = lint
+        self.dialect = dialect
+        self._templates: Dict[str, SQLTemplate] = {}
+        # 未通过注册的模板及原因
+        self.rejected: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def templates(self) -> List[SQLTemplate]:
+        return list(self._templates.values())
+
+    def get(self, name: str) -> Optional[SQLTemplate]:
+        return self._templates.get(name)
+
+    def register(self, template: SQLTemplate) -> SQLTemplate:
+        """
+        解析模板并用示例参数做规范检查，通过后加入模板库（同名模板被替换）
+
+        Raises:
+            TemplateError: SQL 无法解析、占位符与参数定义不一致，或示例SQL未通过规范检查
+        """
+        try:
+            tree = sqlglot.parse_one(template.sql, read=self.dialect)
+        except Exception as e:
+            raise TemplateError(f"模板 {template.name} 解析失败: {e}") from e
+        if not isinstance(tree, exp.Query):
+            raise TemplateError(f"模板 {template.name} 不是 SELECT 查询")
+        placeholders = [node.name for node in tree.find_all(exp.Placeholder)]
+        if not all(placeholders):
+            raise TemplateError(f"模板 {template.name} 只支持 \":名称\" 形式的参数")
+        undefined = sorted(set(placeholders) - set(template.slots))
+        unused = sorted(set(template.slots) - set(placeholders))
+        if undefined or unused:
+            raise TemplateError(f"模板 {template.name} 的参数与占位符不一致：未定义 {undefined}，未使用 {unused}")
+
+        metrics = {}
+        for slot in template.slots.values():
+            if slot.type in ("enum", "metric") and not slot.options:
+                raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 没有取值")
+            if slot.type == "metric":
+                for option in slot.options:
+                    try:
+                        metrics[(slot.name, option.value)] = sqlglot.parse_one(option.value, read=self.dialect)
+                    except Exception as e:
+                        raise TemplateError(f"模板 {template.name} 的指标 {option.value} 解析失败: {e}") from e
+        template.tree, template.metrics = tree, metrics
+
+        today = datetime.date.today()
+        examples = {name: self._example(template, slot, today) for name, slot in template.slots.items()}
+        sql = self.render(template, examples)
+        for slot in template.slots.values():
+            if slot.optional:
+                self.render(template, dict(examples, **{slot.name: None}))
+        if self.lint is not None:
+            report = self.lint(sql)
+            if "符合所有规范" not in report:
+                raise TemplateError(f"模板 {template.name} 未通过规范检查:\n{report}")
+        with self._lock:
+            self._templates = dict(self._templates, **{template.name: template})
+        return template
+
+    def load(self, path: str) -> int:
+        """
+        注册 TOML 文件中 [templates.*] 的全部模板，未通过的模板记录在 rejected 中
+
+        Returns:
+            注册成功的模板数
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = toml.load(f).get("templates", {})
+        loaded = 0
+        for name, entry in entries.items():
+            try:
+                self.register(SQLTemplate.from_config(name, entry))
+                loaded += 1
+            except (TemplateError, KeyError, ValueError) as e:
+                self.rejected[name] = str(e)
+                print(f"SQL模板 {name} 未注册: {e}")
+        return loaded
+
+    def _example(self, template: SQLTemplate, slot: TemplateSlot, today: datetime.date) -> str:
+        if slot.example is not None:
+            return slot.example
+        if slot.type == "date":
+            return _relative_date(slot.default or "yesterday", today).strftime(slot.format)
+        if slot.default is not None:
+            return slot.default
+        if slot.options:
+            return slot.options[0].value
+        if slot.type == "int":
+            return "1"
+        raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 需要 example 或 default")
+
+    def _resolve(self, slot: TemplateSlot, text: str, dates, today: datetime.date) -> Tuple[Optional[str], bool]:
+        """(参数值, 是否取自需求)；取不到时参数值为 None，需求中有多个取值时为 _AMBIGUOUS"""
+        if slot.type == "date":
+            if dates is not None:
+                return (dates[0] if slot.bound == "start" else dates[1]).strftime(slot.format), True
+            if slot.default is not None:
+                return _relative_date(slot.default, today).strftime(slot.format), False
+            return None, False
+        if slot.type in ("enum", "metric"):
+            found = [(normalize(word), option.value) for option in slot.options
+                     for word in (option.value, *option.synonyms) if normalize(word) in text]
+            # 被其他取值的更长说法包含的词不算单独出现，如 "用户数" 之于 "下单用户数"
+            values = {value for word, value in found
+                      if not any(word in other and word != other and value != other_value
+                                 for other, other_value in found)}
+            if len(values) > 1:
+                return _AMBIGUOUS, True
+            if values:
+                return values.pop(), True
+        elif slot.pattern:
+            match = re.search(slot.pattern, text)
+            if match:
+                value = match.group(1)
+                if slot.type == "int":
+                    number = parse_number(value)
+                    if number is not None:
+                        return str(number), True
+                else:
+                    return value, True
+        return slot.default, False
+
+    def match(self, request: str, today: Optional[datetime.date] = None) -> Optional[TemplateMatch]:
+        """
+        按关键词匹配模板并从需求中抽取参数
+
+        Args:
+            request: 用户需求
+            today: 计算相对日期的当天，默认为今天
+
+        Returns:
+            匹配结果；没有模板的关键词全部出现、需求中还有模板覆盖不了的内容、必需的参数无法取得，
+            或需求中同时出现同一参数的多个取值时为 None
+        """
+        started = time.perf_counter()
+        text = normalize(request)
+        today = today or datetime.date.today()
+        dates = extract_date_range(text, today)
+        candidates = []
+        for order, template in enumerate(self._templates.values()):
+            matched = template.matched_keywords(text)
+            if matched is None or template.uncovered(text):
+                continue
+            params, found, complete = {}, 0, True
+            for name, slot in template.slots.items():
+                value, extracted = self._resolve(slot, text, dates, today)
+                if value is _AMBIGUOUS or value is None and not slot.optional:
+                    complete = False
+                    break
+                params[name] = value
+                found += extracted
+            if complete:
+                candidates.append((-matched, -found, order, template, params))
+        if not candidates:
+            return None
+        *_, template, params = min(candidates, key=lambda candidate: candidate[:3])
+        sql = self.render(template, params)
+        return TemplateMatch(template, params, sql, (time.perf_counter() - started) * 1000)
+
+    def render(self, template: SQLTemplate, params: Dict[str, Optional[str]]) -> str:
+        """
+        在预解析的语法树上替换占位符
+
+        Args:
+            template: 已注册的模板
+            params: 参数名 -> 取值；可选参数为 None 时删除所在的过滤条件
+
+        Raises:
+            TemplateError: 缺少参数，或参数值不合法
+        """
+        if template.tree is None:
+            raise TemplateError(f"模板 {template.name} 尚未注册")
+        tree = template.tree.copy()
+        for node in list(tree.find_all(exp.Placeholder)):
+            slot = template.slots[node.name]
+            if params.get(slot.name) is None:
+                if not slot.optional:
+                    raise TemplateError(f"模板 {template.name} 缺少参数 {slot.name}")
+                _drop_condition(node)
+                continue
+            node.replace(self._value(template, slot, params[slot.name]))
+        return tree.sql(self.dialect, pretty=True)
+
+    @staticmethod
+    def _value(template: SQLTemplate, slot: TemplateSlot, value: str) -> exp.Expression:
+        if slot.type == "metric":
+            metric = template.metrics.get((slot.name, value))
+            if metric is None:
+                raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 不支持指标 {value}")
+            return metric.copy()
+        if slot.type == "enum" and value not in {option.value for option in slot.options}:
+            raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 不支持取值 {value}")
+        if slot.type == "int":
+            try:
+                return exp.Literal.number(int(value))
+            except ValueError as e:
+                raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 不是整数: {value}") from e
+        if slot.type == "date":
+            try:
+                datetime.datetime.strptime(value, slot.format)
+            except ValueError as e:
+                raise TemplateError(f"模板 {template.name} 的参数 {slot.name} 不是 {slot.format} 格式的日期: {value}") \
+                    from e
+        return exp.Literal.string(value)
+
+
+_library_lock = threading.Lock()
+_template_library: Optional[SQLTemplateLibrary] = None
+
+
+def get_sql_template_library() -> SQLTemplateLibrary:
+    """进程共享的模板库，加载 SQL_TEMPLATES_PATH（默认 src/rules/sql_templates.toml）并用 lint_sql 的规则检查"""
+    global _template_library
+    if _template_library is None:
+        with _library_lock:
+            if _template_library is None:
+                from .server import RULES_CONFIG, check_sql
+                library = SQLTemplateLibrary(check_sql, RULES_CONFIG.get("general", {}).get("sql_dialect", "hive"))
+                path = config.sql_templates_path or DEFAULT_TEMPLATES_PATH
+                if os.path.exists(path):
+                    library.load(path)
+                _template_library = library
+    return _template_library
+
+
+def set_sql_template_library(library: Optional[SQLTemplateLibrary]) -> Optional[SQLTemplateLibrary]:
+    """替换进程共享的模板库（None 表示下次使用时按配置重新加载），返回原来的实例"""
+    global _template_library
+    with _library_lock:
+        previous, _template_library = _template_library, library
+    return previous
@@ -0,0 +1,245 @@
+# sync_scheduler.py
+"""
+服务进程内的元数据后台同步。
+
+调度线程按检查周期（带随机抖动，避免多个实例同时打到数据源）唤醒，只同步已到各自
+sync_interval 的数据源；同步在独立线程中执行，不占用 MCP 请求的事件循环。同一时刻最多
+只有一次同步：手动触发的范围已被正在进行的同步覆盖时等待并共享它的结果，否则排队在它
+之后再执行一次（排队中的触发合并为一次）。
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, FrozenSet, NamedTuple, Optional, Sequence, Tuple
+
+from .config import config
+from ..utils.db_config import db_config
+from ..utils.metadata_collector import MetadataCollector
+from ..utils.sqlite_access import read_connection
+
+
+class SyncRequest(NamedTuple):
+    """一次同步的范围"""
+    full: bool
+    # None 表示全部数据源
+    sources: Optional[FrozenSet[str]]
+    due_only: bool
+
+    def covers(self, other: "SyncRequest") -> bool:
+        """本次同步是否已包含 other 要求的全部内容"""
+        return ((self.full or not other.full)
+                and (self.sources is None or (other.sources is not None and other.sources <= self.sources))
+                and (not self.due_only or other.due_only))
+
+    def merge(self, other: "SyncRequest") -> "SyncRequest":
+        """同时满足两者的最小同步范围"""
+        sources = None if self.sources is None or other.sources is None else self.sources | other.sources
+        return SyncRequest(self.full or other.full, sources, self.due_only and other.due_only)
+
+
+class SyncScheduler:
+    """后台元数据同步调度器，记录最近一次同步的耗时、变更行数和各数据源的数据陈旧程度"""
+
+    def __init__(self, collector: MetadataCollector, check_interval: float = 60.0, jitter: float = 0.1,
+                 rng: Optional[random.Random] = None):
+        """
+        Args:
+            collector: 元数据采集器
+            check_interval: 检查是否有数据源到期的周期（秒）
+            jitter: 检查周期的随机抖动比例，0.1 表示上下浮动 10%
+            rng: 随机数生成器，测试时可固定
+        """
+        self.collector = collector
+        self.check_interval = check_interval
+        self.jitter = jitter
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+        self._inflight_request: Optional[SyncRequest] = None
+        # 范围未被在途同步覆盖的触发，在途同步结束后执行
+        self._queued: Optional[Tuple[Future, SyncRequest, str]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.next_run_at: Optional[float] = None
+        self.stats = {
+            "runs": 0, "failures": 0, "coalesced": 0,
+            "last_trigger": None, "last_started_at": None, "last_finished_at": None,
+            "last_duration_s": None, "last_rows_changed": None, "last_error": None,
+        }
+
+    def next_delay(self) -> float:
+        """下一次检查前的等待秒数"""
+        return self.check_interval * (1 + self._rng.uniform(-self.jitter, self.jitter))
+
+    def start(self):
+        """启动调度线程（守护线程，重复调用无效）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="metadata-sync-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止调度线程，等待正在进行的同步结束"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        while True:
+            with self._lock:
+                inflight = self._inflight
+            if inflight is None:
+                break
+            try:
+                inflight.result(timeout)
+            except Exception:
+                pass
+            if not inflight.done():
+                break
+
+    def _loop(self):
+        while True:
+            delay = self.next_delay()
+            self.next_run_at = time.time() + delay
+            if self._stop.wait(delay):
+                break
+            future, _ = self.trigger(due_only=True, reason="scheduled")
+            try:
+                future.result()
+            except Exception as e:
+                print(f"定时同步元数据失败: {e}")
+        self.next_run_at = None
+
+    def trigger(self, full: bool = False, sources: Optional[Sequence[str]] = None, due_only: bool = False,
+                reason: str = "manual") -> Tuple[Future, bool]:
+        """
+        发起一次同步；已有同步在进行且范围覆盖本次触发时直接返回它的结果，
+        否则排队在它之后执行（已有排队的触发时合并到一起）
+
+        Args:
+            full: 为True时重新校验所有表
+            sources: 要同步的数据源，默认为全部
+            due_only: 为True时只同步已到同步周期的数据源
+            reason: 触发来源，记录在统计中
+
+        Returns:
+            (同步结果的 Future, 是否新发起了同步)
+        """
+        request = SyncRequest(full, None if sources is None else frozenset(sources), due_only)
+        future = Future()
+        # 标记为运行中，等待方取消时不会取消共享的同步
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._inflight is not None and self._inflight_request.covers(request):
+                self.stats["coalesced"] += 1
+                return self._inflight, False
+            if self._queued is not None:
+                queued, queued_request, queued_reason = self._queued
+                self._queued = (queued, queued_request.merge(request), queued_reason)
+                self.stats["coalesced"] += 1
+                return queued, False
+            if self._inflight is not None:
+                self._queued = (future, request, reason)
+                return future, True
+            self._inflight, self._inflight_request = future, request
+        self._start(future, request, reason)
+        return future, True
+
+    def _start(self, future: Future, request: SyncRequest, reason: str):
+        thread = threading.Thread(target=self._run, args=(future, request, reason), name="metadata-sync",
+                                  daemon=True)
+        thread.start()
+
+    def _run(self, future: Future, request: SyncRequest, reason: str):
+        started_at = time.time()
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            sources = None if request.sources is None else sorted(request.sources)
+            result = self.collector.sync_metadata(full=request.full, sources=sources, due_only=request.due_only)
+        except Exception as e:
+            error = e
+        with self._lock:
+            self.stats.update(last_trigger=reason, last_started_at=started_at, last_finished_at=time.time(),
+                              last_duration_s=round(time.perf_counter() - started, 3))
+            self.stats["runs"] += 1
+            if error is None:
+                self.stats["last_rows_changed"] = result["rows_changed"]
+                self.stats["last_error"] = "; ".join(f"{k}: {v}" for k, v in result["errors"].items()) or None
+            else:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = str(error)
+            # 先切换在途标记再交付结果，等待方随后发起的同步会重新执行
+            queued, self._queued = self._queued, None
+            if queued is None:
+                self._inflight, self._inflight_request = None, None
+            else:
+                self._inflight, self._inflight_request = queued[0], queued[1]
+        if queued is not None:
+            self._start(*queued)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def running(self) -> bool:
+        """是否有同步正在进行"""
+        return self._inflight is not None
+
+    def staleness(self, now: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        各数据源距上次成功同步的秒数
+
+        Returns:
+            数据源名称到秒数的映射，从未成功同步的为 None
+        """
+        now = time.time() if now is None else now
+        last_synced = {}
+        if os.path.exists(self.collector.sqlite_db_path):
+            with read_connection(self.collector.sqlite_db_path) as conn:
+                last_synced = dict(conn.execute("SELECT source, last_synced_at FROM sync_state"))
+        return {name: round(now - last_synced[name], 1) if last_synced.get(name) is not None else None
+                for name in db_config.sources()}
+
+    def metrics(self) -> Dict:
+        """同步统计：运行次数、最近一次的耗时和变更行数、各数据源及最大陈旧秒数"""
+        with self._lock:
+            metrics = dict(self.stats)
+        staleness = self.staleness()
+        metrics.update(running=self.running(), next_run_at=self.next_run_at, staleness_s=staleness,
+                       max_staleness_s=(None if not staleness or None in staleness.values()
+                                        else max(staleness.values())))
+        return metrics
+
+
+_scheduler_lock = threading.Lock()
+_sync_scheduler: Optional[SyncScheduler] = None
+
+
+def get_sync_scheduler() -> SyncScheduler:
+    """进程共享的同步调度器，同步到 METADATA_DB_PATH"""
+    global _sync_scheduler
+    if _sync_scheduler is None:
+        with _scheduler_lock:
+            if _sync_scheduler is None:
+                collector = MetadataCollector(
+                    sqlite_db_path=config.metadata_db_path,
+                    snapshot_path=config.metadata_snapshot_path,
+                    retrieval_index_path=config.retrieval_index_path,
+                    parallelism=config.metadata_sync_parallelism,
+                    max_retries=config.metadata_sync_retries,
+                )
+                _sync_scheduler = SyncScheduler(collector, config.metadata_sync_check_interval,
+                                                config.metadata_sync_jitter)
+    return _sync_scheduler
+
+
+def set_sync_scheduler(scheduler: Optional[SyncScheduler]) -> Optional[SyncScheduler]:
+    """替换进程共享的同步调度器（None 表示下次使用时按配置重新创建），返回原来的调度器"""
+    global _sync_scheduler
+    with _scheduler_lock:
+        previous, _sync_scheduler = _sync_scheduler, scheduler
+    return previous
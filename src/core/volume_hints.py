@@ -0,0 +1,388 @@
+# volume_hints.py
+"""
+根据本地统计估算 SQL 的扫描量：解析出引用的表和分区条件，在 metadata.db 的分区统计上做分区裁剪，
+给出每张表命中的分区数和预估数据量。只读本地库，不访问集群，单次估算在毫秒级。
+"""
+import operator
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from .config import config
+from ..utils.table_stats import TableStats, TableStatsStore
+
+# 扫描量超过该值时提示增加过滤条件
+LARGE_SCAN_BYTES = 1 << 40
+
+_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+
+
+def format_bytes(size: int) -> str:
+    """字节数的可读形式，如 1.5 GB"""
+    value = float(size)
+    for unit in _UNITS:
+        if value < 1024 or unit == _UNITS[-1]:
+            return f"{int(value)} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+class TableVolume(NamedTuple):
+    """一张表的预估扫描量"""
+    table: str
+    has_stats: bool
+    partition_keys: Tuple[str, ...] = ()
+    partitions_total: int = 0
+    partitions_hit: int = 0
+    # 分区条件都能静态计算时为True，否则命中分区数是上限
+    exact: bool = True
+    row_count: Optional[int] = None
+    total_bytes: Optional[int] = None
+
+
+class _TableEntry:
+    """缓存的表统计和解析后的分区值"""
+    __slots__ = ("stats", "partitions")
+
+    def __init__(self, stats: TableStats, partitions: List[Tuple[Dict[str, "Value"], Optional[int], Optional[int]]]):
+        self.stats = stats
+        self.partitions = partitions
+
+
+# 分区值和常量预先转换为 (文本, 数值)，两边都是数值时按数值比较，否则按文本比较
+Value = Tuple[str, Optional[float]]
+
+
+def _value(text: str) -> Value:
+    try:
+        return text, float(text)
+    except ValueError:
+        return text, None
+
+
+def _parse_partition(name: str) -> Dict[str, Value]:
+    """dt=2024-01-01/hour=08 -> {"dt": ("2024-01-01", None), "hour": ("08", 8.0)}"""
+    values = {}
+    for part in name.split("/"):
+        key, _, value = part.partition("=")
+        values[key.lower()] = _value(value)
+    return values
+
+
+def _literal(node: exp.Expression) -> Optional[Value]:
+    """常量的值；不是常量（函数、变量等）时为 None"""
+    while isinstance(node, (exp.Paren, exp.Cast)):
+        node = node.this
+    if isinstance(node, exp.Literal):
+        # ${bizdate} 等调度变量在运行前无法确定
+        return None if "${" in node.this else _value(node.this)
+    return None
+
+
+def _operands(a: Value, b: Value) -> Tuple:
+    return (a[1], b[1]) if a[1] is not None and b[1] is not None else (a[0], b[0])
+
+
+_COMPARISONS = {
+    exp.EQ: operator.eq, exp.NEQ: operator.ne,
+    exp.GT: operator.gt, exp.GTE: operator.ge,
+    exp.LT: operator.lt, exp.LTE: operator.le,
+}
+
+
+def _conjuncts(node: exp.Expression) -> Iterator[exp.Expression]:
+    """拆开顶层的 AND 条件"""
+    while isinstance(node, exp.Paren):
+        node = node.this
+    if isinstance(node, exp.And):
+        yield from _conjuncts(node.left)
+        yield from _conjuncts(node.right)
+    else:
+        yield node
+
+
+PartitionTest = Callable[[Dict[str, Value]], Optional[bool]]
+
+
+def _unknown(values: Dict[str, Value]) -> Optional[bool]:
+    return None
+
+
+def _operand(node: exp.Expression, refers: Callable[[exp.Column], bool]) -> Callable[[Dict[str, Value]], Optional[Value]]:
+    """分区字段取分区值，常量取常量值，其他为 None"""
+    if isinstance(node, exp.Column) and refers(node):
+        key = node.name.lower()
+        return lambda values: values.get(key)
+    value = _literal(node)
+    return lambda values: value
+
+
+def _compile(node: exp.Expression, refers: Callable[[exp.Column], bool]) -> PartitionTest:
+    """
+    把条件编译成在一个分区上求值的函数，语法树只遍历一次
+
+    函数返回 True/False 为确定结果，None 表示与分区无关或无法静态计算。
+    """
+    if isinstance(node, exp.Paren):
+        return _compile(node.this, refers)
+    if isinstance(node, exp.And):
+        left, right = _compile(node.left, refers), _compile(node.right, refers)
+
+        def conjunction(values):
+            a, b = left(values), right(values)
+            return False if a is False or b is False else (True if a and b else None)
+        return conjunction
+    if isinstance(node, exp.Or):
+        left, right = _compile(node.left, refers), _compile(node.right, refers)
+
+        def disjunction(values):
+            a, b = left(values), right(values)
+            return True if a or b else (False if a is False and b is False else None)
+        return disjunction
+    if isinstance(node, exp.Not):
+        inner = _compile(node.this, refers)
+
+        def negation(values):
+            result = inner(values)
+            return None if result is None else not result
+        return negation
+    if type(node) in _COMPARISONS:
+        left, right, test = _operand(node.left, refers), _operand(node.right, refers), _COMPARISONS[type(node)]
+
+        def comparison(values):
+            a, b = left(values), right(values)
+            return None if a is None or b is None else test(*_operands(a, b))
+        return comparison
+    if isinstance(node, exp.In):
+        value, options = _operand(node.this, refers), [_literal(item) for item in node.expressions]
+        if not options or None in options:
+            return _unknown
+
+        def membership(values):
+            v = value(values)
+            return None if v is None else any(operator.eq(*_operands(v, option)) for option in options)
+        return membership
+    if isinstance(node, exp.Between):
+        value, low, high = _operand(node.this, refers), _literal(node.args["low"]), _literal(node.args["high"])
+        if low is None or high is None:
+            return _unknown
+
+        def between(values):
+            v = value(values)
+            return None if v is None else operator.le(*_operands(low, v)) and operator.le(*_operands(v, high))
+        return between
+    return _unknown
+
+
+class VolumeEstimator:
+    """从本地统计估算 SQL 中各表命中的分区和数据量，表统计按表缓存，元数据库更新后失效"""
+
+    def __init__(self, metadata_db_path: str, dialect: str = "hive", cache_size: int = 1024):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            dialect: SQL方言
+            cache_size: 缓存的表统计数量
+        """
+        self.store = TableStatsStore(metadata_db_path)
+        self.dialect = dialect
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Optional[_TableEntry]]" = OrderedDict()
+        self._cache_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _table(self, name: str) -> Optional[_TableEntry]:
+        path = self.store.metadata_db_path
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        key = name.lower()
+        with self._lock:
+            if mtime != self._cache_mtime:
+                self._cache.clear()
+                self._cache_mtime = mtime
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        stats = self.store.table(name) if mtime is not None else None
+        entry = None
+        if stats is not None:
+            partitions = ([(_parse_partition(part), rows, size) for part, rows, size in self.store.partitions(stats)]
+                          if stats.partition_keys else [])
+            entry = _TableEntry(stats, partitions)
+        with self._lock:
+            self._cache[key] = entry
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def stats(self, name: str) -> Optional[TableStats]:
+        """表的统计（经缓存），没有统计时为 None"""
+        entry = self._table(name)
+        return entry.stats if entry is not None else None
+
+    def _scope_hits(self, scope: Scope) -> Iterator[Tuple[str, str, Optional[_TableEntry], Optional[set], bool]]:
+        """
+        Returns:
+            作用域中每个表别名的 (别名, 表名, 缓存的统计, 命中的分区下标, 分区条件是否都能静态计算)；
+            有统计时表名为 "库.表"，否则为 SQL 中的写法
+        """
+        tables = {alias: source for alias, source in scope.sources.items() if isinstance(source, exp.Table)}
+        if not tables:
+            return
+        entries = {alias: self._table(".".join(part for part in (table.db, table.name) if part))
+                   for alias, table in tables.items()}
+        conditions = [scope.expression.args.get("where")]
+        conditions += [join.args.get("on") for join in scope.expression.args.get("joins") or []]
+        conditions = [node.this if isinstance(node, exp.Where) else node for node in conditions if node]
+
+        for alias, table in tables.items():
+            entry = entries[alias]
+            if entry is None:
+                yield alias, ".".join(part for part in (table.db, table.name) if part), None, None, True
+                continue
+            matched, exact = self._prune(entry, alias, table.name, entries, conditions)
+            yield alias, f"{entry.stats.schema}.{entry.stats.table}", entry, matched, exact
+
+    def scope_volumes(self, scope: Scope) -> Dict[str, TableVolume]:
+        """作用域中每个表别名按自身分区条件裁剪后的扫描量，同一张表的多次引用分别计算"""
+        return {alias: self._volume(name, entry, matched, exact) if entry is not None else TableVolume(name, False)
+                for alias, name, entry, matched, exact in self._scope_hits(scope)}
+
+    def estimate(self, sql: str) -> List[TableVolume]:
+        """
+        估算 SQL 中每张表的扫描量，同一张表被多次引用时合并命中的分区
+
+        Returns:
+            按首次出现顺序的各表预估；SQL 无法解析时为空列表
+        """
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+            scopes = traverse_scope(tree)
+        except Exception:
+            return []
+
+        hits: "OrderedDict[str, Tuple[_TableEntry, Optional[set], bool]]" = OrderedDict()
+        missing: List[str] = []
+        for scope in scopes:
+            for _, name, entry, matched, exact in self._scope_hits(scope):
+                if entry is None:
+                    if name not in missing:
+                        missing.append(name)
+                    continue
+                previous = hits.get(name)
+                if previous is not None:
+                    matched = None if previous[1] is None or matched is None else previous[1] | matched
+                    exact = exact and previous[2]
+                hits[name] = (entry, matched, exact)
+
+        volumes = [self._volume(name, entry, matched, exact) for name, (entry, matched, exact) in hits.items()]
+        return volumes + [TableVolume(name, False) for name in missing]
+
+    @staticmethod
+    def _prune(entry: _TableEntry, alias: str, name: str, entries: Dict[str, Optional[_TableEntry]],
+               conditions: List[exp.Expression]) -> Tuple[Optional[set], bool]:
+        """
+        Returns:
+            (命中的分区下标，未分区表为 None；分区条件是否都能静态计算)
+        """
+        keys = tuple(key.lower() for key in entry.stats.partition_keys)
+        if not keys:
+            return None, True
+        # 不带表前缀的分区字段只在该作用域中没有其他表有同名分区字段时归属这张表
+        others = {key.lower() for other_alias, other in entries.items()
+                  if other_alias != alias and other is not None for key in other.stats.partition_keys}
+
+        def refers(column: exp.Column) -> bool:
+            qualifier = column.table.lower()
+            if qualifier:
+                return qualifier in (alias.lower(), name.lower())
+            return column.name.lower() in keys and column.name.lower() not in others
+
+        # 只有引用了分区字段的条件参与裁剪
+        relevant = [conjunct for condition in conditions for conjunct in _conjuncts(condition)
+                    if any(refers(column) and column.name.lower() in keys for column in conjunct.find_all(exp.Column))]
+        tests = [_compile(conjunct, refers) for conjunct in relevant]
+        matched, exact = set(), True
+        for index, (values, _, _) in enumerate(entry.partitions):
+            certain = True
+            for test in tests:
+                result = test(values)
+                if result is False:
+                    break
+                certain = certain and result is not None
+            else:
+                matched.add(index)
+                # 有分区既未被排除也未被确认时，命中数是上限
+                exact = exact and certain
+        return matched, exact
+
+    @staticmethod
+    def _volume(name: str, entry: _TableEntry, matched: Optional[set], exact: bool) -> TableVolume:
+        stats = entry.stats
+        if not stats.partition_keys:
+            return TableVolume(name, True, (), 0, 0, True, stats.row_count, stats.total_bytes)
+        selected = [entry.partitions[index] for index in sorted(matched)]
+        rows = [part[1] for part in selected if part[1] is not None]
+        sizes = [part[2] for part in selected if part[2] is not None]
+        return TableVolume(name, True, stats.partition_keys, len(entry.partitions), len(selected), exact,
+                           sum(rows) if rows else None, sum(sizes) if sizes else None)
+
+    def render(self, sql: str) -> str:
+        """
+        数据量提示文本，附在智能体回复之后
+
+        Returns:
+            提示文本；没有引用任何表或无法解析时为空字符串
+        """
+        volumes = self.estimate(sql)
+        if not volumes:
+            return ""
+        lines = ["📦 **数据量预估**（基于本地统计）:"]
+        total = 0
+        for volume in volumes:
+            if not volume.has_stats:
+                lines.append(f"- {volume.table}: 暂无统计信息")
+                continue
+            size = "未知大小" if volume.total_bytes is None else f"约 {format_bytes(volume.total_bytes)}"
+            if volume.row_count is not None:
+                size += f"（{volume.row_count:,} 行）"
+            total += volume.total_bytes or 0
+            if not volume.partition_keys:
+                lines.append(f"- {volume.table}: 非分区表，{size}")
+            elif volume.partitions_hit == volume.partitions_total and volume.exact:
+                lines.append(f"- {volume.table}: ⚠️ 未按分区字段 {', '.join(volume.partition_keys)} 过滤，"
+                             f"将扫描全部 {volume.partitions_total} 个分区，{size}")
+            else:
+                bound = "" if volume.exact else "（分区条件无法静态计算，按上限估算）"
+                lines.append(f"- {volume.table}: 命中 {volume.partitions_hit}/{volume.partitions_total} 个分区"
+                             f"{bound}，{size}")
+        if len(volumes) > 1 and total:
+            lines.append(f"合计约 {format_bytes(total)}")
+        if total >= LARGE_SCAN_BYTES:
+            lines.append("⚠️ 扫描量较大，建议增加分区或过滤条件后再运行")
+        return "\n".join(lines)
+
+
+_estimator_lock = threading.Lock()
+_volume_estimator: Optional[VolumeEstimator] = None
+
+
+def get_volume_estimator() -> VolumeEstimator:
+    """进程共享的扫描量估算，读取 METADATA_DB_PATH 中的统计；表统计的缓存在元数据库更新后失效"""
+    global _volume_estimator
+    if _volume_estimator is None:
+        with _estimator_lock:
+            if _volume_estimator is None:
+                _volume_estimator = VolumeEstimator(config.metadata_db_path)
+    return _volume_estimator
+
+
+def set_volume_estimator(estimator: Optional[VolumeEstimator]) -> Optional[VolumeEstimator]:
+    """替换进程共享的扫描量估算（None 表示下次使用时按配置重新创建），返回原来的实例"""
+    global _volume_estimator
+    with _estimator_lock:
+        previous, _volume_estimator = _volume_estimator, estimator
+    return previous
@@ -0,0 +1,277 @@
+# write_checks.py
+"""
+写入检查：INSERT OVERWRITE/INSERT INTO 和 CREATE TABLE AS SELECT 的动态分区和小文件风险。
+
+动态分区的值取 SELECT 的最后几列，按来源字段的统计（来源字段是分区字段时取裁剪后命中的分区数，
+否则取近似基数）估算写出的分区数；按输入数据量估算写文件的 Map/Reduce 数，
+没有按动态分区字段 DISTRIBUTE BY 时每个任务都会向每个分区写一个文件。
+"""
+import math
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlglot import exp
+from sqlglot.optimizer.scope import traverse_scope
+
+from .config import config
+from .volume_hints import VolumeEstimator, format_bytes
+
+# 规则配置键及默认编号
+WRITE_RULES = {
+    "dynamic_partition_cardinality": "R901",
+    "dynamic_partition_distribute": "R902",
+    "small_files": "R903",
+}
+
+DEFAULT_MESSAGES = {
+    "dynamic_partition_cardinality": "动态分区字段基数过高，会产生大量分区",
+    "dynamic_partition_distribute": "动态分区写入没有按分区字段 DISTRIBUTE BY，每个任务都会向每个分区写文件",
+    "small_files": "写入会产生大量小文件，增加 NameNode 压力并拖慢下游读取",
+}
+
+# 默认阈值，与 Hive 参数的默认值一致，可在 sql_rules.toml 对应规则中覆盖
+DEFAULT_THRESHOLDS = {
+    # hive.exec.max.dynamic.partitions
+    "max_dynamic_partitions": 1000,
+    # hive.exec.reducers.bytes.per.reducer，同时作为每个 Map 处理的数据量
+    "bytes_per_task": 256_000_000,
+    # hive.exec.reducers.max
+    "max_reducers": 1009,
+    # hive.merge.smallfiles.avgsize：平均文件小于该值视为小文件
+    "small_file_bytes": 16_000_000,
+    "small_file_count": 1000,
+}
+
+
+class WriteEstimate(NamedTuple):
+    """一次写入的预估"""
+    table: str
+    # CTAS 或 INSERT
+    kind: str
+    dynamic_columns: Tuple[str, ...]
+    # 按全部动态分区字段 DISTRIBUTE BY / CLUSTER BY
+    distributed: bool
+    # 写出的分区数（没有动态分区时为 1），无法估算时为 None
+    partitions: Optional[int]
+    input_bytes: Optional[int]
+    # 写文件的任务数
+    writers: Optional[int]
+    files: Optional[int]
+
+
+def _target(statement: exp.Expression) -> Optional[Tuple[exp.Table, str, List[str], exp.Query]]:
+    """(目标表, 写入类型, 动态分区字段, 查询)；不是写入语句时为 None"""
+    if isinstance(statement, exp.Insert) and isinstance(statement.this, exp.Table) \
+            and isinstance(statement.expression, exp.Query):
+        partition = statement.this.args.get("partition")
+        dynamic = [node.name for node in (partition.expressions if partition else []) if isinstance(node, exp.Column)]
+        return statement.this, "INSERT", dynamic, statement.expression
+    if isinstance(statement, exp.Create) and statement.kind == "TABLE" and isinstance(statement.expression, exp.Query):
+        partitioned = statement.find(exp.PartitionedByProperty)
+        dynamic = [node.name for node in partitioned.this.expressions] if partitioned is not None else []
+        table = statement.this.this if isinstance(statement.this, exp.Schema) else statement.this
+        return table, "CTAS", dynamic, statement.expression
+    return None
+
+
+def _has_reduce(query: exp.Query) -> bool:
+    """查询最后一步是否在 Reduce 端执行（写文件的是 Reducer）"""
+    if not isinstance(query, exp.Select):
+        return isinstance(query, exp.Union) and query.args.get("distinct", False)
+    return any(query.args.get(key) for key in ("group", "distinct", "order", "sort", "distribute", "cluster", "joins")) \
+        or any(query.find_all(exp.Window))
+
+
+class WriteChecker:
+    """按本地统计检查写入语句的动态分区和小文件风险"""
+
+    def __init__(self, metadata_db_path: str, dialect: str = "hive"):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+            dialect: SQL方言
+        """
+        self.dialect = dialect
+        self.estimator = VolumeEstimator(metadata_db_path, dialect)
+
+    def estimate(self, statement: exp.Expression, thresholds: Optional[Dict] = None) -> Optional[WriteEstimate]:
+        """
+        Args:
+            statement: 解析后的语句
+            thresholds: 覆盖 DEFAULT_THRESHOLDS 的阈值
+
+        Returns:
+            写入预估；不是写入语句时为 None
+        """
+        limits = dict(DEFAULT_THRESHOLDS, **{key: value for key, value in (thresholds or {}).items()
+                                             if key in DEFAULT_THRESHOLDS})
+        target = _target(statement)
+        if target is None:
+            return None
+        table, kind, dynamic, query = target
+        name = ".".join(part for part in (table.db, table.name) if part)
+        try:
+            scopes = traverse_scope(query)
+        except Exception:
+            scopes = []
+
+        volumes = [volume for scope in scopes for volume in self.estimator.scope_volumes(scope).values()]
+        sizes = [volume.total_bytes for volume in volumes]
+        input_bytes = sum(sizes) if sizes and None not in sizes else None
+        rows = [volume.row_count for volume in volumes]
+        root = scopes[-1] if scopes else None
+
+        distributed = False
+        partitions: Optional[int] = 1
+        if dynamic:
+            distributed = self._distributed(query, dynamic)
+            partitions = self._partitions(query, root, len(dynamic))
+        writers = None
+        if input_bytes is not None:
+            writers = max(1, math.ceil(input_bytes / limits["bytes_per_task"]))
+            if _has_reduce(query):
+                writers = min(writers, limits["max_reducers"])
+        files = None
+        if writers is not None and partitions is not None:
+            files = partitions if distributed else writers * partitions
+            # 每个文件至少一行
+            if rows and None not in rows:
+                files = min(files, max(sum(rows), 1))
+        return WriteEstimate(name, kind, tuple(dynamic), distributed, partitions, input_bytes, writers, files)
+
+    @staticmethod
+    def _distributed(query: exp.Query, dynamic: List[str]) -> bool:
+        """DISTRIBUTE BY / CLUSTER BY 是否包含全部动态分区字段（按字段名或 SELECT 中的输出名匹配）"""
+        if not isinstance(query, exp.Select):
+            return False
+        clause = query.args.get("distribute") or query.args.get("cluster")
+        if clause is None:
+            return False
+        names = {column.name.lower() for node in clause.expressions for column in node.find_all(exp.Column)}
+        outputs = query.expressions[-len(dynamic):] if len(query.expressions) >= len(dynamic) else [None] * len(dynamic)
+        for name, output in zip(dynamic, outputs):
+            options = {name.lower()}
+            if output is not None:
+                options.add(output.alias_or_name.lower())
+                options.update(column.name.lower() for column in output.find_all(exp.Column))
+            if not names & options:
+                return False
+        return True
+
+    def _partitions(self, query: exp.Query, root, count: int) -> Optional[int]:
+        """动态分区数的上限：各动态分区字段基数之积，不超过来源行数"""
+        if not isinstance(query, exp.Select) or root is None or len(query.expressions) < count \
+                or any(isinstance(node, exp.Star) for node in query.expressions):
+            return None
+        volumes = {alias.lower(): volume for alias, volume in self.estimator.scope_volumes(root).items()}
+        total = 1
+        for output in query.expressions[-count:]:
+            values = 1
+            for column in output.unalias().find_all(exp.Column):
+                cardinality = self._cardinality(column, volumes)
+                if cardinality is None:
+                    return None
+                values *= cardinality
+            total *= values
+        rows = [volume.row_count for volume in volumes.values()]
+        if rows and None not in rows:
+            total = min(total, max(max(rows), 1))
+        return total
+
+    def _cardinality(self, column: exp.Column, volumes: Dict) -> Optional[int]:
+        """来源字段的不同值个数：分区字段取命中的分区数，普通字段取近似基数"""
+        if column.table:
+            candidates = [volumes.get(column.table.lower())]
+        else:
+            candidates = list(volumes.values())
+        name = column.name.lower()
+        for volume in candidates:
+            if volume is None or not volume.has_stats:
+                continue
+            if name in (key.lower() for key in volume.partition_keys):
+                return volume.partitions_hit
+            stats = self.estimator.stats(volume.table)
+            columns = {key.lower(): value for key, value in stats.columns.items()} if stats is not None else {}
+            if name in columns and columns[name].ndv is not None:
+                ndv = columns[name].ndv
+                return min(ndv, volume.row_count) if volume.row_count is not None else ndv
+        return None
+
+    def check(self, statement: exp.Expression, rules_config: Dict[str, Dict]) -> List[str]:
+        """
+        检查写入语句
+
+        Args:
+            statement: 解析后的语句
+            rules_config: sql_rules.toml 中的 [rules] 配置
+
+        Returns:
+            问题列表；不是写入语句时为空
+        """
+        enabled = {name for name in WRITE_RULES if rules_config.get(name, {}).get("enabled", True)}
+        if not enabled:
+            return []
+        thresholds = {}
+        for name in WRITE_RULES:
+            thresholds.update(rules_config.get(name, {}))
+        limits = dict(DEFAULT_THRESHOLDS, **{key: value for key, value in thresholds.items()
+                                             if key in DEFAULT_THRESHOLDS})
+        estimate = self.estimate(statement, limits)
+        if estimate is None:
+            return []
+
+        issues: List[str] = []
+
+        def report(name: str, detail: str):
+            rule_config = rules_config.get(name, {})
+            level = rule_config.get("level", "warning")
+            message = rule_config.get("description", DEFAULT_MESSAGES[name])
+            issues.append(f"[{level.capitalize()}-{rule_config.get('id', WRITE_RULES[name])}] {message}：{detail}")
+
+        columns = ", ".join(estimate.dynamic_columns)
+        if "dynamic_partition_cardinality" in enabled and estimate.partitions is not None \
+                and estimate.dynamic_columns and estimate.partitions > limits["max_dynamic_partitions"]:
+            report("dynamic_partition_cardinality",
+                   f"{estimate.table} 的动态分区 ({columns}) 预计写出约 {estimate.partitions:,} 个分区，"
+                   f"超过 hive.exec.max.dynamic.partitions={limits['max_dynamic_partitions']}，"
+                   f"请确认分区字段，或改用静态分区分批写入")
+        if "dynamic_partition_distribute" in enabled and estimate.dynamic_columns and not estimate.distributed:
+            report("dynamic_partition_distribute", f"在查询末尾加上 DISTRIBUTE BY {columns}")
+        if "small_files" in enabled and estimate.files is not None and estimate.input_bytes is not None \
+                and estimate.files >= limits["small_file_count"] \
+                and estimate.input_bytes / estimate.files < limits["small_file_bytes"]:
+            if estimate.distributed:
+                layout = f"每个分区一个文件，共 {estimate.partitions:,} 个分区"
+            elif estimate.dynamic_columns:
+                layout = f"{estimate.writers:,} 个写任务 × {estimate.partitions:,} 个分区"
+            else:
+                layout = f"{estimate.writers:,} 个写任务"
+            fix = f"按 {columns} DISTRIBUTE BY，" if estimate.dynamic_columns and not estimate.distributed else ""
+            report("small_files",
+                   f"{estimate.table} 预计写出约 {estimate.files:,} 个文件（{layout}），"
+                   f"平均不超过 {format_bytes(estimate.input_bytes // estimate.files)}；建议{fix}"
+                   f"SET hive.merge.mapfiles=true; SET hive.merge.mapredfiles=true; "
+                   f"SET hive.merge.smallfiles.avgsize={limits['small_file_bytes']};")
+        return issues
+
+
+_checker_lock = threading.Lock()
+_write_checker: Optional[WriteChecker] = None
+
+
+def get_write_checker() -> WriteChecker:
+    """进程共享的写入检查，读取 METADATA_DB_PATH 中的统计"""
+    global _write_checker
+    if _write_checker is None:
+        with _checker_lock:
+            if _write_checker is None:
+                _write_checker = WriteChecker(config.metadata_db_path)
+    return _write_checker
+
+
+def set_write_checker(checker: Optional[WriteChecker]) -> Optional[WriteChecker]:
+    """替换进程共享的写入检查（None 表示下次使用时按配置重新创建），返回原来的实例"""
+    global _write_checker
+    with _checker_lock:
+        previous, _write_checker = _write_checker, checker
+    return previous
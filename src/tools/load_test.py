@@ -0,0 +1,164 @@
+# load_test.py
+"""
+SQLAssistantAgent 端到端压测：N个并发会话通过 generate_and_review_sql 提交需求，
+统计吞吐量、p50/p95/p99 延迟与错误率。
+
+用法:
+    python -m src.tools.load_test --sessions 50 --requests-per-session 4 --start-mock
+    python -m src.tools.load_test --sessions 20 --base-url http://127.0.0.1:8089/v1
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from ..core.rate_limiter import AdmissionController
+from ..core.sql_assistant_agent import SQLAssistantAgent
+from .mock_deepseek import LatencyModel, MockDeepSeekServer
+
+# 压测使用的示例需求
+SAMPLE_REQUESTS = [
+    "帮我统计每个渠道昨天的新增用户数",
+    "计算用户的次日留存率",
+    "统计最近7天每天的订单金额",
+    "查询昨天支付金额最高的10个用户",
+    "按城市统计活跃用户数",
+]
+
+# 生成失败时智能体返回的前缀
+_FAILURE_PREFIXES = ("抱歉", "处理过程中出现错误")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        values: 数值列表
+        pct: 百分位，0-100
+
+    Returns:
+        百分位数，列表为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_load_test(agent: SQLAssistantAgent, sessions: int, requests_per_session: int,
+                        unique_requests: bool = True, priority: str = "interactive") -> Dict:
+    """
+    运行压测
+
+    Args:
+        agent: 被测智能体
+        sessions: 并发会话数
+        requests_per_session: 每个会话顺序提交的请求数
+        unique_requests: 为True时给每个请求加上会话编号，避免被合并
+        priority: LLM调用的优先级类别
+
+    Returns:
+        压测报告
+    """
+    latencies: List[float] = []
+    errors = {"count": 0}
+
+    async def session(index: int):
+        for n in range(requests_per_session):
+            request = SAMPLE_REQUESTS[(index + n) % len(SAMPLE_REQUESTS)]
+            if unique_requests:
+                request = f"{request}（会话{index}-{n}）"
+            started = time.perf_counter()
+            try:
+                result = await agent.generate_and_review_sql(request, session_id=f"load-{index}", priority=priority)
+                failed = result.startswith(_FAILURE_PREFIXES)
+            except Exception as e:
+                print(f"会话 {index} 请求失败: {e}")
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            if failed:
+                errors["count"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    return {
+        "sessions": sessions,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "error_rate": round(errors["count"] / total, 4) if total else 0.0,
+        "agent_metrics": agent.get_metrics(),
+    }
+
+
+def format_report(report: Dict) -> str:
+    """格式化压测报告"""
+    lines = [
+        "压测报告:",
+        f"  会话数: {report['sessions']}，请求数: {report['requests']}，耗时: {report['elapsed_s']}s",
+        f"  吞吐量: {report['throughput_rps']} req/s",
+        f"  延迟: p50={report['p50_ms']}ms p95={report['p95_ms']}ms p99={report['p99_ms']}ms",
+        f"  错误率: {report['error_rate'] * 100:.2f}%",
+    ]
+    metrics = report["agent_metrics"]
+    lines.append(f"  LLM调用: {metrics['llm_total_calls']}，最大排队: {metrics['llm_max_queue_depth']}，"
+                 f"重试: {metrics['admission_stats']['retries']}，合并: {metrics['coalesced_requests']}")
+    return "\n".join(lines)
+
+
+async def _main(args) -> Dict:
+    mock: Optional[MockDeepSeekServer] = None
+    base_url = args.base_url
+    if args.start_mock:
+        mock = MockDeepSeekServer(port=0, latency=LatencyModel.parse(args.mock_latency),
+                                  error_rate=args.mock_error_rate)
+        await mock.start()
+        base_url = mock.base_url
+    try:
+        agent = SQLAssistantAgent(deepseek_api_key="mock-key", base_url=base_url,
+                                  max_concurrent_requests=args.max_concurrency)
+        if args.requests_per_minute or args.tokens_per_minute:
+            # 覆盖配置中的限流速率，用于探测更高的负载
+            agent.admission = AdmissionController(
+                requests_per_minute=args.requests_per_minute or agent.admission.request_bucket.rate * 60,
+                tokens_per_minute=args.tokens_per_minute or agent.admission.token_bucket.rate * 60,
+                max_retries=agent.admission.max_retries,
+            )
+        return await run_load_test(agent, args.sessions, args.requests_per_session,
+                                   unique_requests=not args.duplicate, priority=args.priority)
+    finally:
+        if mock is not None:
+            await mock.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLAssistantAgent 端到端压测")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数")
+    parser.add_argument("--requests-per-session", type=int, default=3, help="每个会话的请求数")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8089/v1", help="DeepSeek兼容接口地址")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="在途LLM调用上限")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="覆盖每分钟请求数上限")
+    parser.add_argument("--tokens-per-minute", type=float, default=None, help="覆盖每分钟token数上限")
+    parser.add_argument("--priority", default="interactive", choices=["interactive", "batch"])
+    parser.add_argument("--duplicate", action="store_true", help="各会话提交相同需求以测试请求合并")
+    parser.add_argument("--start-mock", action="store_true", help="在进程内启动模拟服务")
+    parser.add_argument("--mock-latency", default="lognormal:-1.5,0.5", help="模拟服务的延迟分布")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟服务注入错误的概率")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# mock_deepseek.py
+"""
+本地 DeepSeek chat completions 模拟服务，用于在不消耗API额度的情况下压测智能体。
+
+用法:
+    python -m src.tools.mock_deepseek --port 8089 --latency lognormal:-1.5,0.5 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from ..core.rate_limiter import estimate_tokens
+
+# 默认返回的SQL，能通过默认规则检查
+DEFAULT_RESPONSE = """```sql
+SELECT
+    u.channel,
+    COUNT(u.user_id) AS new_user_cnt
+FROM dwd_user_register u
+WHERE u.dt = '2024-01-01'
+GROUP BY u.channel
+```"""
+
+
+class LatencyModel:
+    """响应延迟分布"""
+
+    def __init__(self, kind: str = "fixed", params: Optional[List[float]] = None):
+        self.kind = kind
+        self.params = params or [0.0]
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """
+        解析延迟分布描述
+
+        Args:
+            spec: 形如 fixed:0.2、uniform:0.1,0.5、normal:0.3,0.1、lognormal:-1.5,0.5 的描述（单位秒）
+
+        Returns:
+            延迟分布
+        """
+        kind, _, raw = spec.partition(":")
+        params = [float(value) for value in raw.split(",") if value] if raw else [0.0]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"无法解析的延迟分布: {spec}")
+        return cls(kind, params)
+
+    def sample(self) -> float:
+        """采样一次延迟秒数"""
+        if self.kind == "uniform":
+            return random.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, random.gauss(*self.params))
+        if self.kind == "lognormal":
+            return math.exp(random.gauss(*self.params))
+        return self.params[0]
+
+
+class MockDeepSeekServer:
+    """模拟的 chat completions 服务，支持脚本化响应、延迟分布、错误注入与流式输出"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8089,
+                 latency: Optional[LatencyModel] = None, error_rate: float = 0.0,
+                 error_statuses: Optional[List[int]] = None, script: Optional[List[Dict]] = None,
+                 stream_chunk_chars: int = 16):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency: 响应延迟分布
+            error_rate: 注入错误的概率
+            error_statuses: 注入错误时随机选择的HTTP状态码
+            script: 脚本化响应，每项包含 match（在用户消息中匹配的子串，可省略）和 content
+            stream_chunk_chars: 流式输出时每个分片的字符数
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [429, 500, 503]
+        self.script = script or []
+        self.stream_chunk_chars = stream_chunk_chars
+
+        self.stats = {"requests": 0, "errors": 0, "streamed": 0}
+        self._seen_prefixes = set()
+        self._script_cursor = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def _make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle_chat)
+        app.router.add_post("/chat/completions", self._handle_chat)
+        app.router.add_get("/stats", self._handle_stats)
+        return app
+
+    @property
+    def base_url(self) -> str:
+        """供智能体使用的基础地址"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        """在当前事件循环中启动服务"""
+        self._runner = web.AppRunner(self._make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = self._runner.addresses[0][1]
+        print(f"🧪 模拟DeepSeek服务已启动: {self.base_url}")
+
+    async def stop(self):
+        """停止服务"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _pick_content(self, user_message: str) -> str:
+        """按脚本选择响应：优先匹配子串，否则按顺序轮询无匹配条件的条目"""
+        for item in self.script:
+            if item.get("match") and item["match"] in user_message:
+                return item["content"]
+        fallback = [item for item in self.script if not item.get("match")]
+        if not fallback:
+            return DEFAULT_RESPONSE
+        content = fallback[self._script_cursor % len(fallback)]["content"]
+        self._script_cursor += 1
+        return content
+
+    def _usage(self, messages: List[Dict], content: str) -> Dict:
+        """模拟用量，相同的系统提示词第二次出现时计为前缀缓存命中"""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        cache_hit = 0
+        if messages and messages[0].get("role") == "system":
+            digest = hashlib.sha1(messages[0]["content"].encode("utf-8")).hexdigest()
+            if digest in self._seen_prefixes:
+                cache_hit = estimate_tokens(messages[0]["content"])
+            self._seen_prefixes.add(digest)
+        completion_tokens = estimate_tokens(content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "prompt_cache_hit_tokens": cache_hit,
+            "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def _handle_chat(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        payload = await request.json()
+        messages = payload.get("messages", [])
+
+        await asyncio.sleep(self.latency.sample())
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            status = random.choice(self.error_statuses)
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            return web.json_response({"error": {"message": "injected error", "code": status}},
+                                     status=status, headers=headers)
+
+        user_message = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        content = self._pick_content(user_message)
+        completion_id = f"chatcmpl-mock-{self.stats['requests']}"
+        created = int(time.time())
+        usage = self._usage(messages, content)
+
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": payload.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        # 流式输出：按 SSE 格式逐片返回
+        self.stats["streamed"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for start in range(0, len(content), self.stream_chunk_chars):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + self.stream_chunk_chars]},
+                             "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        await response.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def load_script(path: str) -> List[Dict]:
+    """从JSON文件加载脚本化响应列表"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def _serve(server: MockDeepSeekServer):
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地DeepSeek模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="fixed:0.2", help="延迟分布，如 uniform:0.1,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument("--error-statuses", default="429,500,503", help="注入错误的HTTP状态码")
+    parser.add_argument("--script", help="脚本化响应的JSON文件")
+    args = parser.parse_args()
+
+    server = MockDeepSeekServer(
+        host=args.host,
+        port=args.port,
+        latency=LatencyModel.parse(args.latency),
+        error_rate=args.error_rate,
+        error_statuses=[int(code) for code in args.error_statuses.split(",")],
+        script=load_script(args.script) if args.script else None,
+    )
+    try:
+        asyncio.run(_serve(server))
+    except KeyboardInterrupt:
+        print("模拟服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# connection_pool.py
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class ConnectionPool:
+    """线程安全的数据库连接池，复用空闲连接并限制同时打开的连接数"""
+
+    def __init__(self, factory: Callable[[], Any], max_size: int = 4, acquire_timeout: Optional[float] = None):
+        """初始化连接池
+
+        Args:
+            factory: 创建新连接的函数
+            max_size: 最多同时打开的连接数
+            acquire_timeout: 等待空闲连接的超时秒数，None表示一直等待
+        """
+        self._factory = factory
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._idle: deque = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def _validate(self, connection) -> bool:
+        """复用前检查空闲连接是否仍然可用"""
+        ping = getattr(connection, 'ping', None)
+        if ping is None:
+            return True
+        try:
+            ping(reconnect=True)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """获取连接：优先复用空闲连接，未达上限时新建，否则等待归还
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    if not self._cond.wait(self.acquire_timeout):
+                        raise TimeoutError(f"等待数据库连接超时（上限 {self.max_size}）")
+                connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    connection = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                self.stats['created'] += 1
+                return connection
+
+            if self._validate(connection):
+                self.stats['reused'] += 1
+                return connection
+            self.discard(connection)
+
+    def release(self, connection):
+        """归还连接"""
+        with self._cond:
+            self._idle.append(connection)
+            self._cond.notify()
+
+    def discard(self, connection):
+        """关闭并丢弃连接（出错或结果未读完的连接不能复用）"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.stats['discarded'] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """借出一个连接，正常结束时归还，出现异常时丢弃"""
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            self.discard(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for connection in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def snapshot(self) -> Dict[str, int]:
+        """连接池状态"""
+        with self._cond:
+            return dict(self.stats, open=self._size, idle=len(self._idle))
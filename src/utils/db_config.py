@@ -1,34 +1,140 @@
 # db_config.py
 import os
-from typing import Dict, Optional
+import toml
+from typing import Dict, List, Optional
+
+# 数据源可采集的元数据类型：tables 为 information_schema 中的表和字段，lineage 为血缘关系表，
+# stats 为 Hive Metastore 中的表、分区和字段统计
+COLLECT_KINDS = ('tables', 'lineage', 'stats')
+
+# 数据源的默认设置
+SOURCE_DEFAULTS = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': '',
+    'schemas': ['ods', 'dw', 'dim', 'dws', 'app'],
+    'collect': ['tables'],
+    'sync_interval': 3600,
+    'max_concurrency': 4,
+}
 
 class DatabaseConfig:
-    """数据库配置管理类"""
+    """数据库配置管理类
+
+    数据源按以下优先级加载：
+    1. DATA_SOURCES_CONFIG 指向的TOML文件，每个数据源一个 [sources.<名称>] 段
+    2. DATA_SOURCES 列出的数据源名称，配置从 DATA_SOURCE_<名称>_<设置> 环境变量读取
+    3. 默认的 bigdata_db（表结构）和 user_profile_db（血缘关系）两个数据源
+    """
+
+    def __init__(self, config_path: Optional[str] = None, env_prefix: str = 'DATA_SOURCE_'):
+        """初始化数据库配置
+
+        Args:
+            config_path: 数据源TOML配置文件路径，默认读取环境变量 DATA_SOURCES_CONFIG
+            env_prefix: 从环境变量读取数据源配置时的前缀
+        """
+        config_path = config_path or os.getenv('DATA_SOURCES_CONFIG')
+        if config_path:
+            sources = self._load_toml(config_path)
+        elif os.getenv('DATA_SOURCES'):
+            sources = self._load_env(os.getenv('DATA_SOURCES'), env_prefix)
+        else:
+            sources = self._load_legacy()
+        self.configs = {name: self._normalize(name, settings) for name, settings in sources.items()}
+
+    @staticmethod
+    def _load_toml(config_path: str) -> Dict[str, Dict]:
+        """从TOML文件加载数据源，password_env 可指定从环境变量读取密码"""
+        with open(config_path, 'r', encoding='utf-8') as f:
+            sources = toml.load(f).get('sources', {})
+        for settings in sources.values():
+            if 'password_env' in settings:
+                settings['password'] = os.getenv(settings.pop('password_env'), '')
+        return sources
+
+    @staticmethod
+    def _load_env(names: str, prefix: str) -> Dict[str, Dict]:
+        """从 <前缀><名称>_<设置> 环境变量加载数据源，列表类设置用逗号分隔"""
+        sources = {}
+        for name in (item.strip() for item in names.split(',')):
+            if not name:
+                continue
+            key = f"{prefix}{name.upper()}_"
+            settings = {}
+            for field in ('host', 'port', 'user', 'password', 'database', 'sync_interval', 'max_concurrency'):
+                value = os.getenv(key + field.upper())
+                if value is not None:
+                    settings[field] = value
+            for field in ('schemas', 'collect'):
+                value = os.getenv(key + field.upper())
+                if value is not None:
+                    settings[field] = [item.strip() for item in value.split(',') if item.strip()]
+            sources[name] = settings
+        return sources
 
-    def __init__(self):
-        """初始化数据库配置"""
-        self.configs = {
+    @staticmethod
+    def _load_legacy() -> Dict[str, Dict]:
+        """未配置数据源时使用的两个默认数据源"""
+        return {
             'bigdata_db': {
                 'host': os.getenv('BIGDATA_DB_HOST', 'localhost'),
-                'port': int(os.getenv('BIGDATA_DB_PORT', 3306)),
+                'port': os.getenv('BIGDATA_DB_PORT', 3306),
                 'user': os.getenv('BIGDATA_DB_USER', 'root'),
                 'password': os.getenv('BIGDATA_DB_PASSWORD', ''),
-                'database': os.getenv('BIGDATA_DB_NAME', 'bigdata_db')
+                'database': os.getenv('BIGDATA_DB_NAME', 'bigdata_db'),
+                'collect': ['tables'],
             },
             'user_profile_db': {
                 'host': os.getenv('USER_PROFILE_DB_HOST', 'localhost'),
-                'port': int(os.getenv('USER_PROFILE_DB_PORT', 3306)),
+                'port': os.getenv('USER_PROFILE_DB_PORT', 3306),
                 'user': os.getenv('USER_PROFILE_DB_USER', 'root'),
                 'password': os.getenv('USER_PROFILE_DB_PASSWORD', ''),
-                'database': os.getenv('USER_PROFILE_DB_NAME', 'user_profile_db')
+                'database': os.getenv('USER_PROFILE_DB_NAME', 'user_profile_db'),
+                'collect': ['lineage'],
             }
         }
 
+    @staticmethod
+    def _normalize(name: str, settings: Dict) -> Dict:
+        """补全默认设置并校验
+
+        Raises:
+            ValueError: 设置不合法时
+        """
+        config = dict(SOURCE_DEFAULTS, database=name)
+        config.update(settings)
+        config['port'] = int(config['port'])
+        config['sync_interval'] = float(config['sync_interval'])
+        config['max_concurrency'] = int(config['max_concurrency'])
+        config['schemas'] = list(config['schemas'])
+        config['collect'] = list(config['collect'])
+        unknown = [kind for kind in config['collect'] if kind not in COLLECT_KINDS]
+        if unknown:
+            raise ValueError(f"数据源 {name} 的 collect 配置不支持: {', '.join(unknown)}")
+        if config['max_concurrency'] < 1:
+            raise ValueError(f"数据源 {name} 的 max_concurrency 必须大于0")
+        if ('tables' in config['collect'] or 'stats' in config['collect']) and not config['schemas']:
+            raise ValueError(f"数据源 {name} 采集表结构或统计时必须配置 schemas")
+        return config
+
+    def sources(self, kind: Optional[str] = None) -> List[str]:
+        """获取数据源名称列表
+
+        Args:
+            kind: 只返回采集该类元数据的数据源（'tables'、'lineage' 或 'stats'），None表示全部
+
+        Returns:
+            数据源名称列表
+        """
+        return [name for name, config in self.configs.items() if kind is None or kind in config['collect']]
+
     def get_config(self, db_name: str) -> Optional[Dict]:
         """获取指定数据库的配置
 
         Args:
-            db_name: 数据库名称 ('bigdata_db' 或 'user_profile_db')
+            db_name: 数据源名称（默认配置下为 'bigdata_db' 或 'user_profile_db'）
 
         Returns:
             数据库配置字典或None（如果配置不存在）
@@ -51,4 +157,4 @@ class DatabaseConfig:
         return f"mysql://{config['user']}:{config['password']}@{config['host']}:{config['port']}/{config['database']}"
 
 # 全局配置实例
-db_config = DatabaseConfig()
\ No newline at end of file
+db_config = DatabaseConfig()
@@ -2,65 +2,319 @@
 import pymysql
 import sqlite3
 import os
-from typing import Dict, List, Tuple
-from .db_config import db_config
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from .connection_pool import ConnectionPool
+from .db_config import db_config, SOURCE_DEFAULTS
+from .metadata_search import ensure_search_index, refresh_search_index
+from .metadata_snapshot import write_snapshot
+from .retrieval_index import build_retrieval_index
+from .sqlite_access import discard_database, publish_database, read_connection, stage_database
+from .table_stats import HiveMetastoreStatsProvider, StatsProvider, ensure_stats_tables, sync_table_stats
+
+# 各类元数据的字段顺序，与MySQL查询结果的列顺序一致
+TABLE_FIELDS = ('table_schema', 'table_name', 'table_comment')
+COLUMN_FIELDS = ('table_schema', 'table_name', 'column_name', 'data_type', 'is_nullable', 'column_comment')
+LINEAGE_FIELDS = ('source_table', 'target_table', 'source_column', 'target_column', 'transform_rule')
+FIELDS = {'tables': TABLE_FIELDS, 'columns': COLUMN_FIELDS, 'lineage': LINEAGE_FIELDS}
+
+# 默认采集的库（schema）范围，并行同步时每个库作为一个分片
+SCHEMAS = tuple(SOURCE_DEFAULTS['schemas'])
+
+# 采集表注释信息
+TABLES_QUERY = """
+    SELECT
+        table_schema,
+        table_name,
+        table_comment
+    FROM information_schema.tables
+    WHERE table_schema IN ({schemas})
+"""
+
+# 采集表注释及变更时间，用于增量同步
+TABLES_WITH_TIME_QUERY = """
+    SELECT
+        table_schema,
+        table_name,
+        table_comment,
+        create_time,
+        update_time
+    FROM information_schema.tables
+    WHERE table_schema IN ({schemas})
+"""
+
+# 采集表结构和字段注释信息
+COLUMNS_QUERY = """
+    SELECT
+        table_schema,
+        table_name,
+        column_name,
+        data_type,
+        is_nullable,
+        column_comment
+    FROM information_schema.columns
+    WHERE table_schema IN ({schemas})
+    ORDER BY table_schema, table_name, ordinal_position
+"""
+
+def schema_query(template: str, schemas: Sequence[str]) -> Tuple[str, List[str]]:
+    """把查询模板中的 {schemas} 替换为占位符列表
+
+    Returns:
+        (查询语句, 参数) 元组，可直接传给 iter_rows
+    """
+    return template.format(schemas=", ".join(["%s"] * len(schemas))), list(schemas)
+
+# 只采集指定表的字段，{tables} 替换为 (%s, %s) 占位符列表
+COLUMNS_FOR_TABLES_QUERY = """
+    SELECT
+        table_schema,
+        table_name,
+        column_name,
+        data_type,
+        is_nullable,
+        column_comment
+    FROM information_schema.columns
+    WHERE (table_schema, table_name) IN ({tables})
+    ORDER BY table_schema, table_name, ordinal_position
+"""
+
+# 采集表间血缘关系
+LINEAGE_QUERY = """
+    SELECT
+        source_table,
+        target_table,
+        source_column,
+        target_column,
+        transform_rule
+    FROM data_lineage_table_relations
+"""
+
+# 各类元数据的写入语句，第一个参数为数据源名称
+INSERT_STATEMENTS = {
+    'tables': """
+        INSERT OR REPLACE INTO tables_meta
+        (source, table_schema, table_name, table_comment)
+        VALUES (?, ?, ?, ?)
+    """,
+    'columns': """
+        INSERT OR REPLACE INTO columns_meta
+        (source, table_schema, table_name, column_name, data_type, is_nullable, column_comment)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+    'lineage': """
+        INSERT OR IGNORE INTO table_lineage
+        (source, source_table, target_table, source_column, target_column, transform_rule)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+}
+
+# 血缘关系的唯一键，字段级血缘为空时按空字符串处理
+LINEAGE_KEY = "source, source_table, target_table, IFNULL(source_column, ''), IFNULL(target_column, '')"
+
+# 各元数据表的建表语句，同一张表在不同数据源中可以重名
+TABLE_DDL = {
+    'tables_meta': '''
+        CREATE TABLE IF NOT EXISTS tables_meta (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL DEFAULT '',
+            table_schema TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            table_comment TEXT,
+            create_time TEXT,
+            update_time TEXT,
+            columns_checksum TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(source, table_schema, table_name)
+        )
+    ''',
+    'columns_meta': '''
+        CREATE TABLE IF NOT EXISTS columns_meta (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL DEFAULT '',
+            table_schema TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            data_type TEXT,
+            is_nullable TEXT,
+            column_comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(source, table_schema, table_name, column_name)
+        )
+    ''',
+    'table_lineage': '''
+        CREATE TABLE IF NOT EXISTS table_lineage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL DEFAULT '',
+            source_table TEXT NOT NULL,
+            target_table TEXT NOT NULL,
+            source_column TEXT,
+            target_column TEXT,
+            transform_rule TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+}
+
+# 元数据库表结构版本，记录在 PRAGMA user_version 中；表结构变化时递增
+SCHEMA_VERSION = 1
+
+# 增量同步时每次按表查询字段的批大小
+TABLES_PER_QUERY = 500
+
+def columns_checksum(rows: List[Tuple]) -> str:
+    """计算一张表字段列表的校验和
+
+    Args:
+        rows: 按字段顺序排列的字段元数据行（COLUMN_FIELDS 顺序）
+
+    Returns:
+        十六进制校验和
+    """
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update("\x1f".join("" if value is None else str(value) for value in row[2:]).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+def _group_by_table(chunks: Iterable[List[Tuple]]) -> Iterator[Tuple[Tuple[str, str], List[Tuple]]]:
+    """把按表排序的字段行批次重新按表分组，跨批次的同一张表会合并"""
+    current_key = None
+    current_rows: List[Tuple] = []
+    for rows in chunks:
+        for row in rows:
+            key = (row[0], row[1])
+            if key != current_key:
+                if current_key is not None:
+                    yield current_key, current_rows
+                current_key, current_rows = key, []
+            current_rows.append(row)
+    if current_key is not None:
+        yield current_key, current_rows
 
 class MetadataCollector:
     """元数据采集器"""
 
-    def __init__(self, sqlite_db_path: str = "metadata.db"):
+    def __init__(self, sqlite_db_path: str = "metadata.db", chunk_size: int = 10000,
+                 commit_every: int = 500000, parallelism: int = 4, max_retries: int = 2,
+                 retry_backoff: float = 1.0, snapshot_path: Optional[str] = None,
+                 retrieval_index_path: Optional[str] = None):
         """初始化元数据采集器
 
         Args:
             sqlite_db_path: 本地SQLite数据库路径
+            chunk_size: 从MySQL流式读取时每批的行数
+            commit_every: 批量写入SQLite时单个事务的最大行数
+            parallelism: 并行同步的任务数，同时也是每个数据源连接池的大小
+            max_retries: 单个同步任务失败后的重试次数
+            retry_backoff: 重试的基础等待秒数，按指数增长
+            snapshot_path: 同步后生成的只读快照文件路径，默认与数据库同名、扩展名为 .snapshot
+            retrieval_index_path: 同步后更新的表结构检索索引路径，默认与数据库同名、扩展名为 .retrieval.npz
         """
         self.sqlite_db_path = sqlite_db_path
-        self._init_sqlite_db()
+        self.chunk_size = chunk_size
+        self.commit_every = commit_every
+        self.parallelism = parallelism
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.snapshot_path = snapshot_path or os.path.splitext(sqlite_db_path)[0] + ".snapshot"
+        self.retrieval_index_path = (retrieval_index_path
+                                     or os.path.splitext(sqlite_db_path)[0] + ".retrieval.npz")
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._source_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._pools_lock = threading.Lock()
+        # SQLite同一时刻只允许一个写事务，并行任务的写入在此串行
+        self._write_lock = threading.Lock()
+        # 同步期间写入的数据库副本，完成后原子替换正式文件；同一时刻只有一个同步
+        self._staging_path: Optional[str] = None
+        self._staging_lock = threading.RLock()
+        if not self._schema_current():
+            # 建表和迁移同样在副本上进行，不直接改动正式文件
+            with self._staged():
+                pass
+
+    def _connect(self, bulk: bool = False) -> sqlite3.Connection:
+        """打开SQLite连接，同步期间连接到正在写入的数据库副本
 
-    def _init_sqlite_db(self):
-        """初始化SQLite数据库表结构"""
-        conn = sqlite3.connect(self.sqlite_db_path)
-        cursor = conn.cursor()
+        Args:
+            bulk: 是否使用适合批量导入的设置
 
-        # 创建表元数据表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tables_meta (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_schema TEXT NOT NULL,
-                table_name TEXT NOT NULL,
-                table_comment TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(table_schema, table_name)
-            )
-        ''')
+        Returns:
+            SQLite连接
+        """
+        conn = sqlite3.connect(self._staging_path or self.sqlite_db_path)
+        if bulk:
+            # 批量导入：WAL日志、不逐事务fsync、临时数据放内存、加大页缓存
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")
+        return conn
+
+    @contextmanager
+    def _staged(self):
+        """在数据库副本上写入，正常结束后原子替换正式文件，出错时丢弃副本；嵌套调用共用外层副本"""
+        with self._staging_lock:
+            if self._staging_path is not None:
+                yield
+                return
+            staging_path = stage_database(self.sqlite_db_path)
+            self._staging_path = staging_path
+            try:
+                self._init_sqlite_db()
+                yield
+                # 换入前补齐全文检索索引，查询方只读取，不需要再更新索引
+                with self._write_lock:
+                    conn = self._connect()
+                    try:
+                        refresh_search_index(conn)
+                    finally:
+                        conn.close()
+            except BaseException:
+                self._staging_path = None
+                discard_database(staging_path)
+                raise
+            self._staging_path = None
+            publish_database(staging_path, self.sqlite_db_path)
+
+    def _schema_current(self) -> bool:
+        """正式文件的表结构是否已是当前版本"""
+        try:
+            with read_connection(self.sqlite_db_path) as conn:
+                return conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION
+        except sqlite3.OperationalError:
+            return False
 
-        # 创建字段元数据表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS columns_meta (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_schema TEXT NOT NULL,
-                table_name TEXT NOT NULL,
-                column_name TEXT NOT NULL,
-                data_type TEXT,
-                is_nullable TEXT,
-                column_comment TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(table_schema, table_name, column_name)
-            )
-        ''')
+    def _init_sqlite_db(self):
+        """在同步写入的数据库副本上初始化表结构，已是当前版本时跳过"""
+        conn = self._connect()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            conn.close()
+            return
+        cursor = conn.cursor()
 
-        # 创建表血缘关系表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS table_lineage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                source_table TEXT NOT NULL,
-                target_table TEXT NOT NULL,
-                source_column TEXT,
-                target_column TEXT,
-                transform_rule TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        # 创建表元数据表、字段元数据表、表血缘关系表；旧库迁移为带数据源的结构
+        legacy_sources = {
+            'tables_meta': next(iter(db_config.sources('tables')), ''),
+            'columns_meta': next(iter(db_config.sources('tables')), ''),
+            'table_lineage': next(iter(db_config.sources('lineage')), ''),
+        }
+        for table, ddl in TABLE_DDL.items():
+            self._migrate_source_key(cursor, table, ddl, legacy_sources[table])
+
+        # 血缘关系唯一键：先清理历史重复数据再建唯一索引
+        cursor.execute(f'''
+            DELETE FROM table_lineage WHERE id NOT IN (
+                SELECT MIN(id) FROM table_lineage GROUP BY {LINEAGE_KEY}
             )
         ''')
+        cursor.execute("DROP INDEX IF EXISTS idx_table_lineage_key")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_table_lineage_source_key ON table_lineage ({LINEAGE_KEY})")
 
         # 创建业务术语表
         cursor.execute('''
@@ -73,14 +327,46 @@ class MetadataCollector:
             )
         ''')
 
+        # 各数据源的同步状态，用于按同步周期调度
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                source TEXT PRIMARY KEY,
+                last_synced_at REAL,
+                last_error TEXT
+            )
+        ''')
+
+        # 表、分区和字段的数据量统计
+        ensure_stats_tables(conn)
+
+        # 表、字段和业务术语的全文检索索引，变更由触发器记录
+        ensure_search_index(conn)
+
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
         conn.close()
 
-    def connect_to_mysql(self, db_name: str):
+    @staticmethod
+    def _migrate_source_key(cursor: sqlite3.Cursor, table: str, ddl: str, legacy_source: str):
+        """建表；已有的旧表（没有 source 列）重建为新结构，原有数据归属 legacy_source"""
+        cursor.execute(ddl)
+        existing = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if 'source' in existing:
+            return
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        cursor.execute(ddl)
+        current = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        columns = ", ".join(column for column in existing if column in current)
+        cursor.execute(f"INSERT INTO {table} (source, {columns}) SELECT ?, {columns} FROM {table}_legacy",
+                       (legacy_source,))
+        cursor.execute(f"DROP TABLE {table}_legacy")
+
+    def connect_to_mysql(self, db_name: str, streaming: bool = False):
         """连接到MySQL数据库
 
         Args:
             db_name: 数据库名称 ('bigdata_db' 或 'user_profile_db')
+            streaming: 是否使用服务端游标（SSCursor）逐批读取结果
 
         Returns:
             MySQL连接对象
@@ -101,56 +387,109 @@ class MetadataCollector:
                 password=config['password'],
                 database=config['database'],
                 charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.SSCursor if streaming else pymysql.cursors.DictCursor
             )
             return connection
         except Exception as e:
             raise Exception(f"连接到 {db_name} 失败: {str(e)}")
 
-    def collect_table_metadata(self, db_name: str) -> List[Dict]:
-        """从MySQL收集表元数据
+    def _pool(self, db_name: str) -> ConnectionPool:
+        """获取数据源的连接池，首次使用时创建"""
+        with self._pools_lock:
+            pool = self._pools.get(db_name)
+            if pool is None:
+                pool = self._pools[db_name] = ConnectionPool(
+                    lambda: self.connect_to_mysql(db_name, streaming=True), max_size=self._max_concurrency(db_name))
+            return pool
+
+    def _max_concurrency(self, db_name: str) -> int:
+        """数据源的并发上限：数据源配置的 max_concurrency，未配置时为全局并行度"""
+        config = db_config.get_config(db_name) or {}
+        return min(config.get('max_concurrency', self.parallelism), self.parallelism)
+
+    def _source_limit(self, db_name: str) -> threading.BoundedSemaphore:
+        """限制同一数据源同时运行的同步任务数"""
+        with self._pools_lock:
+            limit = self._source_limits.get(db_name)
+            if limit is None:
+                limit = self._source_limits[db_name] = threading.BoundedSemaphore(self._max_concurrency(db_name))
+            return limit
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """各数据源连接池的状态"""
+        with self._pools_lock:
+            return {db_name: pool.snapshot() for db_name, pool in self._pools.items()}
+
+    def close(self):
+        """关闭所有连接池中的空闲连接"""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def iter_rows(self, db_name: str, query) -> Iterator[List[Tuple]]:
+        """使用服务端游标分批读取查询结果，内存占用只与批大小有关
 
         Args:
             db_name: 数据库名称
+            query: 查询语句，或 (查询语句, 参数) 元组
 
-        Returns:
-            表元数据列表
+        Yields:
+            每批最多 chunk_size 行的元组列表
         """
-        connection = self.connect_to_mysql(db_name)
-        try:
+        # 结果读完的连接归还连接池；中途出错或提前结束的连接会被丢弃
+        with self._pool(db_name).connection() as connection:
             with connection.cursor() as cursor:
-                # 收集表结构和注释信息
-                cursor.execute("""
-                    SELECT
-                        table_schema,
-                        table_name,
-                        column_name,
-                        data_type,
-                        is_nullable,
-                        column_comment
-                    FROM information_schema.columns
-                    WHERE table_schema IN ('ods', 'dw', 'dim', 'dws', 'app')
-                    ORDER BY table_schema, table_name, ordinal_position
-                """)
-                columns_data = cursor.fetchall()
-
-                # 收集表注释信息
-                cursor.execute("""
-                    SELECT
-                        table_schema,
-                        table_name,
-                        table_comment
-                    FROM information_schema.tables
-                    WHERE table_schema IN ('ods', 'dw', 'dim', 'dws', 'app')
-                """)
-                tables_data = cursor.fetchall()
-
-                return {
-                    'columns': columns_data,
-                    'tables': tables_data
-                }
-        finally:
-            connection.close()
+                if isinstance(query, tuple):
+                    cursor.execute(*query)
+                else:
+                    cursor.execute(query)
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    yield list(rows)
+
+    def stream_table_metadata(self, db_name: str, schemas: Sequence[str] = SCHEMAS) -> Iterator[Tuple[str, List[Tuple]]]:
+        """流式收集表和字段元数据
+
+        Args:
+            db_name: 数据库名称
+            schemas: 采集的库范围
+
+        Yields:
+            ('tables' 或 'columns', 行批次)
+        """
+        for rows in self.iter_rows(db_name, schema_query(TABLES_QUERY, schemas)):
+            yield 'tables', rows
+        for rows in self.iter_rows(db_name, schema_query(COLUMNS_QUERY, schemas)):
+            yield 'columns', rows
+
+    def stream_lineage_data(self, db_name: str) -> Iterator[Tuple[str, List[Tuple]]]:
+        """流式收集血缘关系数据
+
+        Args:
+            db_name: 数据库名称
+
+        Yields:
+            ('lineage', 行批次)
+        """
+        for rows in self.iter_rows(db_name, LINEAGE_QUERY):
+            yield 'lineage', rows
+
+    def collect_table_metadata(self, db_name: str) -> Dict[str, List[Dict]]:
+        """从MySQL收集表元数据（一次性返回全部结果，大库请使用 stream_table_metadata）
+
+        Args:
+            db_name: 数据库名称
+
+        Returns:
+            包含 tables 和 columns 列表的字典
+        """
+        metadata = {'tables': [], 'columns': []}
+        for kind, rows in self.stream_table_metadata(db_name):
+            metadata[kind].extend(dict(zip(FIELDS[kind], row)) for row in rows)
+        return metadata
 
     def collect_lineage_data(self, db_name: str) -> List[Dict]:
         """从MySQL收集血缘关系数据
@@ -161,112 +500,483 @@ class MetadataCollector:
         Returns:
             血缘关系数据列表
         """
-        connection = self.connect_to_mysql(db_name)
+        return [dict(zip(LINEAGE_FIELDS, row))
+                for _, rows in self.stream_lineage_data(db_name) for row in rows]
+
+    def bulk_load(self, chunks: Iterable[Tuple[str, List[Tuple]]], source: str = '') -> Dict[str, int]:
+        """把元数据批次写入SQLite：每批一次 executemany，写入数据库副本后原子替换
+
+        Args:
+            chunks: ('tables'/'columns'/'lineage', 行批次) 的可迭代对象
+            source: 元数据所属的数据源名称
+
+        Returns:
+            各类元数据写入的行数
+        """
+        counts = {'tables': 0, 'columns': 0, 'lineage': 0}
+        with self._staged():
+            self._bulk_insert(chunks, source, counts)
+        return counts
+
+    def _bulk_insert(self, chunks: Iterable[Tuple[str, List[Tuple]]], source: str, counts: Dict[str, int]):
+        conn = self._connect(bulk=True)
         try:
-            with connection.cursor() as cursor:
-                # 收集表间血缘关系
-                cursor.execute("""
-                    SELECT
-                        source_table,
-                        target_table,
-                        source_column,
-                        target_column,
-                        transform_rule
-                    FROM data_lineage_table_relations
-                """)
-                lineage_data = cursor.fetchall()
-
-                return lineage_data
+            pending = 0
+            for kind, rows in chunks:
+                conn.executemany(INSERT_STATEMENTS[kind], [(source,) + tuple(row) for row in rows])
+                counts[kind] += len(rows)
+                pending += len(rows)
+                if pending >= self.commit_every:
+                    conn.commit()
+                    pending = 0
+            conn.commit()
         finally:
-            connection.close()
+            conn.close()
 
-    def save_to_sqlite(self, metadata: Dict):
+    def save_to_sqlite(self, metadata: Dict, source: str = ''):
         """将元数据保存到SQLite数据库
 
         Args:
             metadata: 包含表和字段元数据的字典
+            source: 元数据所属的数据源名称
         """
-        conn = sqlite3.connect(self.sqlite_db_path)
-        cursor = conn.cursor()
+        def chunks():
+            for kind in ('tables', 'columns', 'lineage'):
+                rows = [tuple(item.get(field) for field in FIELDS[kind]) for item in metadata.get(kind, [])]
+                if rows:
+                    yield kind, rows
+
+        self.bulk_load(chunks(), source=source)
+
+    def _load_table_state(self, conn: sqlite3.Connection, source: str,
+                          schemas: Sequence[str]) -> Dict[Tuple[str, str], Tuple]:
+        """读取数据源本地已同步表的注释、变更时间和字段校验和"""
+        placeholders = ", ".join(["?"] * len(schemas))
+        return {
+            (schema, name): (comment, create_time, update_time, checksum)
+            for schema, name, comment, create_time, update_time, checksum in conn.execute(
+                "SELECT table_schema, table_name, table_comment, create_time, update_time, columns_checksum "
+                f"FROM tables_meta WHERE source = ? AND table_schema IN ({placeholders})", [source, *schemas])
+        }
+
+    def _iter_candidate_columns(self, db_name: str, candidates: List[Tuple[str, str]],
+                                total_tables: int, schemas: Sequence[str]) -> Iterator[List[Tuple]]:
+        """读取候选表的字段：候选表占多数时整体扫描，否则按表分批查询"""
+        if len(candidates) * 2 > total_tables:
+            wanted = set(candidates)
+            for rows in self.iter_rows(db_name, schema_query(COLUMNS_QUERY, schemas)):
+                yield [row for row in rows if (row[0], row[1]) in wanted]
+            return
+        for start in range(0, len(candidates), TABLES_PER_QUERY):
+            batch = candidates[start:start + TABLES_PER_QUERY]
+            placeholders = ", ".join(["(%s, %s)"] * len(batch))
+            params = [value for key in batch for value in key]
+            yield from self.iter_rows(db_name, (COLUMNS_FOR_TABLES_QUERY.format(tables=placeholders), params))
+
+    def sync_table_metadata(self, db_name: str, full: bool = False,
+                            schemas: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """增量同步表和字段元数据
+
+        变更时间未变化的表跳过字段读取；读取到的表按字段列表校验和判断是否变化，
+        只重写发生变化的表，并删除源端已不存在的表。写入按批提交，重复执行是安全的。
 
-        # 保存表元数据
-        if 'tables' in metadata:
-            for table in metadata['tables']:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO tables_meta
-                    (table_schema, table_name, table_comment)
-                    VALUES (?, ?, ?)
-                ''', (
-                    table['table_schema'],
-                    table['table_name'],
-                    table['table_comment']
-                ))
-
-        # 保存字段元数据
-        if 'columns' in metadata:
-            for column in metadata['columns']:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO columns_meta
-                    (table_schema, table_name, column_name, data_type, is_nullable, column_comment)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    column['table_schema'],
-                    column['table_name'],
-                    column['column_name'],
-                    column['data_type'],
-                    column['is_nullable'],
-                    column['column_comment']
-                ))
-
-        # 保存血缘关系数据
-        if 'lineage' in metadata:
-            for relation in metadata['lineage']:
-                cursor.execute('''
-                    INSERT INTO table_lineage
-                    (source_table, target_table, source_column, target_column, transform_rule)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    relation['source_table'],
-                    relation['target_table'],
-                    relation.get('source_column'),
-                    relation.get('target_column'),
-                    relation.get('transform_rule')
-                ))
+        Args:
+            db_name: 数据库名称
+            full: 为True时忽略变更时间，重新校验所有表
+            schemas: 同步的库范围，默认为数据源配置的 schemas
+
+        Returns:
+            同步统计
+        """
+        with self._staged():
+            return self._sync_table_metadata(db_name, full, schemas)
+
+    def _sync_table_metadata(self, db_name: str, full: bool = False,
+                             schemas: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        if schemas is None:
+            schemas = (db_config.get_config(db_name) or {}).get('schemas', SCHEMAS)
+        stats = {'tables_read': 0, 'tables_changed': 0, 'tables_updated': 0, 'tables_deleted': 0,
+                 'columns_read': 0, 'columns_written': 0}
+
+        # 表清单规模较小，整体读取后再比较
+        source_tables: Dict[Tuple[str, str], Tuple] = {}
+        for rows in self.iter_rows(db_name, schema_query(TABLES_WITH_TIME_QUERY, schemas)):
+            for schema, name, comment, create_time, update_time in rows:
+                source_tables[(schema, name)] = (
+                    comment,
+                    None if create_time is None else str(create_time),
+                    None if update_time is None else str(update_time),
+                )
+        stats['tables_read'] = len(source_tables)
+
+        conn = self._connect(bulk=True)
+        try:
+            local_tables = self._load_table_state(conn, db_name, schemas)
+
+            # 1. 新增表、注释变化的表；只有注释变化的表不会重写字段，单独计数以便更新快照和检索索引
+            upserts = [(db_name, key[0], key[1], info[0]) for key, info in source_tables.items()
+                       if key not in local_tables or local_tables[key][0] != info[0]]
+            stats['tables_updated'] = sum(1 for _, schema, name, _ in upserts if (schema, name) in local_tables)
+            with self._write_lock:
+                conn.executemany('''
+                    INSERT INTO tables_meta (source, table_schema, table_name, table_comment)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(source, table_schema, table_name) DO UPDATE SET table_comment = excluded.table_comment
+                ''', upserts)
+                conn.commit()
+
+            # 2. 变更时间变化或无法判断的表需要重新读取字段
+            candidates = [
+                key for key, (_, create_time, update_time) in source_tables.items()
+                if full or key not in local_tables or update_time is None
+                or (create_time, update_time) != local_tables[key][1:3]
+            ]
+
+            batch: List[Tuple[Tuple[str, str], List[Tuple]]] = []
+            batch_rows = 0
+            seen: Set[Tuple[str, str]] = set()
+            columns = self._iter_candidate_columns(db_name, candidates, len(source_tables), schemas)
+            for key, rows in _group_by_table(columns):
+                seen.add(key)
+                stats['columns_read'] += len(rows)
+                batch.append((key, rows))
+                batch_rows += len(rows)
+                if batch_rows >= self.chunk_size:
+                    self._write_tables(conn, db_name, batch, source_tables, local_tables, stats)
+                    batch, batch_rows = [], 0
+            # 没有字段的候选表
+            batch.extend((key, []) for key in candidates if key not in seen)
+            self._write_tables(conn, db_name, batch, source_tables, local_tables, stats)
+
+            # 3. 源端已删除的表
+            removed = [(db_name, *key) for key in local_tables if key not in source_tables]
+            with self._write_lock:
+                conn.executemany("DELETE FROM columns_meta WHERE source = ? AND table_schema = ? AND table_name = ?",
+                                 removed)
+                conn.executemany("DELETE FROM tables_meta WHERE source = ? AND table_schema = ? AND table_name = ?",
+                                 removed)
+                conn.commit()
+            stats['tables_deleted'] = len(removed)
+        finally:
+            conn.close()
+        return stats
+
+    def _write_tables(self, conn: sqlite3.Connection, source: str, batch: List[Tuple[Tuple[str, str], List[Tuple]]],
+                      source_tables: Dict, local_tables: Dict, stats: Dict[str, int]):
+        """在一个事务中写入一批表的字段"""
+        if not batch:
+            return
+        with self._write_lock:
+            for key, rows in batch:
+                self._apply_table_columns(conn, source, key, rows, source_tables[key], local_tables.get(key), stats)
+            conn.commit()
+
+    def _apply_table_columns(self, conn: sqlite3.Connection, source: str, key: Tuple[str, str], rows: List[Tuple],
+                             source_info: Tuple, local_info: Optional[Tuple], stats: Dict[str, int]) -> int:
+        """字段校验和变化时重写该表的字段，并记录变更时间和校验和
+
+        Returns:
+            写入的字段行数
+        """
+        checksum = columns_checksum(rows)
+        written = 0
+        if local_info is None or local_info[3] != checksum:
+            conn.execute("DELETE FROM columns_meta WHERE source = ? AND table_schema = ? AND table_name = ?",
+                         (source, *key))
+            conn.executemany(INSERT_STATEMENTS['columns'], [(source,) + tuple(row) for row in rows])
+            written = len(rows)
+            stats['tables_changed'] += 1
+            stats['columns_written'] += written
+        # 字段写入后再记录变更时间，中途失败时下次会重新检查该表
+        conn.execute(
+            "UPDATE tables_meta SET create_time = ?, update_time = ?, columns_checksum = ? "
+            "WHERE source = ? AND table_schema = ? AND table_name = ?",
+            (source_info[1], source_info[2], checksum, source, key[0], key[1])
+        )
+        return written
+
+    def sync_lineage(self, db_name: str) -> Dict[str, int]:
+        """按唯一键比对同步血缘关系：只插入新增、更新变化、删除消失的关系
+
+        Args:
+            db_name: 数据库名称
+
+        Returns:
+            同步统计
+        """
+        with self._staged():
+            return self._sync_lineage(db_name)
 
+    def _sync_lineage(self, db_name: str) -> Dict[str, int]:
+        stats = {'lineage_read': 0, 'lineage_inserted': 0, 'lineage_updated': 0, 'lineage_deleted': 0}
+        conn = self._connect(bulk=True)
+        try:
+            # 源端数据先写入连接私有的临时表，不占用主库写锁
+            conn.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS lineage_incoming (
+                    source_table TEXT, target_table TEXT, source_column TEXT,
+                    target_column TEXT, transform_rule TEXT
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_lineage_incoming ON lineage_incoming "
+                         "(source_table, target_table, IFNULL(source_column, ''), IFNULL(target_column, ''))")
+            for _, rows in self.stream_lineage_data(db_name):
+                conn.executemany("INSERT INTO lineage_incoming VALUES (?, ?, ?, ?, ?)", rows)
+                stats['lineage_read'] += len(rows)
+            conn.commit()
+
+            # 源端数据全部读取成功后才比对，避免读取失败时误删本地数据
+            with self._write_lock:
+                stats.update(self._apply_lineage_diff(conn, db_name))
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return stats
+
+    def _apply_lineage_diff(self, conn: sqlite3.Connection, source: str) -> Dict[str, int]:
+        """把临时表 lineage_incoming 与数据源在 table_lineage 中的数据比对并提交差异"""
+        stats = {}
+        key_match = (
+            "l.source_table = i.source_table AND l.target_table = i.target_table "
+            "AND IFNULL(l.source_column, '') = IFNULL(i.source_column, '') "
+            "AND IFNULL(l.target_column, '') = IFNULL(i.target_column, '')"
+        )
+        before = conn.total_changes
+        conn.execute(f'''
+            DELETE FROM table_lineage AS l
+            WHERE l.source = ? AND NOT EXISTS (SELECT 1 FROM lineage_incoming i WHERE {key_match})
+        ''', (source,))
+        stats['lineage_deleted'] = conn.total_changes - before
+
+        before = conn.total_changes
+        conn.execute(f'''
+            UPDATE table_lineage AS l
+            SET transform_rule = (SELECT i.transform_rule FROM lineage_incoming i WHERE {key_match} LIMIT 1)
+            WHERE l.source = ? AND EXISTS (
+                SELECT 1 FROM lineage_incoming i
+                WHERE {key_match} AND IFNULL(i.transform_rule, '') != IFNULL(l.transform_rule, '')
+            )
+        ''', (source,))
+        stats['lineage_updated'] = conn.total_changes - before
+
+        before = conn.total_changes
+        conn.execute('''
+            INSERT OR IGNORE INTO table_lineage
+            (source, source_table, target_table, source_column, target_column, transform_rule)
+            SELECT ?, source_table, target_table, source_column, target_column, transform_rule
+            FROM lineage_incoming
+        ''', (source,))
+        stats['lineage_inserted'] = conn.total_changes - before
+
+        conn.execute("DELETE FROM lineage_incoming")
         conn.commit()
-        conn.close()
+        return stats
+
+    def sync_table_stats(self, provider: StatsProvider, source: str = '', schemas: Sequence[str] = SCHEMAS,
+                         full: bool = False) -> Dict[str, int]:
+        """增量刷新表、分区和字段统计
+
+        版本号未变化的表跳过，只写入有变化的分区，并删除源端已不存在的表和分区。
 
-    def sync_metadata(self):
-        """同步所有元数据"""
-        print("开始同步元数据...")
+        Args:
+            provider: 统计来源，如 HiveMetastoreStatsProvider 或 FixtureStatsProvider
+            source: 统计归属的数据源名称
+            schemas: 刷新的库范围
+            full: 为True时忽略版本号，重新读取所有表
+
+        Returns:
+            同步统计
+        """
+        with self._staged():
+            return self._sync_table_stats(provider, source, schemas, full)
 
-        # 收集bigdata_db的元数据
+    def _sync_table_stats(self, provider: StatsProvider, source: str, schemas: Sequence[str],
+                          full: bool = False) -> Dict[str, int]:
+        conn = self._connect(bulk=True)
         try:
-            print("正在收集bigdata_db元数据...")
-            bigdata_metadata = self.collect_table_metadata('bigdata_db')
-            print(f"收集到 {len(bigdata_metadata['tables'])} 个表，{len(bigdata_metadata['columns'])} 个字段")
-        except Exception as e:
-            print(f"收集bigdata_db元数据失败: {e}")
-            bigdata_metadata = {'tables': [], 'columns': []}
+            return sync_table_stats(conn, provider, source, schemas, full, lock=self._write_lock)
+        finally:
+            conn.close()
+
+    def _run_with_retries(self, label: str, db_name: str, func: Callable[[], Dict[str, int]]) -> Dict[str, int]:
+        """执行同步任务，失败时按指数退避重试（增量同步可安全重复执行）
 
-        # 收集user_profile_db的血缘关系数据
+        每次尝试都占用数据源的一个并发名额，退避等待期间不占用。
+        """
+        limit = self._source_limit(db_name)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with limit:
+                    return func()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"同步{label}失败（第{attempt + 1}次）: {e}，{delay:.1f}秒后重试")
+                time.sleep(delay)
+
+    def _sync_jobs(self, db_name: str, full: bool) -> List[Tuple[str, Callable[[], Dict[str, int]]]]:
+        """按数据源配置生成同步任务：表结构和统计按库分片，血缘关系作为一个任务"""
+        config = db_config.get_config(db_name)
+        if not config:
+            raise ValueError(f"数据库配置 {db_name} 不存在")
+        jobs = []
+        if 'tables' in config['collect']:
+            jobs.extend((f"{db_name}.{schema}", partial(self._sync_table_metadata, db_name, full, (schema,)))
+                        for schema in config['schemas'])
+        if 'stats' in config['collect']:
+            provider = HiveMetastoreStatsProvider(self, db_name)
+            jobs.extend((f"{db_name}.{schema}统计", partial(self._sync_table_stats, provider, db_name, (schema,), full))
+                        for schema in config['schemas'])
+        if 'lineage' in config['collect']:
+            jobs.append((f"{db_name}血缘关系", partial(self._sync_lineage, db_name)))
+        return jobs
+
+    def due_sources(self, now: Optional[float] = None) -> List[str]:
+        """距上次成功同步已超过各自 sync_interval 的数据源
+
+        Args:
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            数据源名称列表
+        """
+        now = time.time() if now is None else now
+        with read_connection(self.sqlite_db_path) as conn:
+            last_synced = dict(conn.execute("SELECT source, last_synced_at FROM sync_state"))
+        return [name for name in db_config.sources()
+                if last_synced.get(name) is None
+                or now - last_synced[name] >= db_config.get_config(name)['sync_interval']]
+
+    def _record_sync(self, results: Dict[str, Optional[str]]):
+        """记录各数据源的同步结果：成功时更新同步时间，失败时只记录错误"""
+        now = time.time()
+        conn = self._connect()
         try:
-            print("正在收集user_profile_db血缘关系数据...")
-            lineage_data = self.collect_lineage_data('user_profile_db')
-            print(f"收集到 {len(lineage_data)} 条血缘关系")
-        except Exception as e:
-            print(f"收集user_profile_db血缘关系数据失败: {e}")
-            lineage_data = []
+            with self._write_lock:
+                for source, error in results.items():
+                    if error is None:
+                        conn.execute('''
+                            INSERT INTO sync_state (source, last_synced_at, last_error) VALUES (?, ?, NULL)
+                            ON CONFLICT(source) DO UPDATE SET last_synced_at = excluded.last_synced_at,
+                                                              last_error = NULL
+                        ''', (source, now))
+                    else:
+                        conn.execute('''
+                            INSERT INTO sync_state (source, last_error) VALUES (?, ?)
+                            ON CONFLICT(source) DO UPDATE SET last_error = excluded.last_error
+                        ''', (source, error))
+                conn.commit()
+        finally:
+            conn.close()
 
-        # 保存到SQLite
-        print("正在保存元数据到本地数据库...")
-        self.save_to_sqlite({
-            'tables': bigdata_metadata['tables'],
-            'columns': bigdata_metadata['columns'],
-            'lineage': lineage_data
-        })
+    def write_snapshot(self) -> Dict[str, int]:
+        """生成供工作进程 mmap 共享的只读元数据快照
+
+        Returns:
+            快照的表数、字段数和文件字节数
+        """
+        with self._write_lock:
+            return write_snapshot(self.sqlite_db_path, self.snapshot_path)
 
-        print("元数据同步完成")
+    def write_retrieval_index(self) -> Dict[str, int]:
+        """增量更新表结构检索索引，只重新计算有变化的表
 
-# 全局元数据采集器实例
-metadata_collector = MetadataCollector()
\ No newline at end of file
+        Returns:
+            索引的文档数以及复用、重新计算和删除的文档数
+        """
+        with self._write_lock:
+            return build_retrieval_index(self.sqlite_db_path, self.retrieval_index_path)
+
+    def refresh_search_index(self) -> int:
+        """把同步产生的变更写入全文检索索引
+
+        Returns:
+            更新的索引行数
+        """
+        with self._staged(), self._write_lock:
+            conn = self._connect()
+            try:
+                return refresh_search_index(conn)
+            finally:
+                conn.close()
+
+    def sync_metadata(self, full: bool = False, sources: Optional[Sequence[str]] = None,
+                      due_only: bool = False) -> Dict:
+        """同步所有元数据（默认增量）
+
+        各数据源、各库分片作为独立任务并行执行，总耗时取决于最慢的任务；同一数据源同时运行的
+        任务数不超过其 max_concurrency。单个任务失败会重试，最终失败也不影响其他任务。
+
+        Args:
+            full: 为True时重新校验所有表，而不是只检查变更时间变化的表
+            sources: 要同步的数据源，默认为全部已配置的数据源
+            due_only: 为True时只同步已到同步周期的数据源
+
+        Returns:
+            同步统计，包含变更行数、耗时、吞吐量（行/秒）、同步的数据源和失败的任务
+        """
+        print("开始同步元数据..." if full else "开始增量同步元数据...")
+        started = time.perf_counter()
+        stats: Dict = {'tables_read': 0, 'tables_changed': 0, 'tables_updated': 0, 'tables_deleted': 0,
+                       'columns_read': 0, 'columns_written': 0, 'lineage_read': 0, 'lineage_inserted': 0,
+                       'lineage_updated': 0, 'lineage_deleted': 0, 'stats_tables_read': 0,
+                       'stats_tables_changed': 0, 'stats_tables_deleted': 0, 'partitions_written': 0,
+                       'partitions_deleted': 0}
+        errors: Dict[str, str] = {}
+
+        sources = list(sources) if sources is not None else db_config.sources()
+        if due_only:
+            due = set(self.due_sources())
+            sources = [name for name in sources if name in due]
+
+        jobs = []
+        results: Dict[str, Optional[str]] = {}
+        for db_name in sources:
+            try:
+                jobs.extend((db_name, label, func) for label, func in self._sync_jobs(db_name, full))
+                results[db_name] = None
+            except Exception as e:
+                errors[db_name] = str(e)
+                print(f"同步{db_name}失败: {e}")
+
+        # 所有任务写入同一个数据库副本，全部结束后一次性换入，读取方只会看到同步前或同步后的版本
+        with self._staged():
+            if jobs:
+                with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="metadata-sync") as executor:
+                    futures = {executor.submit(self._run_with_retries, label, db_name, func): (db_name, label)
+                               for db_name, label, func in jobs}
+                    for future in as_completed(futures):
+                        db_name, label = futures[future]
+                        try:
+                            for key, value in future.result().items():
+                                stats[key] += value
+                        except Exception as e:
+                            errors[label] = str(e)
+                            results[db_name] = results[db_name] or f"{label}: {e}"
+                            print(f"同步{label}失败: {e}")
+            self._record_sync(results)
+            stats['search_indexed'] = self.refresh_search_index()
+        # 快照和检索索引包含表注释，只有注释变化时同样需要重建
+        tables_modified = stats['tables_changed'] or stats['tables_updated'] or stats['tables_deleted']
+        if tables_modified or not os.path.exists(self.snapshot_path):
+            stats['snapshot'] = self.write_snapshot()
+        if tables_modified or not os.path.exists(self.retrieval_index_path):
+            stats['retrieval_index'] = self.write_retrieval_index()
+
+        elapsed = time.perf_counter() - started
+        rows_read = stats['tables_read'] + stats['columns_read'] + stats['lineage_read']
+        rows_changed = (stats['tables_changed'] + stats['tables_updated'] + stats['tables_deleted']
+                        + stats['columns_written']
+                        + stats['lineage_inserted'] + stats['lineage_updated'] + stats['lineage_deleted']
+                        + stats['stats_tables_deleted'] + stats['partitions_written'] + stats['partitions_deleted'])
+        stats.update(rows_read=rows_read, rows_changed=rows_changed, sources=sources, errors=errors,
+                     elapsed_s=round(elapsed, 3), rows_per_sec=round(rows_read / elapsed, 1) if elapsed > 0 else 0.0)
+        print(f"变更 {stats['tables_changed']} 个表（删除 {stats['tables_deleted']} 个），"
+              f"写入 {stats['columns_written']} 个字段，血缘新增 {stats['lineage_inserted']} / "
+              f"更新 {stats['lineage_updated']} / 删除 {stats['lineage_deleted']}")
+        print(f"元数据同步完成，同步 {len(sources)} 个数据源，读取 {rows_read} 行，耗时 {elapsed:.2f} 秒，"
+              f"{stats['rows_per_sec']} 行/秒" + (f"，{len(errors)} 个任务失败" if errors else ""))
+        return stats
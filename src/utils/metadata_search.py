@@ -0,0 +1,270 @@
+# metadata_search.py
+"""
+元数据全文检索：基于 SQLite FTS5 检索表名/表注释、字段名/字段注释和业务术语，按 BM25 排序。
+
+中文注释在写入索引前切分为二元组，蛇形/驼峰标识符拆分为单词并保留完整标识符，
+FTS5 使用 unicode61 分词器按空格切分。元数据表上的触发器把变更行记入 search_pending，
+写入方无需注册任何函数；同步在数据库副本上调用 refresh_search_index 增量更新索引，
+检索只读取已换入的正式文件。
+"""
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from .sqlite_access import read_connection
+
+_CJK_RE = re.compile(r"[一-鿿]+")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+# 各检索对象：FTS表、来源表、参与检索的两列（名称列权重更高）
+SEARCH_KINDS = {
+    'tables': ('tables_fts', 'tables_meta', 'table_name', 'table_comment'),
+    'columns': ('columns_fts', 'columns_meta', 'column_name', 'column_comment'),
+    'terms': ('terms_fts', 'business_terms', 'term_name', 'term_definition'),
+}
+
+# 名称列、注释列的 BM25 权重
+NAME_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+
+# 字段命中、术语命中折算到表得分时的系数
+COLUMN_HIT_FACTOR = 0.6
+TERM_HIT_FACTOR = 0.8
+
+# 单次检索每类对象最多取的候选数
+CANDIDATE_LIMIT = 2000
+
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    """
+    把文本切分为检索词：标识符保留完整形式并按下划线和驼峰拆分，中文切分为二元组
+
+    Args:
+        text: 文本
+
+    Returns:
+        检索词列表
+    """
+    if not text:
+        return []
+    tokens = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        lowered = identifier.lower()
+        parts = [part.lower() for chunk in identifier.split("_") for part in _CAMEL_RE.findall(chunk)]
+        if parts != [lowered]:
+            tokens.append(lowered)
+        tokens.extend(parts)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _index_text(text: Optional[str]) -> str:
+    return " ".join(search_tokens(text))
+
+
+def ensure_search_index(conn: sqlite3.Connection):
+    """创建FTS表和变更跟踪触发器；首次创建时把已有数据全部记为待索引"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_pending (
+            kind TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, ref_id)
+        ) WITHOUT ROWID
+    ''')
+    for kind, (fts, source, name_column, text_column) in SEARCH_KINDS.items():
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                name, body, tokenize = "unicode61 tokenchars '_'"
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_search_insert AFTER INSERT ON {source} BEGIN
+                INSERT OR IGNORE INTO search_pending (kind, ref_id) VALUES ('{kind}', new.id);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_search_update
+            AFTER UPDATE OF {name_column}, {text_column} ON {source} BEGIN
+                INSERT OR IGNORE INTO search_pending (kind, ref_id) VALUES ('{kind}', new.id);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_search_delete AFTER DELETE ON {source} BEGIN
+                INSERT OR IGNORE INTO search_pending (kind, ref_id) VALUES ('{kind}', old.id);
+            END
+        ''')
+        if fts not in existing:
+            conn.execute(f"INSERT OR IGNORE INTO search_pending (kind, ref_id) SELECT '{kind}', id FROM {source}")
+
+
+def refresh_search_index(conn: sqlite3.Connection, batch_size: int = 500) -> int:
+    """
+    把 search_pending 中记录的变更同步到FTS表
+
+    Args:
+        conn: 元数据库连接
+        batch_size: 每次按主键回查的行数
+
+    Returns:
+        更新的行数
+    """
+    if conn.execute("SELECT 1 FROM search_pending LIMIT 1").fetchone() is None:
+        return 0
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        pending = conn.execute("SELECT kind, ref_id FROM search_pending").fetchall()
+        by_kind: Dict[str, List[int]] = {}
+        for kind, ref_id in pending:
+            by_kind.setdefault(kind, []).append(ref_id)
+        for kind, ids in by_kind.items():
+            fts, source, name_column, text_column = SEARCH_KINDS[kind]
+            conn.executemany(f"DELETE FROM {fts} WHERE rowid = ?", [(ref_id,) for ref_id in ids])
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                placeholders = ", ".join(["?"] * len(batch))
+                rows = conn.execute(
+                    f"SELECT id, {name_column}, {text_column} FROM {source} WHERE id IN ({placeholders})", batch)
+                conn.executemany(f"INSERT INTO {fts} (rowid, name, body) VALUES (?, ?, ?)",
+                                 [(ref_id, _index_text(name), _index_text(text)) for ref_id, name, text in rows])
+        conn.execute("DELETE FROM search_pending")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(pending)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """把检索文本转换为FTS5查询：各检索词取并集，由BM25决定排序"""
+    tokens = list(dict.fromkeys(search_tokens(query)))
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"' for token in tokens)
+
+
+class MetadataSearch:
+    """按业务需求检索相关数据表"""
+
+    def __init__(self, metadata_db_path: str):
+        """
+        Args:
+            metadata_db_path: 元数据SQLite数据库路径
+        """
+        self.metadata_db_path = metadata_db_path
+
+    def search_tables(self, query: str, page: int = 1, page_size: int = 20) -> Dict:
+        """
+        检索与需求相关的表：表本身、其字段以及关联业务术语的命中共同决定得分
+
+        Args:
+            query: 检索文本，中英文均可
+            page: 页码，从1开始
+            page_size: 每页条数
+
+        Returns:
+            包含 total、page、page_size 和 results 的字典，results 中每项包含
+            source、schema、table、comment、score 和命中的字段
+        """
+        page = max(1, page)
+        page_size = max(1, min(page_size, 100))
+        match = build_match_query(query)
+        if match is None:
+            return {'query': query, 'total': 0, 'page': page, 'page_size': page_size, 'results': []}
+
+        try:
+            return self._search(query, match, page, page_size)
+        except sqlite3.OperationalError:
+            # 元数据库尚未同步，没有检索索引
+            return {'query': query, 'total': 0, 'page': page, 'page_size': page_size, 'results': []}
+
+    def _search(self, query: str, match: str, page: int, page_size: int) -> Dict:
+        with read_connection(self.metadata_db_path) as conn:
+            scores: Dict[Tuple[str, str, str], float] = {}
+            comments: Dict[Tuple[str, str, str], str] = {}
+            matched_columns: Dict[Tuple[str, str, str], List[str]] = {}
+
+            # bm25() 越小越相关，取相反数作为得分
+            for source, schema, name, comment, score in conn.execute(f'''
+                SELECT t.source, t.table_schema, t.table_name, t.table_comment,
+                       -bm25(tables_fts, {NAME_WEIGHT}, {TEXT_WEIGHT}) AS score
+                FROM tables_fts JOIN tables_meta t ON t.id = tables_fts.rowid
+                WHERE tables_fts MATCH ?
+                ORDER BY rank LIMIT {CANDIDATE_LIMIT}
+            ''', (match,)):
+                key = (source, schema, name)
+                scores[key] = scores.get(key, 0.0) + score
+                comments[key] = comment or ""
+
+            # 字段命中：每张表只计最相关的字段得分，并记录命中的字段
+            best_column: Dict[Tuple[str, str, str], float] = {}
+            for source, schema, name, column, score in conn.execute(f'''
+                SELECT c.source, c.table_schema, c.table_name, c.column_name,
+                       -bm25(columns_fts, {NAME_WEIGHT}, {TEXT_WEIGHT}) AS score
+                FROM columns_fts JOIN columns_meta c ON c.id = columns_fts.rowid
+                WHERE columns_fts MATCH ?
+                ORDER BY rank LIMIT {CANDIDATE_LIMIT}
+            ''', (match,)):
+                key = (source, schema, name)
+                best_column[key] = max(best_column.get(key, 0.0), score)
+                columns = matched_columns.setdefault(key, [])
+                if len(columns) < 5:
+                    columns.append(column)
+            for key, score in best_column.items():
+                scores[key] = scores.get(key, 0.0) + COLUMN_HIT_FACTOR * score
+
+            # 业务术语命中：加到术语关联的表上（related_tables 以逗号分隔，可带库名）
+            term_scores: Dict[str, float] = {}
+            for related, score in conn.execute(f'''
+                SELECT b.related_tables, -bm25(terms_fts, {NAME_WEIGHT}, {TEXT_WEIGHT}) AS score
+                FROM terms_fts JOIN business_terms b ON b.id = terms_fts.rowid
+                WHERE terms_fts MATCH ?
+                ORDER BY rank LIMIT {CANDIDATE_LIMIT}
+            ''', (match,)):
+                for table in (related or "").split(","):
+                    table = table.strip().lower()
+                    if table:
+                        term_scores[table] = max(term_scores.get(table, 0.0), score)
+            if term_scores:
+                self._apply_term_scores(conn, term_scores, scores)
+
+            missing = [key for key in scores if key not in comments]
+            for key in missing:
+                row = conn.execute("SELECT table_comment FROM tables_meta WHERE source = ? AND table_schema = ? "
+                                   "AND table_name = ?", key).fetchone()
+                comments[key] = (row[0] if row else "") or ""
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        start = (page - 1) * page_size
+        results = [
+            {
+                'source': source,
+                'schema': schema,
+                'table': name,
+                'comment': comments.get((source, schema, name), ""),
+                'score': round(score, 4),
+                'matched_columns': matched_columns.get((source, schema, name), []),
+            }
+            for (source, schema, name), score in ranked[start:start + page_size]
+        ]
+        return {'query': query, 'total': len(ranked), 'page': page, 'page_size': page_size, 'results': results}
+
+    @staticmethod
+    def _apply_term_scores(conn: sqlite3.Connection, term_scores: Dict[str, float],
+                           scores: Dict[Tuple[str, str, str], float]):
+        """把术语得分加到关联的表上，只给表名时匹配所有库中的同名表"""
+        names = {name.rsplit(".", 1)[-1] for name in term_scores}
+        placeholders = ", ".join(["?"] * len(names))
+        for source, schema, name in conn.execute(
+                f"SELECT source, table_schema, table_name FROM tables_meta WHERE lower(table_name) IN ({placeholders})",
+                list(names)):
+            score = max(term_scores.get(f"{schema}.{name}".lower(), 0.0), term_scores.get(name.lower(), 0.0))
+            if score:
+                key = (source, schema, name)
+                scores[key] = scores.get(key, 0.0) + TERM_HIT_FACTOR * score
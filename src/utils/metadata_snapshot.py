@@ -0,0 +1,403 @@
+# metadata_snapshot.py
+"""
+只读元数据快照文件：由 MetadataCollector 在同步后生成，各工作进程通过 mmap 打开，
+操作系统在进程间共享同一份页缓存，打开时只解析文件头。
+
+文件布局（小端序）：
+    文件头      魔数、格式版本、生成时间、各数据段的条目数与偏移
+    字符串表    u32 偏移数组 + UTF-8 数据，所有字符串去重后只存一份
+    表记录      每表 9 个 u32：数据源、库、表、注释、"库.表"小写键、表名小写键、首字段序号、字段数、
+                同名表数量，按 "库.表" 小写键排序
+    字段记录    每字段 4 个 u32：字段名、小写键、类型、注释，同一张表的字段连续存放且保持字段顺序
+    哈希索引    三个开放寻址哈希表（"库.表" -> 表、表名 -> 表、(表, 字段) -> 字段），槽位存序号+1
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .sqlite_access import read_connection
+
+MAGIC = b"MDSNAP\x00\x01"
+FORMAT_VERSION = 1
+
+# 魔数、版本、生成时间、字符串数、表数、字段数、三个哈希表的槽位数、7 个数据段偏移
+_HEADER = struct.Struct("<8sIdIIIIII7Q")
+_TABLE_FIELDS = 9
+_COLUMN_FIELDS = 4
+
+
+def _hash(key: str) -> int:
+    return zlib.crc32(key.encode("utf-8"))
+
+
+def _slot_count(n: int) -> int:
+    """负载因子不超过 0.5 的 2 的幂"""
+    slots = 8
+    while slots < n * 2:
+        slots <<= 1
+    return slots
+
+
+def _build_hash(entries: Iterable[Tuple[str, int]], slots: int) -> List[int]:
+    """线性探测哈希表，key 相同的后续条目被忽略"""
+    table = [0] * slots
+    mask = slots - 1
+    keys: Dict[str, int] = {}
+    for key, value in entries:
+        if key in keys:
+            continue
+        keys[key] = value
+        slot = _hash(key) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = value
+    return table
+
+
+def write_snapshot(sqlite_db_path: str, snapshot_path: str) -> Dict[str, int]:
+    """
+    从元数据库生成快照文件，先写临时文件再原子替换，正在读取旧快照的进程不受影响
+
+    Args:
+        sqlite_db_path: 元数据SQLite数据库路径
+        snapshot_path: 快照文件路径
+
+    Returns:
+        表数、字段数和文件字节数
+    """
+    strings: Dict[str, int] = {}
+
+    def sid(value: Optional[str]) -> int:
+        value = value or ""
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    with read_connection(sqlite_db_path) as conn:
+        table_rows = conn.execute(
+            "SELECT source, table_schema, table_name, table_comment FROM tables_meta").fetchall()
+        columns_by_table: Dict[Tuple[str, str, str], List[Tuple]] = {}
+        for source, schema, name, column, data_type, comment in conn.execute(
+                "SELECT source, table_schema, table_name, column_name, data_type, column_comment "
+                "FROM columns_meta ORDER BY source, table_schema, table_name, id"):
+            columns_by_table.setdefault((source, schema, name), []).append((column, data_type, comment))
+
+    # 多个数据源中的同名表只保留一个，与 MetadataIndex 一致
+    tables: Dict[str, Tuple] = {}
+    for source, schema, name, comment in table_rows:
+        tables.setdefault(f"{schema}.{name}".lower(), (source, schema, name, comment))
+    ordered = sorted(tables.items())
+
+    table_records: List[int] = []
+    column_records: List[int] = []
+    column_keys: List[Tuple[str, int]] = []
+    name_counts: Dict[str, int] = {}
+    for _, (_, _, name, _) in ordered:
+        name_counts[name.lower()] = name_counts.get(name.lower(), 0) + 1
+    for table_idx, (full_key, (source, schema, name, comment)) in enumerate(ordered):
+        columns = columns_by_table.get((source, schema, name), [])
+        first = len(column_records) // _COLUMN_FIELDS
+        for column, data_type, column_comment in columns:
+            key = column.lower()
+            column_keys.append((f"{table_idx}\x00{key}", len(column_records) // _COLUMN_FIELDS + 1))
+            column_records.extend((sid(column), sid(key), sid(data_type), sid(column_comment)))
+        name_key = name.lower()
+        table_records.extend((sid(source), sid(schema), sid(name), sid(comment), sid(full_key), sid(name_key),
+                              first, len(columns), name_counts[name_key]))
+
+    n_tables = len(ordered)
+    n_columns = len(column_records) // _COLUMN_FIELDS
+    full_slots = _slot_count(n_tables)
+    name_slots = _slot_count(len(name_counts))
+    column_slots = _slot_count(n_columns)
+    full_hash = _build_hash(((key, idx + 1) for idx, (key, _) in enumerate(ordered)), full_slots)
+    name_hash = _build_hash(((record[2].lower(), idx + 1) for idx, (_, record) in enumerate(ordered)), name_slots)
+    column_hash = _build_hash(column_keys, column_slots)
+
+    encoded = [value.encode("utf-8") for value in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    sections = [
+        struct.pack(f"<{len(string_offsets)}I", *string_offsets),
+        b"".join(encoded),
+        struct.pack(f"<{len(table_records)}I", *table_records),
+        struct.pack(f"<{len(column_records)}I", *column_records),
+        struct.pack(f"<{full_slots}I", *full_hash),
+        struct.pack(f"<{name_slots}I", *name_hash),
+        struct.pack(f"<{column_slots}I", *column_hash),
+    ]
+    offsets = []
+    position = _HEADER.size
+    for data in sections:
+        # u32 数组按 4 字节对齐，便于 memoryview.cast 零拷贝访问
+        position += -position % 4
+        offsets.append(position)
+        position += len(data)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), len(strings), n_tables, n_columns,
+                          full_slots, name_slots, column_slots, *offsets)
+    tmp_path = f"{snapshot_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for offset, data in zip(offsets, sections):
+            f.write(b"\x00" * (offset - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, snapshot_path)
+    return {"tables": n_tables, "columns": n_columns, "bytes": position}
+
+
+class SnapshotColumn:
+    """快照中的字段，按需解码"""
+    __slots__ = ("name", "data_type", "comment", "ordinal")
+
+    def __init__(self, name: str, data_type: str, comment: str, ordinal: int):
+        self.name = name
+        self.data_type = data_type
+        self.comment = comment
+        self.ordinal = ordinal
+
+
+class SnapshotColumns(Mapping):
+    """表字段的只读映射：小写字段名 -> SnapshotColumn，查找走快照中的哈希索引"""
+    __slots__ = ("_snapshot", "_table_idx", "_first", "_count")
+
+    def __init__(self, snapshot: "MetadataSnapshot", table_idx: int, first: int, count: int):
+        self._snapshot = snapshot
+        self._table_idx = table_idx
+        self._first = first
+        self._count = count
+
+    def __getitem__(self, key: str) -> SnapshotColumn:
+        column_idx = self._snapshot._find_column(self._table_idx, key.lower())
+        if column_idx is None:
+            raise KeyError(key)
+        return self._snapshot._column(column_idx, column_idx - self._first)
+
+    def __iter__(self) -> Iterator[str]:
+        snapshot = self._snapshot
+        for column_idx in range(self._first, self._first + self._count):
+            yield snapshot._string(snapshot._columns[column_idx * _COLUMN_FIELDS + 1])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def values(self) -> List[SnapshotColumn]:
+        return [self._snapshot._column(self._first + i, i) for i in range(self._count)]
+
+
+class SnapshotTable:
+    """快照中的表"""
+    __slots__ = ("source", "schema", "name", "comment", "columns")
+
+    def __init__(self, source: str, schema: str, name: str, comment: str, columns: SnapshotColumns):
+        self.source = source
+        self.schema = schema
+        self.name = name
+        self.comment = comment
+        self.columns = columns
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+
+class MetadataSnapshot:
+    """mmap 打开的只读元数据快照"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 快照文件路径
+
+        Raises:
+            ValueError: 文件不是快照或格式版本不支持
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.built_at, n_strings, self.n_tables, self.n_columns,
+             full_slots, name_slots, column_slots, *offsets) = _HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            self._mmap.close()
+            raise ValueError(f"{path} 不是元数据快照文件")
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} 不是元数据快照文件或版本不支持（版本 {version}，需要 {FORMAT_VERSION}）")
+
+        buffer = memoryview(self._mmap)
+        self._views = []
+
+        def u32(offset: int, count: int) -> memoryview:
+            view = buffer[offset:offset + count * 4].cast("I")
+            self._views.append(view)
+            return view
+
+        self._string_offsets = u32(offsets[0], n_strings + 1)
+        self._string_base = offsets[1]
+        self._tables = u32(offsets[2], self.n_tables * _TABLE_FIELDS)
+        self._columns = u32(offsets[3], self.n_columns * _COLUMN_FIELDS)
+        self._full_hash = u32(offsets[4], full_slots)
+        self._name_hash = u32(offsets[5], name_slots)
+        self._column_hash = u32(offsets[6], column_slots)
+        self._views.append(buffer)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def _string(self, index: int) -> str:
+        start = self._string_base + self._string_offsets[index]
+        end = self._string_base + self._string_offsets[index + 1]
+        return self._mmap[start:end].decode("utf-8")
+
+    def _probe(self, hash_table: memoryview, key: str, key_of) -> Optional[int]:
+        """在哈希表中查找 key，返回槽位中的值（序号+1）"""
+        mask = len(hash_table) - 1
+        slot = _hash(key) & mask
+        while True:
+            value = hash_table[slot]
+            if value == 0:
+                return None
+            if key_of(value) == key:
+                return value
+            slot = (slot + 1) & mask
+
+    def _table_key(self, value: int, field: int) -> str:
+        return self._string(self._tables[(value - 1) * _TABLE_FIELDS + field])
+
+    def _find_table(self, full_key: str) -> Optional[int]:
+        value = self._probe(self._full_hash, full_key, lambda v: self._table_key(v, 4))
+        return None if value is None else value - 1
+
+    def _find_by_name(self, name_key: str) -> Optional[int]:
+        """按表名查找，返回表序号；不存在返回None，存在多个同名表返回 -1"""
+        value = self._probe(self._name_hash, name_key, lambda v: self._table_key(v, 5))
+        if value is None:
+            return None
+        return -1 if self._tables[(value - 1) * _TABLE_FIELDS + 8] > 1 else value - 1
+
+    def _find_column(self, table_idx: int, column_key: str) -> Optional[int]:
+        first = self._tables[table_idx * _TABLE_FIELDS + 6]
+        count = self._tables[table_idx * _TABLE_FIELDS + 7]
+        mask = len(self._column_hash) - 1
+        slot = _hash(f"{table_idx}\x00{column_key}") & mask
+        while True:
+            value = self._column_hash[slot]
+            if value == 0:
+                return None
+            column_idx = value - 1
+            if first <= column_idx < first + count and \
+                    self._string(self._columns[column_idx * _COLUMN_FIELDS + 1]) == column_key:
+                return column_idx
+            slot = (slot + 1) & mask
+
+    def _column(self, column_idx: int, ordinal: int) -> SnapshotColumn:
+        base = column_idx * _COLUMN_FIELDS
+        return SnapshotColumn(self._string(self._columns[base]), self._string(self._columns[base + 2]),
+                              self._string(self._columns[base + 3]), ordinal)
+
+    def _table(self, table_idx: int) -> SnapshotTable:
+        base = table_idx * _TABLE_FIELDS
+        record = self._tables[base:base + _TABLE_FIELDS]
+        return SnapshotTable(self._string(record[0]), self._string(record[1]), self._string(record[2]),
+                             self._string(record[3]), SnapshotColumns(self, table_idx, record[6], record[7]))
+
+    def get_table(self, table: str, schema: Optional[str] = None) -> Optional[SnapshotTable]:
+        """查找表，语义与 MetadataIndex.get_table 相同"""
+        if schema is None and "." in table:
+            schema, table = table.rsplit(".", 1)
+        if schema:
+            table_idx = self._find_table(f"{schema}.{table}".lower())
+        else:
+            table_idx = self._find_by_name(table.lower())
+        if table_idx is None or table_idx < 0:
+            return None
+        return self._table(table_idx)
+
+    def has_table(self, table: str, schema: Optional[str] = None) -> bool:
+        if schema is None and "." not in table:
+            return self._find_by_name(table.lower()) is not None
+        return self.get_table(table, schema) is not None
+
+    def table_names(self) -> List[str]:
+        """所有表的 "库.表" 名称（按小写键排序）"""
+        names = []
+        for idx in range(self.n_tables):
+            base = idx * _TABLE_FIELDS
+            names.append(f"{self._string(self._tables[base + 1])}.{self._string(self._tables[base + 2])}")
+        return names
+
+
+class SnapshotIndex:
+    """
+    基于快照文件的元数据索引，查询接口与 MetadataIndex 相同；快照文件被替换后自动重新打开
+    """
+
+    def __init__(self, snapshot_path: str, partition_fields: Iterable[str] = ("dt", "date")):
+        self.snapshot_path = snapshot_path
+        self.partition_fields = tuple(field.lower() for field in partition_fields)
+        self._snapshot: Optional[MetadataSnapshot] = None
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _current(self) -> Optional[MetadataSnapshot]:
+        try:
+            stat = os.stat(self.snapshot_path)
+            key = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+        if key != self._stat_key:
+            with self._lock:
+                if key != self._stat_key:
+                    # 旧快照不主动关闭：可能仍有其他线程持有其中的表对象，由垃圾回收释放
+                    self._snapshot = MetadataSnapshot(self.snapshot_path) if key else None
+                    self._stat_key = key
+        return self._snapshot
+
+    def is_empty(self) -> bool:
+        snapshot = self._current()
+        return snapshot is None or snapshot.n_tables == 0
+
+    def table_count(self) -> int:
+        snapshot = self._current()
+        return snapshot.n_tables if snapshot else 0
+
+    def get_table(self, table: str, schema: Optional[str] = None) -> Optional[SnapshotTable]:
+        snapshot = self._current()
+        return snapshot.get_table(table, schema) if snapshot else None
+
+    def has_table(self, table: str, schema: Optional[str] = None) -> bool:
+        snapshot = self._current()
+        return snapshot.has_table(table, schema) if snapshot else False
+
+    def columns(self, table: str, schema: Optional[str] = None) -> List[SnapshotColumn]:
+        meta = self.get_table(table, schema)
+        return meta.columns.values() if meta else []
+
+    def column(self, table: str, column: str, schema: Optional[str] = None) -> Optional[SnapshotColumn]:
+        meta = self.get_table(table, schema)
+        return meta.columns.get(column.lower()) if meta else None
+
+    def partition_keys(self, table: str, schema: Optional[str] = None) -> Tuple[str, ...]:
+        meta = self.get_table(table, schema)
+        if meta is None:
+            return ()
+        found = [meta.columns.get(field) for field in self.partition_fields]
+        return tuple(column.name for column in sorted((c for c in found if c), key=lambda c: c.ordinal))
+
+    def table_names(self) -> List[str]:
+        snapshot = self._current()
+        return snapshot.table_names() if snapshot else []
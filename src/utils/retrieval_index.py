@@ -0,0 +1,336 @@
+# retrieval_index.py
+"""
+表结构检索索引：每张表的表名、表注释、字段名和字段注释组成一个文档，按字符 n-gram 计算
+TF-IDF 向量，用于在本地为用户需求挑选相关的表，不依赖外部向量服务。
+
+n-gram 用 crc32 哈希到固定维度，稀疏矩阵用 NumPy 数组存储两份：
+    按文档      各文档的原始词频，增量重建时未变化的文档直接复用
+    按特征      TF-IDF 权重（行已归一化），检索时只取查询包含的特征列，
+                一次 bincount 完成稀疏矩阵与查询向量的乘积
+索引保存为 .npz 文件，由 MetadataCollector 在同步后更新。
+"""
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .sqlite_access import read_connection
+
+FORMAT_VERSION = 1
+
+# 哈希特征维度
+DIMENSIONS = 1 << 18
+
+# 各字段在文档中的权重
+NAME_WEIGHT = 3.0
+COMMENT_WEIGHT = 2.0
+COLUMN_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-鿿]+")
+_ASCII_RE = re.compile(r"[a-z0-9]+")
+
+DocumentKey = Tuple[str, str, str]
+Document = Tuple[DocumentKey, Sequence[Tuple[str, float]]]
+
+
+def char_ngrams(text: Optional[str]) -> List[str]:
+    """
+    字符 n-gram：英文单词两端补空格后取 3-gram，中文取 2-gram 和 3-gram，
+    下划线等符号视为分隔符，因此蛇形命名的各个单词分别生成 n-gram
+
+    Args:
+        text: 文本
+
+    Returns:
+        n-gram 列表
+    """
+    if not text:
+        return []
+    grams = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if _ASCII_RE.fullmatch(token):
+            padded = f" {token} "
+            grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        elif len(token) == 1:
+            grams.append(token)
+        else:
+            grams.extend(token[i:i + 2] for i in range(len(token) - 1))
+            grams.extend(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+
+def _features(fields: Sequence[Tuple[str, float]]) -> Dict[int, float]:
+    """按字段权重累计 n-gram 的词频，返回 特征 -> 对数词频"""
+    counts: Dict[int, float] = {}
+    for text, weight in fields:
+        for gram in char_ngrams(text):
+            feature = zlib.crc32(gram.encode("utf-8")) & (DIMENSIONS - 1)
+            counts[feature] = counts.get(feature, 0.0) + weight
+    return {feature: 1.0 + math.log(count) if count >= 1.0 else count for feature, count in counts.items()}
+
+
+def _checksum(fields: Sequence[Tuple[str, float]]) -> str:
+    digest = hashlib.sha1()
+    for text, weight in fields:
+        digest.update(f"{weight}\x1f{text or ''}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def gather_csr_rows(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """取 CSR 中若干行的元素下标，返回 (下标数组, 各行元素数)"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), lengths
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return offsets + np.arange(total, dtype=np.int64), lengths
+
+
+def document_fields(name: str, comment: Optional[str],
+                    columns: Sequence[Tuple[str, Optional[str]]]) -> List[Tuple[str, float]]:
+    """
+    一张表的检索文档
+
+    Args:
+        name: 表名
+        comment: 表注释
+        columns: [(字段名, 字段注释), ...]
+
+    Returns:
+        [(文本, 权重), ...]
+    """
+    fields = [(name, NAME_WEIGHT), (comment or "", COMMENT_WEIGHT)]
+    for column, column_comment in columns:
+        fields.append((column, COLUMN_WEIGHT))
+        fields.append((column_comment or "", COLUMN_WEIGHT))
+    return fields
+
+
+def load_documents(sqlite_db_path: str) -> List[Document]:
+    """
+    从元数据库读取每张表的检索文档
+
+    Returns:
+        [((数据源, 库, 表), [(文本, 权重), ...]), ...]
+    """
+    tables: Dict[DocumentKey, Tuple[str, List[Tuple[str, str]]]] = {}
+    try:
+        with read_connection(sqlite_db_path) as conn:
+            for source, schema, name, comment in conn.execute(
+                    "SELECT source, table_schema, table_name, table_comment FROM tables_meta"):
+                tables[(source, schema, name)] = (comment or "", [])
+            for source, schema, name, column, comment in conn.execute(
+                    "SELECT source, table_schema, table_name, column_name, column_comment "
+                    "FROM columns_meta ORDER BY source, table_schema, table_name, id"):
+                tables.setdefault((source, schema, name), ("", []))[1].append((column, comment))
+    except sqlite3.OperationalError:
+        # 元数据库尚未初始化
+        return []
+    return [(key, document_fields(key[2], comment, columns)) for key, (comment, columns) in tables.items()]
+
+
+class RetrievalIndex:
+    """字符 n-gram TF-IDF 检索索引"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: 索引文件路径，None表示只在内存中使用
+        """
+        self.path = path
+        self.keys: List[DocumentKey] = []
+        self._checksums: List[str] = []
+        self._positions: Dict[DocumentKey, int] = {}
+        # 按文档存储的原始词频
+        self._doc_indptr = np.zeros(1, dtype=np.int64)
+        self._doc_features = np.zeros(0, dtype=np.int32)
+        self._doc_tf = np.zeros(0, dtype=np.float32)
+        # 按特征存储的归一化 TF-IDF 权重
+        self._idf = np.zeros(DIMENSIONS, dtype=np.float32)
+        self._feat_indptr = np.zeros(DIMENSIONS + 1, dtype=np.int64)
+        self._feat_docs = np.zeros(0, dtype=np.int32)
+        self._feat_weights = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def load(self) -> bool:
+        """
+        从索引文件加载
+
+        Returns:
+            是否加载成功；文件不存在、损坏或格式版本不同时返回False
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                if int(data["version"]) != FORMAT_VERSION or int(data["dimensions"]) != DIMENSIONS:
+                    return False
+                keys = [tuple(key.split("\x1f")) for key in data["keys"].tolist()]
+                checksums = data["checksums"].tolist()
+                arrays = {name: data[name] for name in ("doc_indptr", "doc_features", "doc_tf", "idf",
+                                                        "feat_indptr", "feat_docs", "feat_weights")}
+        except (OSError, KeyError, ValueError):
+            return False
+        self.keys, self._checksums = keys, checksums
+        self._positions = {key: i for i, key in enumerate(keys)}
+        for name, value in arrays.items():
+            setattr(self, f"_{name}", value)
+        return True
+
+    def save(self):
+        """写入索引文件：先写临时文件再原子替换，读取方不会看到写了一半的文件"""
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, version=FORMAT_VERSION, dimensions=DIMENSIONS,
+                         keys=np.array(["\x1f".join(key) for key in self.keys], dtype=str),
+                         checksums=np.array(self._checksums, dtype=str),
+                         doc_indptr=self._doc_indptr, doc_features=self._doc_features, doc_tf=self._doc_tf,
+                         idf=self._idf, feat_indptr=self._feat_indptr, feat_docs=self._feat_docs,
+                         feat_weights=self._feat_weights)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def update(self, documents: Sequence[Document]) -> Dict[str, int]:
+        """
+        按文档集合增量重建索引：内容未变的文档复用已有词频，只对新增和变化的文档提取 n-gram，
+        IDF 和归一化权重整体重新计算。更新后索引中的文档顺序与 documents 一致。
+
+        Args:
+            documents: 检索文档
+
+        Returns:
+            复用、重新计算和删除的文档数
+        """
+        checksums = [_checksum(fields) for _, fields in documents]
+        keys = [key for key, _ in documents]
+        if keys == self.keys and checksums == self._checksums:
+            return {'reused': len(keys), 'rebuilt': 0, 'removed': 0}
+
+        reused_rows, reused_positions = [], []
+        new_features: List[np.ndarray] = []
+        new_tf: List[np.ndarray] = []
+        lengths = np.zeros(len(documents), dtype=np.int64)
+        fresh_positions = []
+        for position, ((key, fields), checksum) in enumerate(zip(documents, checksums)):
+            old = self._positions.get(key)
+            if old is not None and self._checksums[old] == checksum:
+                reused_rows.append(old)
+                reused_positions.append(position)
+                lengths[position] = self._doc_indptr[old + 1] - self._doc_indptr[old]
+            else:
+                features = _features(fields)
+                new_features.append(np.fromiter(features.keys(), dtype=np.int32, count=len(features)))
+                new_tf.append(np.fromiter(features.values(), dtype=np.float32, count=len(features)))
+                fresh_positions.append(position)
+                lengths[position] = len(features)
+
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        doc_features = np.empty(int(indptr[-1]), dtype=np.int32)
+        doc_tf = np.empty(int(indptr[-1]), dtype=np.float32)
+        if reused_rows:
+            source, _ = gather_csr_rows(self._doc_indptr, np.array(reused_rows, dtype=np.int64))
+            target, _ = gather_csr_rows(indptr, np.array(reused_positions, dtype=np.int64))
+            doc_features[target] = self._doc_features[source]
+            doc_tf[target] = self._doc_tf[source]
+        for position, features, tf in zip(fresh_positions, new_features, new_tf):
+            doc_features[indptr[position]:indptr[position + 1]] = features
+            doc_tf[indptr[position]:indptr[position + 1]] = tf
+
+        removed = len(set(self._positions) - set(keys))
+        self.keys, self._checksums = keys, checksums
+        self._positions = {key: i for i, key in enumerate(keys)}
+        self._doc_indptr, self._doc_features, self._doc_tf = indptr, doc_features, doc_tf
+        self._reweight()
+        return {'reused': len(reused_rows), 'rebuilt': len(fresh_positions), 'removed': removed}
+
+    def _reweight(self):
+        """重新计算 IDF 和归一化的 TF-IDF 权重，并转置为按特征存储"""
+        n_docs = len(self.keys)
+        doc_ids = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self._doc_indptr))
+        df = np.bincount(self._doc_features, minlength=DIMENSIONS)
+        self._idf = (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        weights = self._doc_tf * self._idf[self._doc_features]
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights.astype(np.float64) ** 2, minlength=n_docs))
+        norms[norms == 0] = 1.0
+        weights = (weights / norms[doc_ids]).astype(np.float32)
+
+        order = np.argsort(self._doc_features, kind="stable")
+        self._feat_indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self._feat_docs = doc_ids[order]
+        self._feat_weights = weights[order]
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        查询与所有文档的余弦相似度：只取查询包含的特征列，一次 bincount 完成矩阵与向量的乘积
+
+        Args:
+            query: 查询文本
+
+        Returns:
+            与 keys 对齐的得分数组
+        """
+        features = _features([(query, 1.0)])
+        if not features or not self.keys:
+            return np.zeros(len(self.keys), dtype=np.float32)
+        columns = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        query_weights = np.fromiter(features.values(), dtype=np.float32, count=len(features)) * self._idf[columns]
+        positions, lengths = gather_csr_rows(self._feat_indptr, columns)
+        return np.bincount(self._feat_docs[positions],
+                           weights=self._feat_weights[positions] * np.repeat(query_weights, lengths),
+                           minlength=len(self.keys))
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[DocumentKey, float]]:
+        """
+        按相关度返回前 limit 个文档
+
+        Args:
+            query: 查询文本
+            limit: 最多返回的文档数
+
+        Returns:
+            [(文档键, 得分), ...]，只包含得分大于0的文档
+        """
+        scores = self.scores(query)
+        if not len(scores):
+            return []
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(self.keys[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def build_retrieval_index(sqlite_db_path: str, index_path: str) -> Dict[str, int]:
+    """
+    根据元数据库增量更新索引文件
+
+    Args:
+        sqlite_db_path: 元数据SQLite数据库路径
+        index_path: 索引文件路径
+
+    Returns:
+        文档数以及复用、重新计算和删除的文档数
+    """
+    index = RetrievalIndex(index_path)
+    index.load()
+    stats = index.update(load_documents(sqlite_db_path))
+    if stats['rebuilt'] or stats['removed'] or not os.path.exists(index_path):
+        index.save()
+    stats['documents'] = len(index)
+    return stats
@@ -0,0 +1,232 @@
+# sample_data.py
+"""
+本地样本数据：按表物化少量样本行，供沙箱试运行生成的SQL。
+
+分区表按分区抽样（默认最新几个分区，每个分区若干行），样本按库保存为 <目录>/<库名>.db，
+试运行时以库名 ATTACH，SQL 中的 "库.表" 无需改写即可直接查询。
+样本来源是可替换的 SampleProvider：JSON 夹具，或按字段统计（基数、空值比例）生成的合成数据。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+# 库名只允许可以安全用作文件名的字符
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+MANIFEST_DDL = '''
+    CREATE TABLE IF NOT EXISTS _samples (
+        table_name TEXT PRIMARY KEY,
+        partitions TEXT NOT NULL DEFAULT '',
+        row_count INTEGER NOT NULL,
+        materialized_at REAL NOT NULL
+    )
+'''
+
+
+def sqlite_type(data_type: str) -> str:
+    """Hive/MySQL 字段类型对应的 SQLite 类型亲和性"""
+    name = (data_type or "").lower()
+    if re.match(r"(tiny|small|medium|big)?int|integer|long|boolean|bool", name):
+        return "INTEGER"
+    if re.match(r"decimal|numeric|double|float|real", name):
+        return "REAL"
+    return "TEXT"
+
+
+def parse_partition(name: str) -> Dict[str, str]:
+    """"dt=2024-01-01/hour=08" -> {"dt": "2024-01-01", "hour": "08"}"""
+    return dict(part.split("=", 1) for part in name.split("/") if "=" in part)
+
+
+class SampleProvider(ABC):
+    """样本数据来源"""
+
+    @abstractmethod
+    def rows(self, schema: str, table: str, columns: Sequence[Tuple[str, str]], partition: Dict[str, str],
+             limit: int) -> Iterable[Sequence]:
+        """
+        Args:
+            schema: 库名
+            table: 表名
+            columns: (字段名, 类型)，含分区字段
+            partition: 抽样的分区值，未分区表为空字典
+            limit: 最多返回的行数
+
+        Returns:
+            按 columns 顺序的行
+        """
+
+
+class FixtureSampleProvider(SampleProvider):
+    """
+    从 JSON 夹具读取样本，供测试和本地开发使用
+
+    夹具以 "库.表" 为键，值为行的列表，每行是字段名到值的字典::
+
+        {"dw.dwd_order_detail": [{"order_id": 1, "pay_amount": 9.9, "dt": "2024-01-01"}]}
+    """
+
+    def __init__(self, fixture: Union[str, Dict[str, List[Dict]]]):
+        """
+        Args:
+            fixture: 夹具文件路径或已加载的字典
+        """
+        if isinstance(fixture, str):
+            with open(fixture, 'r', encoding='utf-8') as f:
+                fixture = json.load(f)
+        self.fixture = {name.lower(): [{key.lower(): value for key, value in row.items()} for row in rows]
+                        for name, rows in fixture.items()}
+
+    def rows(self, schema, table, columns, partition, limit):
+        names = [name.lower() for name, _ in columns]
+        selected = []
+        for row in self.fixture.get(f"{schema}.{table}".lower(), []):
+            if all(str(row.get(key.lower())) == value for key, value in partition.items()):
+                selected.append(tuple(row.get(name) for name in names))
+                if len(selected) >= limit:
+                    break
+        return selected
+
+
+class SyntheticSampleProvider(SampleProvider):
+    """
+    按字段统计生成合成样本：取值个数不超过字段基数，按空值比例插入 NULL。
+
+    同名字段在不同表中取值方式相同（如 user_id 都是 1..基数），连接能关联上，
+    用于验证SQL语义和结果形状，不代表真实数据分布。
+    """
+
+    def __init__(self, stats_store=None):
+        """
+        Args:
+            stats_store: TableStatsStore，提供字段基数和空值比例；为 None 时只按类型生成
+        """
+        self.stats_store = stats_store
+
+    def rows(self, schema, table, columns, partition, limit):
+        stats = self.stats_store.table(f"{schema}.{table}") if self.stats_store is not None else None
+        column_stats = {name.lower(): value for name, value in stats.columns.items()} if stats is not None else {}
+        partition = {key.lower(): value for key, value in partition.items()}
+        generated = []
+        for index in range(limit):
+            row = []
+            for name, data_type in columns:
+                key = name.lower()
+                if key in partition:
+                    row.append(partition[key])
+                    continue
+                column = column_stats.get(key)
+                null_fraction = column.null_fraction if column is not None else None
+                if null_fraction and index % max(1, round(1 / null_fraction)) == 0:
+                    row.append(None)
+                    continue
+                ndv = column.ndv if column is not None and column.ndv else limit
+                row.append(self._value(key, data_type, index % max(1, ndv), partition))
+            generated.append(tuple(row))
+        return generated
+
+    @staticmethod
+    def _value(name: str, data_type: str, index: int, partition: Dict[str, str]):
+        kind = (data_type or "").lower()
+        affinity = sqlite_type(kind)
+        if affinity == "INTEGER":
+            return index % 2 if kind.startswith("bool") else index + 1
+        if affinity == "REAL":
+            return round((index * 37 % 10000) / 100, 2)
+        day = partition.get("dt") or partition.get("date") or "2024-01-01"
+        if kind.startswith("date"):
+            return day
+        if kind.startswith("timestamp") or kind.startswith("datetime"):
+            return f"{day} {index % 24:02d}:00:00"
+        return f"{name}_{index}"
+
+
+class SampleInfo(NamedTuple):
+    """一张表已物化的样本"""
+    partitions: Tuple[str, ...]
+    row_count: int
+    materialized_at: float
+
+
+class SampleStore:
+    """样本数据目录，每个库一个 SQLite 文件"""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: 样本目录
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path(self, schema: str) -> str:
+        if not _SAFE_NAME.match(schema):
+            raise ValueError(f"不支持的库名: {schema}")
+        return os.path.join(self.directory, f"{schema.lower()}.db")
+
+    def info(self, schema: str, table: str) -> Optional[SampleInfo]:
+        """表的样本信息，未物化时为 None"""
+        path = self.path(schema)
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT partitions, row_count, materialized_at FROM _samples WHERE table_name = ?",
+                               (table.lower(),)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return SampleInfo(tuple(part for part in row[0].split(",") if part), row[1], row[2])
+
+    def materialize(self, provider: SampleProvider, schema: str, table: str, columns: Sequence[Tuple[str, str]],
+                    partitions: Sequence[str] = (), rows_per_partition: int = 200,
+                    partition_rows: Optional[Dict[str, Optional[int]]] = None) -> SampleInfo:
+        """
+        按分区抽样并替换表的样本
+
+        Args:
+            provider: 样本来源
+            schema: 库名
+            table: 表名
+            columns: (字段名, 类型)，含分区字段
+            partitions: 抽样的分区名，如 "dt=2024-01-01"；为空时整表抽样
+            rows_per_partition: 每个分区的样本行数
+            partition_rows: 分区名（未分区表为 ""）到实际行数，样本不超过实际行数
+
+        Returns:
+            物化后的样本信息
+        """
+        rows: List[Sequence] = []
+        for partition in (partitions or [""]):
+            limit = rows_per_partition
+            actual = (partition_rows or {}).get(partition)
+            if actual is not None:
+                limit = min(limit, actual)
+            rows.extend(provider.rows(schema, table, columns, parse_partition(partition), limit))
+
+        table_name = table.lower()
+        definition = ", ".join(f'"{name}" {sqlite_type(data_type)}' for name, data_type in columns)
+        placeholders = ", ".join(["?"] * len(columns))
+        now = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            conn = sqlite3.connect(self.path(schema))
+            try:
+                with conn:
+                    conn.execute(MANIFEST_DDL)
+                    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                    conn.execute(f'CREATE TABLE "{table_name}" ({definition})')
+                    conn.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+                    conn.execute("INSERT OR REPLACE INTO _samples (table_name, partitions, row_count, materialized_at) "
+                                 "VALUES (?, ?, ?, ?)", (table_name, ",".join(partitions), len(rows), now))
+            finally:
+                conn.close()
+        return SampleInfo(tuple(partitions), len(rows), now)
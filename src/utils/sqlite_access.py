@@ -0,0 +1,150 @@
+# sqlite_access.py
+"""
+元数据库的并发访问：查询走只读连接池，同步在数据库副本上写入后原子替换。
+
+同步期间所有写入都发生在副本上（WAL 模式，批量写入不阻塞），完成后检查点并切回
+rollback 日志模式，再用 os.replace 换入正式路径。正式文件在两次替换之间不再被写入，
+读取方既不会等待写锁，也不会看到同步了一半的数据；已打开的连接继续读取旧版本，
+连接池在借出连接前发现文件已被替换时关闭旧连接并重新打开。
+
+正式文件不使用 WAL：-wal/-shm 文件按路径命名，换入新文件后会与旧文件的日志混用。
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from .connection_pool import ConnectionPool
+
+# 每个数据库文件最多同时打开的只读连接数
+READ_POOL_SIZE = 16
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class ReadConnection:
+    """只读连接，记录打开时的文件，文件被替换后 ping 失败以便连接池重新打开"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.identity = _file_identity(path)
+        self._conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA query_only = ON")
+
+    def ping(self, reconnect: bool = False):
+        """
+        Raises:
+            sqlite3.OperationalError: 数据库文件已被替换或删除
+        """
+        if _file_identity(self.path) != self.identity:
+            raise sqlite3.OperationalError("元数据库文件已被替换")
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self._conn.execute(sql, parameters)
+
+    def close(self):
+        self._conn.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def read_pool(path: str) -> ConnectionPool:
+    """数据库文件的只读连接池"""
+    key = os.path.abspath(path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(lambda: ReadConnection(key), max_size=READ_POOL_SIZE)
+        return pool
+
+
+@contextmanager
+def read_connection(path: str) -> Iterator[ReadConnection]:
+    """
+    借出一个只读连接
+
+    Raises:
+        sqlite3.OperationalError: 数据库文件不存在时
+    """
+    with read_pool(path).connection() as conn:
+        yield conn
+
+
+def close_read_pools():
+    """关闭所有空闲的只读连接"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _remove_with_journals(path: str):
+    for name in (path, path + "-wal", path + "-shm", path + "-journal"):
+        if os.path.exists(name):
+            os.unlink(name)
+
+
+def stage_database(path: str) -> str:
+    """
+    复制数据库到同目录下的临时文件，供同步写入
+
+    Returns:
+        副本路径
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, staging_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".building")
+    os.close(fd)
+    try:
+        target = sqlite3.connect(staging_path)
+        try:
+            if os.path.exists(path):
+                source = sqlite3.connect(path)
+                try:
+                    source.backup(target)
+                finally:
+                    source.close()
+            target.execute("PRAGMA journal_mode=WAL")
+        finally:
+            target.close()
+    except BaseException:
+        _remove_with_journals(staging_path)
+        raise
+    return staging_path
+
+
+def publish_database(staging_path: str, path: str):
+    """检查点并切回 rollback 日志模式，落盘后原子替换正式文件"""
+    conn = sqlite3.connect(staging_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conn.close()
+    with open(staging_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(staging_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    _remove_with_journals(staging_path)
+
+
+def discard_database(staging_path: str):
+    """删除未发布的副本"""
+    _remove_with_journals(staging_path)
@@ -0,0 +1,423 @@
+# table_stats.py
+"""
+表和分区的数据量统计：每个分区的行数和字节数、表的分区数，以及字段的近似基数（NDV）、空值比例
+和最高频值占比（判断连接键倾斜）。
+
+统计来源是可替换的 StatsProvider：线上从 Hive Metastore 的 MySQL 库读取 ANALYZE 产生的统计，
+测试和本地开发使用 JSON 夹具。统计保存在 metadata.db 中（WITHOUT ROWID 表，主键即索引），
+按提供方给出的版本号增量刷新，成本估算和数据量提示只读本地库，不访问集群。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .sqlite_access import read_connection
+
+STATS_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS table_stats (
+        source TEXT NOT NULL DEFAULT '',
+        table_schema TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        partition_keys TEXT NOT NULL DEFAULT '',
+        row_count INTEGER,
+        total_bytes INTEGER,
+        partition_count INTEGER NOT NULL DEFAULT 0,
+        latest_partition TEXT,
+        version TEXT,
+        collected_at REAL,
+        PRIMARY KEY (source, table_schema, table_name)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS partition_stats (
+        source TEXT NOT NULL DEFAULT '',
+        table_schema TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        partition_name TEXT NOT NULL,
+        row_count INTEGER,
+        total_bytes INTEGER,
+        version TEXT,
+        PRIMARY KEY (source, table_schema, table_name, partition_name)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS column_stats (
+        source TEXT NOT NULL DEFAULT '',
+        table_schema TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        column_name TEXT NOT NULL,
+        ndv INTEGER,
+        null_fraction REAL,
+        top_fraction REAL,
+        PRIMARY KEY (source, table_schema, table_name, column_name)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# 每个事务写入的表数
+STATS_TABLES_PER_COMMIT = 200
+
+
+def ensure_stats_tables(conn: sqlite3.Connection):
+    """创建统计表（已存在时不变），旧版本的字段统计表补上 top_fraction"""
+    for ddl in STATS_DDL:
+        conn.execute(ddl)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(column_stats)")}
+    if "top_fraction" not in columns:
+        conn.execute("ALTER TABLE column_stats ADD COLUMN top_fraction REAL")
+
+
+class StatsProvider(ABC):
+    """
+    统计信息来源
+
+    tables 给出每张表的版本号，版本号不变的表不再读取分区和字段统计；分区同样按版本号只写入有变化的。
+    版本号为 None 表示无法判断，每次都重新读取。
+    """
+
+    @abstractmethod
+    def tables(self, schemas: Sequence[str]) -> Iterable[Tuple[str, str, Sequence[str], Optional[str]]]:
+        """
+        Returns:
+            (库名, 表名, 分区字段, 版本号)
+        """
+
+    @abstractmethod
+    def partitions(self, schema: str, table: str) -> Iterable[Tuple[str, Optional[int], Optional[int], Optional[str]]]:
+        """
+        Returns:
+            (分区名, 行数, 字节数, 版本号)，未分区的表返回一个分区名为空字符串的整表统计
+        """
+
+    @abstractmethod
+    def columns(self, schema: str, table: str) -> Iterable[Tuple[str, Optional[int], Optional[float], Optional[float]]]:
+        """
+        Returns:
+            (字段名, 近似基数, 空值比例, 最高频非空值的行数占比)，未知的统计为 None
+        """
+
+
+def _digest(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class FixtureStatsProvider(StatsProvider):
+    """
+    从 JSON 夹具读取统计，供测试和本地开发使用
+
+    夹具以 "库.表" 为键::
+
+        {"dw.dwd_order_detail": {
+            "partition_keys": ["dt"],
+            "partitions": {"dt=2024-01-01": {"row_count": 1200, "total_bytes": 65536}},
+            "columns": {"user_id": {"ndv": 300, "null_fraction": 0.0, "top_fraction": 0.02}}},
+         "dim.dim_city": {"row_count": 300, "total_bytes": 4096}}
+
+    未给出 version 时按内容计算，夹具内容变化即视为统计变化。
+    """
+
+    def __init__(self, fixture: Union[str, Dict[str, Dict]]):
+        """
+        Args:
+            fixture: 夹具文件路径或已加载的字典
+        """
+        if isinstance(fixture, str):
+            with open(fixture, 'r', encoding='utf-8') as f:
+                fixture = json.load(f)
+        self.fixture = fixture
+
+    def tables(self, schemas: Sequence[str]) -> Iterator[Tuple[str, str, Sequence[str], Optional[str]]]:
+        for name, entry in self.fixture.items():
+            schema, table = name.split(".", 1)
+            if schema in schemas:
+                yield schema, table, tuple(entry.get("partition_keys", ())), entry.get("version") or _digest(entry)
+
+    def partitions(self, schema: str, table: str) -> Iterator[Tuple[str, Optional[int], Optional[int], Optional[str]]]:
+        entry = self.fixture[f"{schema}.{table}"]
+        if not entry.get("partition_keys"):
+            yield "", entry.get("row_count"), entry.get("total_bytes"), entry.get("version") or _digest(entry)
+            return
+        for name, part in entry.get("partitions", {}).items():
+            yield name, part.get("row_count"), part.get("total_bytes"), part.get("version") or _digest(part)
+
+    def columns(self, schema: str, table: str) -> Iterator[Tuple[str, Optional[int], Optional[float], Optional[float]]]:
+        for name, column in self.fixture[f"{schema}.{table}"].get("columns", {}).items():
+            yield name, column.get("ndv"), column.get("null_fraction"), column.get("top_fraction")
+
+
+# Hive Metastore 中的表清单；版本号由表的 DDL 时间和分区数、最新分区 DDL 时间组成，新增分区时也会变化
+METASTORE_TABLES_QUERY = """
+    SELECT
+        d.NAME,
+        t.TBL_NAME,
+        (SELECT GROUP_CONCAT(k.PKEY_NAME ORDER BY k.INTEGER_IDX SEPARATOR ',')
+         FROM PARTITION_KEYS k WHERE k.TBL_ID = t.TBL_ID),
+        CONCAT_WS('/',
+            (SELECT tp.PARAM_VALUE FROM TABLE_PARAMS tp
+             WHERE tp.TBL_ID = t.TBL_ID AND tp.PARAM_KEY = 'transient_lastDdlTime'),
+            (SELECT CONCAT(COUNT(*), ':', IFNULL(MAX(pp.PARAM_VALUE), ''))
+             FROM PARTITIONS p
+             LEFT JOIN PARTITION_PARAMS pp ON pp.PART_ID = p.PART_ID AND pp.PARAM_KEY = 'transient_lastDdlTime'
+             WHERE p.TBL_ID = t.TBL_ID))
+    FROM TBLS t
+    JOIN DBS d ON d.DB_ID = t.DB_ID
+    WHERE d.NAME IN ({schemas})
+"""
+
+# 分区表各分区的统计
+METASTORE_PARTITIONS_QUERY = """
+    SELECT
+        p.PART_NAME,
+        MAX(CASE WHEN pp.PARAM_KEY = 'numRows' THEN pp.PARAM_VALUE END),
+        MAX(CASE WHEN pp.PARAM_KEY = 'totalSize' THEN pp.PARAM_VALUE END),
+        MAX(CASE WHEN pp.PARAM_KEY = 'transient_lastDdlTime' THEN pp.PARAM_VALUE END)
+    FROM PARTITIONS p
+    JOIN TBLS t ON t.TBL_ID = p.TBL_ID
+    JOIN DBS d ON d.DB_ID = t.DB_ID
+    LEFT JOIN PARTITION_PARAMS pp ON pp.PART_ID = p.PART_ID
+    WHERE d.NAME = %s AND t.TBL_NAME = %s
+    GROUP BY p.PART_NAME
+"""
+
+# 未分区表的整表统计
+METASTORE_TABLE_PARAMS_QUERY = """
+    SELECT
+        '',
+        MAX(CASE WHEN tp.PARAM_KEY = 'numRows' THEN tp.PARAM_VALUE END),
+        MAX(CASE WHEN tp.PARAM_KEY = 'totalSize' THEN tp.PARAM_VALUE END),
+        MAX(CASE WHEN tp.PARAM_KEY = 'transient_lastDdlTime' THEN tp.PARAM_VALUE END)
+    FROM TBLS t
+    JOIN DBS d ON d.DB_ID = t.DB_ID
+    LEFT JOIN TABLE_PARAMS tp ON tp.TBL_ID = t.TBL_ID
+    WHERE d.NAME = %s AND t.TBL_NAME = %s
+"""
+
+# 字段统计：分区表取各分区基数的最大值作为近似值，空值比例按有统计的分区计算
+METASTORE_PARTITION_COLUMNS_QUERY = """
+    SELECT
+        s.COLUMN_NAME,
+        MAX(s.NUM_DISTINCTS),
+        SUM(s.NUM_NULLS) / NULLIF(SUM(pp.PARAM_VALUE), 0)
+    FROM PART_COL_STATS s
+    JOIN PARTITION_PARAMS pp ON pp.PART_ID = s.PART_ID AND pp.PARAM_KEY = 'numRows'
+    WHERE s.DB_NAME = %s AND s.TABLE_NAME = %s
+    GROUP BY s.COLUMN_NAME
+"""
+
+METASTORE_TABLE_COLUMNS_QUERY = """
+    SELECT
+        s.COLUMN_NAME,
+        s.NUM_DISTINCTS,
+        s.NUM_NULLS / NULLIF(tp.PARAM_VALUE, 0)
+    FROM TAB_COL_STATS s
+    LEFT JOIN TABLE_PARAMS tp ON tp.TBL_ID = s.TBL_ID AND tp.PARAM_KEY = 'numRows'
+    WHERE s.DB_NAME = %s AND s.TABLE_NAME = %s
+"""
+
+
+def _count(value) -> Optional[int]:
+    """Metastore 中未统计的行数为 -1 或缺失"""
+    if value is None:
+        return None
+    value = int(value)
+    return value if value >= 0 else None
+
+
+class HiveMetastoreStatsProvider(StatsProvider):
+    """从 Hive Metastore 的 MySQL 库读取 ANALYZE TABLE 产生的统计，复用采集器的连接池"""
+
+    def __init__(self, collector, db_name: str):
+        """
+        Args:
+            collector: MetadataCollector，提供 iter_rows
+            db_name: Metastore 所在的数据源名称
+        """
+        self.collector = collector
+        self.db_name = db_name
+        self._partitioned: Dict[Tuple[str, str], bool] = {}
+
+    def _rows(self, query, params) -> Iterator[Tuple]:
+        for rows in self.collector.iter_rows(self.db_name, (query, list(params))):
+            yield from rows
+
+    def tables(self, schemas: Sequence[str]) -> Iterator[Tuple[str, str, Sequence[str], Optional[str]]]:
+        query = METASTORE_TABLES_QUERY.format(schemas=", ".join(["%s"] * len(schemas)))
+        # 先读完表清单归还连接，逐表读取分区和字段统计时再借连接；边读边查在连接池只有一个连接时会死锁
+        rows = list(self._rows(query, schemas))
+        for schema, table, keys, version in rows:
+            keys = tuple(keys.split(",")) if keys else ()
+            self._partitioned[(schema, table)] = bool(keys)
+            yield schema, table, keys, version
+
+    def partitions(self, schema: str, table: str) -> Iterator[Tuple[str, Optional[int], Optional[int], Optional[str]]]:
+        query = (METASTORE_PARTITIONS_QUERY if self._partitioned.get((schema, table), True)
+                 else METASTORE_TABLE_PARAMS_QUERY)
+        for name, rows, size, version in self._rows(query, (schema, table)):
+            yield name, _count(rows), _count(size), version
+
+    def columns(self, schema: str, table: str) -> Iterator[Tuple[str, Optional[int], Optional[float], Optional[float]]]:
+        query = (METASTORE_PARTITION_COLUMNS_QUERY if self._partitioned.get((schema, table), True)
+                 else METASTORE_TABLE_COLUMNS_QUERY)
+        # Metastore 只保存基数和空值数，没有高频值
+        for name, ndv, null_fraction in self._rows(query, (schema, table)):
+            yield name, _count(ndv), None if null_fraction is None else float(null_fraction), None
+
+
+def _total(values: List[Optional[int]]) -> Optional[int]:
+    """已知值之和，全部未知时为 None"""
+    known = [value for value in values if value is not None]
+    return sum(known) if known else None
+
+
+def sync_table_stats(conn: sqlite3.Connection, provider: StatsProvider, source: str, schemas: Sequence[str],
+                     full: bool = False, lock: Optional[threading.Lock] = None) -> Dict[str, int]:
+    """
+    按版本号增量刷新统计：版本不变的表跳过，只写入有变化的分区，删除源端已不存在的表和分区
+
+    Args:
+        conn: 元数据库连接
+        provider: 统计来源
+        source: 数据源名称
+        schemas: 刷新的库范围
+        full: 为True时忽略版本号，重新读取所有表
+        lock: 写入时持有的锁（并行同步共用一个写连接时）
+
+    Returns:
+        读取、变更、删除的表数以及写入、删除的分区数
+    """
+    stats = {'stats_tables_read': 0, 'stats_tables_changed': 0, 'stats_tables_deleted': 0,
+             'partitions_written': 0, 'partitions_deleted': 0}
+    lock = lock or nullcontext()
+    placeholders = ", ".join(["?"] * len(schemas))
+    local = {(schema, table): version for schema, table, version in conn.execute(
+        f"SELECT table_schema, table_name, version FROM table_stats WHERE source = ? AND table_schema IN ({placeholders})",
+        [source, *schemas])}
+
+    seen = set()
+    pending: List[Tuple] = []
+    for schema, table, keys, version in provider.tables(schemas):
+        key = (schema, table)
+        seen.add(key)
+        stats['stats_tables_read'] += 1
+        if not full and version is not None and local.get(key) == version:
+            continue
+        partitions = list(provider.partitions(schema, table))
+        columns = list(provider.columns(schema, table))
+        pending.append((key, keys, version, partitions, columns))
+        if len(pending) >= STATS_TABLES_PER_COMMIT:
+            with lock:
+                _write_stats(conn, source, pending, full, stats)
+            pending = []
+    removed = [(source, *key) for key in local if key not in seen]
+    with lock:
+        _write_stats(conn, source, pending, full, stats)
+        for table in ("partition_stats", "column_stats", "table_stats"):
+            conn.executemany(f"DELETE FROM {table} WHERE source = ? AND table_schema = ? AND table_name = ?", removed)
+        conn.commit()
+    stats['stats_tables_deleted'] = len(removed)
+    return stats
+
+
+def _write_stats(conn: sqlite3.Connection, source: str, pending: List[Tuple], full: bool, stats: Dict[str, int]):
+    """在一个事务中写入一批表的统计"""
+    now = time.time()
+    for (schema, table), keys, version, partitions, columns in pending:
+        local_parts = dict(conn.execute(
+            "SELECT partition_name, version FROM partition_stats "
+            "WHERE source = ? AND table_schema = ? AND table_name = ?", (source, schema, table)))
+        changed = [(source, schema, table, *part) for part in partitions
+                   if full or part[3] is None or local_parts.get(part[0]) != part[3]]
+        names = {part[0] for part in partitions}
+        gone = [(source, schema, table, name) for name in local_parts if name not in names]
+        conn.executemany("INSERT OR REPLACE INTO partition_stats (source, table_schema, table_name, partition_name, "
+                         "row_count, total_bytes, version) VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+        conn.executemany("DELETE FROM partition_stats WHERE source = ? AND table_schema = ? AND table_name = ? "
+                         "AND partition_name = ?", gone)
+        conn.execute("DELETE FROM column_stats WHERE source = ? AND table_schema = ? AND table_name = ?",
+                     (source, schema, table))
+        conn.executemany("INSERT INTO column_stats (source, table_schema, table_name, column_name, ndv, null_fraction, "
+                         "top_fraction) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         [(source, schema, table, *column) for column in columns])
+        partitioned = bool(keys)
+        conn.execute('''
+            INSERT OR REPLACE INTO table_stats (source, table_schema, table_name, partition_keys, row_count,
+                                                total_bytes, partition_count, latest_partition, version, collected_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (source, schema, table, ",".join(keys), _total([part[1] for part in partitions]),
+              _total([part[2] for part in partitions]), len(partitions) if partitioned else 0,
+              max(names) if partitioned and names else None, version, now))
+        stats['stats_tables_changed'] += 1
+        stats['partitions_written'] += len(changed)
+        stats['partitions_deleted'] += len(gone)
+    conn.commit()
+
+
+class ColumnStats(NamedTuple):
+    """字段的近似基数、空值比例和最高频值占比"""
+    ndv: Optional[int]
+    null_fraction: Optional[float]
+    top_fraction: Optional[float] = None
+
+
+class TableStats(NamedTuple):
+    """一张表的数据量统计"""
+    source: str
+    schema: str
+    table: str
+    partition_keys: Tuple[str, ...]
+    row_count: Optional[int]
+    total_bytes: Optional[int]
+    partition_count: int
+    latest_partition: Optional[str]
+    columns: Dict[str, ColumnStats]
+
+
+class TableStatsStore:
+    """从本地元数据库读取统计"""
+
+    def __init__(self, path: str):
+        self.metadata_db_path = path
+
+    def table(self, name: str) -> Optional[TableStats]:
+        """
+        Args:
+            name: "库.表" 或表名；只有表名且多个库中重名时取数据量最大的
+
+        Returns:
+            表的统计，没有统计时为 None
+        """
+        schema, _, table = name.rpartition(".")
+        where, params = ("table_schema = ? AND table_name = ?", (schema, table)) if schema else ("table_name = ?", (table,))
+        try:
+            with read_connection(self.metadata_db_path) as conn:
+                row = conn.execute(
+                    "SELECT source, table_schema, table_name, partition_keys, row_count, total_bytes, partition_count, "
+                    f"latest_partition FROM table_stats WHERE {where} ORDER BY IFNULL(total_bytes, -1) DESC LIMIT 1",
+                    params).fetchone()
+                if row is None:
+                    return None
+                columns = {name: ColumnStats(*values) for name, *values in conn.execute(
+                    "SELECT column_name, ndv, null_fraction, top_fraction FROM column_stats "
+                    "WHERE source = ? AND table_schema = ? AND table_name = ?", row[:3])}
+        except sqlite3.OperationalError:
+            # 元数据库不存在或尚未建立统计表
+            return None
+        keys = tuple(row[3].split(",")) if row[3] else ()
+        return TableStats(row[0], row[1], row[2], keys, row[4], row[5], row[6], row[7], columns)
+
+    def partitions(self, stats: TableStats, limit: Optional[int] = None) -> List[Tuple[str, Optional[int], Optional[int]]]:
+        """
+        Returns:
+            按分区名倒序（最新在前）的 (分区名, 行数, 字节数)
+        """
+        with read_connection(self.metadata_db_path) as conn:
+            return conn.execute(
+                "SELECT partition_name, row_count, total_bytes FROM partition_stats "
+                "WHERE source = ? AND table_schema = ? AND table_name = ? ORDER BY partition_name DESC LIMIT ?",
+                (stats.source, stats.schema, stats.table, -1 if limit is None else limit)).fetchall()
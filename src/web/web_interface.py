@@ -4,6 +4,8 @@ from ..core.sql_assistant_agent import SQLAssistantAgent
 import sys
 import os
 import asyncio
+import concurrent.futures
+import threading
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -11,14 +13,20 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Initialize the agent with a dummy API key for testing
 agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
 
-# 创建一个事件循环用于异步操作
+# 在后台线程中运行共享事件循环，各会话的请求并发提交到该循环
 loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
 
-async def process_query_async(user_input):
+def _session_id(request: gr.Request) -> str:
+    """获取Gradio会话ID"""
+    if request is not None and getattr(request, "session_hash", None):
+        return request.session_hash
+    return SQLAssistantAgent.DEFAULT_SESSION
+
+async def process_query_async(user_input, session_id: str = SQLAssistantAgent.DEFAULT_SESSION):
     """异步处理用户查询"""
     print(">>>>>>>>>>>>>>>>>>>>>开始处理用户需求<<<<<<<<<<<<<<<<<<<<<")
-    print(f"用户输入: {repr(user_input)} \n")
+    print(f"会话: {session_id}, 用户输入: {repr(user_input)} \n")
 
     # 严格的输入验证
     if user_input is None:
@@ -35,7 +43,7 @@ async def process_query_async(user_input):
         print(f"调用AI助手生成SQL，输入内容: {user_input}")
 
         # 调用异步处理函数
-        result = await agent.generate_and_review_sql(user_input)
+        result = await agent.generate_and_review_sql(user_input, session_id=session_id)
 
         print(f"AI助手返回结果: {result}")
 
@@ -49,22 +57,26 @@ async def process_query_async(user_input):
         print(f"错误信息: {error_msg}")
         return error_msg
 
-def process_query(user_input):
+def process_query(user_input, request: gr.Request):
     """Process the user query and generate SQL (同步包装版本)"""
-    # 使用我们创建的事件循环运行异步代码
-    return loop.run_until_complete(process_query_async(user_input))
+    # 提交到后台事件循环，多个会话的请求可以并发执行
+    future = asyncio.run_coroutine_threadsafe(process_query_async(user_input, _session_id(request)), loop)
+    try:
+        return future.result()
+    except (asyncio.CancelledError, concurrent.futures.CancelledError):
+        return "任务已取消"
 
-def stop_processing():
-    """停止当前处理任务"""
+def stop_processing(request: gr.Request):
+    """停止当前会话的处理任务"""
     global agent
 
-    print("收到停止请求")
+    session_id = _session_id(request)
+    print(f"收到停止请求, 会话: {session_id}")
 
     try:
-        # 尝试取消agent内部的任务
-        # 在同步上下文中直接调用异步方法
-        future = asyncio.run_coroutine_threadsafe(agent.cancel_current_task(), loop)
-        result = future.result(timeout=5)  # 等待最多5秒
+        # 只取消当前会话的任务，不影响其他用户
+        future = asyncio.run_coroutine_threadsafe(agent.cancel_session_task(session_id), loop)
+        result = future.result(timeout=10)  # 等待最多10秒
         return result
 
     except Exception as e:
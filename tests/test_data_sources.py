@@ -0,0 +1,188 @@
+# test_data_sources.py
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.utils.metadata_collector as collector_module
+from src.utils.db_config import DatabaseConfig
+from src.utils.metadata_collector import MetadataCollector
+from tests.test_metadata_streaming import FakeConnection, FakeCursor
+
+SOURCES_TOML = """
+[sources.cluster_a]
+host = "a.example.com"
+password_env = "TEST_CLUSTER_A_PASSWORD"
+schemas = ["dw", "app"]
+max_concurrency = 1
+
+[sources.cluster_b]
+host = "b.example.com"
+database = "hive_meta_b"
+schemas = ["dw"]
+sync_interval = 60
+
+[sources.lineage_db]
+collect = ["lineage"]
+"""
+
+
+def _write_toml(tmp, content=SOURCES_TOML):
+    path = os.path.join(tmp, "sources.toml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def test_load_sources_from_toml():
+    """从TOML加载数据源，未配置的设置使用默认值"""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["TEST_CLUSTER_A_PASSWORD"] = "secret"
+        try:
+            config = DatabaseConfig(config_path=_write_toml(tmp))
+        finally:
+            del os.environ["TEST_CLUSTER_A_PASSWORD"]
+
+        assert config.sources() == ["cluster_a", "cluster_b", "lineage_db"]
+        assert config.sources("lineage") == ["lineage_db"]
+        cluster_a = config.get_config("cluster_a")
+        assert cluster_a["password"] == "secret"
+        assert cluster_a["database"] == "cluster_a"
+        assert cluster_a["port"] == 3306
+        assert cluster_a["max_concurrency"] == 1
+        assert config.get_config("cluster_b")["sync_interval"] == 60.0
+        assert config.get_connection_string("cluster_b").endswith("@b.example.com:3306/hive_meta_b")
+
+
+def test_invalid_source_is_rejected():
+    """不支持的采集类型直接报错"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_toml(tmp, '[sources.x]\ncollect = ["views"]\n')
+        try:
+            DatabaseConfig(config_path=path)
+            assert False, "应当报错"
+        except ValueError as e:
+            assert "views" in str(e)
+
+
+def test_load_sources_from_env_prefix():
+    """从 DATA_SOURCE_<名称>_<设置> 环境变量加载数据源"""
+    env = {"DATA_SOURCES": "east, west", "DATA_SOURCE_EAST_HOST": "east.example.com",
+           "DATA_SOURCE_EAST_SCHEMAS": "ods,dw", "DATA_SOURCE_WEST_PORT": "3307",
+           "DATA_SOURCE_WEST_COLLECT": "tables,lineage"}
+    os.environ.update(env)
+    try:
+        config = DatabaseConfig()
+    finally:
+        for key in env:
+            del os.environ[key]
+
+    assert config.sources() == ["east", "west"]
+    assert config.get_config("east")["schemas"] == ["ods", "dw"]
+    assert config.get_config("west")["port"] == 3307
+    assert config.sources("lineage") == ["west"]
+
+
+class _TrackingCursor(FakeCursor):
+    """记录每个数据源同时在执行的查询数"""
+
+    def __init__(self, db_name, active, peaks, lock):
+        tables = [(schema, 'dw_orders', f'{db_name}订单表', '2024-01-01', '2024-01-02') for schema in ('dw', 'app')]
+        columns = [(schema, 'dw_orders', 'order_id', 'bigint', 'NO', '') for schema in ('dw', 'app')]
+        lineage = [('dw.dw_orders', 'app.dw_orders', None, None, None)]
+        super().__init__(tables, columns, lineage, [])
+        self.db_name, self.active, self.peaks, self.lock = db_name, active, peaks, lock
+
+    def execute(self, query, params=None):
+        with self.lock:
+            self.active[self.db_name] = self.active.get(self.db_name, 0) + 1
+            self.peaks[self.db_name] = max(self.peaks.get(self.db_name, 0), self.active[self.db_name])
+        time.sleep(0.05)
+        with self.lock:
+            self.active[self.db_name] -= 1
+        super().execute(query, params)
+
+
+def test_sync_fans_out_across_configured_sources():
+    """按配置同步所有数据源，元数据带数据源标识，并遵守各自的并发上限和同步周期"""
+    with tempfile.TemporaryDirectory() as tmp:
+        original = collector_module.db_config
+        collector_module.db_config = DatabaseConfig(config_path=_write_toml(tmp))
+        try:
+            collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"), parallelism=4,
+                                          retry_backoff=0)
+            active, peaks, lock = {}, {}, threading.Lock()
+            collector.connect_to_mysql = lambda db_name, streaming=False: FakeConnection(
+                _TrackingCursor(db_name, active, peaks, lock))
+
+            stats = collector.sync_metadata()
+            assert stats['errors'] == {}
+            assert stats['sources'] == ["cluster_a", "cluster_b", "lineage_db"]
+            assert peaks['cluster_a'] == 1
+
+            conn = sqlite3.connect(collector.sqlite_db_path)
+            rows = conn.execute("SELECT source, table_schema, table_comment FROM tables_meta "
+                                "ORDER BY source, table_schema").fetchall()
+            lineage_sources = conn.execute("SELECT DISTINCT source FROM table_lineage").fetchall()
+            conn.close()
+            # 同名表按数据源分别保存，cluster_b 只采集 dw 库
+            assert rows == [('cluster_a', 'app', 'cluster_a订单表'), ('cluster_a', 'dw', 'cluster_a订单表'),
+                            ('cluster_b', 'dw', 'cluster_b订单表')]
+            assert lineage_sources == [('lineage_db',)]
+
+            assert collector.due_sources() == []
+            assert collector.due_sources(now=time.time() + 120) == ["cluster_b"]
+            assert collector.sync_metadata(due_only=True)['sources'] == []
+        finally:
+            collector_module.db_config = original
+
+
+def test_legacy_database_is_migrated():
+    """旧结构的元数据库在副本上升级后换入，原有数据归属默认数据源"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        conn = sqlite3.connect(path)
+        conn.execute("""
+            CREATE TABLE tables_meta (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, table_schema TEXT NOT NULL, table_name TEXT NOT NULL,
+                table_comment TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, UNIQUE(table_schema, table_name))
+        """)
+        conn.execute("INSERT INTO tables_meta (table_schema, table_name, table_comment) VALUES ('dw', 't', '旧表')")
+        conn.execute("""
+            CREATE TABLE table_lineage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, source_table TEXT NOT NULL, target_table TEXT NOT NULL,
+                source_column TEXT, target_column TEXT, transform_rule TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+        """)
+        conn.executemany("INSERT INTO table_lineage (source_table, target_table) VALUES (?, ?)",
+                         [('dw.a', 'dw.b'), ('dw.a', 'dw.b')])
+        conn.commit()
+        conn.close()
+
+        legacy = os.stat(path).st_ino
+        MetadataCollector(sqlite_db_path=path)
+        # 迁移在副本上完成后换入，已是当前版本时不再改动正式文件
+        migrated = os.stat(path)
+        assert migrated.st_ino != legacy
+        MetadataCollector(sqlite_db_path=path)
+        assert os.stat(path).st_ino == migrated.st_ino and os.stat(path).st_mtime_ns == migrated.st_mtime_ns
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT source, table_comment, columns_checksum FROM tables_meta").fetchall() == [
+            ('bigdata_db', '旧表', None)]
+        assert conn.execute("SELECT source, source_table FROM table_lineage").fetchall() == [
+            ('user_profile_db', 'dw.a')]
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_load_sources_from_toml()
+    test_invalid_source_is_rejected()
+    test_load_sources_from_env_prefix()
+    test_sync_fans_out_across_configured_sources()
+    test_legacy_database_is_migrated()
+    print("测试完成")
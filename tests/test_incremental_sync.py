@@ -0,0 +1,167 @@
+# test_incremental_sync.py
+import sys
+import os
+import sqlite3
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.metadata_snapshot import MetadataSnapshot
+from tests.test_metadata_streaming import FakeConnection, FakeCursor, _fake_source
+
+
+class RecordingCursor(FakeCursor):
+    """记录执行过的查询，每次执行时读取数据源的最新内容（连接会被连接池复用）"""
+
+    def __init__(self, source, queries):
+        super().__init__(source['tables'], source['columns'], source['lineage'], [])
+        self.source = source
+        self.queries = queries
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        self.results = {"information_schema.tables": self.source['tables'],
+                        "information_schema.columns": self.source['columns'],
+                        "data_lineage_table_relations": self.source['lineage']}
+        super().execute(query, params)
+
+
+def _collector(tmp, source):
+    collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"), retry_backoff=0)
+    queries = []
+    collector.connect_to_mysql = lambda db_name, streaming=False: FakeConnection(RecordingCursor(source, queries))
+    return collector, queries
+
+
+def _source(n_tables=10, columns_per_table=3):
+    tables, columns, lineage = _fake_source(n_tables, columns_per_table)
+    return {'tables': tables, 'columns': columns, 'lineage': lineage}
+
+
+def test_unchanged_source_writes_nothing():
+    """源端未变化时第二次同步不读取字段、不写入任何数据"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source()
+        collector, queries = _collector(tmp, source)
+        first = collector.sync_metadata()
+        assert first['tables_changed'] == 10
+        assert first['lineage_inserted'] == 9
+
+        queries.clear()
+        second = collector.sync_metadata()
+        assert second['rows_changed'] == 0
+        assert second['columns_read'] == 0
+        assert not any("information_schema.columns" in query for query, _ in queries)
+
+
+def test_only_changed_tables_are_rewritten():
+    """只重新读取并重写变更时间变化的表"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source()
+        collector, queries = _collector(tmp, source)
+        collector.sync_metadata()
+
+        # dwd_t3 新增一个字段并更新了变更时间，dwd_t9 被删除
+        source['tables'][3] = source['tables'][3][:4] + ('2024-02-01 00:00:00',)
+        source['columns'].append(('dw', 'dwd_t3', 'c_new', 'bigint', 'YES', '新字段'))
+        source['tables'].pop()
+        source['columns'] = [row for row in source['columns'] if row[1] != 'dwd_t9']
+
+        queries.clear()
+        stats = collector.sync_metadata()
+        assert stats['tables_changed'] == 1
+        assert stats['tables_deleted'] == 1
+        assert stats['columns_written'] == 4
+        column_queries = [params for query, params in queries if "information_schema.columns" in query]
+        assert column_queries == [['dw', 'dwd_t3']]
+
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        assert conn.execute("SELECT COUNT(*) FROM columns_meta WHERE table_name = 'dwd_t3'").fetchone()[0] == 4
+        assert conn.execute("SELECT COUNT(*) FROM tables_meta WHERE table_name = 'dwd_t9'").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM columns_meta WHERE table_name = 'dwd_t9'").fetchone()[0] == 0
+        conn.close()
+
+
+def test_touched_table_with_same_columns_is_not_rewritten():
+    """变更时间变化但字段未变时，校验和相同，不重写字段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source()
+        collector, _ = _collector(tmp, source)
+        collector.sync_metadata()
+        source['tables'][0] = source['tables'][0][:4] + ('2024-03-01 00:00:00',)
+
+        stats = collector.sync_metadata()
+        assert stats['columns_read'] == 3
+        assert stats['columns_written'] == 0
+        assert stats['tables_changed'] == 0
+
+
+def test_comment_only_change_rebuilds_snapshot():
+    """只有表注释变化时更新快照和检索索引"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source()
+        collector, _ = _collector(tmp, source)
+        collector.sync_metadata()
+        source['tables'][0] = source['tables'][0][:2] + ('新的表注释',) + source['tables'][0][3:]
+
+        stats = collector.sync_metadata()
+        assert stats['tables_changed'] == 0 and stats['tables_updated'] == 1 and stats['rows_changed'] == 1
+        assert 'snapshot' in stats and 'retrieval_index' in stats
+        snapshot = MetadataSnapshot(collector.snapshot_path)
+        assert snapshot.get_table(f"{source['tables'][0][0]}.{source['tables'][0][1]}").comment == '新的表注释'
+        snapshot.close()
+
+        assert 'snapshot' not in collector.sync_metadata()
+
+
+def test_lineage_diff_upsert():
+    """血缘按唯一键比对：新增、更新转换规则、删除消失的关系"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source(n_tables=4)
+        collector, _ = _collector(tmp, source)
+        collector.sync_metadata()
+
+        source['lineage'] = [
+            ('dw.dwd_t0', 'dw.dwd_t1', None, None, 'daily'),
+            ('dw.dwd_t1', 'dw.dwd_t2', None, None, None),
+            ('dw.dwd_t0', 'dw.dwd_t3', 'c0', 'c0', None),
+            ('dw.dwd_t0', 'dw.dwd_t3', 'c0', 'c0', None),
+        ]
+        stats = collector.sync_lineage('user_profile_db')
+        assert stats == {'lineage_read': 4, 'lineage_inserted': 1, 'lineage_updated': 1, 'lineage_deleted': 1}
+
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        rows = conn.execute("SELECT source_table, target_table, transform_rule FROM table_lineage "
+                            "ORDER BY source_table, target_table").fetchall()
+        conn.close()
+        assert rows == [('dw.dwd_t0', 'dw.dwd_t1', 'daily'), ('dw.dwd_t0', 'dw.dwd_t3', None),
+                        ('dw.dwd_t1', 'dw.dwd_t2', None)]
+
+
+def test_failed_table_stream_keeps_local_metadata():
+    """读取表清单失败时不删除本地元数据"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = _source(n_tables=3)
+        collector, _ = _collector(tmp, source)
+        collector.sync_metadata()
+
+        def broken(db_name, streaming=False):
+            raise Exception("连接被拒绝")
+
+        collector.connect_to_mysql = broken
+        collector.sync_metadata()
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        assert conn.execute("SELECT COUNT(*) FROM tables_meta").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM table_lineage").fetchone()[0] == 2
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_unchanged_source_writes_nothing()
+    test_only_changed_tables_are_rewritten()
+    test_touched_table_with_same_columns_is_not_rewritten()
+    test_lineage_diff_upsert()
+    test_failed_table_stream_keeps_local_metadata()
+    print("测试完成")
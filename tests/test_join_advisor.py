@@ -0,0 +1,95 @@
+# test_join_advisor.py
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.join_advisor import JoinAdvisor, set_join_advisor
+from src.core.server import advise_joins, lint_sql
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import FixtureStatsProvider
+
+GB = 1 << 30
+
+FIXTURE = {
+    "dw.dwd_order_detail": {
+        "partition_keys": ["dt"],
+        "partitions": {f"dt=2024-01-{day:02d}": {"row_count": 5_000_000, "total_bytes": GB} for day in range(1, 31)},
+        "columns": {"user_id": {"ndv": 2_000_000, "null_fraction": 0.3},
+                    "city_code": {"ndv": 300, "null_fraction": 0.0},
+                    "shop_id": {"ndv": 100_000, "null_fraction": 0.0, "top_fraction": 0.2}},
+    },
+    "dim.dim_city": {"row_count": 300, "total_bytes": 4096, "columns": {"city_code": {"ndv": 300}}},
+    "dw.dim_user": {"row_count": 50_000_000, "total_bytes": 20 * GB,
+                    "columns": {"user_id": {"ndv": 50_000_000, "null_fraction": 0.0}}},
+    "dw.dim_shop": {"row_count": 10_000_000, "total_bytes": 2 * GB,
+                    "columns": {"shop_id": {"ndv": 10_000_000, "top_fraction": 0.0}}},
+}
+
+
+def _advisor(tmp):
+    path = os.path.join(tmp, "metadata.db")
+    MetadataCollector(sqlite_db_path=path).sync_table_stats(FixtureStatsProvider(FIXTURE), "cluster_bj", ("dw", "dim"))
+    return JoinAdvisor(path)
+
+
+def test_mapjoin_broadcasts_the_small_side():
+    """小表建议广播；外连接只能广播非保留的一侧"""
+    with tempfile.TemporaryDirectory() as tmp:
+        advisor = _advisor(tmp)
+        [advice] = advisor.advise("SELECT o.order_id FROM dw.dwd_order_detail o JOIN dim.dim_city c "
+                                  "ON o.city_code = c.city_code WHERE o.dt = '2024-01-01'")
+        assert (advice.broadcast, advice.broadcast_bytes, advice.keys) == ("c", 4096, (("o.city_code", "c.city_code"),))
+        assert "MAPJOIN(c)" in advice.suggestions()[0]
+
+        [advice] = advisor.advise("SELECT o.order_id FROM dim.dim_city c RIGHT JOIN dw.dwd_order_detail o "
+                                  "ON o.city_code = c.city_code")
+        assert advice.broadcast == "c"
+        # LEFT JOIN 保留左侧的小表，不能广播，只能在 Reduce 端连接
+        [advice] = advisor.advise("SELECT o.order_id FROM dim.dim_city c LEFT JOIN dw.dwd_order_detail o "
+                                  "ON o.city_code = c.city_code")
+        assert advice.broadcast is None and [key.reason for key in advice.skewed] == ["low_ndv"]
+        # 逗号连接按 WHERE 中的关联条件判断
+        [advice] = advisor.advise("SELECT o.order_id FROM dw.dwd_order_detail o, dim.dim_city c "
+                                  "WHERE o.city_code = c.city_code")
+        assert (advice.kind, advice.broadcast) == ("JOIN", "c")
+
+
+def test_skewed_join_keys():
+    """Reduce 端连接的连接键：NULL 过多、高频值；大小按分区裁剪后计算"""
+    with tempfile.TemporaryDirectory() as tmp:
+        advisor = _advisor(tmp)
+        [advice] = advisor.advise("SELECT o.order_id FROM dw.dwd_order_detail o JOIN dw.dim_user u "
+                                  "ON o.user_id = u.user_id WHERE o.dt = '2024-01-01'")
+        [key] = advice.skewed
+        assert (key.table, key.column, key.reason, key.rows) == ("dw.dwd_order_detail", "user_id", "null", 1_500_000)
+        assert "o.user_id IS NOT NULL" in advice.suggestions()[0]
+
+        [advice] = advisor.advise("SELECT o.order_id FROM dw.dwd_order_detail o LEFT JOIN dw.dim_user u "
+                                  "ON o.user_id = u.user_id WHERE o.dt = '2024-01-01'")
+        assert "COALESCE(o.user_id" in advice.suggestions()[0]
+
+        [advice] = advisor.advise("SELECT o.order_id FROM dw.dwd_order_detail o JOIN dw.dim_shop s USING (shop_id)")
+        assert [(key.alias, key.reason, key.rows) for key in advice.skewed] == [("o", "hot", 30_000_000)]
+        assert "SET hive.optimize.skewjoin=true; SET hive.skewjoin.key=100000;" in advice.suggestions()[0]
+
+        # 没有统计的表不做判断
+        assert advisor.advise("SELECT a.id FROM ods.a a JOIN ods.b b ON a.id = b.id") == []
+
+
+def test_lint_rule_and_tool():
+    """lint_sql 报告 R505，advise_joins 工具输出每个连接的建议"""
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = set_join_advisor(_advisor(tmp))
+        try:
+            sql = ("SELECT o.order_id FROM dw.dwd_order_detail o JOIN dw.dim_shop s ON o.shop_id = s.shop_id "
+                   "WHERE o.dt = '2024-01-01'")
+            assert "[Warning-R505]" in asyncio.run(lint_sql(sql))
+            result = asyncio.run(advise_joins(sql))
+            assert "o JOIN s" in result and "最高频值约占 20%" in result
+            assert "未发现需要调整的连接" in asyncio.run(advise_joins("SELECT a.id FROM ods.a a"))
+        finally:
+            set_join_advisor(previous)
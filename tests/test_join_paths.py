@@ -0,0 +1,147 @@
+# test_join_paths.py
+import asyncio
+import sys
+import os
+import random
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.join_paths import JoinPathFinder, set_join_path_finder
+from src.core.prompt_builder import PromptBuilder
+from src.utils.metadata_collector import MetadataCollector
+
+COLUMNS = [
+    ('dw', 'dwd_order_detail', 'order_id', 'bigint', 'YES', '订单ID'),
+    ('dw', 'dwd_order_detail', 'user_id', 'bigint', 'YES', '用户ID'),
+    ('dw', 'dwd_order_detail', 'pay_amount', 'decimal(18,2)', 'YES', '支付金额'),
+    ('dw', 'dwd_order_detail', 'dt', 'string', 'YES', '分区日期'),
+    ('dim', 'dim_user', 'user_id', 'bigint', 'YES', '用户ID'),
+    ('dim', 'dim_user', 'city_code', 'string', 'YES', '城市编码'),
+    ('dim', 'dim_city', 'city_code', 'string', 'YES', '城市编码'),
+    ('dim', 'dim_city', 'city_name', 'string', 'YES', '城市名称'),
+    ('dw', 'dwd_user_register', 'user_id', 'bigint', 'YES', '用户ID'),
+    ('dw', 'dwd_user_register', 'channel', 'string', 'YES', '注册渠道'),
+    ('dw', 'dwd_user_register', 'dt', 'string', 'YES', '分区日期'),
+    ('ods', 'ods_user_log', 'uid', 'bigint', 'YES', '用户'),
+    ('ods', 'ods_user_log', 'dt', 'string', 'YES', '分区日期'),
+    ('tmp', 'tmp_user_str', 'user_id', 'string', 'YES', '字符串类型的用户ID'),
+]
+
+LINEAGE = [('ods.ods_user_log', 'dw.dwd_user_register', 'uid', 'user_id', '直接映射')]
+
+
+def _build_db(path, columns=COLUMNS, lineage=LINEAGE):
+    collector = MetadataCollector(sqlite_db_path=path)
+    tables = sorted({(schema, table) for schema, table, *_ in columns})
+    collector.bulk_load([('tables', [(schema, table, '') for schema, table in tables]),
+                         ('columns', columns), ('lineage', lineage)])
+
+
+def test_paths_over_shared_keys_and_lineage():
+    """共同键要求名称和类型都相同，字段级血缘给出不同名字段的连接条件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_db(path)
+        finder = JoinPathFinder(path)
+
+        join = finder.find_path("dw.dwd_order_detail", "dim_city")
+        assert join.tables == ('dw.dwd_order_detail', 'dim.dim_user', 'dim.dim_city')
+        assert [step.conditions for step in join.steps] == [(('user_id', 'user_id'),), (('city_code', 'city_code'),)]
+        assert join.to_sql() == ("FROM dw.dwd_order_detail t1\n"
+                                 "JOIN dim.dim_user t2 ON t1.user_id = t2.user_id\n"
+                                 "JOIN dim.dim_city t3 ON t2.city_code = t3.city_code")
+
+        join = finder.find_path("ods_user_log", "dwd_order_detail")
+        assert join.steps[0] == ('ods.ods_user_log', 'dw.dwd_user_register', (('uid', 'user_id'),), 'lineage')
+        reverse = finder.find_path("dwd_order_detail", "ods_user_log")
+        assert reverse.steps[-1].conditions == (('user_id', 'uid'),)
+
+        # 类型不同的同名字段和分区字段都不作为连接键
+        assert finder.find_path("tmp_user_str", "dim_user") is None
+        assert finder.find_path("dwd_order_detail", "unknown") is None
+
+
+def test_prompt_and_tool_include_join_hints():
+    """表结构上下文和MCP工具都给出连接条件"""
+    from src.core import server
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_db(path)
+
+        builder = PromptBuilder(path, schema_token_budget=1000)
+        context = builder.schema_context("各城市的订单支付金额 city_name pay_amount")
+        assert "表连接建议" in context
+        assert "dim.dim_city.city_code = dim.dim_user.city_code" in context
+        assert "dim.dim_user.user_id = dw.dwd_order_detail.user_id" in context
+
+        previous = set_join_path_finder(JoinPathFinder(path))
+        try:
+            output = asyncio.run(server.suggest_join_path("dwd_order_detail", "dim.dim_city"))
+        finally:
+            set_join_path_finder(previous)
+        assert "dw.dwd_order_detail -> dim.dim_user -> dim.dim_city（2 次连接）" in output
+        assert "JOIN dim.dim_city t3 ON t2.city_code = t3.city_code" in output
+
+
+def test_lookups_are_fast_on_large_catalogs():
+    """数千张表的目录上，预计算和缓存后的路径查询在毫秒级"""
+    rng = random.Random(3)
+    keys = [f"key{i}_id" for i in range(300)]
+    columns = []
+    for i in range(3000):
+        for key in rng.sample(keys, 4):
+            columns.append(('dw', f't{i}', key, 'bigint', 'YES', ''))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_db(path, columns, [])
+        finder = JoinPathFinder(path)
+        assert finder.find_path("t1", "t2") is not None
+
+        pairs = [(f"t{rng.randrange(3000)}", f"t{rng.randrange(3000)}") for _ in range(50)]
+        for a, b in pairs:
+            finder.find_path(a, b)
+        started = time.perf_counter()
+        for a, b in pairs:
+            finder.find_path(a, b)
+        assert (time.perf_counter() - started) / len(pairs) < 0.01
+
+
+def test_metric_lineage_is_not_a_join_condition():
+    """指标加工的血缘不作为连接条件，键字段之间的血缘也不优先于共同键"""
+    columns = [
+        ('dwd', 'order_detail', 'user_id', 'bigint', 'YES', ''),
+        ('dwd', 'order_detail', 'order_id', 'bigint', 'YES', ''),
+        ('dwd', 'order_detail', 'pay_amount', 'decimal(18,2)', 'YES', ''),
+        ('dws', 'user_daily', 'user_id', 'bigint', 'YES', ''),
+        ('dws', 'user_daily', 'last_order_id', 'bigint', 'YES', ''),
+        ('dws', 'user_daily', 'total_amount', 'decimal(18,2)', 'YES', ''),
+    ]
+    lineage = [('dwd.order_detail', 'dws.user_daily', 'pay_amount', 'total_amount', 'SUM(pay_amount)'),
+               ('dwd.order_detail', 'dws.user_daily', 'order_id', 'last_order_id', 'MAX(order_id)')]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_db(path, columns, lineage)
+        join = JoinPathFinder(path).find_path("order_detail", "user_daily")
+        assert join.steps == (('dwd.order_detail', 'dws.user_daily', (('user_id', 'user_id'),), 'key'),)
+
+
+def test_join_limit_keeps_paths_with_fewer_joins():
+    """代价更低但连接更多的路径不会挤掉连接次数在上限内的路径"""
+    # a、b 通过很多表共享的 pop_id 直接相连，代价高于经过 c 的两次具体键连接
+    columns = [('dw', f'p{i}', 'pop_id', 'bigint', 'YES', '') for i in range(5000)]
+    columns += [('dw', table, column, 'bigint', 'YES', '') for table, column in (
+        ('a', 'pop_id'), ('b', 'pop_id'), ('a', 'ac_id'), ('c', 'ac_id'), ('c', 'cb_id'), ('b', 'cb_id'),
+        ('b', 'b_id'), ('d', 'b_id'))]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_db(path, columns, [])
+        finder = JoinPathFinder(path, max_joins=2)
+        assert finder.find_path("a", "b").tables == ('dw.a', 'dw.c', 'dw.b')
+        join = finder.find_path("a", "d")
+        assert join.tables == ('dw.a', 'dw.b', 'dw.d')
+        assert [step.conditions for step in join.steps] == [(('pop_id', 'pop_id'),), (('b_id', 'b_id'),)]
+        assert finder.find_path("d", "a").tables == ('dw.d', 'dw.b', 'dw.a')
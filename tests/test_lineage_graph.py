@@ -0,0 +1,116 @@
+# test_lineage_graph.py
+import asyncio
+import sys
+import os
+import random
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.lineage_graph import LineageGraph, set_lineage_graph
+from src.utils.metadata_collector import MetadataCollector
+
+LINEAGE = [
+    ('ods.ods_user_login', 'dw.dwd_user_login', 'user_id', 'user_id', '直接映射'),
+    ('ods.ods_user_login', 'dw.dwd_user_login', 'login_ts', 'login_time', 'from_unixtime(login_ts)'),
+    ('dw.dwd_user_login', 'dws.dws_user_active', 'user_id', 'user_id', 'count(distinct user_id)'),
+    ('dw.dwd_user_register', 'dws.dws_user_active', 'channel', 'channel', '直接映射'),
+    ('dws.dws_user_active', 'app.app_user_report', 'user_id', 'active_users', 'sum(user_id)'),
+    ('dw.dwd_user_login', 'app.app_login_report', None, None, None),
+]
+
+
+def _build_graph(tmp, rows=LINEAGE):
+    path = os.path.join(tmp, "metadata.db")
+    collector = MetadataCollector(sqlite_db_path=path)
+    collector.bulk_load([('lineage', rows)])
+    return LineageGraph(path)
+
+
+def test_downstream_and_upstream_tables():
+    """按层返回上下游表，支持只给表名和深度限制"""
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build_graph(tmp)
+
+        downstream = graph.downstream("dwd_user_login")
+        assert [(hop.node, hop.depth) for hop in downstream] == [
+            ('app.app_login_report', 1), ('dws.dws_user_active', 1), ('app.app_user_report', 2)]
+        assert downstream[2].via == 'dws.dws_user_active'
+        assert [hop.node for hop in graph.downstream("dw.dwd_user_login", max_depth=1)] == [
+            'app.app_login_report', 'dws.dws_user_active']
+
+        upstream = graph.upstream("app.app_user_report")
+        assert {hop.node for hop in upstream} == {
+            'dws.dws_user_active', 'dw.dwd_user_login', 'dw.dwd_user_register', 'ods.ods_user_login'}
+        assert graph.upstream("ods_user_login") == []
+        assert graph.downstream("not_exists") == []
+
+
+def test_column_lineage_and_dfs_order():
+    """字段级血缘带转换规则，深度优先按路径先序返回"""
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build_graph(tmp)
+
+        upstream = graph.upstream("app_user_report", column="active_users")
+        assert [(hop.node, hop.rule) for hop in upstream] == [
+            ('dws.dws_user_active.user_id', 'sum(user_id)'),
+            ('dw.dwd_user_login.user_id', 'count(distinct user_id)'),
+            ('ods.ods_user_login.user_id', '直接映射'),
+        ]
+        assert graph.downstream("ods.ods_user_login", column="login_ts")[0].node == 'dw.dwd_user_login.login_time'
+
+        dfs = graph.downstream("ods.ods_user_login", order="dfs")
+        assert [hop.node for hop in dfs] == [
+            'dw.dwd_user_login', 'app.app_login_report', 'dws.dws_user_active', 'app.app_user_report']
+
+
+def test_results_are_cached_until_lineage_changes():
+    """相同查询复用缓存，元数据库更新后重新加载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build_graph(tmp)
+        first = graph.downstream("dw.dwd_user_login")
+        assert graph.downstream("dw.dwd_user_login") is first
+
+        time.sleep(0.01)
+        MetadataCollector(sqlite_db_path=graph.metadata_db_path).bulk_load(
+            [('lineage', [('app.app_user_report', 'app.app_user_export', None, None, None)])])
+        assert graph.downstream("dw.dwd_user_login")[-1].node == 'app.app_user_export'
+
+
+def test_large_graph_queries_are_fast():
+    """数十万条边的图上遍历在毫秒级完成"""
+    rng = random.Random(7)
+    layers = [[f"l{layer}.t{i}" for i in range(1000)] for layer in range(6)]
+    rows = []
+    for layer in range(5):
+        for source in layers[layer]:
+            for target in rng.sample(layers[layer + 1], 40):
+                rows.append((source, target, None, None, None))
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build_graph(tmp, rows)
+        assert graph.stats()['table_edges'] == 200000
+
+        started = time.perf_counter()
+        hops = graph.downstream("l3.t0", max_depth=2)
+        elapsed = time.perf_counter() - started
+        assert {hop.depth for hop in hops} == {1, 2}
+        assert elapsed < 0.05
+
+
+def test_lineage_tools():
+    """MCP工具按层输出上下游"""
+    from src.core import server
+
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = set_lineage_graph(_build_graph(tmp))
+        try:
+            output = asyncio.run(server.lineage_downstream("dwd_user_login", max_depth=1))
+            assert "'dwd_user_login' 的下游（共 2 个表，最多 1 层）" in output
+            assert "第1层: dws.dws_user_active（来自 dw.dwd_user_login）" in output
+            output = asyncio.run(server.lineage_upstream("app.app_user_report", column="active_users"))
+            assert "规则: sum(user_id)" in output
+            assert "没有" in asyncio.run(server.lineage_upstream("unknown_table"))
+        finally:
+            set_lineage_graph(previous)
@@ -0,0 +1,103 @@
+# test_load_harness.py
+import asyncio
+import json
+import sys
+import os
+
+import aiohttp
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.sql_assistant_agent import SQLAssistantAgent
+from src.tools.load_test import percentile, run_load_test
+from src.tools.mock_deepseek import LatencyModel, MockDeepSeekServer
+
+
+def test_latency_model_parse():
+    """解析延迟分布描述"""
+    assert LatencyModel.parse("fixed:0.2").sample() == 0.2
+    assert 0.1 <= LatencyModel.parse("uniform:0.1,0.3").sample() <= 0.3
+    try:
+        LatencyModel.parse("poisson:1")
+        assert False, "应拒绝未知分布"
+    except ValueError:
+        pass
+
+
+def test_percentile():
+    """线性插值百分位数"""
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.5
+    assert percentile([], 99) == 0.0
+
+
+def test_agent_against_mock_server():
+    """智能体通过可配置的基础地址调用模拟服务"""
+    async def run():
+        server = MockDeepSeekServer(port=0, script=[{"match": "留存", "content": "SELECT r.user_id FROM dws_retention r WHERE r.dt = '2024-01-01'"}])
+        await server.start()
+        try:
+            agent = SQLAssistantAgent(deepseek_api_key="mock-key", base_url=server.base_url)
+            result = await agent.generate_and_review_sql("计算用户的次日留存率")
+            return result, server.stats, agent.request_stats[-1]
+        finally:
+            await server.stop()
+
+    result, stats, request_stats = asyncio.run(run())
+    assert "dws_retention" in result
+    assert stats["requests"] == 1
+    assert request_stats["prompt_tokens"] > 0
+
+
+def test_mock_server_streaming():
+    """流式请求按SSE分片返回并以[DONE]结束"""
+    async def run():
+        server = MockDeepSeekServer(port=0, stream_chunk_chars=8)
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                payload = {"model": "deepseek-chat", "stream": True,
+                           "messages": [{"role": "user", "content": "hi"}]}
+                async with session.post(f"{server.base_url}/chat/completions", json=payload) as resp:
+                    body = await resp.text()
+        finally:
+            await server.stop()
+        return body
+
+    events = [line[len("data: "):] for line in asyncio.run(run()).splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    content = "".join(json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1])
+    assert "SELECT" in content
+
+
+def test_load_test_reports_percentiles_and_errors():
+    """压测报告包含吞吐量、延迟分位与错误率，注入的错误会被重试"""
+    async def run():
+        server = MockDeepSeekServer(port=0, latency=LatencyModel.parse("uniform:0.01,0.03"),
+                                    error_rate=0.2, error_statuses=[503])
+        await server.start()
+        try:
+            agent = SQLAssistantAgent(deepseek_api_key="mock-key", base_url=server.base_url,
+                                      max_concurrent_requests=4)
+            agent.admission.backoff_base = 0.01
+            agent.admission.breaker.failure_threshold = 1000
+            return await run_load_test(agent, sessions=8, requests_per_session=2)
+        finally:
+            await server.stop()
+
+    report = asyncio.run(run())
+    print(report)
+    assert report["requests"] == 16
+    assert report["throughput_rps"] > 0
+    assert report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"]
+    assert 0.0 <= report["error_rate"] <= 1.0
+
+
+if __name__ == "__main__":
+    test_latency_model_parse()
+    test_percentile()
+    test_agent_against_mock_server()
+    test_mock_server_streaming()
+    test_load_test_reports_percentiles_and_errors()
+    print("测试完成")
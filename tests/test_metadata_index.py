@@ -0,0 +1,106 @@
+# test_metadata_index.py
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.metadata_index import MetadataIndex, set_metadata_index
+from src.core.server import lint_sql
+from tests.test_prompt_builder import _build_metadata_db
+
+
+def test_index_lookups():
+    """表、字段、分区键查询"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        index = MetadataIndex(path)
+
+        assert index.table_count() == 2
+        assert index.get_table("dw.dwd_order_detail").comment == "订单明细"
+        assert index.get_table("DWD_ORDER_DETAIL").schema == "dw"
+        assert index.get_table("dwd_order_detail", schema="ods") is None
+        assert [c.name for c in index.columns("dw.dwd_user_register")] == ["user_id", "channel", "dt"]
+        column = index.column("dwd_order_detail", "PAY_AMOUNT")
+        assert (column.data_type, column.comment) == ("decimal", "支付金额")
+        assert index.partition_keys("dwd_user_register") == ("dt",)
+        assert index.has_table("dwd_user_register")
+        assert not index.has_table("dws_user_active")
+
+
+def test_index_reloads_when_file_changes():
+    """元数据库更新后重新加载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        index = MetadataIndex(path)
+        assert index.is_empty()
+        _build_metadata_db(path)
+        assert not index.is_empty()
+
+
+def _lint(sql, index):
+    previous = set_metadata_index(index)
+    try:
+        return asyncio.run(lint_sql(sql))
+    finally:
+        set_metadata_index(previous)
+
+
+def test_lint_flags_hallucinated_tables_and_columns():
+    """元数据中不存在的表和字段报告为错误，并给出相近字段建议"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        index = MetadataIndex(path)
+
+        result = _lint("SELECT o.order_id, o.pay_amt FROM dw.dwd_order_detail o WHERE o.dt = '2024-01-01'", index)
+        assert "R801" in result
+        assert "'o.pay_amt'" in result
+        assert "pay_amount" in result
+
+        result = _lint("SELECT u.user_id FROM dw.dws_user_active u WHERE u.dt = '2024-01-01'", index)
+        assert "表 'dw.dws_user_active' 不存在" in result
+
+        result = _lint("SELECT user_id, register_channel FROM dwd_user_register r WHERE dt = '2024-01-01'", index)
+        assert "字段 'register_channel' 不存在" in result
+
+
+def test_lint_accepts_valid_references():
+    """合法的表、字段、CTE和输出别名不报告"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        index = MetadataIndex(path)
+
+        sql = """
+            WITH reg AS (
+                SELECT r.user_id, r.channel FROM dw.dwd_user_register r WHERE r.dt = '2024-01-01'
+            )
+            SELECT reg.channel, SUM(o.pay_amount) AS pay_total
+            FROM reg
+            JOIN dw.dwd_order_detail o ON o.order_id = reg.user_id
+            WHERE o.dt = '2024-01-01'
+            GROUP BY reg.channel
+            ORDER BY pay_total
+        """
+        assert "R801" not in _lint(sql, index)
+
+
+def test_lint_skips_check_without_metadata():
+    """没有元数据时不检查"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = MetadataIndex(os.path.join(tmp, "missing.db"))
+        result = _lint("SELECT x.a FROM dw.anything x WHERE x.dt = '2024-01-01'", index)
+        assert "R801" not in result
+
+
+if __name__ == "__main__":
+    test_index_lookups()
+    test_index_reloads_when_file_changes()
+    test_lint_flags_hallucinated_tables_and_columns()
+    test_lint_accepts_valid_references()
+    test_lint_skips_check_without_metadata()
+    print("测试完成")
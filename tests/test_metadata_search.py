@@ -0,0 +1,109 @@
+# test_metadata_search.py
+import asyncio
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.metadata_search import MetadataSearch, search_tokens
+from tests.test_prompt_builder import _build_metadata_db
+
+
+def test_search_tokens():
+    """标识符保留完整形式并拆分为单词，中文切分为二元组"""
+    assert search_tokens("dwd_user_register") == ["dwd_user_register", "dwd", "user", "register"]
+    assert search_tokens("payAmount") == ["payamount", "pay", "amount"]
+    assert search_tokens("注册渠道") == ["注册", "册渠", "渠道"]
+    assert search_tokens("dt") == ["dt"]
+
+
+def test_search_ranks_tables_by_relevance():
+    """表注释和字段注释的命中共同决定排序，并返回命中字段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        search = MetadataSearch(path)
+
+        result = search.search_tables("用户注册渠道")
+        assert result["results"][0]["table"] == "dwd_user_register"
+        assert "channel" in result["results"][0]["matched_columns"]
+
+        result = search.search_tables("pay_amount")
+        assert [item["table"] for item in result["results"]] == ["dwd_order_detail"]
+        assert search.search_tables("不存在的需求xyz")["total"] == 0
+        assert MetadataSearch(os.path.join(tmp, "missing.db")).search_tables("订单")["total"] == 0
+
+
+def test_search_index_follows_metadata_changes():
+    """同步之外修改元数据库后由写入方更新索引，检索本身不写库；业务术语命中关联的表"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        search = MetadataSearch(path)
+        assert search.search_tables("退款")["total"] == 0
+
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE tables_meta SET table_comment = '订单及退款明细' WHERE table_name = 'dwd_order_detail'")
+        conn.execute("INSERT INTO business_terms (term_name, term_definition, related_tables) "
+                     "VALUES ('GMV', '成交总额', 'dw.dwd_order_detail')")
+        conn.execute("DELETE FROM tables_meta WHERE table_name = 'dwd_user_register'")
+        conn.execute("DELETE FROM columns_meta WHERE table_name = 'dwd_user_register'")
+        conn.commit()
+        conn.close()
+
+        modified = os.stat(path).st_mtime_ns
+        assert search.search_tables("退款")["total"] == 0
+        assert os.stat(path).st_mtime_ns == modified
+
+        MetadataCollector(sqlite_db_path=path).refresh_search_index()
+        assert [item["table"] for item in search.search_tables("退款")["results"]] == ["dwd_order_detail"]
+        assert search.search_tables("GMV")["results"][0]["table"] == "dwd_order_detail"
+        assert all(item["table"] != "dwd_user_register" for item in search.search_tables("注册")["results"])
+
+
+def test_search_pagination_and_latency():
+    """分页返回结果；大量字段下检索仍在毫秒级"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        tables = [('dw', f'dwd_biz_{i}', f'业务明细{i}') for i in range(1000)]
+        columns = [('dw', f'dwd_biz_{i}', f'metric_{j}', 'bigint', 'YES', f'指标{j}订单金额' if j == 0 else f'指标{j}')
+                   for i in range(1000) for j in range(50)]
+        collector.bulk_load([('tables', tables), ('columns', columns)])
+        collector.refresh_search_index()
+        search = MetadataSearch(path)
+
+        first = search.search_tables("订单金额", page=1, page_size=10)
+        second = search.search_tables("订单金额", page=2, page_size=10)
+        assert first["total"] == 1000
+        assert len(first["results"]) == len(second["results"]) == 10
+        assert not {r["table"] for r in first["results"]} & {r["table"] for r in second["results"]}
+
+        started = time.perf_counter()
+        search.search_tables("dwd_biz_42 明细")
+        assert time.perf_counter() - started < 0.5
+
+
+def test_search_tables_tool():
+    """MCP工具输出格式化的分页结果"""
+    from src.core import server
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(path)
+        previous = os.environ.get("METADATA_DB_PATH")
+        os.environ["METADATA_DB_PATH"] = path
+        try:
+            output = asyncio.run(server.search_tables("订单金额", page=1, page_size=5))
+        finally:
+            if previous is None:
+                os.environ.pop("METADATA_DB_PATH")
+            else:
+                os.environ["METADATA_DB_PATH"] = previous
+        assert "dw.dwd_order_detail - 订单明细" in output
+        assert "第 1/1 页" in output
@@ -0,0 +1,135 @@
+# test_metadata_snapshot.py
+import asyncio
+import sys
+import os
+import subprocess
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.metadata_index import MetadataIndex, set_metadata_index
+from src.core.server import lint_sql
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.metadata_snapshot import MetadataSnapshot, SnapshotIndex, write_snapshot
+from tests.test_prompt_builder import _build_metadata_db
+
+
+def _build_large_db(path, n_tables, columns_per_table):
+    collector = MetadataCollector(sqlite_db_path=path)
+    tables = [('dw' if i % 2 else 'app', f't{i}', f'表{i}') for i in range(n_tables)]
+    columns = [(schema, name, f'c{j}' if j else 'dt', 'string', 'YES', f'字段{j}')
+               for schema, name, _ in tables for j in range(columns_per_table)]
+    collector.bulk_load([('tables', tables), ('columns', columns)], source='cluster')
+    return collector
+
+
+def test_snapshot_matches_in_memory_index():
+    """快照的查询结果与内存索引一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        snapshot_path = os.path.join(tmp, "metadata.snapshot")
+        _build_metadata_db(db_path)
+        stats = write_snapshot(db_path, snapshot_path)
+        assert stats['tables'] == 2 and stats['columns'] == 6
+
+        memory, snapshot = MetadataIndex(db_path), SnapshotIndex(snapshot_path)
+        assert sorted(snapshot.table_names()) == sorted(memory.table_names())
+        for name in ("dw.dwd_order_detail", "DWD_USER_REGISTER"):
+            assert [(c.name, c.data_type, c.comment) for c in snapshot.columns(name)] == \
+                   [(c.name, c.data_type, c.comment) for c in memory.columns(name)]
+            assert snapshot.partition_keys(name) == memory.partition_keys(name)
+        assert snapshot.column("dwd_order_detail", "Pay_Amount").comment == "支付金额"
+        assert snapshot.column("dwd_order_detail", "missing") is None
+        assert snapshot.get_table("ods.dwd_order_detail") is None
+        assert not snapshot.has_table("dws_user_active")
+
+
+def test_ambiguous_table_name():
+    """只给表名且多个库中有同名表时无法定位"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=db_path)
+        collector.bulk_load([('tables', [('ods', 'orders', ''), ('dw', 'orders', '')])])
+        collector.write_snapshot()
+        snapshot = MetadataSnapshot(collector.snapshot_path)
+        assert snapshot.get_table("orders") is None
+        assert snapshot.has_table("orders")
+        assert snapshot.get_table("dw.orders").schema == "dw"
+        snapshot.close()
+
+
+def test_rejects_unknown_format():
+    """版本不匹配的文件拒绝打开"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bad.snapshot")
+        with open(path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        try:
+            MetadataSnapshot(path)
+            assert False, "应当报错"
+        except ValueError:
+            pass
+
+
+def test_large_snapshot_opens_without_loading():
+    """打开快照只解析文件头，与字段数量无关"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = _build_large_db(os.path.join(tmp, "metadata.db"), n_tables=2000, columns_per_table=50)
+        stats = collector.write_snapshot()
+        assert stats['columns'] == 100000
+
+        started = time.perf_counter()
+        snapshot = MetadataSnapshot(collector.snapshot_path)
+        opened_ms = (time.perf_counter() - started) * 1000
+        assert opened_ms < 50
+        assert snapshot.get_table("dw.t1999").columns["c49"].comment == "字段49"
+        snapshot.close()
+
+
+def test_index_follows_replaced_snapshot_across_processes():
+    """快照被替换后重新打开；其他进程可直接打开同一文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(db_path)
+        collector = MetadataCollector(sqlite_db_path=db_path)
+        collector.write_snapshot()
+        index = SnapshotIndex(collector.snapshot_path)
+        assert index.table_count() == 2
+
+        collector.bulk_load([('tables', [('dw', 'dws_user_active', '活跃用户')])])
+        collector.write_snapshot()
+        assert index.has_table("dw.dws_user_active")
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("from src.utils.metadata_snapshot import SnapshotIndex; import sys; "
+                "print(SnapshotIndex(sys.argv[1]).get_table('dws_user_active').comment)")
+        output = subprocess.run([sys.executable, "-c", code, collector.snapshot_path], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "活跃用户"
+
+
+def test_lint_uses_snapshot_index():
+    """规范检查可直接使用快照索引"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(db_path)
+        write_snapshot(db_path, os.path.join(tmp, "metadata.snapshot"))
+        previous = set_metadata_index(SnapshotIndex(os.path.join(tmp, "metadata.snapshot")))
+        try:
+            result = asyncio.run(lint_sql(
+                "SELECT o.order_id, o.pay_amt FROM dw.dwd_order_detail o WHERE o.dt = '2024-01-01'"))
+        finally:
+            set_metadata_index(previous)
+        assert "'o.pay_amt'" in result and "pay_amount" in result
+
+
+if __name__ == "__main__":
+    test_snapshot_matches_in_memory_index()
+    test_ambiguous_table_name()
+    test_rejects_unknown_format()
+    test_large_snapshot_opens_without_loading()
+    test_index_follows_replaced_snapshot_across_processes()
+    test_lint_uses_snapshot_index()
+    print("测试完成")
@@ -0,0 +1,126 @@
+# test_metadata_streaming.py
+import sys
+import os
+import sqlite3
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+
+
+class FakeCursor:
+    """模拟服务端游标，记录每次 fetchmany 的批大小"""
+
+    def __init__(self, tables, columns, lineage, fetch_sizes):
+        self.results = {"information_schema.tables": tables, "information_schema.columns": columns,
+                        "data_lineage_table_relations": lineage}
+        self.rows = []
+        self.fetch_sizes = fetch_sizes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        source = next(key for key in self.results if key in query)
+        rows = self.results[source]
+        if source == "information_schema.tables" and "update_time" not in query:
+            rows = [row[:3] for row in rows]
+        if params and "table_schema IN" in query:
+            # 按 table_schema IN (...) 过滤
+            rows = [row for row in rows if row[0] in params]
+        elif params:
+            # 按 (table_schema, table_name) IN (...) 过滤
+            wanted = set(zip(params[::2], params[1::2]))
+            rows = [row for row in rows if (row[0], row[1]) in wanted]
+        self.rows = iter(rows)
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        batch = []
+        for row in self.rows:
+            batch.append(row)
+            if len(batch) == size:
+                break
+        return batch
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+def _fake_source(n_tables=50, columns_per_table=40):
+    tables = [('dw', f'dwd_t{i}', f'表{i}', '2024-01-01 00:00:00', '2024-01-02 00:00:00') for i in range(n_tables)]
+    columns = [('dw', f'dwd_t{i}', f'c{j}', 'string', 'YES', f'字段{j}')
+               for i in range(n_tables) for j in range(columns_per_table)]
+    lineage = [(f'dw.dwd_t{i}', f'dw.dwd_t{i + 1}', None, None, None) for i in range(n_tables - 1)]
+    return tables, columns, lineage
+
+
+def test_sync_streams_in_chunks():
+    """同步按批读取并批量写入，报告吞吐量"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"),
+                                      chunk_size=500, commit_every=1000)
+        tables, columns, lineage = _fake_source()
+        fetch_sizes = []
+        collector.connect_to_mysql = lambda db_name, streaming=False: FakeConnection(
+            FakeCursor(tables, columns, lineage, fetch_sizes))
+
+        stats = collector.sync_metadata()
+
+        assert stats['tables_read'] == 50
+        assert stats['columns_read'] == 2000
+        assert stats['lineage_read'] == 49
+        assert stats['rows_per_sec'] > 0
+        assert set(fetch_sizes) == {500}
+
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        assert conn.execute("SELECT COUNT(*) FROM columns_meta").fetchone()[0] == 2000
+        conn.close()
+
+
+def test_failed_source_does_not_stop_sync():
+    """血缘数据源失败时，表结构仍然写入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"), retry_backoff=0)
+        tables, columns, lineage = _fake_source(n_tables=3, columns_per_table=2)
+
+        def connect(db_name, streaming=False):
+            if db_name == 'user_profile_db':
+                raise Exception("连接被拒绝")
+            return FakeConnection(FakeCursor(tables, columns, lineage, []))
+
+        collector.connect_to_mysql = connect
+        stats = collector.sync_metadata()
+        assert stats['columns_written'] == 6
+        assert stats['lineage_read'] == 0
+        assert list(stats['errors']) == ['user_profile_db血缘关系']
+
+
+def test_save_to_sqlite_accepts_dicts():
+    """save_to_sqlite 仍然接受字典列表"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"))
+        collector.save_to_sqlite({'tables': [{'table_schema': 'dw', 'table_name': 't', 'table_comment': '测试'}]})
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        assert conn.execute("SELECT table_comment FROM tables_meta").fetchone()[0] == '测试'
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_sync_streams_in_chunks()
+    test_failed_source_does_not_stop_sync()
+    test_save_to_sqlite_accepts_dicts()
+    print("测试完成")
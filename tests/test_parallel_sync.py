@@ -0,0 +1,125 @@
+# test_parallel_sync.py
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.connection_pool import ConnectionPool
+from src.utils.metadata_collector import MetadataCollector, SCHEMAS
+from tests.test_metadata_streaming import FakeConnection, FakeCursor
+
+
+class SlowCursor(FakeCursor):
+    """每次查询固定耗时，并可让指定库的查询失败若干次"""
+
+    def __init__(self, *args, delay, failures):
+        super().__init__(*args)
+        self.delay = delay
+        self.failures = failures
+
+    def execute(self, query, params=None):
+        time.sleep(self.delay)
+        for schema, remaining in list(self.failures.items()):
+            if remaining and params and schema in params:
+                self.failures[schema] -= 1
+                raise Exception(f"{schema} 查询超时")
+        super().execute(query, params)
+
+
+def _source():
+    tables = [(schema, f'{schema}_t{i}', '', '2024-01-01', '2024-01-02') for schema in SCHEMAS for i in range(2)]
+    columns = [(schema, name, f'c{j}', 'string', 'YES', '') for schema, name, *_ in tables for j in range(2)]
+    lineage = [('dw.dw_t0', 'app.app_t0', None, None, None)]
+    return tables, columns, lineage
+
+
+def _collector(tmp, delay=0.0, failures=None, **kwargs):
+    collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"), retry_backoff=0, **kwargs)
+    tables, columns, lineage = _source()
+    failures = failures if failures is not None else {}
+    connects = []
+
+    def connect(db_name, streaming=False):
+        connects.append(db_name)
+        return FakeConnection(SlowCursor(tables, columns, lineage, [], delay=delay, failures=failures))
+
+    collector.connect_to_mysql = connect
+    return collector, connects
+
+
+def test_pool_reuses_and_bounds_connections():
+    """连接池复用空闲连接，打开的连接数不超过上限"""
+    created = []
+    pool = ConnectionPool(lambda: created.append(1) or FakeConnection(None), max_size=2)
+    in_use = [pool.acquire(), pool.acquire()]
+
+    def borrow():
+        with pool.connection():
+            pass
+
+    waiter = threading.Thread(target=borrow)
+    waiter.start()
+    time.sleep(0.05)
+    assert waiter.is_alive()
+    pool.release(in_use.pop())
+    waiter.join(timeout=1)
+    assert not waiter.is_alive()
+    assert len(created) == 2
+    assert pool.snapshot()['reused'] == 1
+
+
+def test_failed_connection_is_discarded():
+    """出错的连接不会归还连接池"""
+    pool = ConnectionPool(lambda: FakeConnection(None), max_size=1)
+    try:
+        with pool.connection():
+            raise RuntimeError("查询中断")
+    except RuntimeError:
+        pass
+    assert pool.snapshot() == {'created': 1, 'reused': 0, 'discarded': 1, 'open': 0, 'idle': 0}
+
+
+def test_sync_runs_shards_in_parallel():
+    """各库分片并行同步，总耗时远小于串行耗时"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector, connects = _collector(tmp, delay=0.1, parallelism=6)
+        started = time.perf_counter()
+        stats = collector.sync_metadata()
+        elapsed = time.perf_counter() - started
+
+        # 5 个分片各 2 次查询 + 血缘 1 次查询，串行至少 1.1 秒
+        assert elapsed < 0.8
+        assert stats['errors'] == {}
+        assert stats['tables_read'] == 10
+        assert stats['columns_written'] == 20
+        assert stats['lineage_inserted'] == 1
+        # 每个分片的第二次查询复用第一次的连接
+        assert len(connects) <= 6
+        assert collector.pool_stats()['bigdata_db']['reused'] >= 5
+
+
+def test_failing_shard_is_retried_and_isolated():
+    """分片失败会重试；重试耗尽时只影响该分片"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector, _ = _collector(tmp, failures={'dw': 1, 'ods': 10}, max_retries=2)
+        stats = collector.sync_metadata()
+
+        assert list(stats['errors']) == ['bigdata_db.ods']
+        assert stats['tables_read'] == 8
+        conn = sqlite3.connect(collector.sqlite_db_path)
+        schemas = {row[0] for row in conn.execute("SELECT DISTINCT table_schema FROM tables_meta")}
+        conn.close()
+        assert schemas == {'dw', 'dim', 'dws', 'app'}
+
+
+if __name__ == "__main__":
+    test_pool_reuses_and_bounds_connections()
+    test_failed_connection_is_discarded()
+    test_sync_runs_shards_in_parallel()
+    test_failing_shard_is_retried_and_isolated()
+    print("测试完成")
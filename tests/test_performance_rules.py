@@ -0,0 +1,106 @@
+# test_performance_rules.py
+import asyncio
+import sys
+import os
+import tempfile
+
+import sqlglot
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.performance_rules import check_performance
+from src.core.server import RULES_CONFIG, lint_sql
+from src.core.volume_hints import VolumeEstimator, set_volume_estimator
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import FixtureStatsProvider
+
+RULES = RULES_CONFIG["rules"]
+PARTITION_FIELDS = ["dt", "date"]
+
+
+def _check(sql, table_rows=None, rules=RULES):
+    issues = check_performance(sqlglot.parse_one(sql, read="hive"), rules, PARTITION_FIELDS, table_rows)
+    return [issue[1:issue.index("]")] for issue in issues]
+
+
+def test_partition_functions_and_cartesian_joins():
+    """分区字段上的函数和没有关联条件的连接；CAST、SELECT 中的函数、WHERE 中的关联条件不报告"""
+    assert _check("SELECT o.id FROM dw.orders o WHERE substr(o.dt, 1, 7) = '2024-01'") == ["Error-R102"]
+    assert _check("SELECT o.id FROM dw.orders o JOIN dw.users u ON o.uid = u.uid "
+                  "AND to_date(u.dt) = '2024-01-01' WHERE o.dt = '2024-01-01'") == ["Error-R102"]
+    assert _check("SELECT substr(o.dt, 1, 7) AS month FROM dw.orders o "
+                  "WHERE CAST(o.dt AS DATE) = '2024-01-01'") == []
+
+    assert _check("SELECT o.id FROM dw.orders o, dw.users u WHERE o.dt = '2024-01-01'") == ["Warning-R401"]
+    assert _check("SELECT o.id FROM dw.orders o JOIN dw.users u WHERE o.dt = '2024-01-01'") == ["Warning-R401"]
+    assert _check("SELECT o.id FROM dw.orders o JOIN dw.users u ON o.dt = '2024-01-01'") == ["Warning-R401"]
+    assert _check("SELECT o.id FROM dw.orders o, dw.users u WHERE o.uid = u.uid") == []
+    assert _check("SELECT o.id FROM dw.orders o JOIN dw.users u USING (uid)") == []
+    # 与单行聚合结果做笛卡尔积不放大数据量
+    assert _check("SELECT o.id, o.amount / t.total AS ratio FROM dw.orders o "
+                  "CROSS JOIN (SELECT SUM(amount) AS total FROM dw.orders) t") == []
+
+
+def test_order_by_count_distinct_and_union():
+    """ORDER BY 不带 LIMIT、大表 COUNT(DISTINCT)、UNION 去重"""
+    assert _check("SELECT o.id FROM dw.orders o ORDER BY o.id") == ["Warning-R502"]
+    assert _check("SELECT o.id FROM dw.orders o ORDER BY o.id LIMIT 10") == []
+    assert _check("SELECT o.id, ROW_NUMBER() OVER (ORDER BY o.ts) AS rn FROM dw.orders o") == []
+    assert _check("SELECT a.id FROM dw.a a UNION ALL SELECT b.id FROM dw.b b ORDER BY id") == ["Warning-R502"]
+
+    rows = {"dw.orders": 50_000_000, "dim.city": 300}.get
+    assert _check("SELECT COUNT(DISTINCT o.uid) AS users FROM dw.orders o", rows) == ["Warning-R503"]
+    assert _check("SELECT COUNT(DISTINCT c.code) AS codes FROM dim.city c", rows) == []
+    # 没有统计时不检查
+    assert _check("SELECT COUNT(DISTINCT o.uid) AS users FROM dw.orders o") == []
+
+    assert _check("SELECT a.id FROM dw.a a UNION SELECT b.id FROM dw.b b") == ["Warning-R504"]
+    assert _check("SELECT a.id FROM dw.a a UNION ALL SELECT b.id FROM dw.b b") == []
+
+
+def test_query_complexity_and_disabled_rules():
+    """连接数超过上限时报告，CTE 名不计入表数；关闭的规则不检查"""
+    joins = " ".join(f"JOIN dw.t{i} t{i} ON t0.id = t{i}.id" for i in range(1, 7))
+    issues = check_performance(sqlglot.parse_one(f"SELECT t0.id FROM dw.t0 t0 {joins}", read="hive"),
+                               RULES, PARTITION_FIELDS)
+    assert len(issues) == 1 and "连接 6 个（上限 5）" in issues[0]
+    assert _check("WITH a AS (SELECT x.id FROM dw.x x) SELECT a.id FROM a a JOIN a b ON a.id = b.id") == []
+
+    rules = dict(RULES, union_distinct={"enabled": False}, order_by_limit={"enabled": False})
+    assert _check("SELECT a.id FROM dw.a a UNION SELECT b.id FROM dw.b b ORDER BY id", rules=rules) == []
+
+
+def test_lint_sql_reports_performance_rules():
+    """lint_sql 输出性能规则，规范的查询仍然通过"""
+    result = asyncio.run(lint_sql("SELECT o.id FROM ods_order o WHERE date_format(o.dt, 'yyyy-MM') = '2024-01'"))
+    assert "[Error-R102]" in result and "DATE_FORMAT(o.dt" in result
+
+    result = asyncio.run(lint_sql(
+        "SELECT u.user_id, COUNT(o.order_id) AS total_orders FROM ods_user u "
+        "JOIN ods_order o ON u.user_id = o.user_id WHERE u.dt = '2024-09-11' AND o.dt = '2024-09-11' "
+        "GROUP BY u.user_id"))
+    assert "R401" not in result and "R102" not in result
+
+
+def test_lint_reuses_cached_table_stats():
+    """lint 按共享估算器缓存的统计判断大表，元数据库更新前不重复查询"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        collector.sync_table_stats(FixtureStatsProvider({"dw.orders": {"row_count": 50_000_000}}), "", ("dw",))
+        estimator = VolumeEstimator(path)
+        lookups = []
+        table = estimator.store.table
+        estimator.store.table = lambda name: lookups.append(name) or table(name)
+        previous = set_volume_estimator(estimator)
+        try:
+            sql = "SELECT COUNT(DISTINCT o.uid) AS users FROM dw.orders o WHERE o.dt = '2024-01-01'"
+            assert "R503" in asyncio.run(lint_sql(sql))
+            assert "R503" in asyncio.run(lint_sql(sql))
+            assert lookups == ["dw.orders"]
+
+            collector.sync_table_stats(FixtureStatsProvider({"dw.orders": {"row_count": 300}}), "", ("dw",))
+            assert "R503" not in asyncio.run(lint_sql(sql))
+        finally:
+            set_volume_estimator(previous)
@@ -0,0 +1,99 @@
+# test_prompt_builder.py
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.prompt_builder import PromptBuilder, extract_terms
+from src.core.rate_limiter import estimate_tokens
+from src.core.sql_assistant_agent import SQLAssistantAgent
+from src.utils.metadata_collector import MetadataCollector
+
+
+def _build_metadata_db(path: str):
+    """构造一个小型元数据库"""
+    collector = MetadataCollector(sqlite_db_path=path)
+    columns = [
+        ('dw', 'dwd_user_register', 'user_id', 'bigint', 'YES', '用户ID'),
+        ('dw', 'dwd_user_register', 'channel', 'string', 'YES', '注册渠道'),
+        ('dw', 'dwd_user_register', 'dt', 'string', 'YES', '分区日期'),
+        ('dw', 'dwd_order_detail', 'order_id', 'bigint', 'YES', '订单ID'),
+        ('dw', 'dwd_order_detail', 'pay_amount', 'decimal', 'YES', '支付金额'),
+        ('dw', 'dwd_order_detail', 'dt', 'string', 'YES', '分区日期'),
+    ]
+    collector.save_to_sqlite({
+        'tables': [
+            {'table_schema': 'dw', 'table_name': 'dwd_user_register', 'table_comment': '用户注册明细'},
+            {'table_schema': 'dw', 'table_name': 'dwd_order_detail', 'table_comment': '订单明细'},
+        ],
+        'columns': [dict(zip(['table_schema', 'table_name', 'column_name', 'data_type',
+                              'is_nullable', 'column_comment'], row)) for row in columns],
+    })
+
+
+def test_extract_terms():
+    """蛇形命名按单词切分，中文按二元组切分"""
+    assert extract_terms("dwd_user_register") == ["dwd", "user", "register"]
+    assert extract_terms("新增用户") == ["新增", "增用", "用户"]
+
+
+def test_schema_context_selects_relevant_tables():
+    """只选择与需求相关的表，并放在消息末尾"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(db_path)
+        builder = PromptBuilder(db_path, schema_token_budget=500)
+
+        context = builder.schema_context("统计每个渠道昨天的注册用户数")
+        assert "dwd_user_register" in context
+        assert "dwd_order_detail" not in context
+
+        messages = builder.generation_messages("统计每个渠道昨天的注册用户数", context)
+        assert messages[0]["content"] == builder.system_prompt()
+        assert messages[1]["content"].endswith(context)
+
+
+def test_schema_context_respects_budget():
+    """表结构不超过token预算，分区字段优先保留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "metadata.db")
+        _build_metadata_db(db_path)
+        builder = PromptBuilder(db_path, schema_token_budget=30)
+
+        context = builder.schema_context("注册用户")
+        assert estimate_tokens(context) <= 30
+        assert "dt string" in context
+
+
+def test_agent_reports_prompt_stats():
+    """每次请求记录提示词token、缓存命中与修复轮次"""
+    async def run():
+        agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
+
+        async def fake_post(payload):
+            sql = "SELECT u.user_id FROM dwd_user u WHERE u.dt = '2024-01-01'"
+            return {"choices": [{"message": {"content": sql}}],
+                    "usage": {"prompt_tokens": 400, "prompt_cache_hit_tokens": 300,
+                              "completion_tokens": 20, "total_tokens": 420}}
+
+        agent._post_chat_completion = fake_post
+        await agent.generate_and_review_sql("统计用户数")
+        return agent
+
+    agent = asyncio.run(run())
+    stats = agent.request_stats[-1]
+    assert stats["prompt_tokens"] == 400
+    assert stats["prompt_cache_hit_tokens"] == 300
+    assert stats["repair_rounds"] == 0
+    assert agent.get_metrics()["prompt_cache_hit_rate"] == 0.75
+
+
+if __name__ == "__main__":
+    test_extract_terms()
+    test_schema_context_selects_relevant_tables()
+    test_schema_context_respects_budget()
+    test_agent_reports_prompt_stats()
+    print("测试完成")
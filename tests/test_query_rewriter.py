@@ -0,0 +1,123 @@
+# test_query_rewriter.py
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.metadata_index import MetadataIndex
+from src.core.query_rewriter import QueryRewriter, Rewrite, RewriteError, set_query_rewriter
+from src.core.server import rewrite_sql
+from src.core.sql_assistant_agent import SQLAssistantAgent
+from src.core.volume_hints import VolumeEstimator
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import FixtureStatsProvider
+
+GB = 1 << 30
+
+COLUMNS = {
+    "dwd_order_detail": [("order_id", "bigint"), ("user_id", "bigint"), ("pay_amount", "decimal(18,2)"),
+                         ("city_code", "string"), ("dt", "string")],
+    "dim_user": [("user_id", "bigint"), ("user_name", "varchar(64)"), ("level", "int"), ("ext", "geometry_x")],
+}
+
+STATS = {
+    "dw.dwd_order_detail": {
+        "partition_keys": ["dt"],
+        "partitions": {f"dt=2024-01-{day:02d}": {"row_count": 1000, "total_bytes": GB} for day in range(1, 31)},
+    },
+    "dw.dim_user": {"row_count": 100, "total_bytes": GB},
+}
+
+NESTED_SQL = """
+WITH o AS (SELECT * FROM dwd_order_detail)
+SELECT x.order_id, x.user_name
+FROM (SELECT o.order_id, o.dt, u.user_name, o.pay_amount FROM o JOIN dw.dim_user u ON o.user_id = u.user_id) x
+WHERE x.dt = '2024-01-01'
+"""
+
+
+def _rewriter(tmp):
+    path = os.path.join(tmp, "metadata.db")
+    collector = MetadataCollector(sqlite_db_path=path)
+    collector.save_to_sqlite({
+        'tables': [{'table_schema': 'dw', 'table_name': name, 'table_comment': ''} for name in COLUMNS],
+        'columns': [{'table_schema': 'dw', 'table_name': name, 'column_name': column, 'data_type': data_type,
+                     'is_nullable': 'YES', 'column_comment': ''}
+                    for name, columns in COLUMNS.items() for column, data_type in columns],
+    })
+    collector.sync_table_stats(FixtureStatsProvider(STATS), "", ("dw",))
+    return QueryRewriter(MetadataIndex(path), VolumeEstimator(path))
+
+
+def test_rewrite_pushes_down_filters_and_prunes_columns():
+    """CTE 和子查询合并后分区条件直接作用于事实表，只读取用到的字段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        rewrite = _rewriter(tmp).rewrite(NESTED_SQL)
+        assert "WITH" not in rewrite.sql and "FROM dw.dwd_order_detail AS dwd_order_detail" in rewrite.sql
+        assert "dwd_order_detail.dt = '2024-01-01'" in rewrite.sql
+        assert "pay_amount" not in rewrite.sql
+        assert rewrite.diff.startswith("--- 原始SQL\n+++ 改写后") and "-WITH o AS (" in rewrite.diff
+        # 原SQL扫描订单表全部30个分区的全部字段，改写后只读1个分区的3/5字段
+        assert rewrite.scan_before == 30 * GB + GB // 2
+        assert rewrite.scan_after == int(GB * 3 / 5) + GB // 2
+        assert rewrite.improved and "减少 96%" in rewrite.summary()
+
+
+def test_unnest_and_unknown_tables():
+    """IN 子查询解嵌套为连接；元数据中没有的表、非查询语句不改写"""
+    with tempfile.TemporaryDirectory() as tmp:
+        rewriter = _rewriter(tmp)
+        rewrite = rewriter.rewrite("SELECT o.order_id FROM dw.dwd_order_detail o WHERE o.dt = '2024-01-01' "
+                                   "AND o.user_id IN (SELECT u.user_id FROM dw.dim_user u WHERE u.level > 3)")
+        assert "JOIN (" in rewrite.sql and " IN (" not in rewrite.sql
+
+        for sql, reason in (("SELECT a.id FROM ods.unknown a", "元数据中没有表"),
+                            ("SELECT o.missing FROM dw.dwd_order_detail o", "无法按元数据确定字段来源"),
+                            ("DROP TABLE dw.dim_user", "只支持 SELECT 查询")):
+            try:
+                rewriter.rewrite(sql)
+            except RewriteError as e:
+                assert reason in str(e)
+            else:
+                raise AssertionError(sql)
+
+
+def test_tool_and_agent_auto_rewrite():
+    """rewrite_sql 工具输出改写结果和差异；开启自动改写时智能体返回改写后的SQL及其检查结果，
+    规范问题更多的改写不采用"""
+    with tempfile.TemporaryDirectory() as tmp:
+        rewriter = _rewriter(tmp)
+        previous = set_query_rewriter(rewriter)
+        try:
+            result = asyncio.run(rewrite_sql(NESTED_SQL))
+            assert "改写后的SQL:" in result and "```diff" in result and "预估扫描量" in result
+            assert "无法改写" in asyncio.run(rewrite_sql("SELECT a.id FROM ods.unknown a"))
+        finally:
+            set_query_rewriter(previous)
+
+        async def run(query_rewriter):
+            agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
+            agent.query_rewriter = query_rewriter
+            agent.auto_rewrite = True
+
+            async def fake_post(payload):
+                return {"choices": [{"message": {"content": NESTED_SQL}}],
+                        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}}
+
+            agent._post_chat_completion = fake_post
+            return await agent.generate_and_review_sql("查询1月1日的订单和用户名")
+
+        answer = asyncio.run(run(rewriter))
+        assert "已自动改写为等价SQL" in answer and "WITH o AS" not in answer
+        # 原SQL的 SELECT * 问题在改写后已消除，不再出现在结果中
+        assert answer.startswith("✅ 已为您生成符合规范的SQL") and "R001" not in answer
+
+        class WorseRewriter:
+            def rewrite(self, sql):
+                return Rewrite(sql, "SELECT * FROM dw.dwd_order_detail, dw.dim_user", "", 2 * GB, GB)
+
+        answer = asyncio.run(run(WorseRewriter()))
+        assert "已自动改写为等价SQL" not in answer and "WITH o AS" in answer
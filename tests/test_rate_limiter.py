@@ -0,0 +1,146 @@
+# test_rate_limiter.py
+import asyncio
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.rate_limiter import (
+    AdmissionController, APICallError, CircuitOpenError, TokenBucket, estimate_tokens
+)
+
+
+def test_token_bucket_wait_time():
+    """令牌耗尽后需要等待补充"""
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.wait_time(1) == 0.0
+    bucket.consume(2)
+    wait = bucket.wait_time(1)
+    assert 0.9 < wait <= 1.0
+
+
+def test_estimate_tokens():
+    """中文按字计，英文按4字符计"""
+    assert estimate_tokens("统计用户") == 4
+    assert estimate_tokens("select user_id") == 4
+
+
+def test_interactive_admitted_before_batch():
+    """令牌不足时交互请求先于批量请求放行"""
+    async def run():
+        controller = AdmissionController(requests_per_minute=600, tokens_per_minute=10 ** 6)
+        controller.request_bucket = TokenBucket(rate_per_minute=600, capacity=1)
+        controller.request_bucket.consume(1)
+
+        order = []
+
+        async def admit(name, priority):
+            await controller.acquire(1, priority)
+            order.append(name)
+
+        batch = asyncio.create_task(admit("batch", "batch"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(admit("interactive", "interactive"))
+        await asyncio.gather(batch, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "batch"]
+
+
+def test_retry_on_429_then_succeed():
+    """429错误按退避重试后成功"""
+    async def run():
+        controller = AdmissionController(requests_per_minute=6000, tokens_per_minute=10 ** 6,
+                                         max_retries=3, backoff_base=0.01)
+        calls = {"count": 0}
+
+        async def flaky():
+            calls["count"] += 1
+            if calls["count"] < 3:
+                raise APICallError("rate limited", status_code=429)
+            return "ok"
+
+        result = await controller.call(flaky, estimated_tokens=10)
+        return result, calls["count"], controller.stats
+
+    result, count, stats = asyncio.run(run())
+    assert result == "ok"
+    assert count == 3
+    assert stats["retries"] == 2
+
+
+def test_client_error_not_retried():
+    """4xx错误（非429）不重试"""
+    async def run():
+        controller = AdmissionController(requests_per_minute=6000, tokens_per_minute=10 ** 6)
+        calls = {"count": 0}
+
+        async def bad_request():
+            calls["count"] += 1
+            raise APICallError("bad request", status_code=400)
+
+        try:
+            await controller.call(bad_request, estimated_tokens=10)
+        except APICallError:
+            pass
+        return calls["count"]
+
+    assert asyncio.run(run()) == 1
+
+
+def test_circuit_breaker_opens_after_failures():
+    """连续失败后熔断，后续请求快速失败"""
+    async def run():
+        controller = AdmissionController(requests_per_minute=6000, tokens_per_minute=10 ** 6,
+                                         max_retries=0, failure_threshold=2, reset_timeout=60)
+
+        async def server_error():
+            raise APICallError("server error", status_code=503)
+
+        for _ in range(2):
+            try:
+                await controller.call(server_error, estimated_tokens=10)
+            except APICallError:
+                pass
+        try:
+            await controller.call(server_error, estimated_tokens=10)
+        except CircuitOpenError:
+            return controller.breaker.state
+        return None
+
+    assert asyncio.run(run()) == "open"
+
+
+def test_client_errors_do_not_trip_breaker():
+    """4xx错误（非429）不计入熔断，其他请求不受影响"""
+    async def run():
+        controller = AdmissionController(requests_per_minute=6000, tokens_per_minute=10 ** 6,
+                                         max_retries=0, failure_threshold=2, reset_timeout=60)
+
+        async def client_error(status_code):
+            raise APICallError("client error", status_code=status_code)
+
+        for status_code in (400, 401, 413, 400):
+            try:
+                await controller.call(lambda: client_error(status_code), estimated_tokens=10)
+            except APICallError:
+                pass
+
+        async def ok():
+            return "ok"
+
+        return controller.breaker.state, controller.breaker.failures, await controller.call(ok, estimated_tokens=10)
+
+    assert asyncio.run(run()) == ("closed", 0, "ok")
+
+
+if __name__ == "__main__":
+    test_token_bucket_wait_time()
+    test_estimate_tokens()
+    test_interactive_admitted_before_batch()
+    test_retry_on_429_then_succeed()
+    test_client_error_not_retried()
+    test_circuit_breaker_opens_after_failures()
+    test_client_errors_do_not_trip_breaker()
+    print("测试完成")
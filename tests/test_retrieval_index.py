@@ -0,0 +1,92 @@
+# test_retrieval_index.py
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.retrieval_index import RetrievalIndex, build_retrieval_index, char_ngrams, document_fields
+from tests.test_prompt_builder import _build_metadata_db
+
+
+def _document(name, comment, columns=()):
+    return (('', 'dw', name), document_fields(name, comment, columns))
+
+
+def test_char_ngrams():
+    """英文单词补空格取 3-gram，中文取 2-gram 和 3-gram"""
+    assert char_ngrams("user_id") == [" us", "use", "ser", "er ", " id", "id "]
+    assert char_ngrams("注册渠道") == ["注册", "册渠", "渠道", "注册渠", "册渠道"]
+
+
+def test_ranking_and_incremental_update():
+    """按相关度排序；只重新计算变化的文档，结果与全量构建一致"""
+    documents = [
+        _document("dwd_user_register", "用户注册明细", [("channel", "注册渠道"), ("dt", "分区日期")]),
+        _document("dwd_order_detail", "订单明细", [("pay_amount", "支付金额"), ("dt", "分区日期")]),
+        _document("dws_user_active", "用户活跃汇总", [("active_days", "活跃天数")]),
+    ]
+    index = RetrievalIndex()
+    assert index.update(documents) == {'reused': 0, 'rebuilt': 3, 'removed': 0}
+    assert index.search("各渠道注册用户数")[0][0][2] == "dwd_user_register"
+    assert index.search("支付金额")[0][0][2] == "dwd_order_detail"
+    assert index.search("xyz") == []
+
+    changed = documents[:1] + [_document("dwd_order_detail", "订单及退款明细", [("refund_amount", "退款金额")])]
+    assert index.update(changed) == {'reused': 1, 'rebuilt': 1, 'removed': 1}
+    full = RetrievalIndex()
+    full.update(changed)
+    for query in ("退款金额", "注册渠道", "明细"):
+        assert index.search(query) == full.search(query)
+
+
+def test_index_file_is_reused_by_catalog():
+    """同步后生成的索引文件在下次构建时复用，表结构目录也使用它排序"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        index_path = os.path.join(tmp, "metadata.retrieval.npz")
+        _build_metadata_db(path)
+        assert build_retrieval_index(path, index_path)['rebuilt'] == 2
+        assert build_retrieval_index(path, index_path) == {'reused': 2, 'rebuilt': 0, 'removed': 0, 'documents': 2}
+
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE tables_meta SET table_comment = '订单退款明细' WHERE table_name = 'dwd_order_detail'")
+        conn.commit()
+        conn.close()
+        assert build_retrieval_index(path, index_path)['rebuilt'] == 1
+
+        loaded = RetrievalIndex(index_path)
+        assert loaded.load()
+        assert loaded.search("退款")[0][0] == ('', 'dw', 'dwd_order_detail')
+
+
+def test_collector_writes_index_after_sync():
+    """采集器默认把索引写在数据库旁边"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        _build_metadata_db(path)
+        assert collector.retrieval_index_path == os.path.join(tmp, "metadata.retrieval.npz")
+        assert collector.write_retrieval_index()['documents'] == 2
+        assert os.path.exists(collector.retrieval_index_path)
+
+
+def test_scoring_whole_catalog_is_fast():
+    """对整个目录打分只做一次向量化的稀疏矩阵向量乘积"""
+    documents = [
+        _document(f"dwd_biz_{i}", f"业务{i % 97}明细", [(f"metric_{j}", f"指标{j}") for j in range(10)])
+        for i in range(5000)
+    ]
+    index = RetrievalIndex()
+    index.update(documents)
+    index.search("业务3明细 metric_1")
+
+    started = time.perf_counter()
+    for _ in range(20):
+        results = index.search("业务3明细 metric_1", limit=10)
+    assert (time.perf_counter() - started) / 20 < 0.02
+    assert results[0][0][2].startswith("dwd_biz_")
@@ -0,0 +1,139 @@
+# test_sample_sandbox.py
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.metadata_index import MetadataIndex
+from src.core.sample_sandbox import SampleSandbox, SandboxError, set_sample_sandbox
+from src.core.server import sample_run_sql
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.sample_data import FixtureSampleProvider, SampleStore, SyntheticSampleProvider
+from src.utils.table_stats import FixtureStatsProvider, TableStatsStore
+
+COLUMNS = {
+    "dwd_order_detail": [("order_id", "bigint"), ("user_id", "bigint"), ("pay_amount", "decimal(18,2)"),
+                         ("dt", "string")],
+    "dim_user": [("user_id", "bigint"), ("user_name", "varchar(64)")],
+}
+
+STATS = {
+    "dw.dwd_order_detail": {
+        "partition_keys": ["dt"],
+        "partitions": {f"dt=2024-01-{day:02d}": {"row_count": 1000, "total_bytes": 65536} for day in range(1, 11)},
+        "columns": {"user_id": {"ndv": 5, "null_fraction": 0.0}},
+    },
+    "dw.dim_user": {"row_count": 5, "total_bytes": 4096, "columns": {"user_id": {"ndv": 5}}},
+}
+
+FIXTURE = {
+    "dw.dwd_order_detail": [
+        {"order_id": 1, "user_id": 1, "pay_amount": 10.5, "dt": "2024-01-10"},
+        {"order_id": 2, "user_id": 2, "pay_amount": 20.0, "dt": "2024-01-10"},
+        {"order_id": 3, "user_id": 1, "pay_amount": 5.0, "dt": "2024-01-09"},
+        {"order_id": 4, "user_id": 1, "pay_amount": 99.0, "dt": "2024-01-01"},
+    ],
+    "dw.dim_user": [{"user_id": 1, "user_name": "alice"}, {"user_id": 2, "user_name": "bob"}],
+}
+
+ORDERS_BY_USER = """
+SELECT u.user_name, COUNT(o.order_id) AS orders, SUM(o.pay_amount) AS amount
+FROM dwd_order_detail o JOIN dw.dim_user u ON o.user_id = u.user_id
+WHERE o.dt >= '2024-01-09'
+GROUP BY u.user_name
+ORDER BY amount DESC
+"""
+
+
+def _sandbox(tmp, provider):
+    path = os.path.join(tmp, "metadata.db")
+    collector = MetadataCollector(sqlite_db_path=path)
+    collector.save_to_sqlite({
+        'tables': [{'table_schema': 'dw', 'table_name': name, 'table_comment': ''} for name in COLUMNS],
+        'columns': [{'table_schema': 'dw', 'table_name': name, 'column_name': column, 'data_type': data_type,
+                     'is_nullable': 'YES', 'column_comment': ''}
+                    for name, columns in COLUMNS.items() for column, data_type in columns],
+    })
+    collector.sync_table_stats(FixtureStatsProvider(STATS), "", ("dw",))
+    stats_store = TableStatsStore(path)
+    if provider is None:
+        provider = SyntheticSampleProvider(stats_store)
+    return SampleSandbox(SampleStore(os.path.join(tmp, "samples")), provider, MetadataIndex(path), stats_store,
+                         partitions_per_table=2, rows_per_partition=10)
+
+
+def test_fixture_samples_follow_latest_partitions():
+    """按最新分区物化夹具样本，Hive SQL 转写后在样本上执行，库名省略的表按元数据补全"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sandbox = _sandbox(tmp, FixtureSampleProvider(FIXTURE))
+        result = sandbox.run(ORDERS_BY_USER, limit=1)
+        assert result.ok and result.columns == ("user_name", "orders", "amount")
+        # 2024-01-01 不在抽样的分区中
+        assert result.rows == [("bob", 1, 20.0)] and result.truncated
+        assert result.samples["dw.dwd_order_detail"].partitions == ("dt=2024-01-10", "dt=2024-01-09")
+        assert result.samples["dw.dim_user"].partitions == () and result.samples["dw.dim_user"].row_count == 2
+        assert 'FROM "dw".dwd_order_detail AS o' in result.sql
+
+        # 已物化的样本直接复用
+        assert sandbox.store.info("dw", "dwd_order_detail") == result.samples["dw.dwd_order_detail"]
+        assert sandbox.run(ORDERS_BY_USER).rows == [("bob", 1, 20.0), ("alice", 2, 15.5)]
+
+
+def test_synthetic_samples_join_and_errors():
+    """合成样本的同名字段能关联上；执行错误返回 SQLite 的错误，非查询和未知表报错"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sandbox = _sandbox(tmp, None)
+        result = sandbox.run("SELECT COUNT(*) AS n, COUNT(DISTINCT o.user_id) AS users, MAX(o.dt) AS latest "
+                             "FROM dw.dwd_order_detail o JOIN dw.dim_user u ON o.user_id = u.user_id")
+        # 维表样本不超过统计的行数，连接不放大
+        assert result.ok and result.rows == [(20, 5, "2024-01-10")]
+        assert result.samples["dw.dim_user"].row_count == 5
+
+        failed = sandbox.run("SELECT o.no_such_column FROM dw.dwd_order_detail o")
+        assert not failed.ok and "no_such_column" in failed.error
+
+        for sql in ("INSERT OVERWRITE TABLE dw.dim_user SELECT 1, 'x'", "SELECT x.a FROM dw.unknown_table x"):
+            try:
+                sandbox.run(sql)
+                assert False, sql
+            except SandboxError:
+                pass
+
+
+def test_schemas_named_like_sqlite_keywords():
+    """default、main 这类与 SQLite 关键字或内置库同名的库以及带连字符的库名都能挂载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        schemas = ("default", "main", "ods-raw")
+        MetadataCollector(sqlite_db_path=path).save_to_sqlite({
+            'tables': [{'table_schema': schema, 'table_name': 't', 'table_comment': ''} for schema in schemas],
+            'columns': [{'table_schema': schema, 'table_name': 't', 'column_name': 'id', 'data_type': 'bigint',
+                         'is_nullable': 'YES', 'column_comment': ''} for schema in schemas],
+        })
+        fixture = {f"{schema}.t": [{"id": 1}, {"id": 2}] for schema in schemas}
+        sandbox = SampleSandbox(SampleStore(os.path.join(tmp, "samples")), FixtureSampleProvider(fixture),
+                                MetadataIndex(path))
+        result = sandbox.run("SELECT d.id, COUNT(m.id) AS matched FROM default.t d JOIN main.t m ON d.id = m.id "
+                             "JOIN `ods-raw`.t r ON r.id = d.id GROUP BY d.id ORDER BY d.id")
+        assert result.ok, result.error
+        assert result.rows == [(1, 1), (2, 1)] and set(result.samples) == {"default.t", "main.t", "ods-raw.t"}
+
+
+def test_sample_run_sql_tool():
+    """MCP 工具输出样本范围、耗时和结果表格"""
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = set_sample_sandbox(_sandbox(tmp, FixtureSampleProvider(FIXTURE)))
+        try:
+            result = asyncio.run(sample_run_sql(ORDERS_BY_USER, limit=5, refresh_tables="dw.dim_user"))
+            assert "dw.dwd_order_detail：分区 dt=2024-01-10, dt=2024-01-09，3 行样本" in result
+            assert "| user_name | orders | amount |" in result and "| alice | 2 | 15.5 |" in result
+            assert "执行" in result and "ms" in result
+
+            result = asyncio.run(sample_run_sql("SELECT o.order_id FROM dw.dwd_order_detail o WHERE o.dt = '2023-12-31'"))
+            assert "结果为空" in result
+            assert asyncio.run(sample_run_sql("DROP TABLE dw.dim_user")).startswith("无法试运行")
+        finally:
+            set_sample_sandbox(previous)
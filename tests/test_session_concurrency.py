@@ -0,0 +1,77 @@
+# test_session_concurrency.py
+import asyncio
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.sql_assistant_agent import SQLAssistantAgent
+
+
+def _make_agent(max_concurrent_requests: int, delay: float) -> SQLAssistantAgent:
+    """创建一个使用假LLM调用的智能体"""
+    agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing",
+                              max_concurrent_requests=max_concurrent_requests)
+    peak = {"inflight": 0}
+
+    async def fake_post(payload):
+        peak["inflight"] = max(peak["inflight"], agent.get_metrics()["llm_inflight"])
+        await asyncio.sleep(delay)
+        sql = "SELECT u.user_id FROM dwd_user u WHERE u.dt = '2024-01-01'"
+        return {"choices": [{"message": {"content": sql}}]}
+
+    agent._post_chat_completion = fake_post
+    agent.peak = peak
+    return agent
+
+
+def test_semaphore_bounds_inflight_calls():
+    """并发请求的在途LLM调用数不超过上限"""
+    async def run():
+        agent = _make_agent(max_concurrent_requests=2, delay=0.05)
+        requests = [agent.generate_and_review_sql(f"统计渠道{i}的用户数", session_id=f"s{i}") for i in range(6)]
+        results = await asyncio.gather(*requests)
+        return agent, results
+
+    agent, results = asyncio.run(run())
+    assert len(results) == 6
+    metrics = agent.get_metrics()
+    print(f"并发指标: {metrics}")
+    assert agent.peak["inflight"] <= 2
+    assert metrics["llm_max_queue_depth"] >= 1
+    assert metrics["active_sessions"] == 0
+    assert metrics["llm_inflight"] == 0
+
+
+def test_cancel_only_affects_own_session():
+    """取消一个会话不影响其他会话的请求"""
+    async def run():
+        agent = _make_agent(max_concurrent_requests=4, delay=0.2)
+        task_a = asyncio.create_task(agent.generate_and_review_sql("统计用户数", session_id="a"))
+        task_b = asyncio.create_task(agent.generate_and_review_sql("统计订单数", session_id="b"))
+        await asyncio.sleep(0.05)
+        assert agent.get_metrics()["active_sessions"] == 2
+
+        message = await agent.cancel_session_task("a")
+        result_b = await task_b
+        return agent, message, task_a, result_b
+
+    agent, message, task_a, result_b = asyncio.run(run())
+    assert message == "任务已成功取消"
+    assert task_a.cancelled()
+    assert "SELECT" in result_b
+    assert agent.get_metrics()["running_tasks"] == 0
+
+
+if __name__ == "__main__":
+    test_semaphore_bounds_inflight_calls()
+    test_cancel_only_affects_own_session()
+    print("测试完成")
+
+
+def test_explicit_api_key_takes_precedence(monkeypatch):
+    """显式传入的密钥优先于环境变量"""
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "env-key")
+    assert SQLAssistantAgent(deepseek_api_key="explicit-key").api_key == "explicit-key"
+    assert SQLAssistantAgent().api_key == "env-key"
@@ -0,0 +1,107 @@
+# test_single_flight.py
+import asyncio
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.single_flight import SingleFlight
+from src.core.sql_assistant_agent import SQLAssistantAgent
+
+
+def test_identical_requests_share_one_call():
+    """相同key的并发调用只执行一次"""
+    async def run():
+        flight = SingleFlight()
+        calls = {"count": 0}
+
+        async def work():
+            calls["count"] += 1
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("k", work) for _ in range(5)])
+        return results, calls["count"], flight
+
+    results, count, flight = asyncio.run(run())
+    assert results == ["result"] * 5
+    assert count == 1
+    assert flight.stats["coalesced"] == 4
+    assert flight.inflight() == 0
+
+
+def test_one_waiter_cancel_keeps_shared_call():
+    """一个等待者取消不影响其他等待者"""
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.1)
+            return "result"
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first
+
+    result, first = asyncio.run(run())
+    assert result == "result"
+    assert first.cancelled()
+
+
+def test_all_waiters_cancel_cancels_shared_call():
+    """所有等待者取消后底层调用也被取消"""
+    async def run():
+        flight = SingleFlight()
+        state = {"cancelled": False}
+
+        async def work():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        waiter = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        return state["cancelled"], flight.inflight()
+
+    cancelled, inflight = asyncio.run(run())
+    assert cancelled
+    assert inflight == 0
+
+
+def test_agent_coalesces_normalized_requests():
+    """智能体对规范化后相同的需求只调用一次LLM"""
+    async def run():
+        agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
+        calls = {"count": 0}
+
+        async def fake_post(payload):
+            calls["count"] += 1
+            await asyncio.sleep(0.05)
+            sql = "SELECT u.user_id FROM dwd_user u WHERE u.dt = '2024-01-01'"
+            return {"choices": [{"message": {"content": sql}}]}
+
+        agent._post_chat_completion = fake_post
+        results = await asyncio.gather(
+            agent.generate_and_review_sql("统计 用户数", session_id="a"),
+            agent.generate_and_review_sql("  统计 用户数 ", session_id="b"),
+        )
+        return results, calls["count"]
+
+    results, count = asyncio.run(run())
+    assert results[0] == results[1]
+    assert count == 1
+
+
+if __name__ == "__main__":
+    test_identical_requests_share_one_call()
+    test_one_waiter_cancel_keeps_shared_call()
+    test_all_waiters_cancel_cancels_shared_call()
+    test_agent_coalesces_normalized_requests()
+    print("测试完成")
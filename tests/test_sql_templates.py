@@ -0,0 +1,112 @@
+# test_sql_templates.py
+import asyncio
+import datetime
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.server import check_sql, match_sql_template
+from src.core.sql_assistant_agent import SQLAssistantAgent
+from src.core.sql_templates import (DEFAULT_TEMPLATES_PATH, SQLTemplate, SQLTemplateLibrary, TemplateError,
+                                    TemplateSlot, extract_date_range, set_sql_template_library)
+
+TODAY = datetime.date(2024, 3, 13)
+
+
+def _library():
+    library = SQLTemplateLibrary(check_sql)
+    assert library.load(DEFAULT_TEMPLATES_PATH) == len(library) and not library.rejected
+    return library
+
+
+def test_date_ranges_and_registration_checks():
+    """日期范围抽取；占位符与参数不一致、未通过规范检查、可选参数不在过滤条件中的模板不能注册"""
+    day = datetime.date
+    assert extract_date_range("2024-03-01到2024年3月5日", TODAY) == (day(2024, 3, 1), day(2024, 3, 5))
+    assert extract_date_range("最近七天", TODAY) == (day(2024, 3, 6), day(2024, 3, 12))
+    assert extract_date_range("上周", TODAY) == (day(2024, 3, 4), day(2024, 3, 10))
+    assert extract_date_range("上个月", TODAY) == (day(2024, 2, 1), day(2024, 2, 29))
+    assert extract_date_range("昨天", TODAY) == (day(2024, 3, 12), day(2024, 3, 12))
+    assert extract_date_range("所有用户", TODAY) is None
+
+    library = SQLTemplateLibrary(check_sql)
+    date = TemplateSlot("dt", "date")
+    invalid = [
+        SQLTemplate("undefined", "t", "SELECT o.id FROM dw.o o WHERE o.dt = :dt AND o.c = :channel", ["x"], [date]),
+        SQLTemplate("star", "t", "SELECT * FROM dw.o o WHERE o.dt = :dt", ["x"], [date]),
+        SQLTemplate("optional", "t", "SELECT :dt AS d FROM dw.o o WHERE o.dt = '2024-01-01'", ["x"],
+                    [date._replace(optional=True)]),
+    ]
+    for template in invalid:
+        try:
+            library.register(template)
+            raise AssertionError(template.name)
+        except TemplateError:
+            pass
+    assert len(library) == 0
+
+
+def test_match_and_render_by_ast():
+    """按关键词匹配模板并抽取参数；可选的过滤条件在语法树上删除，排除词和缺少必需参数时不匹配"""
+    library = _library()
+    match = library.match("小程序每天的GMV趋势，2024-03-01到2024-03-05", TODAY)
+    assert match.template.name == "daily_gmv"
+    assert "BETWEEN '2024-03-01' AND '2024-03-05' AND o.channel = 'mini_program'" in match.sql
+    assert "渠道：小程序" in match.describe()
+
+    match = library.match("每天的成交额", TODAY)
+    assert match.params["channel"] is None and "channel" not in match.sql
+    assert "BETWEEN '2024-03-06' AND '2024-03-12'" in match.sql
+
+    match = library.match("最近7天各渠道的下单用户数", TODAY)
+    assert match.template.name == "channel_metric" and "COUNT(DISTINCT o.user_id) AS metric_value" in match.sql
+
+    match = library.match("上周销售额 TOP 5 的商品", TODAY)
+    assert match.template.name == "top_products" and match.sql.endswith("LIMIT 5")
+    assert library.match("上个月商品排行前二十", TODAY).sql.endswith("LIMIT 20")
+
+    for request in ("帮我统计每个渠道昨天的新增用户数", "各渠道的留存率", "统计用户数"):
+        assert library.match(request, TODAY) is None, request
+
+
+def test_requests_beyond_the_template_do_not_match():
+    """需求中有模板覆盖不了的指标或条件、或同一参数有多个取值时不匹配；"前天"、"之前" 中的 "前" 不算排行"""
+    library = _library()
+    for request in ("新用户7日留存率是多少", "统计新用户中首单金额大于100的人数", "查询前天每个商品的库存",
+                    "商品退货率排行", "每天销售额和去年同期对比", "之前卖出的商品排行里哪些退过款",
+                    "APP、小程序每日GMV", "各渠道GMV和订单数"):
+        assert library.match(request, TODAY) is None, request
+    assert library.match("前天每天的GMV", TODAY).params["start_date"] == "2024-03-11"
+    assert library.match("昨天销售额前10的商品", TODAY).sql.endswith("LIMIT 10")
+    assert library.match("最近七天每天的新增用户数", TODAY).template.name == "daily_new_users"
+
+
+def test_agent_fast_path_skips_llm(monkeypatch):
+    """模板快速通道默认关闭；开启后命中模板的需求不调用LLM；MCP 工具返回模板和参数"""
+    monkeypatch.delenv("SQL_TEMPLATES_ENABLED", raising=False)
+    assert SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing").template_library is None
+
+    library = _library()
+    previous = set_sql_template_library(library)
+    try:
+        assert "模板: 每日新增用户" in asyncio.run(match_sql_template("昨天APP的新增用户数"))
+        assert "没有匹配的SQL模板" in asyncio.run(match_sql_template("计算用户的次日留存率"))
+    finally:
+        set_sql_template_library(previous)
+
+    async def run():
+        agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
+        agent.template_library = library
+
+        async def fail_post(payload):
+            raise AssertionError("命中模板时不应调用LLM")
+
+        agent._post_chat_completion = fail_post
+        answer = await agent.generate_and_review_sql("昨天APP的新增用户数")
+        return answer, agent.get_metrics()
+
+    answer, metrics = asyncio.run(run())
+    assert "已按模板「每日新增用户」生成符合规范的SQL" in answer and "u.channel = 'app'" in answer
+    assert metrics["template_hit_rate"] == 1.0 and metrics["llm_total_calls"] == 0
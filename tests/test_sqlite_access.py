@@ -0,0 +1,111 @@
+# test_sqlite_access.py
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.sqlite_access import read_connection, read_pool
+
+TABLES = [('dw', f'dwd_table_{i}', f'表{i}') for i in range(100)]
+
+
+def _table_count(path):
+    with read_connection(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM tables_meta").fetchone()[0]
+
+
+def test_readers_see_previous_version_until_swap():
+    """写入发生在副本上，完成前读取方看到的是同步前的完整版本，完成后看到新版本"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        collector.bulk_load([('tables', TABLES[:10])])
+        assert _table_count(path) == 10
+
+        with collector._staged():
+            conn = collector._connect(bulk=True)
+            conn.executemany("INSERT INTO tables_meta (table_schema, table_name, table_comment) VALUES (?, ?, ?)",
+                             TABLES[10:])
+            conn.commit()
+            conn.close()
+            assert _table_count(path) == 10
+        assert _table_count(path) == 100
+        assert not [name for name in os.listdir(tmp) if name.endswith(".building")]
+
+
+def test_readers_never_wait_for_sync_writes():
+    """同步持有写事务时，读取立即返回"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        collector.bulk_load([('tables', TABLES[:10])])
+
+        writing, release = threading.Event(), threading.Event()
+
+        def sync():
+            with collector._staged():
+                conn = collector._connect()
+                conn.execute("BEGIN EXCLUSIVE")
+                conn.execute("DELETE FROM tables_meta")
+                writing.set()
+                release.wait(5)
+                conn.commit()
+                conn.close()
+
+        thread = threading.Thread(target=sync)
+        thread.start()
+        try:
+            assert writing.wait(5)
+            started = time.perf_counter()
+            assert _table_count(path) == 10
+            assert time.perf_counter() - started < 0.5
+        finally:
+            release.set()
+            thread.join()
+        assert _table_count(path) == 0
+
+
+def test_failed_build_keeps_published_file():
+    """同步出错时丢弃副本，正式文件保持不变"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        collector.bulk_load([('tables', TABLES[:10])])
+
+        try:
+            with collector._staged():
+                collector._bulk_insert([('tables', TABLES[10:])], '', {'tables': 0})
+                raise RuntimeError("源端读取失败")
+        except RuntimeError:
+            pass
+        assert _table_count(path) == 10
+        assert sorted(os.listdir(tmp)) == ["metadata.db"]
+
+
+def test_pooled_readers_reopen_after_swap():
+    """连接池中的只读连接在文件被替换后重新打开，且不能写入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        collector.bulk_load([('tables', TABLES[:10])])
+        assert _table_count(path) == 10
+        created = read_pool(path).snapshot()['created']
+
+        collector.bulk_load([('tables', TABLES[10:20])])
+        assert _table_count(path) == 20
+        stats = read_pool(path).snapshot()
+        assert stats['discarded'] >= 1 and stats['created'] == created + 1
+
+        with read_connection(path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+            try:
+                conn.execute("DELETE FROM tables_meta")
+                assert False, "只读连接不应允许写入"
+            except sqlite3.OperationalError:
+                pass
@@ -0,0 +1,173 @@
+# test_sync_scheduler.py
+import asyncio
+import sys
+import os
+import random
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.sync_scheduler import SyncScheduler, set_sync_scheduler
+from tests.test_incremental_sync import _collector, _source
+
+
+class SlowCollector:
+    """记录调用的采集器，同步在 release 被设置前一直阻塞"""
+
+    def __init__(self, tmp):
+        self.sqlite_db_path = os.path.join(tmp, "metadata.db")
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def sync_metadata(self, full=False, sources=None, due_only=False):
+        self.calls.append({'full': full, 'sources': sources, 'due_only': due_only})
+        self.started.set()
+        assert self.release.wait(5)
+        return {'rows_changed': 7, 'rows_read': 20, 'elapsed_s': 0.01, 'sources': ['bigdata_db'], 'errors': {}}
+
+
+def test_triggers_are_single_flight():
+    """同步进行中再次触发且范围已被覆盖时共享同一次同步，结束后的触发重新执行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = SlowCollector(tmp)
+        scheduler = SyncScheduler(collector)
+
+        first, started = scheduler.trigger()
+        assert started and collector.started.wait(5)
+        second, started = scheduler.trigger(sources=["bigdata_db"])
+        assert second is first and not started
+        assert scheduler.running()
+
+        collector.release.set()
+        assert first.result(5)['rows_changed'] == 7
+        assert len(collector.calls) == 1
+        assert not scheduler.running()
+
+        third, started = scheduler.trigger()
+        assert started and third is not first
+        third.result(5)
+        metrics = scheduler.metrics()
+        assert (metrics['runs'], metrics['coalesced'], metrics['last_rows_changed']) == (2, 1, 7)
+
+
+def test_uncovered_triggers_queue_one_follow_up():
+    """定时的到期同步进行中，全量或指定数据源的手动触发排队在其后执行，排队的触发合并为一次"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = SlowCollector(tmp)
+        scheduler = SyncScheduler(collector)
+
+        scheduled, _ = scheduler.trigger(due_only=True, reason="scheduled")
+        assert collector.started.wait(5)
+        full, started = scheduler.trigger(full=True)
+        assert started and full is not scheduled
+        source, started = scheduler.trigger(sources=["user_profile_db"])
+        assert source is full and not started
+        assert scheduler.trigger(due_only=True)[0] is scheduled
+
+        collector.release.set()
+        scheduled.result(5)
+        full.result(5)
+        assert collector.calls == [{'full': False, 'sources': None, 'due_only': True},
+                                   {'full': True, 'sources': None, 'due_only': False}]
+        assert scheduler.metrics()['runs'] == 2 and not scheduler.running()
+
+        # 不相交的数据源同样排队
+        collector.release.clear()
+        collector.started.clear()
+        first, _ = scheduler.trigger(sources=["bigdata_db"])
+        assert collector.started.wait(5)
+        other, started = scheduler.trigger(sources=["user_profile_db"])
+        assert started and other is not first
+        collector.release.set()
+        other.result(5)
+        assert collector.calls[-1]['sources'] == ["user_profile_db"]
+
+
+def test_periodic_syncs_with_jitter():
+    """按带抖动的周期只同步到期的数据源，停止后不再同步"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = SlowCollector(tmp)
+        collector.release.set()
+        scheduler = SyncScheduler(collector, check_interval=0.02, jitter=0.5, rng=random.Random(1))
+        delays = [scheduler.next_delay() for _ in range(100)]
+        assert 0.01 <= min(delays) < max(delays) <= 0.03
+
+        scheduler.start()
+        deadline = time.time() + 5
+        while len(collector.calls) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        scheduler.stop(5)
+        calls = len(collector.calls)
+        assert calls >= 3
+        assert all(call['due_only'] for call in collector.calls)
+        assert scheduler.stats['last_trigger'] == "scheduled"
+        time.sleep(0.1)
+        assert len(collector.calls) == calls
+
+
+def test_metrics_report_staleness():
+    """统计中包含各数据源距上次成功同步的秒数"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector, _ = _collector(tmp, _source())
+        scheduler = SyncScheduler(collector)
+        assert set(scheduler.metrics()['staleness_s'].values()) == {None}
+
+        future, _ = scheduler.trigger()
+        assert future.result(30)['tables_changed'] == 10
+        metrics = scheduler.metrics()
+        assert metrics['last_rows_changed'] > 0 and metrics['last_error'] is None
+        assert all(seconds is not None and seconds < 60 for seconds in metrics['staleness_s'].values())
+        assert metrics['max_staleness_s'] < 60
+
+        later = scheduler.staleness(now=time.time() + 3600)
+        assert all(seconds >= 3599 for seconds in later.values())
+
+
+def test_sync_tools_do_not_block_event_loop():
+    """手动同步在后台线程执行，并发的工具调用合并为一次同步"""
+    from src.core import server
+
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = SlowCollector(tmp)
+        previous = set_sync_scheduler(SyncScheduler(collector))
+
+        async def scenario():
+            first = asyncio.ensure_future(server.sync_metadata_now())
+            second = asyncio.ensure_future(server.sync_metadata_now(source="bigdata_db"))
+            # 同步阻塞期间事件循环仍可处理其他请求
+            ticks = 0
+            while not collector.started.is_set() or ticks < 5:
+                await asyncio.sleep(0.01)
+                ticks += 1
+            status = await server.metadata_sync_status()
+            collector.release.set()
+            return await first, await second, status
+
+        try:
+            first, second, status = asyncio.run(scenario())
+        finally:
+            set_sync_scheduler(previous)
+        assert len(collector.calls) == 1
+        assert "变更 7 行" in first
+        assert second.startswith("已有同步在进行")
+        assert "正在同步: 是" in status and "从未同步" in status
+
+
+def test_server_import_has_no_side_effects():
+    """导入 MCP 服务不加载采集器和数据源配置，也不在当前目录创建元数据库"""
+    import subprocess
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import sys; import src.core.server; "
+              "print(sorted(name for name in ('src.utils.metadata_collector', 'src.utils.db_config') "
+              "if name in sys.modules))")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=root)
+        output = subprocess.run([sys.executable, "-c", script], cwd=tmp, env=env, capture_output=True,
+                                text=True, check=True).stdout
+        assert output.strip().splitlines()[-1] == "[]"
+        assert os.listdir(tmp) == []
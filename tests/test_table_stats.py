@@ -0,0 +1,185 @@
+# test_table_stats.py
+import sys
+import os
+import copy
+import json
+import sqlite3
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import (METASTORE_PARTITION_COLUMNS_QUERY, METASTORE_PARTITIONS_QUERY,
+                                   FixtureStatsProvider, HiveMetastoreStatsProvider, TableStatsStore)
+
+FIXTURE = {
+    "dw.dwd_order_detail": {
+        "partition_keys": ["dt"],
+        "partitions": {
+            "dt=2024-01-01": {"row_count": 1000, "total_bytes": 50000},
+            "dt=2024-01-02": {"row_count": 1200, "total_bytes": 60000},
+            "dt=2024-01-03": {"row_count": None, "total_bytes": 70000},
+        },
+        "columns": {"user_id": {"ndv": 300, "null_fraction": 0.0},
+                    "coupon_id": {"ndv": 12, "null_fraction": 0.85}},
+    },
+    "dim.dim_city": {"row_count": 300, "total_bytes": 4096,
+                     "columns": {"city_code": {"ndv": 300, "null_fraction": 0.0}}},
+    "tmp.tmp_ignored": {"row_count": 1},
+}
+
+SCHEMAS = ("dw", "dim")
+
+
+def test_stats_are_stored_per_table_partition_and_column():
+    """按分区保存行数和字节数，表级汇总、分区数、最新分区和字段统计可直接读取"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        stats = collector.sync_table_stats(FixtureStatsProvider(FIXTURE), "cluster_bj", SCHEMAS)
+        assert stats == {'stats_tables_read': 2, 'stats_tables_changed': 2, 'stats_tables_deleted': 0,
+                         'partitions_written': 4, 'partitions_deleted': 0}
+
+        store = TableStatsStore(path)
+        order = store.table("dwd_order_detail")
+        assert (order.source, order.schema, order.partition_keys) == ("cluster_bj", "dw", ("dt",))
+        # 未统计行数的分区不计入行数
+        assert (order.row_count, order.total_bytes, order.partition_count) == (2200, 180000, 3)
+        assert order.latest_partition == "dt=2024-01-03"
+        assert order.columns["coupon_id"].null_fraction == 0.85
+        assert [name for name, _, _ in store.partitions(order, limit=2)] == ["dt=2024-01-03", "dt=2024-01-02"]
+
+        city = store.table("dim.dim_city")
+        assert (city.row_count, city.partition_count, city.latest_partition) == (300, 0, None)
+        assert store.table("tmp_ignored") is None
+        assert TableStatsStore(os.path.join(tmp, "missing.db")).table("dim_city") is None
+
+
+def test_refresh_is_incremental():
+    """版本不变的表不再读取，只写入有变化的分区，删除消失的表和分区"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        collector = MetadataCollector(sqlite_db_path=path)
+        fixture = copy.deepcopy(FIXTURE)
+        collector.sync_table_stats(FixtureStatsProvider(fixture), "cluster_bj", SCHEMAS)
+
+        unchanged = collector.sync_table_stats(FixtureStatsProvider(fixture), "cluster_bj", SCHEMAS)
+        assert (unchanged['stats_tables_changed'], unchanged['partitions_written']) == (0, 0)
+
+        partitions = fixture["dw.dwd_order_detail"]["partitions"]
+        partitions["dt=2024-01-04"] = {"row_count": 800, "total_bytes": 40000}
+        del partitions["dt=2024-01-01"]
+        del fixture["dim.dim_city"]
+        stats = collector.sync_table_stats(FixtureStatsProvider(fixture), "cluster_bj", SCHEMAS)
+        assert stats == {'stats_tables_read': 1, 'stats_tables_changed': 1, 'stats_tables_deleted': 1,
+                         'partitions_written': 1, 'partitions_deleted': 1}
+
+        order = TableStatsStore(path).table("dw.dwd_order_detail")
+        assert (order.row_count, order.partition_count, order.latest_partition) == (2000, 3, "dt=2024-01-04")
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM column_stats WHERE table_name = 'dim_city'").fetchone()[0] == 0
+        conn.close()
+
+        full = collector.sync_table_stats(FixtureStatsProvider(fixture), "cluster_bj", SCHEMAS, full=True)
+        assert full['partitions_written'] == 3
+
+
+def test_fixture_file_and_metastore_rows():
+    """夹具可以是JSON文件；Metastore 中 -1 表示未统计"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_path = os.path.join(tmp, "stats.json")
+        with open(fixture_path, "w", encoding="utf-8") as f:
+            json.dump(FIXTURE, f)
+        provider = FixtureStatsProvider(fixture_path)
+        assert [row[:3] for row in provider.tables(("dim",))] == [("dim", "dim_city", ())]
+
+    class FakeCollector:
+        def __init__(self, results):
+            self.results = results
+            self.queries = []
+
+        def iter_rows(self, db_name, query):
+            self.queries.append(query)
+            yield self.results.pop(0)
+
+    collector = FakeCollector([
+        [("dw", "dwd_order_detail", "dt,hour", "1700000000/2:1700000500"), ("dim", "dim_city", None, "1700000000/0:")],
+        [("", "-1", "4096", "1700000000")],
+        [("city_code", 300, 0.0)],
+    ])
+    provider = HiveMetastoreStatsProvider(collector, "cluster_bj")
+    assert list(provider.tables(SCHEMAS)) == [("dw", "dwd_order_detail", ("dt", "hour"), "1700000000/2:1700000500"),
+                                              ("dim", "dim_city", (), "1700000000/0:")]
+    assert list(provider.partitions("dim", "dim_city")) == [("", None, 4096, "1700000000")]
+    assert list(provider.columns("dim", "dim_city")) == [("city_code", 300, 0.0, None)]
+    # 未分区的表读取整表参数
+    assert "TABLE_PARAMS" in collector.queries[1][0] and "TAB_COL_STATS" in collector.queries[2][0]
+
+
+class MetastoreCursor:
+    """按查询返回 Metastore 结果的服务端游标"""
+
+    def __init__(self):
+        self.rows = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        if query == METASTORE_PARTITIONS_QUERY:
+            rows = [("dt=2024-01-01", "100", "4096", "1700000000")]
+        elif query == METASTORE_PARTITION_COLUMNS_QUERY:
+            rows = [("user_id", 50, 0.0)]
+        else:
+            rows = [("dw", f"dwd_t{i}", "dt", f"1700000000/1:{i}") for i in range(3)]
+        self.rows = iter(rows)
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self.rows)]
+
+
+class MetastoreConnection:
+    def cursor(self):
+        return MetastoreCursor()
+
+    def close(self):
+        pass
+
+
+def test_metastore_stats_with_single_connection():
+    """连接池只有一个连接时，读完表清单后再逐表读取统计，不会死锁"""
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = MetadataCollector(sqlite_db_path=os.path.join(tmp, "metadata.db"), parallelism=1)
+        collector.connect_to_mysql = lambda db_name, streaming=False: MetastoreConnection()
+        results = []
+        worker = threading.Thread(target=lambda: results.append(collector.sync_table_stats(
+            HiveMetastoreStatsProvider(collector, "metastore"), "metastore", ("dw",))), daemon=True)
+        worker.start()
+        worker.join(10)
+        assert not worker.is_alive(), "同步统计在单连接的连接池上死锁"
+        assert results[0]['stats_tables_changed'] == 3 and results[0]['partitions_written'] == 3
+        assert collector.pool_stats()["metastore"]["created"] == 1
+
+
+def test_column_stats_gain_top_fraction():
+    """旧版本的字段统计表打开时补上 top_fraction 字段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metadata.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE column_stats (source TEXT NOT NULL DEFAULT '', table_schema TEXT NOT NULL, "
+                     "table_name TEXT NOT NULL, column_name TEXT NOT NULL, ndv INTEGER, null_fraction REAL, "
+                     "PRIMARY KEY (source, table_schema, table_name, column_name)) WITHOUT ROWID")
+        conn.commit()
+        conn.close()
+
+        fixture = copy.deepcopy(FIXTURE)
+        fixture["dim.dim_city"]["columns"]["city_code"]["top_fraction"] = 0.4
+        MetadataCollector(sqlite_db_path=path).sync_table_stats(FixtureStatsProvider(fixture), "cluster_bj", SCHEMAS)
+        store = TableStatsStore(path)
+        assert store.table("dim_city").columns["city_code"].top_fraction == 0.4
+        assert store.table("dwd_order_detail").columns["user_id"].top_fraction is None
@@ -0,0 +1,137 @@
+# test_volume_hints.py
+import asyncio
+import sys
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.sql_assistant_agent import SQLAssistantAgent
+from src.core.volume_hints import VolumeEstimator, format_bytes
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import FixtureStatsProvider
+
+GB = 1 << 30
+
+
+def _days(n, start=date(2024, 1, 1)):
+    return [(start + timedelta(days=i)).isoformat() for i in range(n)]
+
+
+def _fixture(days=30, part_bytes=GB):
+    return {
+        "dw.dwd_order_detail": {
+            "partition_keys": ["dt"],
+            "partitions": {f"dt={day}": {"row_count": 1000, "total_bytes": part_bytes} for day in _days(days)},
+        },
+        "dw.dwd_user_log": {
+            "partition_keys": ["dt", "hour"],
+            "partitions": {f"dt={day}/hour={hour:02d}": {"row_count": 10, "total_bytes": 1024}
+                           for day in _days(2) for hour in range(24)},
+        },
+        "dim.dim_city": {"row_count": 300, "total_bytes": 4096},
+    }
+
+
+def _estimator(tmp, fixture=None):
+    path = os.path.join(tmp, "metadata.db")
+    MetadataCollector(sqlite_db_path=path).sync_table_stats(
+        FixtureStatsProvider(fixture or _fixture()), "cluster_bj", ("dw", "dim"))
+    return VolumeEstimator(path)
+
+
+def test_partition_pruning_from_where_and_join_conditions():
+    """按等值、范围、IN 和多级分区条件裁剪，连接条件中的分区过滤归属对应的表"""
+    with tempfile.TemporaryDirectory() as tmp:
+        estimator = _estimator(tmp)
+
+        volumes = estimator.estimate(
+            "SELECT o.order_id, c.city_name FROM dw.dwd_order_detail o "
+            "JOIN dim.dim_city c ON o.city_code = c.city_code "
+            "WHERE o.dt BETWEEN '2024-01-01' AND '2024-01-07' AND o.pay_amount > 0")
+        order, city = volumes
+        assert (order.table, order.partitions_hit, order.partitions_total, order.exact) == (
+            "dw.dwd_order_detail", 7, 30, True)
+        assert (order.row_count, order.total_bytes) == (7000, 7 * GB)
+        assert (city.partition_keys, city.total_bytes) == ((), 4096)
+
+        [log] = estimator.estimate("SELECT uid FROM dwd_user_log WHERE dt IN ('2024-01-02') AND hour >= '20'")
+        assert (log.partitions_hit, log.partitions_total) == (4, 48)
+
+        # 同一张表在 CTE 和主查询中引用时合并命中的分区
+        volumes = estimator.estimate(
+            "WITH a AS (SELECT * FROM dw.dwd_order_detail WHERE dt = '2024-01-05') "
+            "SELECT * FROM a JOIN dw.dwd_order_detail b ON a.order_id = b.order_id AND b.dt = '2024-01-06'")
+        assert [(v.table, v.partitions_hit) for v in volumes] == [("dw.dwd_order_detail", 2)]
+
+
+def test_unfiltered_and_unknown_conditions():
+    """没有分区条件时扫描全部分区；无法静态计算的条件按上限估算；没有统计的表单独标出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        estimator = _estimator(tmp)
+
+        [order] = estimator.estimate("SELECT * FROM dw.dwd_order_detail WHERE pay_amount > 100")
+        assert (order.partitions_hit, order.exact) == (30, True)
+
+        [order] = estimator.estimate("SELECT * FROM dw.dwd_order_detail WHERE dt = '${bizdate}'")
+        assert (order.partitions_hit, order.exact) == (30, False)
+        [order] = estimator.estimate("SELECT * FROM dw.dwd_order_detail WHERE dt >= date_sub(current_date, 7)")
+        assert order.exact is False
+
+        volumes = estimator.estimate("SELECT * FROM ods.ods_unknown")
+        assert [(v.table, v.has_stats) for v in volumes] == [("ods.ods_unknown", False)]
+        assert estimator.estimate("这不是SQL") == []
+
+
+def test_render_hints():
+    """提示文本包含命中分区数、预估大小，扫描量大时给出警告"""
+    with tempfile.TemporaryDirectory() as tmp:
+        estimator = _estimator(tmp, _fixture(days=2000))
+        text = estimator.render("SELECT o.order_id FROM dw.dwd_order_detail o JOIN dim.dim_city c "
+                                "ON o.city_code = c.city_code WHERE o.dt = '2024-01-03'")
+        assert "dw.dwd_order_detail: 命中 1/2000 个分区，约 1.0 GB（1,000 行）" in text
+        assert "dim.dim_city: 非分区表，约 4.0 KB（300 行）" in text
+
+        text = estimator.render("SELECT * FROM dw.dwd_order_detail")
+        assert "未按分区字段 dt 过滤，将扫描全部 2000 个分区" in text
+        assert "扫描量较大" in text
+        assert format_bytes(512) == "512 B" and format_bytes(3 * GB // 2) == "1.5 GB"
+
+
+def test_estimates_take_milliseconds():
+    """数千个分区的表上，缓存后的估算在毫秒级"""
+    with tempfile.TemporaryDirectory() as tmp:
+        estimator = _estimator(tmp, _fixture(days=3000))
+        sql = ("SELECT o.order_id, c.city_name FROM dw.dwd_order_detail o JOIN dim.dim_city c "
+               "ON o.city_code = c.city_code WHERE o.dt >= '2025-01-01' AND o.dt < '2025-02-01'")
+        assert estimator.estimate(sql)[0].partitions_hit == 31
+
+        started = time.perf_counter()
+        for _ in range(20):
+            estimator.estimate(sql)
+        assert (time.perf_counter() - started) / 20 < 0.01
+
+
+def test_agent_answer_includes_volume_hints():
+    """智能体回复附带各表的预估数据量"""
+    with tempfile.TemporaryDirectory() as tmp:
+        estimator = _estimator(tmp)
+
+        async def run():
+            agent = SQLAssistantAgent(deepseek_api_key="dummy-key-for-testing")
+            agent.volume_estimator = estimator
+
+            async def fake_post(payload):
+                sql = "SELECT o.order_id FROM dw.dwd_order_detail o WHERE o.dt = '2024-01-01'"
+                return {"choices": [{"message": {"content": sql}}],
+                        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}}
+
+            agent._post_chat_completion = fake_post
+            return await agent.generate_and_review_sql("查询1月1日的订单")
+
+        answer = asyncio.run(run())
+        assert "数据量预估" in answer
+        assert "dw.dwd_order_detail: 命中 1/30 个分区，约 1.0 GB" in answer
@@ -0,0 +1,96 @@
+# test_write_checks.py
+import asyncio
+import sys
+import os
+import tempfile
+
+import sqlglot
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.server import RULES_CONFIG, lint_sql
+from src.core.write_checks import WriteChecker, set_write_checker
+from src.utils.metadata_collector import MetadataCollector
+from src.utils.table_stats import FixtureStatsProvider
+
+GB = 1 << 30
+
+FIXTURE = {
+    "ods.ods_event_log": {
+        "partition_keys": ["dt"],
+        "partitions": {f"dt=2024-01-{day:02d}": {"row_count": 50_000_000, "total_bytes": 100 * GB}
+                       for day in range(1, 31)},
+        "columns": {"user_id": {"ndv": 20_000_000}, "city_code": {"ndv": 300}, "event": {"ndv": 40}},
+    },
+    "dim.dim_city": {"row_count": 300, "total_bytes": 4096, "columns": {"city_code": {"ndv": 300}}},
+}
+
+
+def _checker(tmp):
+    path = os.path.join(tmp, "metadata.db")
+    MetadataCollector(sqlite_db_path=path).sync_table_stats(FixtureStatsProvider(FIXTURE), "cluster_bj", ("ods", "dim"))
+    return WriteChecker(path)
+
+
+def _estimate(checker, sql):
+    return checker.estimate(sqlglot.parse_one(sql, read="hive"))
+
+
+def test_dynamic_partition_estimates():
+    """动态分区取 SELECT 最后几列：来源是分区字段时取命中的分区数，否则取基数；DISTRIBUTE BY 后每个分区一个文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        checker = _checker(tmp)
+        estimate = _estimate(checker, "INSERT OVERWRITE TABLE dw.dwd_event PARTITION (dt) "
+                                      "SELECT e.user_id, e.dt FROM ods.ods_event_log e WHERE e.dt >= '2024-01-24'")
+        assert (estimate.kind, estimate.dynamic_columns, estimate.partitions) == ("INSERT", ("dt",), 7)
+        assert (estimate.input_bytes, estimate.writers, estimate.files) == (700 * GB, 2937, 7 * 2937)
+
+        estimate = _estimate(checker, "INSERT OVERWRITE TABLE dw.dwd_event PARTITION (dt='2024-01-01', city) "
+                                      "SELECT e.event, e.city_code AS city FROM ods.ods_event_log e "
+                                      "WHERE e.dt = '2024-01-01' DISTRIBUTE BY city")
+        assert (estimate.partitions, estimate.distributed, estimate.files) == (300, True, 300)
+
+        # 静态分区只写一个分区；SELECT * 无法确定动态分区的来源
+        estimate = _estimate(checker, "INSERT INTO TABLE dw.dwd_event PARTITION (dt='2024-01-01') "
+                                      "SELECT e.event FROM ods.ods_event_log e WHERE e.dt = '2024-01-01'")
+        assert (estimate.dynamic_columns, estimate.partitions, estimate.files) == ((), 1, 420)
+        assert _estimate(checker, "INSERT OVERWRITE TABLE dw.t PARTITION (dt) SELECT * FROM ods.ods_event_log e"
+                         ).partitions is None
+        assert _estimate(checker, "SELECT e.event FROM ods.ods_event_log e") is None
+
+
+def test_write_rules():
+    """高基数动态分区、缺少 DISTRIBUTE BY、小文件；CTAS 的 PARTITIONED BY 同样按动态分区检查"""
+    with tempfile.TemporaryDirectory() as tmp:
+        checker = _checker(tmp)
+
+        def rules(sql):
+            issues = checker.check(sqlglot.parse_one(sql, read="hive"), RULES_CONFIG["rules"])
+            return [issue[1:issue.index("]")] for issue in issues]
+
+        assert rules("INSERT OVERWRITE TABLE dw.t PARTITION (dt='2024-01-01', uid) SELECT e.event, e.user_id "
+                     "FROM ods.ods_event_log e WHERE e.dt = '2024-01-01'") == [
+            "Error-R901", "Warning-R902", "Warning-R903"]
+        assert rules("INSERT OVERWRITE TABLE dw.t PARTITION (dt='2024-01-01', city) SELECT e.event, e.city_code "
+                     "FROM ods.ods_event_log e WHERE e.dt = '2024-01-01' DISTRIBUTE BY e.city_code") == []
+        assert rules("CREATE TABLE dw.t PARTITIONED BY (dt) AS SELECT e.event, e.dt FROM ods.ods_event_log e") == [
+            "Warning-R902", "Warning-R903"]
+        # 小表写入不会产生小文件问题
+        assert rules("INSERT OVERWRITE TABLE dw.t SELECT c.city_code FROM dim.dim_city c") == []
+
+
+def test_lint_sql_checks_inserts_and_ctas():
+    """lint_sql 对 INSERT 和 CTAS 做写入检查"""
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = set_write_checker(_checker(tmp))
+        try:
+            result = asyncio.run(lint_sql(
+                "INSERT OVERWRITE TABLE dw.dwd_event PARTITION (dt) "
+                "SELECT e.user_id, e.dt FROM ods.ods_event_log e WHERE e.dt >= '2024-01-01'"))
+            assert "[Warning-R902]" in result and "DISTRIBUTE BY dt" in result
+            result = asyncio.run(lint_sql(
+                "CREATE EXTERNAL TABLE dw.t PARTITIONED BY (dt) AS SELECT e.event, e.dt FROM ods.ods_event_log e"))
+            assert "[Warning-R903]" in result
+        finally:
+            set_write_checker(previous)